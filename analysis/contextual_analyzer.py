@@ -1,7 +1,9 @@
 # analysis/contextual_analyzer.py
+import numpy as np
 import pandas as pd
 import pandas_ta as ta
 import config
+from analysis.streaming_indicators import EMA, ADX
 
 def get_market_bias(df_context: pd.DataFrame):
     """
@@ -36,4 +38,99 @@ def get_market_bias(df_context: pd.DataFrame):
         else:
             return 'BEARISH'
     else:
-        return 'SIDEWAYS'
\ No newline at end of file
+        return 'SIDEWAYS'
+
+
+def _bias_from_values(price, ema, adx):
+    """Stessa regola di get_market_bias applicata a una singola candela."""
+    if adx > config.ADX_CONTEXT_THRESHOLD:
+        return 'BULLISH' if price > ema else 'BEARISH'
+    return 'SIDEWAYS'
+
+
+# ==============================================================================
+# --- BIAS SU TUTTO LO STORICO (BACKTEST) ---
+# ==============================================================================
+
+def timeframe_delta(timeframe: str) -> pd.Timedelta:
+    """Durata di una candela del timeframe ('15m', '4h', '1d', ...)."""
+    return pd.Timedelta(str(timeframe).lower())
+
+
+def market_bias_series(df_context: pd.DataFrame) -> pd.Series:
+    """
+    Bias di get_market_bias per ogni candela di contesto, calcolato in un solo passaggio:
+    il valore alla riga k è quello che get_market_bias restituirebbe su df_context.loc[:k]
+    (EMA e ADX sono ricorsivi, quindi il prefisso non cambia i valori già calcolati).
+    """
+    if df_context is None or df_context.empty:
+        return pd.Series(dtype=object)
+    df = df_context.copy()
+    df.ta.ema(length=config.EMA_CONTEXT_PERIOD, append=True)
+    df.ta.adx(length=config.ADX_CONTEXT_PERIOD, append=True)
+
+    price = df['close'].to_numpy(dtype=float)
+    ema = df[f"EMA_{config.EMA_CONTEXT_PERIOD}"].to_numpy(dtype=float)
+    adx = df[f"ADX_{config.ADX_CONTEXT_PERIOD}"].to_numpy(dtype=float)
+    bias = np.where(adx > config.ADX_CONTEXT_THRESHOLD, np.where(price > ema, 'BULLISH', 'BEARISH'), 'SIDEWAYS')
+
+    # Come dropna() + iloc[-1]: le righe incomplete ereditano il bias dell'ultima riga valida
+    series = pd.Series(bias, index=df.index, dtype=object).where(df.notna().all(axis=1)).ffill().fillna('SIDEWAYS')
+    series.iloc[:config.EMA_CONTEXT_PERIOD - 1] = 'SIDEWAYS'  # prefisso troppo corto
+    return series
+
+
+def bias_asof(bias_series: pd.Series, trigger_index, context_timeframe=None, trigger_timeframe=None) -> np.ndarray:
+    """
+    Bias disponibile a ogni barra trigger, senza look-ahead: as-of join (backward) tra
+    la chiusura della barra trigger e la chiusura delle barre di contesto.
+    Entrambi gli indici sono tempi di apertura; una barra di contesto entra in gioco
+    solo quando è chiusa, cioè a open + durata del timeframe.
+    """
+    context_delta = timeframe_delta(context_timeframe or config.CONTEXT_TIMEFRAME)
+    trigger_delta = timeframe_delta(trigger_timeframe or config.OPERATIONAL_TIMEFRAME)
+    context = pd.DataFrame({'available_at': bias_series.index + context_delta, 'bias': bias_series.to_numpy()})
+    trigger = pd.DataFrame({'decision_at': pd.DatetimeIndex(trigger_index) + trigger_delta})
+    merged = pd.merge_asof(trigger, context, left_on='decision_at', right_on='available_at', direction='backward')
+    return merged['bias'].fillna('SIDEWAYS').to_numpy()
+
+
+# ==============================================================================
+# --- BIAS INCREMENTALE (LIVE) ---
+# ==============================================================================
+
+class MarketBiasTracker:
+    """
+    Bias di contesto aggiornato in O(1) a ogni nuova candela di contesto CHIUSA,
+    con EMA e ADX di analysis.streaming_indicators (identici a pandas_ta). Si
+    inizializza con seed() sullo storico e poi riceve solo le nuove candele via update().
+    """
+
+    def __init__(self, ema_period=None, adx_period=None):
+        self.ema_period = ema_period or config.EMA_CONTEXT_PERIOD
+        self.adx_period = adx_period or config.ADX_CONTEXT_PERIOD
+        self._ema = EMA(self.ema_period)
+        self._adx = ADX(self.adx_period)
+        self.bars = 0
+        self.last_timestamp = None
+        self.bias = 'SIDEWAYS'
+
+    @classmethod
+    def seed(cls, df_context: pd.DataFrame, **kwargs):
+        tracker = cls(**kwargs)
+        for ts, row in zip(df_context.index, df_context[['high', 'low', 'close']].itertuples(index=False)):
+            tracker.update(ts, row.high, row.low, row.close)
+        return tracker
+
+    def update(self, timestamp, high, low, close) -> str:
+        """Aggiunge una candela chiusa (ignorata se non più recente dell'ultima) e restituisce il bias."""
+        if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+            return self.bias
+        ema = self._ema.update(close)
+        adx = self._adx.update(high, low, close)
+        self.bars += 1
+        self.last_timestamp = timestamp
+        if self.bars >= self.ema_period and not np.isnan(ema) and not np.isnan(adx):
+            self.bias = _bias_from_values(close, ema, adx)
+        return self.bias
+
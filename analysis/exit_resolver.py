@@ -0,0 +1,134 @@
+# analysis/exit_resolver.py - v1.0 (Risoluzione SL/TP in O(log n))
+# Indice "sparse table" su high/low: permette di trovare la prima barra che tocca
+# lo Stop Loss o il Take Profit con una ricerca binaria, invece di scorrere
+# il trade candela per candela. Condiviso da tutti i backtester.
+import numpy as np
+
+
+class SparseTable:
+    """
+    Tabella di minimi (o massimi) su blocchi di ampiezza 2^k.
+    Livello k, posizione i -> estremo di values[i : i + 2^k].
+    """
+    def __init__(self, values, op):
+        self.op = op
+        self.levels = [np.asarray(values, dtype=float)]
+        step = 1
+        while 2 * step <= len(self.levels[0]):
+            prev = self.levels[-1]
+            self.levels.append(op(prev[:-step], prev[step:]))
+            step *= 2
+
+    def query(self, start, end):
+        """Estremo su values[start:end] in O(1) (end esclusivo, start < end)."""
+        k = (end - start).bit_length() - 1
+        level = self.levels[k]
+        return self.op(level[start], level[end - (1 << k)])
+
+
+class ExitResolver:
+    """
+    Trova in O(log n) la prima barra che colpisce SL o TP a partire da un indice.
+    Le barre con high/low mancanti (NaN) non fanno mai scattare un'uscita.
+    """
+    def __init__(self, high, low):
+        high = np.asarray(high, dtype=float)
+        low = np.asarray(low, dtype=float)
+        self.n = len(high)
+        self._low_min = SparseTable(np.where(np.isnan(low), np.inf, low), np.minimum)
+        self._high_max = SparseTable(np.where(np.isnan(high), -np.inf, high), np.maximum)
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(df['high'].to_numpy(dtype=float), df['low'].to_numpy(dtype=float))
+
+    def first_low_at_or_below(self, start, level, end=None):
+        """Primo indice k in [start, end) con low[k] <= level (end se non esiste)."""
+        end = self.n if end is None else min(end, self.n)
+        if start >= end or level != level:
+            return end
+        pos = start
+        for k in range(len(self._low_min.levels) - 1, -1, -1):
+            step = 1 << k
+            if pos + step <= end and self._low_min.levels[k][pos] > level:
+                pos += step
+        return pos
+
+    def first_high_at_or_above(self, start, level, end=None):
+        """Primo indice k in [start, end) con high[k] >= level (end se non esiste)."""
+        end = self.n if end is None else min(end, self.n)
+        if start >= end or level != level:
+            return end
+        pos = start
+        for k in range(len(self._high_max.levels) - 1, -1, -1):
+            step = 1 << k
+            if pos + step <= end and self._high_max.levels[k][pos] < level:
+                pos += step
+        return pos
+
+    def resolve(self, side, start, sl, tp, end=None):
+        """
+        Restituisce (indice_barra, 'SL'|'TP') della prima barra in [start, end)
+        che tocca uno dei due livelli, oppure (None, None) se il trade resta aperto.
+        Se SL e TP cadono sulla stessa barra vince lo SL, come nei cicli per-barra.
+        """
+        end = self.n if end is None else min(end, self.n)
+        if str(side).upper() == 'LONG':
+            sl_idx = self.first_low_at_or_below(start, sl, end)
+            tp_idx = self.first_high_at_or_above(start, tp, end)
+        else:
+            sl_idx = self.first_high_at_or_above(start, sl, end)
+            tp_idx = self.first_low_at_or_below(start, tp, end)
+        if sl_idx >= end and tp_idx >= end:
+            return None, None
+        if sl_idx <= tp_idx:
+            return sl_idx, 'SL'
+        return tp_idx, 'TP'
+
+    def first_exit_bar(self, side, start, sl, tp, forced_exit_bars=None):
+        """
+        Indice della barra in cui il trade si chiude: la prima che tocca SL/TP
+        oppure, se viene prima, la prima barra di uscita forzata (es. flatten di
+        fine giornata). forced_exit_bars deve essere un array ordinato di indici.
+        Restituisce None se il trade resta aperto fino alla fine dei dati.
+        """
+        forced_bar = None
+        if forced_exit_bars is not None:
+            pos = np.searchsorted(forced_exit_bars, start)
+            if pos < len(forced_exit_bars):
+                forced_bar = int(forced_exit_bars[pos])
+        end = forced_bar + 1 if forced_bar is not None else None
+        exit_bar, _ = self.resolve(side, start, sl, tp, end=end)
+        return exit_bar if exit_bar is not None else forced_bar
+
+    # --- Versioni "batch": una ricerca per ogni elemento degli array di input ---
+
+    @staticmethod
+    def _walk_many(table, starts, levels, end, keep_going):
+        pos = starts.copy()
+        for k in range(len(table.levels) - 1, -1, -1):
+            step = 1 << k
+            fits = pos + step <= end
+            values = table.levels[k][np.where(fits, pos, 0)]
+            pos = np.where(fits & keep_going(values, levels), pos + step, pos)
+        return np.where(np.isnan(levels) | (starts >= end), end, pos)
+
+    def resolve_many(self, is_long, starts, sl, tp, end=None):
+        """
+        Come resolve() ma su array di trade (es. una colonna per combinazione di
+        parametri). Restituisce (indici_uscita, hit_sl, risolto): dove risolto è
+        False il trade resta aperto e l'indice vale `end`.
+        """
+        end = self.n if end is None else min(end, self.n)
+        starts = np.asarray(starts, dtype=np.int64)
+        sl, tp = np.asarray(sl, dtype=float), np.asarray(tp, dtype=float)
+        is_long = np.broadcast_to(np.asarray(is_long, dtype=bool), starts.shape)
+        sl_idx, tp_idx = np.empty_like(starts), np.empty_like(starts)
+        for side_mask, sl_table, tp_table, sl_go, tp_go in (
+                (is_long, self._low_min, self._high_max, np.greater, np.less),
+                (~is_long, self._high_max, self._low_min, np.less, np.greater)):
+            if side_mask.any():
+                sl_idx[side_mask] = self._walk_many(sl_table, starts[side_mask], sl[side_mask], end, sl_go)
+                tp_idx[side_mask] = self._walk_many(tp_table, starts[side_mask], tp[side_mask], end, tp_go)
+        hit_sl = sl_idx <= tp_idx
+        return np.where(hit_sl, sl_idx, tp_idx), hit_sl, (sl_idx < end) | (tp_idx < end)
@@ -0,0 +1,107 @@
+# analysis/indicator_cache.py - v1.1 (Cache Indicatori tra Trial)
+# Cache LRU limitata in memoria per le serie di indicatori (EMA, ATR, ...).
+# Ogni serie distinta viene calcolata una volta per dataset e riutilizzata da
+# tutti i trial dell'optimizer, dallo strategy_generator e dalla ricerca intraday.
+import logging
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # 256 MB per processo
+FINGERPRINT_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+
+def dataset_fingerprint(df: pd.DataFrame) -> tuple:
+    """
+    Impronta del dataset: numero di barre, primo/ultimo timestamp e CRC dell'intera
+    matrice OHLCV (timestamp compresi). Evita di servire serie calcolate su una
+    finestra diversa o su barre corrette a posteriori in una sola colonna.
+    """
+    if df.empty:
+        return (0,)
+    ts = df['timestamp'] if 'timestamp' in df.columns else df.index.to_series()
+    crc = zlib.crc32(np.ascontiguousarray(pd.to_datetime(ts).to_numpy(dtype='datetime64[ns]')).tobytes())
+    for col in FINGERPRINT_COLUMNS:
+        if col in df.columns:
+            crc = zlib.crc32(np.ascontiguousarray(df[col].to_numpy(dtype=float)).tobytes(), crc)
+    return (len(df), str(ts.iloc[0]), str(ts.iloc[-1]), crc)
+
+
+def _nbytes(value) -> int:
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=False).sum())
+    if isinstance(value, (pd.Series, np.ndarray)):
+        return int(value.nbytes)
+    return 0
+
+
+class IndicatorCache:
+    """Cache LRU con tetto in byte e contatori di hit/miss."""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key: tuple, compute):
+        """Restituisce la serie in cache per `key`, calcolandola con compute() se assente."""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+        self.misses += 1
+        value = compute()
+        size = _nbytes(value)
+        if size <= self.max_bytes:
+            self._entries[key] = value
+            self.bytes_used += size
+            self._evict()
+        return value
+
+    def _evict(self):
+        while self.bytes_used > self.max_bytes and self._entries:
+            _, value = self._entries.popitem(last=False)
+            self.bytes_used -= _nbytes(value)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes_used = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries), "bytes_used": self.bytes_used,
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def log_stats(self, label: str = ""):
+        s = self.stats()
+        logging.info(f"Cache indicatori {label}| hit {s['hits']} / miss {s['misses']} (ratio {s['hit_ratio']:.1%}) | "
+                     f"{s['entries']} serie, {s['bytes_used'] / 1e6:.1f} MB, {s['evictions']} evizioni")
+
+
+# Istanza condivisa a livello di processo (ogni worker del pool ha la propria)
+INDICATOR_CACHE = IndicatorCache()
+
+
+def cached_indicator(df: pd.DataFrame, dataset_key, indicator: str, compute, *args,
+                     cache: IndicatorCache = None, backend: str = 'pandas_ta'):
+    """
+    Serie di un indicatore per (symbol, timeframe, indicator, *parametri, backend) sul
+    dataset df. Il backend ('pandas_ta' o 'numba') fa parte della chiave: i kernel e
+    pandas_ta possono differire nell'ultima cifra e non devono servirsi a vicenda.
+    Senza dataset_key il calcolo viene eseguito direttamente, senza cache.
+    """
+    if dataset_key is None:
+        return compute()
+    cache = cache or INDICATOR_CACHE
+    key = (*tuple(dataset_key), indicator, *args, backend, dataset_fingerprint(df))
+    return cache.get_or_compute(key, compute)
@@ -0,0 +1,628 @@
+# analysis/kernels.py - v1.2 (Kernel Numerici per gli Indicatori Caldi)
+# Implementazioni su array float64 contigui degli indicatori che optimizer e
+# backtest ricalcolano milioni di volte con df.ta.*: EMA, SMA, media di Wilder
+# (RMA), ATR, RSI, ADX, Bande di Bollinger, massimo/minimo mobile e quantile
+# mobile. Niente DataFrame intermedi, concat o apply riga per riga: si lavora su
+# array NumPy e si restituiscono array NumPy.
+#
+# Le ricorsioni (ewm, rolling mean/var con compensazione di Kahan, min/max,
+# quantile) sono quelle di pandas e le formule quelle di pandas_ta 0.3.14b, quindi
+# i risultati coincidono bit per bit con le colonne pandas_ta. Con numba installato
+# i cicli vengono compilati (njit); senza numba le stesse ricorsioni vengono
+# delegate alle routine Cython di pandas chiamate direttamente sugli array, e la
+# parte elementare (true range, DM, bande) resta in NumPy vettoriale.
+#
+# Opt-in: KernelTA(df) espone ema/sma/rsi/atr/adx/bbands con la stessa firma e gli
+# stessi nomi di colonna di df.ta; ta_accessor(df, use_kernels) sceglie tra i due.
+#
+# Parità con pandas_ta/pandas (anche su NaN di warm-up, serie corte e prezzo costante)
+# e benchmark; codice di uscita 1 se un confronto differisce, 2 se manca pandas_ta:
+#   python -m analysis.kernels [--bars 5000] [--repeat 20]
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:  # numba è opzionale: si ripiega su NumPy + routine Cython di pandas
+    njit = None
+    HAVE_NUMBA = False
+
+EPSILON = sys.float_info.epsilon
+
+
+def _jit(func):
+    """njit (con cache su disco) se numba è disponibile, altrimenti la funzione Python così com'è."""
+    return njit(cache=True, nogil=True)(func) if HAVE_NUMBA else func
+
+
+def _as_array(values) -> np.ndarray:
+    """Series/lista/array -> array float64 contiguo (senza copia se lo è già)."""
+    if isinstance(values, (pd.Series, pd.Index)):
+        values = values.to_numpy(dtype=np.float64)
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+
+def _ewm_alpha(com=None, span=None, alpha=None) -> float:
+    """alpha come lo ricava pandas ewm(): passando sempre dal centro di massa."""
+    if span is not None:
+        com = (span - 1) / 2
+    elif alpha is not None:
+        com = (1 - alpha) / alpha
+    return 1.0 / (1.0 + float(com))
+
+
+def _min_periods(length, min_periods) -> int:
+    return length if min_periods is None else int(min_periods)
+
+
+# ==============================================================================
+# --- CICLI (COMPILATI CON NUMBA SE PRESENTE) ---
+# ==============================================================================
+
+@_jit
+def _ewm_mean_loop(values, alpha, adjust, min_periods):
+    n = len(values)
+    out = np.empty(n)
+    old_wt_factor = 1.0 - alpha
+    new_wt = 1.0 if adjust else alpha
+    minp = max(min_periods, 1)
+    weighted = np.nan
+    old_wt = 1.0
+    nobs = 0
+    for i in range(n):
+        cur = values[i]
+        is_observation = cur == cur
+        if is_observation:
+            nobs += 1
+        if weighted == weighted:
+            old_wt *= old_wt_factor
+            if is_observation:
+                if weighted != cur:
+                    weighted = old_wt * weighted + new_wt * cur
+                    weighted /= old_wt + new_wt
+                if adjust:
+                    old_wt += new_wt
+                else:
+                    old_wt = 1.0
+        elif is_observation:
+            weighted = cur
+        out[i] = weighted if nobs >= minp else np.nan
+    return out
+
+
+@_jit
+def _rolling_mean_loop(values, window, min_periods):
+    n = len(values)
+    out = np.empty(n)
+    nobs = neg_ct = same_count = 0
+    sum_x = comp_add = comp_remove = 0.0
+    prev_value = np.nan
+    for i in range(n):
+        if i == 0 or window == 1:  # prima finestra (o finestra di una barra): pandas riparte da zero
+            nobs = neg_ct = same_count = 0
+            sum_x = comp_add = comp_remove = 0.0
+            prev_value = np.nan
+            first = max(0, i - window + 1)
+        else:
+            first = i
+            if i >= window:
+                val = values[i - window]
+                if val == val:
+                    nobs -= 1
+                    y = -val - comp_remove
+                    t = sum_x + y
+                    comp_remove = t - sum_x - y
+                    sum_x = t
+                    if math.copysign(1.0, val) < 0:
+                        neg_ct -= 1
+        for j in range(first, i + 1):
+            val = values[j]
+            if val == val:
+                nobs += 1
+                y = val - comp_add
+                t = sum_x + y
+                comp_add = t - sum_x - y
+                sum_x = t
+                if math.copysign(1.0, val) < 0:
+                    neg_ct += 1
+                same_count = same_count + 1 if val == prev_value else 1
+                prev_value = val
+        if nobs >= min_periods and nobs > 0:
+            result = sum_x / nobs
+            if same_count >= nobs:
+                result = prev_value
+            elif (neg_ct == 0 and result < 0) or (neg_ct == nobs and result > 0):
+                result = 0.0
+            out[i] = result
+        else:
+            out[i] = np.nan
+    return out
+
+
+@_jit
+def _var_add(val, nobs, mean_x, ssqdm_x, comp, unstable):
+    if val != val:
+        return nobs, mean_x, ssqdm_x, comp, unstable
+    prev_m2 = ssqdm_x
+    nobs += 1.0
+    prev_mean = mean_x - comp
+    y = val - comp
+    t = y - mean_x
+    comp = t + mean_x - y
+    mean_x = mean_x + t / nobs
+    ssqdm_x = ssqdm_x + (val - prev_mean) * (val - mean_x)
+    if prev_m2 * (EPSILON * 1e3) > ssqdm_x:  # possibile cancellazione catastrofica
+        unstable = True
+    return nobs, mean_x, ssqdm_x, comp, unstable
+
+
+@_jit
+def _rolling_var_loop(values, window, ddof, min_periods):
+    n = len(values)
+    out = np.empty(n)
+    minp = max(min_periods, 1)
+    nobs = mean_x = ssqdm_x = comp_add = comp_remove = 0.0
+    unstable = False
+    for i in range(n):
+        recompute = i == 0 or window == 1
+        if not recompute:
+            if i >= window:
+                val = values[i - window]
+                if val == val:
+                    prev_m2 = ssqdm_x
+                    nobs -= 1.0
+                    if nobs:
+                        prev_mean = mean_x - comp_remove
+                        y = val - comp_remove
+                        t = y - mean_x
+                        comp_remove = t + mean_x - y
+                        mean_x = mean_x - t / nobs
+                        ssqdm_x = ssqdm_x - (val - prev_mean) * (val - mean_x)
+                        if prev_m2 * (EPSILON * 1e3) > ssqdm_x:
+                            unstable = True
+                    else:
+                        mean_x = ssqdm_x = 0.0
+                        unstable = False
+            nobs, mean_x, ssqdm_x, comp_add, unstable = _var_add(values[i], nobs, mean_x, ssqdm_x, comp_add, unstable)
+        if recompute or unstable:  # come pandas: la finestra viene ricalcolata da capo
+            nobs = mean_x = ssqdm_x = comp_add = comp_remove = 0.0
+            for j in range(max(0, i - window + 1), i + 1):
+                nobs, mean_x, ssqdm_x, comp_add, unstable = _var_add(values[j], nobs, mean_x, ssqdm_x, comp_add, unstable)
+            unstable = False
+        if nobs >= minp and nobs > ddof:
+            out[i] = ssqdm_x / (nobs - ddof)
+        else:
+            out[i] = np.nan
+    return out
+
+
+@_jit
+def _rolling_extreme_loop(values, window, min_periods, is_max):
+    # Coda monotona di indici: values[queue[head]] è sempre l'estremo della finestra
+    n = len(values)
+    out = np.empty(n)
+    queue = np.empty(n, dtype=np.int64)
+    head = tail = nobs = 0
+    minp = max(min_periods, 1)
+    for i in range(n):
+        val = values[i]
+        if val == val:
+            nobs += 1
+            while tail > head and ((values[queue[tail - 1]] <= val) if is_max else (values[queue[tail - 1]] >= val)):
+                tail -= 1
+            queue[tail] = i
+            tail += 1
+        if i >= window:
+            old = values[i - window]
+            if old == old:
+                nobs -= 1
+        while tail > head and queue[head] <= i - window:
+            head += 1
+        out[i] = values[queue[head]] if nobs >= minp and tail > head else np.nan
+    return out
+
+
+@_jit
+def _rolling_quantile_loop(values, window, quantile, min_periods):
+    # Finestra tenuta ordinata in un buffer (al posto della skiplist di pandas), interpolazione lineare
+    n = len(values)
+    out = np.empty(n)
+    ordered = np.empty(window + 1)
+    nobs = 0
+    for i in range(n):
+        if window == 1:
+            nobs = 0
+        elif i >= window:
+            old = values[i - window]
+            if old == old:
+                k = np.searchsorted(ordered[:nobs], old)
+                for j in range(k, nobs - 1):
+                    ordered[j] = ordered[j + 1]
+                nobs -= 1
+        val = values[i]
+        if val == val:
+            k = np.searchsorted(ordered[:nobs], val, side='right')
+            for j in range(nobs, k, -1):
+                ordered[j] = ordered[j - 1]
+            ordered[k] = val
+            nobs += 1
+        if nobs >= min_periods and nobs > 0:
+            if nobs == 1:
+                out[i] = ordered[0]
+            else:
+                idx_with_fraction = quantile * (nobs - 1)
+                idx = int(idx_with_fraction)
+                if idx_with_fraction == idx:
+                    out[i] = ordered[idx]
+                else:
+                    vlow, vhigh = ordered[idx], ordered[idx + 1]
+                    out[i] = vlow + (vhigh - vlow) * (idx_with_fraction - idx)
+        else:
+            out[i] = np.nan
+    return out
+
+
+# ==============================================================================
+# --- MATTONI: EWM E FINESTRE MOBILI ---
+# ==============================================================================
+
+def ewm_mean(values, com=None, span=None, alpha=None, adjust=True, min_periods=0) -> np.ndarray:
+    """pandas Series.ewm(com|span|alpha, adjust, min_periods).mean() su un array."""
+    values = _as_array(values)
+    if HAVE_NUMBA:
+        return _ewm_mean_loop(values, _ewm_alpha(com, span, alpha), bool(adjust), int(min_periods))
+    return pd.Series(values).ewm(com=com, span=span, alpha=alpha, adjust=adjust, min_periods=min_periods).mean().to_numpy()
+
+
+def rolling_mean(values, length, min_periods=None) -> np.ndarray:
+    """pandas rolling(length, min_periods).mean()."""
+    values, minp = _as_array(values), _min_periods(length, min_periods)
+    if HAVE_NUMBA:
+        return _rolling_mean_loop(values, int(length), minp)
+    return pd.Series(values).rolling(length, min_periods=minp).mean().to_numpy()
+
+
+def rolling_var(values, length, ddof=1, min_periods=None) -> np.ndarray:
+    """pandas rolling(length, min_periods).var(ddof)."""
+    values, minp = _as_array(values), _min_periods(length, min_periods)
+    if HAVE_NUMBA:
+        return _rolling_var_loop(values, int(length), int(ddof), minp)
+    return pd.Series(values).rolling(length, min_periods=minp).var(ddof=ddof).to_numpy()
+
+
+def rolling_std(values, length, ddof=1, min_periods=None) -> np.ndarray:
+    """pandas rolling().std(ddof): radice della varianza (negativi numerici -> 0)."""
+    var = rolling_var(values, length, ddof, min_periods)
+    with np.errstate(invalid='ignore'):
+        return np.where(var < 0, 0.0, np.sqrt(var))
+
+
+def rolling_max(values, length, min_periods=None) -> np.ndarray:
+    """pandas rolling(length, min_periods).max() (i NaN vengono saltati)."""
+    values, minp = _as_array(values), _min_periods(length, min_periods)
+    if HAVE_NUMBA:
+        return _rolling_extreme_loop(values, int(length), minp, True)
+    return pd.Series(values).rolling(length, min_periods=minp).max().to_numpy()
+
+
+def rolling_min(values, length, min_periods=None) -> np.ndarray:
+    """pandas rolling(length, min_periods).min() (i NaN vengono saltati)."""
+    values, minp = _as_array(values), _min_periods(length, min_periods)
+    if HAVE_NUMBA:
+        return _rolling_extreme_loop(values, int(length), minp, False)
+    return pd.Series(values).rolling(length, min_periods=minp).min().to_numpy()
+
+
+def rolling_quantile(values, length, quantile, min_periods=None) -> np.ndarray:
+    """pandas rolling(length, min_periods).quantile(q) con interpolazione lineare."""
+    if quantile < 0.0 or quantile > 1.0:
+        raise ValueError(f"quantile value {quantile} not in [0, 1]")
+    values, minp = _as_array(values), _min_periods(length, min_periods)
+    if HAVE_NUMBA:
+        return _rolling_quantile_loop(values, int(length), float(quantile), minp)
+    return pd.Series(values).rolling(length, min_periods=minp).quantile(quantile).to_numpy()
+
+
+def _non_zero_range(high, low) -> np.ndarray:
+    """non_zero_range di pandas_ta: se una differenza è nulla si aggiunge epsilon a TUTTE."""
+    diff = high - low
+    return diff + EPSILON if (diff == 0).any() else diff
+
+
+# ==============================================================================
+# --- INDICATORI PANDAS_TA ---
+# ==============================================================================
+
+def sma(close, length=10) -> np.ndarray:
+    """SMA_<length> di pandas_ta."""
+    return rolling_mean(close, length)
+
+
+def ema(close, length=10) -> np.ndarray:
+    """EMA_<length> di pandas_ta: seed con la SMA delle prime `length` chiusure, poi ewm(span, adjust=False)."""
+    close = _as_array(close).copy()
+    if len(close) >= length:
+        seed = np.nansum(close[:length]) / length
+        close[:length - 1] = np.nan
+        close[length - 1] = seed
+    return ewm_mean(close, span=length, adjust=False)
+
+
+def rma(values, length=10) -> np.ndarray:
+    """Media di Wilder di pandas_ta: ewm(alpha=1/length, min_periods=length)."""
+    return ewm_mean(values, alpha=1.0 / length, min_periods=length)
+
+
+def true_range(high, low, close) -> np.ndarray:
+    """True range di pandas_ta (prima barra NaN, epsilon sulle candele piatte)."""
+    high, low, close = _as_array(high), _as_array(low), _as_array(close)
+    prev_close = np.empty_like(close)
+    prev_close[:1] = np.nan
+    prev_close[1:] = close[:-1]
+    tr = np.fmax(np.fmax(np.abs(_non_zero_range(high, low)), np.abs(high - prev_close)), np.abs(prev_close - low))
+    tr[:1] = np.nan
+    return tr
+
+
+def atr(high, low, close, length=14) -> np.ndarray:
+    """ATRr_<length> di pandas_ta: RMA del true range."""
+    return rma(true_range(high, low, close), length)
+
+
+def rsi(close, length=14) -> np.ndarray:
+    """RSI_<length> di pandas_ta: RMA dei rialzi e dei ribassi di chiusura."""
+    close = _as_array(close)
+    change = np.empty_like(close)
+    change[:1] = np.nan
+    change[1:] = close[1:] - close[:-1]
+    gain = np.where(change < 0, 0.0, change)
+    loss = np.where(change > 0, 0.0, change)
+    gain_avg, loss_avg = rma(gain, length), rma(loss, length)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 * gain_avg / (gain_avg + np.abs(loss_avg))
+
+
+def adx(high, low, close, length=14):
+    """(ADX_<length>, DMP_<length>, DMN_<length>) di pandas_ta."""
+    high, low = _as_array(high), _as_array(low)
+    atr_ = atr(high, low, close, length)
+    up, down = np.full_like(high, np.nan), np.full_like(low, np.nan)
+    up[1:] = high[1:] - high[:-1]
+    down[1:] = low[:-1] - low[1:]
+    with np.errstate(invalid='ignore'):
+        pos = np.where((up > down) & (up > 0), up, 0.0 * up)
+        neg = np.where((down > up) & (down > 0), down, 0.0 * down)
+    pos[np.abs(pos) < EPSILON] = 0.0  # come zero() di pandas_ta
+    neg[np.abs(neg) < EPSILON] = 0.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k = 100 / atr_
+        dmp, dmn = k * rma(pos, length), k * rma(neg, length)
+        dx = 100 * np.abs(dmp - dmn) / (dmp + dmn)
+    return rma(dx, length), dmp, dmn
+
+
+def bbands(close, length=5, std=2.0):
+    """(BBL, BBM, BBU, BBB, BBP) di pandas_ta: SMA +- std * deviazione standard (ddof=0)."""
+    close = _as_array(close)
+    mid = rolling_mean(close, length)
+    with np.errstate(invalid='ignore'):
+        deviations = std * np.sqrt(rolling_var(close, length, ddof=0))
+    lower, upper = mid - deviations, mid + deviations
+    band = _non_zero_range(upper, lower)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return lower, mid, upper, 100 * band / mid, _non_zero_range(close, lower) / band
+
+
+# ==============================================================================
+# --- OPT-IN: STESSA INTERFACCIA DI df.ta ---
+# ==============================================================================
+
+class KernelTA:
+    """
+    Sottoinsieme di df.ta (ema, sma, rsi, atr, adx, bbands) calcolato con i kernel.
+    Stessi argomenti, stessi nomi di colonna e stesso comportamento di append/col_names;
+    come pandas_ta restituisce None (e non aggiunge nulla) se le barre sono meno di length.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self._df = df
+
+    def _column(self, name):
+        return self._df[name].to_numpy(dtype=np.float64)
+
+    def _finish(self, result, append, col_names):
+        if append:
+            if isinstance(result, pd.DataFrame):
+                for name in result.columns:
+                    self._df[name] = result[name]
+            else:
+                self._df[col_names or result.name] = result
+        return result
+
+    def _series(self, values, name, append, col_names):
+        return self._finish(pd.Series(values, index=self._df.index, name=name), append, col_names)
+
+    def ema(self, length=10, append=False, col_names=None, **kwargs):
+        if len(self._df) < length:
+            return None
+        return self._series(ema(self._column('close'), length), f"EMA_{length}", append, col_names)
+
+    def sma(self, length=10, append=False, col_names=None, **kwargs):
+        if len(self._df) < length:
+            return None
+        return self._series(sma(self._column('close'), length), f"SMA_{length}", append, col_names)
+
+    def rsi(self, length=14, append=False, col_names=None, **kwargs):
+        if len(self._df) < length:
+            return None
+        return self._series(rsi(self._column('close'), length), f"RSI_{length}", append, col_names)
+
+    def atr(self, length=14, append=False, col_names=None, **kwargs):
+        if len(self._df) < length:
+            return None
+        values = atr(self._column('high'), self._column('low'), self._column('close'), length)
+        return self._series(values, f"ATRr_{length}", append, col_names)
+
+    def adx(self, length=14, append=False, **kwargs):
+        if len(self._df) < length:
+            return None
+        adx_, dmp, dmn = adx(self._column('high'), self._column('low'), self._column('close'), length)
+        result = pd.DataFrame({f"ADX_{length}": adx_, f"DMP_{length}": dmp, f"DMN_{length}": dmn}, index=self._df.index)
+        return self._finish(result, append, None)
+
+    def bbands(self, length=5, std=2.0, append=False, **kwargs):
+        if len(self._df) < length:
+            return None
+        suffix = f"{length}_{float(std)}"
+        columns = (f"BBL_{suffix}", f"BBM_{suffix}", f"BBU_{suffix}", f"BBB_{suffix}", f"BBP_{suffix}")
+        result = pd.DataFrame(dict(zip(columns, bbands(self._column('close'), length, float(std)))), index=self._df.index)
+        return self._finish(result, append, None)
+
+
+def ta_accessor(df: pd.DataFrame, use_kernels: bool = False):
+    """df.ta oppure KernelTA(df): le strategie chiamano ta_accessor(df, use_kernels).adx(...)."""
+    return KernelTA(df) if use_kernels else df.ta
+
+
+# ==============================================================================
+# --- PARITÀ CON PANDAS_TA E BENCHMARK ---
+# ==============================================================================
+
+def _synthetic_ohlcv(bars: int, seed: int = 7) -> pd.DataFrame:
+    """OHLCV a passeggiata casuale con qualche candela piatta (per l'epsilon di pandas_ta)."""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.004, bars)))
+    open_ = np.r_[close[0], close[:-1]]
+    spread = np.abs(rng.normal(0, 0.003, bars)) * close
+    high, low = np.maximum(open_, close) + spread, np.minimum(open_, close) - spread
+    flat = rng.random(bars) < 0.01
+    high[flat] = low[flat] = close[flat] = open_[flat]
+    return pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close,
+                         'volume': rng.gamma(2.0, 50.0, bars)},
+                        index=pd.date_range('2024-01-01', periods=bars, freq='5min', tz='UTC'))
+
+
+def _pandas_cases(df):
+    """Mattoni confrontati direttamente con pandas (sempre eseguibili): (nome, riferimento, kernel)."""
+    c, v = df['close'], df['volume']
+    return [
+        ('EWM_SPAN9', lambda: c.ewm(span=9).mean(), lambda: ewm_mean(c, span=9)),
+        ('EWM_COM4_NOADJ', lambda: c.ewm(com=4, adjust=False).mean(), lambda: ewm_mean(c, com=4, adjust=False)),
+        ('EWM_A0.1_MINP20', lambda: c.ewm(alpha=0.1, min_periods=20).mean(), lambda: ewm_mean(c, alpha=0.1, min_periods=20)),
+        ('ROLL_MEAN_30', lambda: c.rolling(30).mean(), lambda: rolling_mean(c, 30)),
+        ('ROLL_MEAN_30_MINP5', lambda: c.rolling(30, min_periods=5).mean(), lambda: rolling_mean(c, 30, min_periods=5)),
+        ('ROLL_MEAN_1', lambda: c.rolling(1).mean(), lambda: rolling_mean(c, 1)),
+        ('ROLL_VAR_30', lambda: c.rolling(30).var(), lambda: rolling_var(c, 30)),
+        ('ROLL_VAR_30_DDOF0', lambda: c.rolling(30).var(ddof=0), lambda: rolling_var(c, 30, ddof=0)),
+        ('ROLL_STD_20', lambda: v.rolling(20).std(), lambda: rolling_std(v, 20)),
+        ('VOL_STD_20', lambda: v.rolling(20).std(ddof=0), lambda: rolling_std(v, 20, ddof=0)),
+        ('ROLL_MAX_40', lambda: df['high'].rolling(40).max(), lambda: rolling_max(df['high'], 40)),
+        ('ROLL_MIN_40', lambda: df['low'].rolling(40).min(), lambda: rolling_min(df['low'], 40)),
+        ('ROLL_MAX_40_MINP1', lambda: c.rolling(40, min_periods=1).max(), lambda: rolling_max(c, 40, min_periods=1)),
+        ('ROLL_Q10_365', lambda: c.rolling(365, min_periods=100).quantile(0.10),
+         lambda: rolling_quantile(c, 365, 0.10, min_periods=100)),
+        ('ROLL_Q50_20', lambda: v.rolling(20).quantile(0.5), lambda: rolling_quantile(v, 20, 0.5)),
+        ('ROLL_Q0_20', lambda: c.rolling(20).quantile(0.0), lambda: rolling_quantile(c, 20, 0.0)),
+        ('ROLL_Q100_20', lambda: c.rolling(20).quantile(1.0), lambda: rolling_quantile(c, 20, 1.0)),
+    ]
+
+
+def _ta_cases(df):
+    """Indicatori confrontati con pandas_ta, tramite df.ta e KernelTA (stessa interfaccia, None se corto)."""
+    import pandas_ta as ta  # noqa: F401 (registra l'accessor df.ta)
+    h, l, c = (df[col].to_numpy() for col in ('high', 'low', 'close'))
+    k = KernelTA(df)
+    short = lambda n: len(df) < n
+    cases = [
+        ('EMA_20', lambda: df.ta.ema(length=20), lambda: k.ema(length=20)),
+        ('EMA_200', lambda: df.ta.ema(length=200), lambda: k.ema(length=200)),
+        ('SMA_50', lambda: df.ta.sma(length=50), lambda: k.sma(length=50)),
+        ('RMA_19', lambda: ta.rma(df['close'], length=19), lambda: None if short(19) else rma(c, 19)),
+        ('TRUE_RANGE', lambda: ta.true_range(df['high'], df['low'], df['close']), lambda: true_range(h, l, c)),
+        ('ATRr_14', lambda: df.ta.atr(length=14), lambda: k.atr(length=14)),
+        ('RSI_14', lambda: df.ta.rsi(length=14), lambda: k.rsi(length=14)),
+        ('ADX_14', lambda: df.ta.adx(length=14), lambda: k.adx(length=14)),
+        ('BBANDS_20_2.0', lambda: df.ta.bbands(length=20, std=2.0), lambda: k.bbands(length=20, std=2.0)),
+        ('BBANDS_5_1.5', lambda: df.ta.bbands(length=5, std=1.5), lambda: k.bbands(length=5, std=1.5)),
+    ]
+    if not short(14):
+        rsi_ = df.ta.rsi(length=14)
+        cases.append(('RSI_ROLL_Q10', lambda: rsi_.rolling(365, min_periods=100).quantile(0.10),
+                      lambda: rolling_quantile(rsi_.to_numpy(), 365, 0.10, min_periods=100)))
+    return cases
+
+
+def _edge_datasets(bars: int):
+    """Casi limite: warm-up con NaN (in testa e in mezzo), serie più corta dei periodi, prezzo costante."""
+    warmup = _synthetic_ohlcv(max(bars // 5, 400), seed=11)
+    warmup.iloc[:30, :4] = np.nan
+    warmup.iloc[200, :4] = np.nan
+    flat = _synthetic_ohlcv(300, seed=5).assign(open=100.0, high=100.0, low=100.0, close=100.0)
+    return [('nan_warmup', warmup), ('corta_12', _synthetic_ohlcv(12, seed=3)), ('costante', flat)]
+
+
+def _same(expected, got) -> bool:
+    """Parità bit per bit; None (pandas_ta con meno barre di length) deve corrispondere a None."""
+    if expected is None or got is None:
+        return expected is None and got is None
+    expected = np.asarray(expected, dtype=np.float64)
+    return np.array_equal(expected, np.asarray(got, dtype=np.float64).reshape(expected.shape), equal_nan=True)
+
+
+def _timeit(func, repeat):
+    func()  # riscaldamento (compilazione JIT alla prima chiamata)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _main(argv=None):
+    parser = argparse.ArgumentParser(description="Parità dei kernel con pandas_ta/pandas e benchmark per chiamata.")
+    parser.add_argument('--bars', type=int, default=5000, help="Barre del dataset sintetico")
+    parser.add_argument('--repeat', type=int, default=20, help="Ripetizioni per misura (si tiene la migliore)")
+    args = parser.parse_args(argv)
+
+    try:
+        import pandas_ta  # noqa: F401
+        have_ta = True
+    except ImportError:
+        have_ta = False
+
+    df = _synthetic_ohlcv(args.bars)
+    print(f"Backend: {'numba ' + __import__('numba').__version__ if HAVE_NUMBA else 'NumPy + pandas (numba non installato)'} "
+          f"| {args.bars} barre")
+    print(f"{'indicatore':<20}{'parità':>8}{'riferimento µs':>16}{'kernel µs':>12}{'speedup':>10}")
+    failures = 0
+    for name, reference, kernel in _pandas_cases(df) + (_ta_cases(df) if have_ta else []):
+        same = _same(reference(), kernel())
+        failures += not same
+        t_ref, t_kernel = _timeit(reference, args.repeat), _timeit(kernel, args.repeat)
+        print(f"{name:<20}{'ok' if same else 'DIFF':>8}{t_ref * 1e6:>16,.0f}{t_kernel * 1e6:>12,.0f}{t_ref / t_kernel:>9.1f}x")
+
+    for label, data in _edge_datasets(args.bars):
+        cases = _pandas_cases(data) + (_ta_cases(data) if have_ta else [])
+        diff = [name for name, reference, kernel in cases if not _same(reference(), kernel())]
+        failures += len(diff)
+        print(f"caso limite {label:<12} {len(data):>5} barre: {'ok' if not diff else 'DIFF ' + ', '.join(diff)}")
+
+    if failures:
+        print(f"{failures} confronti diversi dal riferimento.")
+        return 1
+    if not have_ta:
+        print("pandas_ta non installato: verificati solo i mattoni contro pandas, indicatori NON verificati.")
+        return 2
+    print("Parità bit per bit su tutti i kernel e i casi limite.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
@@ -1,20 +1,35 @@
-# analysis/market_analysis.py - v14.0 (Strategy Building Blocks)
+# analysis/market_analysis.py - v14.2 (Strategy Building Blocks)
 import pandas as pd
 import pandas_ta as ta
 import logging
 import json
 
 import database as db
+from analysis.indicator_cache import cached_indicator
+from analysis.kernels import ta_accessor
 
 # ==============================================================================
 # --- LIBRERIA DI BLOCCHI LOGICI (I nostri "LEGO") ---
 # ==============================================================================
 
-def add_indicators(df, params):
-    """Aggiunge al DataFrame tutti gli indicatori necessari per una strategia."""
-    df.ta.ema(length=params['ema_fast'], append=True, col_names=f"EMA_{params['ema_fast']}")
-    df.ta.ema(length=params['ema_slow'], append=True, col_names=f"EMA_{params['ema_slow']}")
-    df.ta.atr(length=params['atr_len'], append=True, col_names=f"ATR_{params['atr_len']}")
+def add_indicators(df, params, dataset_key=None, use_kernels=False):
+    """
+    Aggiunge al DataFrame tutti gli indicatori necessari per una strategia.
+    Con dataset_key=(symbol, timeframe) le serie vengono servite dalla cache
+    indicatori condivisa tra i trial (calcolate una sola volta per dataset).
+    Con use_kernels=True EMA e ATR vengono calcolati con analysis.kernels
+    (stessi valori di pandas_ta, senza l'overhead dei DataFrame).
+    """
+    ta_ = ta_accessor(df, use_kernels)
+    if dataset_key is None:
+        ta_.ema(length=params['ema_fast'], append=True, col_names=f"EMA_{params['ema_fast']}")
+        ta_.ema(length=params['ema_slow'], append=True, col_names=f"EMA_{params['ema_slow']}")
+        ta_.atr(length=params['atr_len'], append=True, col_names=f"ATR_{params['atr_len']}")
+    else:
+        backend = 'numba' if use_kernels else 'pandas_ta'
+        for name, length in (('EMA', params['ema_fast']), ('EMA', params['ema_slow']), ('ATR', params['atr_len'])):
+            compute = (lambda l=length: ta_.ema(length=l)) if name == 'EMA' else (lambda l=length: ta_.atr(length=l))
+            df[f"{name}_{length}"] = cached_indicator(df, dataset_key, name, compute, length, backend=backend).to_numpy()
     df['EMA_SLOW_SLOPE'] = df[f"EMA_{params['ema_slow']}"].diff()
     return df
 
@@ -57,6 +72,12 @@ def check_pullback_entry_condition(df, trend, params):
     
     return False
 
+# Direzioni per cui calculate_sl_tp apre un trade. Riceve il trend di check_trend_condition
+# ('UP'/'DOWN'/'NONE'): il ramo long scatta solo per 'LONG', quindi i blueprint aprono solo short.
+# signal_engine.sl_tp_arrays e optimization.sweep replicano gli stessi rami da qui.
+LONG_DIRECTIONS = ('LONG',)
+SHORT_DIRECTIONS = ('DOWN',)  # Corretto da 'SHORT' a 'DOWN' per coerenza
+
 def calculate_sl_tp(df, direction, params):
     """Calcola entry, stop loss e take profit basati sulla logica della strategia."""
     confirmation_candle = df.iloc[-2]
@@ -65,7 +86,7 @@ def calculate_sl_tp(df, direction, params):
     rr_ratio = params.get('rr_ratio', 3.0) # Default più aggressivo
     atr_mult_sl = params.get('atr_mult_sl', 2.5) # Default più ampio
 
-    if direction == 'LONG':
+    if direction in LONG_DIRECTIONS:
         entry_price = confirmation_candle['high']
         stop_loss = setup_candle['low'] - (confirmation_candle[atr_col_name] * (atr_mult_sl - 1.0))
         if stop_loss >= entry_price: return None, None, None
@@ -73,7 +94,7 @@ def calculate_sl_tp(df, direction, params):
         take_profit = entry_price + (risk * rr_ratio)
         return entry_price, stop_loss, take_profit
     
-    if direction == 'DOWN': # Corretto da 'SHORT' a 'DOWN' per coerenza
+    if direction in SHORT_DIRECTIONS:
         entry_price = confirmation_candle['low']
         stop_loss = setup_candle['high'] + (confirmation_candle[atr_col_name] * (atr_mult_sl - 1.0))
         if stop_loss <= entry_price: return None, None, None
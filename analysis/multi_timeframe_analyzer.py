@@ -1,8 +1,11 @@
-# analysis/multi_timeframe_analyzer.py (Patch 1)
+# analysis/multi_timeframe_analyzer.py (Patch 2 - timeframe superiori derivati dal più fine)
 import pandas as pd
 import pandas_ta as ta
 from analysis.phoenix_signal_v91 import phoenix_signal_v91
 from analysis.phoenix_momentum import phoenix_momentum
+from analysis.resampler import fetch_timeframes
+
+TIMEFRAME_LIMIT = 500  # candele per timeframe analizzate
 
 def _prepare_indicators(df, adx_len=14, rsi_len=14, atr_len=14):
     df.ta.adx(length=adx_len, append=True)
@@ -11,8 +14,9 @@ def _prepare_indicators(df, adx_len=14, rsi_len=14, atr_len=14):
     df.dropna(inplace=True)
     return df
 
-def analyze_single_timeframe(symbol, timeframe, data_client, config):
-    df = data_client.get_klines(symbol, timeframe, config.DATA_SOURCE, limit=500)
+def analyze_single_timeframe(symbol, timeframe, data_client, config, df=None):
+    if df is None:
+        df = data_client.get_klines(symbol, timeframe, config.DATA_SOURCE, limit=500)
     if df is None or df.empty or len(df) < 50: return None
     df = _prepare_indicators(df, config.ADX_PERIOD, config.RSI_PERIOD, config.ATR_PERIOD)
     signals = phoenix_signal_v91(df)
@@ -22,11 +26,16 @@ def analyze_single_timeframe(symbol, timeframe, data_client, config):
     best["timeframe"] = timeframe
     return best
 
-def analyze_multi_timeframes(symbol, data_client, config):
+def analyze_multi_timeframes(symbol, data_client, config, frames=None):
     labels = {"1d": "Daily", "4h": "4H", "15m": "15m"}
     results = {}
+    # Poche serie base (dall'archivio locale): i timeframe superiori si ricavano in locale.
+    # frames: risultato di fetch_timeframes già scaricato dal runner (es. in parallelo per tutti gli asset)
+    if frames is None:
+        frames = fetch_timeframes(data_client, symbol, config.ACTIVE_TIMEFRAMES, config.DATA_SOURCE, limit=TIMEFRAME_LIMIT)
     for tf in config.ACTIVE_TIMEFRAMES:
-        best = analyze_single_timeframe(symbol, tf, data_client, config)
+        if tf not in frames: continue
+        best = analyze_single_timeframe(symbol, tf, data_client, config, df=frames[tf].copy())
         if best: results[labels[tf]] = best
     coherence = None
     if "Daily" in results and "4H" in results:
@@ -0,0 +1,228 @@
+# analysis/resampler.py - v1.1 (Timeframe Superiori Derivati dal Timeframe Base)
+# Invece di scaricare 15m, 4h e 1d separatamente, si scarica (o si legge
+# dall'archivio OHLCV) solo il timeframe più fine e si derivano gli altri in
+# locale. I bucket sono quelli degli exchange: allineati all'epoca UTC
+# (00:00, 04:00, 08:00... per il 4h, mezzanotte UTC per il giornaliero) e al
+# lunedì 00:00 UTC per il settimanale. Aggregazione: open = primo, high = max,
+# low = min, close = ultimo, volume = somma.
+#
+# Una candela derivata è "parziale" se non è ancora chiusa (termina dopo `now`) o
+# se le mancano candele base: con partial='keep' resta in coda come la candela in
+# formazione restituita dall'exchange, con 'flag' si aggiunge la colonna booleana
+# 'partial', con 'drop' viene scartata.
+#
+# Ogni timeframe si ricava dal più fine per cui bastano MAX_BASE_BARS candele base: con
+# limit=500, il 4h e il 1d si ricavano dal 4h (3000 righe), non da 48000 candele da 15m.
+#
+# IncrementalResampler fa lo stesso su un flusso di candele base chiuse (feed
+# WebSocket) e segnala le candele derivate appena si chiudono.
+import time
+
+import numpy as np
+import pandas as pd
+
+from infra.kline_decoder import matrix_frame
+from infra.ohlcv_store import OHLCV_COLUMNS, OHLCVArrays, interval_ms, to_ms
+from infra.ring_buffer import OHLCVRing
+
+WEEK_MS = interval_ms('1w')
+WEEK_OFFSET_MS = 4 * interval_ms('1d')  # 1970-01-01 era giovedì: le settimane degli exchange partono dal lunedì
+MAX_BASE_BARS = 5000                    # candele base al massimo per ricavare un timeframe
+
+
+def bucket_start(stamps_ms, step: int):
+    """Apertura del bucket (ms) che contiene ogni timestamp, per una candela di durata step."""
+    offset = WEEK_OFFSET_MS if step % WEEK_MS == 0 else 0
+    return (stamps_ms - offset) // step * step + offset
+
+
+def _check_steps(base_step: int, step: int):
+    if step < base_step or step % base_step:
+        raise ValueError(f"Impossibile derivare candele da {step} ms da candele da {base_step} ms.")
+
+
+def resample_matrix(matrix: np.ndarray, base_step: int, step: int, now_ms: int = None):
+    """
+    Matrice (6, n) nel layout di OHLCVArrays, ordinata e senza duplicati -> (matrice derivata, partial).
+    partial[k] è True se al bucket k mancano candele base o se non è ancora chiuso a now_ms.
+    """
+    _check_steps(base_step, step)
+    stamps = matrix[0].view(np.int64)
+    if not len(stamps):
+        return np.empty((1 + len(OHLCV_COLUMNS), 0)), np.zeros(0, dtype=bool)
+    buckets = bucket_start(stamps, step)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(stamps)] - 1
+    out = np.empty((1 + len(OHLCV_COLUMNS), len(starts)))
+    out[0].view(np.int64)[:] = buckets[starts]
+    out[1] = matrix[1, starts]
+    out[2] = np.maximum.reduceat(matrix[2], starts)
+    out[3] = np.minimum.reduceat(matrix[3], starts)
+    out[4] = matrix[4, ends]
+    out[5] = np.add.reduceat(matrix[5], starts)
+    partial = (ends - starts + 1) < step // base_step
+    if now_ms is not None:
+        partial |= buckets[starts] + step > now_ms
+    return out, partial
+
+
+def _base_step(index: pd.DatetimeIndex) -> int:
+    """Durata della candela base dedotta dall'indice (differenza minima tra timestamp consecutivi)."""
+    stamps = index.as_unit('ms').asi8
+    if len(stamps) < 2:
+        raise ValueError("Servono almeno due candele per dedurre il timeframe base: passare base_timeframe.")
+    return int(np.diff(stamps).min())
+
+
+def resample_ohlcv(df: pd.DataFrame, timeframe: str, base_timeframe: str = None, now=None, partial: str = 'keep') -> pd.DataFrame:
+    """
+    DataFrame OHLCV con DatetimeIndex (UTC o naive UTC, come get_klines) -> candele di `timeframe`,
+    con lo stesso tipo di indice. now (default: adesso) decide quali bucket sono ancora aperti;
+    partial: 'keep', 'flag' (colonna booleana 'partial') o 'drop'.
+    """
+    if partial not in ('keep', 'flag', 'drop'):
+        raise ValueError(f"partial non valido: {partial}")
+    if df is None or df.empty:
+        return pd.DataFrame()
+    index = df.index.sort_values() if not df.index.is_monotonic_increasing else df.index
+    base_step = interval_ms(base_timeframe) if base_timeframe else _base_step(index)
+    matrix = np.empty((1 + len(OHLCV_COLUMNS), len(df)))
+    matrix[0].view(np.int64)[:] = df.index.as_unit('ms').asi8
+    for row, col in enumerate(OHLCV_COLUMNS, start=1):
+        matrix[row] = df[col].to_numpy(dtype=np.float64)
+    if index is not df.index:
+        matrix = matrix[:, np.argsort(matrix[0].view(np.int64), kind='stable')]
+    now_ms = int(time.time() * 1000) if now is None else to_ms(now)
+    out, flags = resample_matrix(matrix, base_step, interval_ms(timeframe), now_ms)
+    if partial == 'drop':
+        out, flags = out[:, ~flags], flags[~flags]
+    frame = matrix_frame(out, utc=df.index.tz is not None)
+    if partial == 'flag':
+        frame['partial'] = flags
+    return frame
+
+
+def derive_timeframes(df_base: pd.DataFrame, timeframes, base_timeframe: str, now=None, limit: int = None) -> dict:
+    """{timeframe: DataFrame} derivati da df_base (ultime `limit` candele, parziale inclusa come da exchange)."""
+    frames = {}
+    for tf in timeframes:
+        df = df_base if interval_ms(tf) == interval_ms(base_timeframe) else resample_ohlcv(df_base, tf, base_timeframe, now)
+        frames[tf] = df.iloc[-limit:] if limit else df
+    return frames
+
+
+def timeframe_sources(timeframes, limit: int, max_base_bars: int = MAX_BASE_BARS) -> dict:
+    """
+    {timeframe base: [timeframe ricavati]}: ogni timeframe si ricava dal più fine dell'elenco
+    che lo divide e per cui le sue `limit` candele richiedono al massimo max_base_bars candele base.
+    """
+    timeframes = sorted(set(timeframes), key=interval_ms)
+    sources = {}
+    for tf in timeframes:
+        step = interval_ms(tf)
+        base = next((b for b in timeframes if step % interval_ms(b) == 0 and limit * (step // interval_ms(b)) <= max_base_bars), tf)
+        sources.setdefault(base, []).append(tf)
+    return sources
+
+
+def timeframe_requests(symbol: str, timeframes, source: str = 'bybit', limit: int = 500, now=None,
+                       max_base_bars: int = MAX_BASE_BARS) -> dict:
+    """
+    {timeframe base: (symbol, base, source, limit, start_ms, end_ms)}: le richieste get_klines di
+    fetch_timeframes. start_ms è allineato al bucket del timeframe più largo ricavato da quella base,
+    quindi resta uguale (e condivisibile dalla cache) finché quel bucket non si chiude.
+    """
+    now_ms = int(time.time() * 1000) if now is None else to_ms(now)
+    requests = {}
+    for base, derived in timeframe_sources(timeframes, limit, max_base_bars).items():
+        widest = max(interval_ms(tf) for tf in derived)
+        start_ms = int(bucket_start(now_ms - limit * widest, widest))
+        requests[base] = (symbol, base, source, limit, start_ms, now_ms)
+    return requests
+
+
+def fetch_timeframes(data_client, symbol: str, timeframes, source: str = 'bybit', limit: int = 500, now=None) -> dict:
+    """
+    Ultime `limit` candele di ogni timeframe ricavate da poche serie base (timeframe_sources), lette
+    tramite get_klines(start_time, end_time) e quindi dall'archivio OHLCV locale (dall'API arrivano
+    solo le candele mancanti). Restituisce {timeframe: DataFrame}; mancano i timeframe il cui download fallisce.
+    """
+    now_ms = int(time.time() * 1000) if now is None else to_ms(now)
+    sources = timeframe_sources(timeframes, limit)
+    frames = {}
+    for base, request in timeframe_requests(symbol, timeframes, source, limit, now_ms).items():
+        df_base = data_client.get_klines(symbol, base, source, start_time=request[4], end_time=request[5])
+        if df_base is None or df_base.empty:
+            continue
+        frames.update(derive_timeframes(df_base, sources[base], base, now_ms, limit))
+    return frames
+
+
+class IncrementalResampler:
+    """
+    Candele derivate aggiornate a ogni candela base CHIUSA (es. 4h dal feed 15m): update() restituisce
+    le candele derivate che si sono appena chiuse come (timeframe, (ts ms, o, h, l, c, v), partial).
+    Le ultime `capacity` candele chiuse di ogni timeframe stanno in un OHLCVRing.
+    """
+
+    __slots__ = ('base_step', 'steps', 'closed', 'forming', 'last_ms')
+
+    def __init__(self, base_timeframe: str, timeframes, capacity: int = 400):
+        self.base_step = interval_ms(base_timeframe)
+        self.steps = {tf: interval_ms(tf) for tf in timeframes}
+        for step in self.steps.values():
+            _check_steps(self.base_step, step)
+        self.closed = {tf: OHLCVRing(capacity) for tf in self.steps}
+        self.forming = {tf: None for tf in self.steps}  # [bucket ms, o, h, l, c, v, candele base]
+        self.last_ms = None
+
+    def seed(self, arrays: OHLCVArrays, events: list = None) -> "IncrementalResampler":
+        """
+        Scorre uno storico di candele base chiuse (es. KlineBuffer.window()); le candele derivate
+        chiuse nel frattempo, con il flag partial, si aggiungono a events se passato.
+        """
+        for bar in zip(arrays.timestamp_ms.tolist(), *(arrays.column(c).tolist() for c in OHLCV_COLUMNS)):
+            closed = self.update(*bar)
+            if events is not None:
+                events.extend(closed)
+        return self
+
+    def _close(self, tf, bar, events):
+        complete = bar[6] == self.steps[tf] // self.base_step
+        self.closed[tf].append(*bar[:6])
+        events.append((tf, tuple(bar[:6]), not complete))
+
+    def update(self, ts_ms: int, open_, high, low, close, volume) -> list:
+        """Aggiunge una candela base chiusa (ignorata se non più recente dell'ultima); restituisce le derivate chiuse."""
+        if self.last_ms is not None and ts_ms <= self.last_ms:
+            return []
+        self.last_ms = ts_ms
+        events = []
+        for tf, step in self.steps.items():
+            bucket = int(bucket_start(ts_ms, step))
+            bar = self.forming[tf]
+            if bar is not None and bar[0] != bucket:
+                self._close(tf, bar, events)  # bucket lasciato incompleto da un buco nelle candele base
+                bar = None
+            if bar is None:
+                bar = [bucket, open_, high, low, close, volume, 1]
+            else:
+                bar[2] = max(bar[2], high)
+                bar[3] = min(bar[3], low)
+                bar[4] = close
+                bar[5] += volume
+                bar[6] += 1
+            if ts_ms + self.base_step >= bucket + step:
+                self._close(tf, bar, events)
+                bar = None
+            self.forming[tf] = bar
+        return events
+
+    def frame(self, timeframe: str, include_forming: bool = False) -> pd.DataFrame:
+        """Candele derivate chiuse (più quella in formazione) con indice UTC, come KlineBuffer.frame()."""
+        ring, bar = self.closed[timeframe], self.forming[timeframe]
+        if not include_forming or bar is None:
+            return ring.frame()
+        forming = np.array(bar[:6], dtype=np.float64)
+        forming[0] = np.int64(bar[0]).view(np.float64)
+        return OHLCVArrays(np.column_stack([ring.window_matrix(), forming])).to_dataframe(as_index=True)
@@ -0,0 +1,164 @@
+# analysis/signal_engine.py - v1.0 (Motore Vettoriale dei Blueprint)
+# Calcola gli indicatori UNA volta sull'intero storico e trasforma i blocchi
+# logici di market_analysis in array booleani/di prezzo per ogni barra.
+# Il ciclo per-barra resta solo per la macchina a stati dei trade.
+import numpy as np
+
+from analysis.market_analysis import add_indicators, LONG_DIRECTIONS, SHORT_DIRECTIONS
+from analysis.exit_resolver import ExitResolver
+
+# ==============================================================================
+# --- CONVENZIONE DEGLI INDICI ---
+# Nel percorso per-barra, all'iterazione `i` la strategia vede df.iloc[0:i]:
+#   iloc[-1] -> barra i-1 | iloc[-2] (conferma) -> i-2 | iloc[-3] (setup) -> i-3
+#   iloc[-10] (riferimento trend) -> i-10
+# Tutti gli array restituiti qui sono allineati all'indice di iterazione `i`.
+# ==============================================================================
+
+def _lag(values, k):
+    """Restituisce l'array traslato in avanti di k barre (NaN in testa)."""
+    out = np.full(len(values), np.nan)
+    if k < len(values):
+        out[k:] = values[:len(values) - k]
+    return out
+
+def _col(df, name):
+    return df[name].to_numpy(dtype=float)
+
+def trend_condition_array(df, params):
+    """Versione vettoriale di check_trend_condition: array di 'UP'/'DOWN'/'NONE'."""
+    ema_slow = _col(df, f"EMA_{params['ema_slow']}")
+    slope = _col(df, 'EMA_SLOW_SLOPE')
+    ema_slope_min = params.get('ema_slope_min', 0.0)
+
+    setup_ema, ref_ema, setup_slope = _lag(ema_slow, 3), _lag(ema_slow, 10), _lag(slope, 3)
+    is_uptrend = (setup_ema > ref_ema) & (setup_slope > ema_slope_min)
+    is_downtrend = (setup_ema < ref_ema) & (setup_slope < -ema_slope_min)
+    return np.where(is_uptrend, 'UP', np.where(is_downtrend, 'DOWN', 'NONE'))
+
+def pullback_entry_array(df, trend, params):
+    """Versione vettoriale di check_pullback_entry_condition."""
+    close, open_, high, low = _col(df, 'close'), _col(df, 'open'), _col(df, 'high'), _col(df, 'low')
+    ema_fast = _col(df, f"EMA_{params['ema_fast']}")
+
+    setup_close, setup_ema_fast = _lag(close, 3), _lag(ema_fast, 3)
+    setup_high, setup_low = _lag(high, 3), _lag(low, 3)
+    conf_close, conf_open = _lag(close, 2), _lag(open_, 2)
+    conf_high, conf_low = _lag(high, 2), _lag(low, 2)
+
+    long_ok = (setup_close < setup_ema_fast) & (conf_close > conf_open) & (conf_high > setup_high)
+    short_ok = (setup_close > setup_ema_fast) & (conf_close < conf_open) & (conf_low < setup_low)
+    return np.where(trend == 'UP', long_ok, np.where(trend == 'DOWN', short_ok, False))
+
+def ema_cross_entry_array(df, trend, params):
+    """Versione vettoriale di check_ema_cross_entry_condition."""
+    ema_fast = _col(df, f"EMA_{params['ema_fast']}")
+    ema_slow = _col(df, f"EMA_{params['ema_slow']}")
+
+    prev_fast, prev_slow = _lag(ema_fast, 2), _lag(ema_slow, 2)
+    prev2_fast, prev2_slow = _lag(ema_fast, 3), _lag(ema_slow, 3)
+
+    cross_up = (prev2_fast < prev2_slow) & (prev_fast > prev_slow)
+    cross_down = (prev2_fast > prev2_slow) & (prev_fast < prev_slow)
+    return np.where(trend == 'UP', cross_up, np.where(trend == 'DOWN', cross_down, False))
+
+def sl_tp_arrays(df, direction, params):
+    """
+    Versione vettoriale di calculate_sl_tp.
+    Restituisce (entry, sl, tp, valid). Replica fedelmente i rami della versione
+    per-barra: il ramo long scatta solo per direction == 'LONG' e quello short
+    per direction == 'DOWN', esattamente come calculate_sl_tp.
+    """
+    high, low = _col(df, 'high'), _col(df, 'low')
+    atr = _col(df, f"ATR_{params['atr_len']}")
+    rr_ratio = params.get('rr_ratio', 3.0)
+    atr_mult_sl = params.get('atr_mult_sl', 2.5)
+
+    conf_high, conf_low, conf_atr = _lag(high, 2), _lag(low, 2), _lag(atr, 2)
+    setup_high, setup_low = _lag(high, 3), _lag(low, 3)
+
+    long_sl = setup_low - (conf_atr * (atr_mult_sl - 1.0))
+    long_tp = conf_high + ((conf_high - long_sl) * rr_ratio)
+    short_sl = setup_high + (conf_atr * (atr_mult_sl - 1.0))
+    short_tp = conf_low - ((short_sl - conf_low) * rr_ratio)
+
+    is_long = np.isin(direction, LONG_DIRECTIONS) & ~(long_sl >= conf_high)
+    is_short = np.isin(direction, SHORT_DIRECTIONS) & ~(short_sl <= conf_low)
+
+    entry = np.where(is_long, conf_high, np.where(is_short, conf_low, np.nan))
+    stop_loss = np.where(is_long, long_sl, np.where(is_short, short_sl, np.nan))
+    take_profit = np.where(is_long, long_tp, np.where(is_short, short_tp, np.nan))
+    # `all([entry, sl, tp])` scarta i valori nulli (0.0) ma non i NaN
+    valid = (is_long | is_short) & (entry != 0) & (stop_loss != 0) & (take_profit != 0)
+    return entry, stop_loss, take_profit, valid
+
+# ==============================================================================
+# --- SEGNALI SU TUTTO LO STORICO ---
+# ==============================================================================
+
+def build_signal_arrays(df_full, params, strategy_logic, dataset_key=None):
+    """
+    Equivalente vettoriale di evaluate_strategy_extended applicato a ogni barra.
+    Restituisce un dizionario di array allineati all'indice di iterazione.
+    dataset_key=(symbol, timeframe) abilita la cache indicatori tra i trial.
+    """
+    df = add_indicators(df_full.copy(), params, dataset_key=dataset_key)
+    n = len(df)
+
+    if strategy_logic.get('trend_filter') == 'check_trend_condition':
+        trend = trend_condition_array(df, params)
+    else:
+        trend = np.full(n, 'UP')
+
+    entry_condition = strategy_logic.get('entry_condition')
+    if entry_condition == 'check_pullback_entry_condition':
+        entry_signal = pullback_entry_array(df, trend, params)
+    elif entry_condition == 'check_ema_cross_entry_condition':
+        entry_signal = ema_cross_entry_array(df, trend, params)
+    else:
+        entry_signal = np.zeros(n, dtype=bool)
+
+    entry, stop_loss, take_profit, levels_ok = sl_tp_arrays(df, trend, params)
+    return {
+        "signal": entry_signal & (trend != 'NONE') & levels_ok,
+        "is_long": trend == 'UP',
+        "entry": entry, "sl": stop_loss, "tp": take_profit,
+        "timestamp": df['timestamp'].tolist(),
+        "high": _col(df, 'high'), "low": _col(df, 'low'),
+    }
+
+def generate_trades(df_full, params, strategy_logic, dataset_key=None, start=None):
+    """
+    Macchina a stati dei trade sopra i segnali vettoriali.
+    Produce la stessa lista di trade del ciclo per-barra di optimizer/strategy_generator,
+    saltando direttamente dal segnale all'uscita tramite ExitResolver.
+    start (opzionale) è la prima iterazione in cui cercare segnali, mai prima del warm-up
+    (es. l'inizio della finestra out-of-sample nel walk-forward).
+    """
+    arrays = build_signal_arrays(df_full, params, strategy_logic, dataset_key=dataset_key)
+    is_long, entry, sl, tp = arrays['is_long'], arrays['entry'], arrays['sl'], arrays['tp']
+    timestamps = arrays['timestamp']
+    resolver = ExitResolver(arrays['high'], arrays['low'])
+    signal_idx = np.flatnonzero(arrays['signal'])
+
+    trades = []
+    n = len(timestamps)
+    i = max(params.get('ema_slow', 200), params.get('atr_len', 14)) + 10
+    if start is not None: i = max(i, start)
+
+    while True:
+        # Prossima barra con segnale a partire da i
+        pos = np.searchsorted(signal_idx, i)
+        if pos >= len(signal_idx): break
+        i = int(signal_idx[pos])
+        trade = {
+            "timestamp": timestamps[i - 1], "type": "LONG" if is_long[i] else "SHORT",
+            "entry": entry[i], "sl": sl[i], "tp": tp[i]
+        }
+        # Il trade aperto all'iterazione i viene controllato sulle barre i..n-2
+        exit_bar, result = resolver.resolve(trade['type'], i, trade['sl'], trade['tp'], end=n - 1)
+        if result is None: break
+        trade['result'] = result
+        trades.append(trade)
+        i = exit_bar + 1
+    return trades
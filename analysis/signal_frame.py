@@ -0,0 +1,84 @@
+# analysis/signal_frame.py - v1.0 (Segnali Intraday Pre-calcolati per Barra)
+# Le strategie intraday per-barra ricalcolano tutti gli indicatori sul prefisso
+# df.loc[:t], scartano le righe con NaN (dropna) e guardano le ultime due righe
+# valide (T = setup, T1 = trigger). Gli indicatori usati sono causali, quindi
+# calcolarli una volta sull'intero storico dà gli stessi valori riga per riga:
+# qui si mappa ogni barra t sulla sua "ultima riga valida" e si costruisce un
+# frame con un segnale (o nessuno) per ogni barra, da leggere con signals_at.
+#
+# Unica differenza nota: l'ATR di pandas_ta aggiunge un epsilon a tutte le
+# ampiezze high-low se nel frame c'è almeno una candela con high == low; sullo
+# storico completo può quindi cambiare l'ultima cifra di ATR/ADX rispetto al
+# prefisso (irrilevante per le soglie delle strategie).
+import numpy as np
+import pandas as pd
+
+SIGNAL_COLUMNS = ['side', 'entry_price', 'sl', 'tp', 'score', 'strategy']
+
+
+def valid_rows(df) -> np.ndarray:
+    """Maschera delle righe che sopravvivono a df.dropna()."""
+    return df.notna().all(axis=1).to_numpy()
+
+
+def previous_valid_rows(valid) -> np.ndarray:
+    """Per ogni riga valida, la posizione della riga valida precedente (T di iloc[-2]); -1 altrimenti."""
+    prev = np.full(len(valid), -1, dtype=np.int64)
+    rows = np.flatnonzero(valid)
+    prev[rows[1:]] = rows[:-1]
+    return prev
+
+
+def last_valid_rows(valid) -> np.ndarray:
+    """Per ogni barra t, la posizione dell'ultima riga valida <= t (T1 di iloc[-1]); -1 se nessuna."""
+    return np.maximum.accumulate(np.where(valid, np.arange(len(valid)), -1)) if len(valid) else np.empty(0, dtype=np.int64)
+
+
+def empty_signal_frame(index) -> pd.DataFrame:
+    """Frame senza segnali: side mancante, livelli NaN, score 0."""
+    n = len(index)
+    return pd.DataFrame({'side': np.full(n, None, dtype=object), 'entry_price': np.full(n, np.nan),
+                         'sl': np.full(n, np.nan), 'tp': np.full(n, np.nan),
+                         'score': np.zeros(n, dtype=np.int64), 'strategy': np.full(n, None, dtype=object)},
+                        index=index, columns=SIGNAL_COLUMNS)
+
+
+def set_signals(frame, mask, side, entry_price, sl, tp, score, strategy):
+    """Scrive un segnale sulle righe di mask; entry_price/sl/tp sono array lunghi quanto il frame."""
+    mask = np.asarray(mask, dtype=bool)
+    if not mask.any():
+        return frame
+    rows = np.flatnonzero(mask)
+    for name, values in (('entry_price', entry_price), ('sl', sl), ('tp', tp)):
+        frame.iloc[rows, frame.columns.get_loc(name)] = np.asarray(values, dtype=float)[rows]
+    frame.iloc[rows, frame.columns.get_loc('side')] = side
+    frame.iloc[rows, frame.columns.get_loc('score')] = score
+    frame.iloc[rows, frame.columns.get_loc('strategy')] = strategy
+    return frame
+
+
+def spread_to_bars(frame, valid, eligible=None) -> pd.DataFrame:
+    """
+    Da segnali calcolati "come se la riga fosse T1" a segnali per barra: la barra t
+    riceve il segnale della sua ultima riga valida. eligible (maschera per barra)
+    spegne le barre in cui la versione per-barra uscirebbe prima (es. prefisso corto).
+    """
+    last = last_valid_rows(valid)
+    off = last < 0 if eligible is None else (last < 0) | ~np.asarray(eligible, dtype=bool)
+    source = np.maximum(last, 0)
+    empty = empty_signal_frame(frame.index)
+    columns = {}
+    for name in SIGNAL_COLUMNS:
+        values = frame[name].to_numpy()[source]
+        values[off] = empty[name].to_numpy()[off]
+        columns[name] = values
+    return pd.DataFrame(columns, index=frame.index, columns=SIGNAL_COLUMNS)
+
+
+def signals_at(frame, pos) -> list:
+    """Segnali della barra in posizione pos, nello stesso formato (lista di dict) delle funzioni per-barra."""
+    side = frame['side'].iat[pos]
+    if pd.isna(side):
+        return []
+    return [{'side': side, 'entry_price': float(frame['entry_price'].iat[pos]), 'sl': float(frame['sl'].iat[pos]),
+             'tp': float(frame['tp'].iat[pos]), 'score': int(frame['score'].iat[pos]), 'strategy': frame['strategy'].iat[pos]}]
@@ -1,12 +1,16 @@
 # analysis/strategy_bb_squeeze.py
+import numpy as np
 import pandas as pd
 import pandas_ta as ta
 import config
+from analysis.kernels import ta_accessor, rolling_min
+from analysis.signal_frame import valid_rows, previous_valid_rows, last_valid_rows, empty_signal_frame, set_signals
 
-def bollinger_squeeze_breakout(df_trigger: pd.DataFrame, bias: str):
+def bollinger_squeeze_breakout(df_trigger: pd.DataFrame, bias: str, use_kernels: bool = False):
     """
     Strategia che cerca un breakout da una "compressione" delle Bande di Bollinger.
     Opera solo nella direzione del bias fornito dal contesto.
+    Con use_kernels=True gli indicatori vengono calcolati con analysis.kernels.
     """
     out = []
     if len(df_trigger) < config.BBANDS_PERIOD:
@@ -15,9 +19,10 @@ def bollinger_squeeze_breakout(df_trigger: pd.DataFrame, bias: str):
     df = df_trigger.copy()
     
     # Calcola le Bande di Bollinger e la loro ampiezza
-    df.ta.bbands(length=config.BBANDS_PERIOD, std=config.BBANDS_STD, append=True)
+    ta_ = ta_accessor(df, use_kernels)
+    ta_.bbands(length=config.BBANDS_PERIOD, std=config.BBANDS_STD, append=True)
     # Aggiungi anche l'ATR per il calcolo del TP/SL
-    df.ta.atr(length=config.ATR_PERIOD, append=True)
+    ta_.atr(length=config.ATR_PERIOD, append=True)
 
     bbw_col = f"BBW_{config.BBANDS_PERIOD}_{config.BBANDS_STD:.1f}"
     bbl_col = f"BBL_{config.BBANDS_PERIOD}_{config.BBANDS_STD:.1f}"
@@ -28,7 +33,7 @@ def bollinger_squeeze_breakout(df_trigger: pd.DataFrame, bias: str):
 
     # Trova il punto di minima ampiezza delle bande nelle ultime N candele
     squeeze_window = 40
-    df['squeeze_point'] = df[bbw_col].rolling(squeeze_window).min()
+    df['squeeze_point'] = rolling_min(df[bbw_col], squeeze_window) if use_kernels else df[bbw_col].rolling(squeeze_window).min()
     
     df.dropna(inplace=True)
     if len(df) < 2:
@@ -64,3 +69,57 @@ def bollinger_squeeze_breakout(df_trigger: pd.DataFrame, bias: str):
             })
             
     return out
+
+
+def bollinger_squeeze_breakout_batch(df_trigger: pd.DataFrame, bias, use_kernels: bool = False):
+    """
+    Versione "batch" di bollinger_squeeze_breakout su tutto lo storico in un passaggio.
+    bias può essere una stringa unica o un array allineato alle righe di df_trigger
+    (il bias in vigore a ogni barra). La riga t del frame restituito contiene il segnale
+    che bollinger_squeeze_breakout(df_trigger.iloc[:t + 1], bias[t]) emetterebbe.
+    """
+    frame = empty_signal_frame(df_trigger.index)
+    n = len(df_trigger)
+    if n < config.BBANDS_PERIOD:
+        return frame
+
+    df = df_trigger.copy()
+    ta_ = ta_accessor(df, use_kernels)
+    ta_.bbands(length=config.BBANDS_PERIOD, std=config.BBANDS_STD, append=True)
+    ta_.atr(length=config.ATR_PERIOD, append=True)
+
+    bbw_col = f"BBW_{config.BBANDS_PERIOD}_{config.BBANDS_STD:.1f}"
+    bbl_col = f"BBL_{config.BBANDS_PERIOD}_{config.BBANDS_STD:.1f}"
+    bbu_col = f"BBU_{config.BBANDS_PERIOD}_{config.BBANDS_STD:.1f}"
+    atr_col = f"ATRr_{config.ATR_PERIOD}"
+
+    if bbw_col not in df.columns:
+        return frame
+
+    squeeze_window = 40
+    df['squeeze_point'] = rolling_min(df[bbw_col], squeeze_window) if use_kernels else df[bbw_col].rolling(squeeze_window).min()
+    valid = valid_rows(df)
+    setup = previous_valid_rows(valid)
+    has_setup = valid & (setup >= 0)
+    prev = np.maximum(setup, 0)
+
+    close, bbw, bbl, bbu, squeeze = (df[c].to_numpy(dtype=float) for c in ('close', bbw_col, bbl_col, bbu_col, 'squeeze_point'))
+    atr = df[atr_col].to_numpy(dtype=float) if atr_col in df.columns else None
+
+    # Setup sulla riga valida precedente (T), trigger sulla riga corrente (T1)
+    with np.errstate(invalid='ignore'):
+        is_in_squeeze = has_setup & (bbw[prev] <= squeeze[prev] * 1.1)
+        breakout_up = is_in_squeeze & (close[prev] < bbu[prev]) & (close > bbu[prev])
+        breakout_down = is_in_squeeze & (close[prev] > bbl[prev]) & (close < bbl[prev])
+    long_atr = atr if atr is not None else (close - bbl) * 0.5
+    short_atr = atr if atr is not None else (bbu - close) * 0.5
+
+    # Ogni barra legge la sua ultima riga valida; il bias invece è quello della barra stessa
+    last = last_valid_rows(valid)
+    row = np.maximum(last, 0)
+    bias = np.broadcast_to(np.asarray(bias, dtype=object), (n,))
+    is_long = (last >= 0) & breakout_up[row] & (bias == 'BULLISH')
+    is_short = (last >= 0) & breakout_down[row] & (bias == 'BEARISH')
+    set_signals(frame, is_long, "Long", close[row], bbl[row], (close + 2.0 * long_atr)[row], 80, "BB-Squeeze-Breakout")
+    set_signals(frame, is_short, "Short", close[row], bbu[row], (close - 2.0 * short_atr)[row], 80, "BB-Squeeze-Breakout")
+    return frame
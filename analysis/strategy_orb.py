@@ -1,10 +1,13 @@
 # analysis/strategy_orb.py
+import numpy as np
 import pandas as pd
 import pandas_ta as ta
 from datetime import datetime, time
 from analysis.session_clock import TZ, SESSION_START
+from analysis.kernels import ta_accessor, rolling_mean
+from analysis.signal_frame import valid_rows, last_valid_rows, empty_signal_frame, set_signals
 
-def opening_range_breakout(df: pd.DataFrame, *, adx_len=14, vol_ma=20, or_minutes=30):
+def opening_range_breakout(df: pd.DataFrame, *, adx_len=14, vol_ma=20, or_minutes=30, use_kernels=False):
     out = []
     if df.empty or not isinstance(df.index, pd.DatetimeIndex):
         return out
@@ -16,9 +19,9 @@ def opening_range_breakout(df: pd.DataFrame, *, adx_len=14, vol_ma=20, or_minute
         df.index = df.index.tz_convert(TZ)
 
     df = df.copy()
-    df.ta.adx(length=adx_len, append=True)
+    ta_accessor(df, use_kernels).adx(length=adx_len, append=True)
     adx_col = f"ADX_{adx_len}"
-    df["vol_ma"] = df["volume"].rolling(vol_ma).mean()
+    df["vol_ma"] = rolling_mean(df["volume"], vol_ma) if use_kernels else df["volume"].rolling(vol_ma).mean()
     df.dropna(inplace=True)
     if len(df) < 1:
         return out
@@ -63,4 +66,56 @@ def opening_range_breakout(df: pd.DataFrame, *, adx_len=14, vol_ma=20, or_minute
             "score": 76, "strategy":"OpeningRangeBreakout"
         })
 
-    return out
\ No newline at end of file
+    return out
+
+
+def opening_range_breakout_batch(df: pd.DataFrame, *, adx_len=14, vol_ma=20, or_minutes=30, use_kernels=False):
+    """
+    Versione "batch" di opening_range_breakout: segnali per ogni barra dello storico.
+    La versione per-barra prende l'Opening Range del giorno di datetime.now(), cioè del
+    giorno dell'ultima candela quando gira live; qui ogni barra usa l'OR del proprio
+    giorno di sessione, così un backtest vede gli stessi breakout del live.
+    """
+    frame = empty_signal_frame(df.index)
+    if df.empty or not isinstance(df.index, pd.DatetimeIndex):
+        return frame
+
+    df = df.copy()
+    if df.index.tz is None:
+        df.index = df.index.tz_localize('UTC').tz_convert(TZ)
+    else:
+        df.index = df.index.tz_convert(TZ)
+
+    ta_accessor(df, use_kernels).adx(length=adx_len, append=True)
+    adx_col = f"ADX_{adx_len}"
+    df["vol_ma"] = rolling_mean(df["volume"], vol_ma) if use_kernels else df["volume"].rolling(vol_ma).mean()
+    valid = valid_rows(df)
+
+    # Finestra dell'OR [or_start, or_end) del giorno di ogni barra
+    days = df.index.date
+    bounds = {}
+    for day in dict.fromkeys(days):
+        or_start = datetime.combine(day, SESSION_START, TZ)
+        bounds[day] = (or_start, or_start.replace(minute=SESSION_START.minute + or_minutes))
+    or_start = pd.DatetimeIndex([bounds[d][0] for d in days]).tz_convert(TZ)
+    or_end = pd.DatetimeIndex([bounds[d][1] for d in days]).tz_convert(TZ)
+
+    # Massimo/minimo dell'OR sulle sole righe valide, per giorno
+    in_window = valid & (df.index >= or_start) & (df.index < or_end)
+    window = df.loc[in_window, ["high", "low"]].groupby(days[in_window])
+    or_high = pd.Series(days).map(window["high"].max()).to_numpy(dtype=float)
+    or_low = pd.Series(days).map(window["low"].min()).to_numpy(dtype=float)
+    or_range = or_high - or_low
+
+    # T1 = ultima riga valida della barra; l'OR è quello del giorno della barra valutata
+    last = last_valid_rows(valid)
+    row = np.maximum(last, 0)
+    close, volume = df["close"].to_numpy(dtype=float)[row], df["volume"].to_numpy(dtype=float)[row]
+    adx, volume_ma = df[adx_col].to_numpy(dtype=float)[row], df["vol_ma"].to_numpy(dtype=float)[row]
+    with np.errstate(invalid='ignore'):
+        ready = (last >= 0) & (df.index[row] >= or_end) & (or_range > 0)
+        strong = ready & (adx >= 18) & (volume > volume_ma)
+        is_long, is_short = strong & (close > or_high), strong & (close < or_low)
+    set_signals(frame, is_long, "Long", close, or_high, close + 1.2 * or_range, 76, "OpeningRangeBreakout")
+    set_signals(frame, is_short, "Short", close, or_low, close - 1.2 * or_range, 76, "OpeningRangeBreakout")
+    return frame
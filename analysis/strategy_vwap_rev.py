@@ -1,29 +1,26 @@
-# analysis/strategy_vwap_rev.py (v4.0 - "Genetic-Aware")
+# analysis/strategy_vwap_rev.py (v4.3 - "Genetic-Aware" + Batch + Kernel + Streaming)
 import pandas as pd
 import numpy as np
 import pandas_ta as ta
+from collections import deque
 from analysis.session_clock import TZ, SESSION_START
+from analysis.streaming_indicators import SessionVWAP, ADX, RSI, ATR
+from analysis.kernels import ta_accessor
+from analysis.signal_frame import (valid_rows, previous_valid_rows, empty_signal_frame,
+                                   set_signals, spread_to_bars)
 import config
 
-def vwap_reversion_intraday(df: pd.DataFrame, asset: str, **kwargs):
-    out = []
-    
-    # Logic to decide where to get params from (optimizer or config file)
+def _resolve_params(asset, kwargs):
+    """(k_atr, rsi_len, adx_threshold) dall'optimizer (kwargs) o da config; None se l'asset non è nel portafoglio."""
     if 'k_atr' in kwargs: # Called from optimizer
-        k_atr = kwargs['k_atr']
-        rsi_len = kwargs['rsi_len']
-        adx_threshold = kwargs['adx_threshold']
-    elif asset in config.OPTIMIZED_PARAMS: # Called from backtester
+        return kwargs['k_atr'], kwargs['rsi_len'], kwargs['adx_threshold']
+    if asset in config.OPTIMIZED_PARAMS: # Called from backtester
         asset_params = config.OPTIMIZED_PARAMS[asset]
-        k_atr = asset_params['k_atr']
-        rsi_len = asset_params['rsi_len']
-        adx_threshold = asset_params['adx_threshold']
-    else: # Asset not in our genetic portfolio
-        return out
+        return asset_params['k_atr'], asset_params['rsi_len'], asset_params['adx_threshold']
+    return None # Asset not in our genetic portfolio
 
-    adx_len = 14
-    if len(df) < 100: return out
-    
+def session_vwap_frame(df):
+    """Copia di df con indice nel fuso di sessione e colonna VWAP azzerata a ogni apertura di sessione."""
     df = df.copy()
     if df.index.tz is None: df.index = df.index.tz_localize('UTC').tz_convert(TZ)
     else: df.index = df.index.tz_convert(TZ)
@@ -39,11 +36,32 @@ def vwap_reversion_intraday(df: pd.DataFrame, asset: str, **kwargs):
         volume = group["volume"].replace(0, np.nan); vwap = (tp * volume).cumsum() / volume.cumsum()
         group['VWAP'] = vwap; return group
     
-    df = df.groupby('session_group').apply(session_vwap, include_groups=False)
+    return df.groupby('session_group').apply(session_vwap, include_groups=False)
+
+def _add_vwap_indicators(df, rsi_len, adx_len, use_kernels=False):
+    """
+    Copia di df con indice nel fuso di sessione, VWAP di sessione, ADX, RSI e ATR (prima del dropna).
+    Con use_kernels=True ADX/RSI/ATR vengono da analysis.kernels invece che da pandas_ta.
+    """
+    df = session_vwap_frame(df)
+    ta_ = ta_accessor(df, use_kernels)
+    ta_.adx(length=adx_len, append=True)
+    ta_.rsi(length=rsi_len, append=True)
+    ta_.atr(length=config.ATR_PERIOD, append=True)
+    return df
+
+def vwap_reversion_intraday(df: pd.DataFrame, asset: str, use_kernels: bool = False, **kwargs):
+    out = []
+    
+    # Logic to decide where to get params from (optimizer or config file)
+    params = _resolve_params(asset, kwargs)
+    if params is None: return out
+    k_atr, rsi_len, adx_threshold = params
+
+    adx_len = 14
+    if len(df) < 100: return out
     
-    df.ta.adx(length=adx_len, append=True)
-    df.ta.rsi(length=rsi_len, append=True)
-    df.ta.atr(length=config.ATR_PERIOD, append=True)
+    df = _add_vwap_indicators(df, rsi_len, adx_len, use_kernels)
     
     df.dropna(inplace=True);
     if len(df) < 2: return out
@@ -52,16 +70,99 @@ def vwap_reversion_intraday(df: pd.DataFrame, asset: str, **kwargs):
     T = df.iloc[-2]; T1 = df.iloc[-1]
 
     if 'VWAP' not in T1 or pd.isna(T1['VWAP']): return out
-    if T1[adx_col] >= adx_threshold: return out
+    return _reversion_signals(T["close"], T1["close"], T1["high"], T1["low"], T1["VWAP"],
+                              T1[adx_col], T1[rsi_col], T1[atr_col], k_atr, adx_threshold)
 
-    dist_atr = abs(T1["close"] - T1["VWAP"]) / max(1e-9, T1[atr_col])
+def _reversion_signals(prev_close, close, high, low, vwap, adx, rsi, atr, k_atr, adx_threshold):
+    """Regole di ingresso sulle ultime due righe complete (T, T1): comuni a batch e streaming."""
+    out = []
+    if adx >= adx_threshold: return out
+
+    dist_atr = abs(close - vwap) / max(1e-9, atr)
 
-    if (T1["close"] < T1["VWAP"]) and (dist_atr >= k_atr) and (T1[rsi_col] <= 40) and (T1["close"] > T["close"]):
-        entry = float(T1["close"]); sl = float(T1["low"] - 1.2 * T1[atr_col]); tp = float(T1["VWAP"])
+    if (close < vwap) and (dist_atr >= k_atr) and (rsi <= 40) and (close > prev_close):
+        entry = float(close); sl = float(low - 1.2 * atr); tp = float(vwap)
         out.append({"side": "Long", "entry_price": entry, "sl": sl, "tp": tp, "score": 75, "strategy": "VWAP-Reversion"})
 
-    if (T1["close"] > T1["VWAP"]) and (dist_atr >= k_atr) and (T1[rsi_col] >= 60) and (T1["close"] < T["close"]):
-        entry = float(T1["close"]); sl = float(T1["high"] + 1.2 * T1[atr_col]); tp = float(T1["VWAP"])
+    if (close > vwap) and (dist_atr >= k_atr) and (rsi >= 60) and (close < prev_close):
+        entry = float(close); sl = float(high + 1.2 * atr); tp = float(vwap)
         out.append({"side": "Short", "entry_price": entry, "sl": sl, "tp": tp, "score": 75, "strategy": "VWAP-Reversion"})
 
     return out
+
+class VwapReversionTracker:
+    """
+    vwap_reversion_intraday per il runner live, in O(1) per candela: VWAP di sessione, ADX,
+    RSI e ATR di analysis.streaming_indicators avanzano solo con le candele chiuse invece di
+    ricalcolare pandas_ta sulle ultime 400 a ogni evento. Sulla stessa storia i valori
+    coincidono con il batch; rispetto al batch sulla finestra di 400 candele cambiano solo
+    le code delle medie di Wilder (che partono dall'inizio del seed, non della finestra).
+    """
+
+    def __init__(self, asset: str, adx_len: int = 14, **kwargs):
+        self.params = _resolve_params(asset, kwargs)
+        rsi_len = self.params[1] if self.params else 14
+        self._vwap, self._adx, self._rsi, self._atr = SessionVWAP(), ADX(adx_len), RSI(rsi_len), ATR(config.ATR_PERIOD)
+        self._rows = deque(maxlen=2)  # ultime due righe senza NaN, come dopo il dropna del batch
+        self.bars = 0
+        self.last_timestamp = None
+
+    def seed(self, df: pd.DataFrame):
+        """Scorre lo storico (indice UTC, colonne OHLCV) e restituisce self."""
+        for ts, row in zip(df.index, df[['open', 'high', 'low', 'close', 'volume']].itertuples(index=False)):
+            self.update(ts, *row)
+        return self
+
+    def update(self, timestamp, open_, high, low, close, volume) -> bool:
+        """Aggiunge una candela chiusa; False (e nessun effetto) se non è più recente dell'ultima."""
+        if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+            return False
+        self.last_timestamp = timestamp
+        self.bars += 1
+        vwap = self._vwap.update(timestamp, high, low, close, volume)
+        adx, rsi, atr = self._adx.update(high, low, close), self._rsi.update(close), self._atr.update(high, low, close)
+        row = (open_, high, low, close, volume, vwap, adx, self._adx.dmp, self._adx.dmn, rsi, atr)
+        if not np.isnan(row).any():
+            self._rows.append(row)
+        return True
+
+    def signals(self) -> list:
+        """Segnali sull'ultima candela chiusa, con le stesse regole di vwap_reversion_intraday."""
+        if self.params is None or self.bars < 100 or len(self._rows) < 2: return []
+        k_atr, _, adx_threshold = self.params
+        T, T1 = self._rows
+        _, high, low, close, _, vwap, adx, _, _, rsi, atr = T1
+        return _reversion_signals(T[3], close, high, low, vwap, adx, rsi, atr, k_atr, adx_threshold)
+
+def vwap_reversion_batch(df: pd.DataFrame, asset: str, use_kernels: bool = False, **kwargs) -> pd.DataFrame:
+    """
+    Versione "batch" di vwap_reversion_intraday: un solo passaggio sull'intero storico.
+    Restituisce un frame allineato alle righe di df (colonne di signal_frame.SIGNAL_COLUMNS)
+    in cui la riga t contiene il segnale che vwap_reversion_intraday(df.iloc[:t + 1]) emetterebbe.
+    """
+    frame = empty_signal_frame(df.index)
+    params = _resolve_params(asset, kwargs)
+    if params is None or len(df) < 2: return frame
+    k_atr, rsi_len, adx_threshold = params
+
+    adx_len = 14
+    ind = _add_vwap_indicators(df, rsi_len, adx_len, use_kernels)
+    valid = valid_rows(ind)
+    prev = previous_valid_rows(valid)
+
+    adx_col = f"ADX_{adx_len}"; rsi_col = f"RSI_{rsi_len}"; atr_col = f"ATRr_{config.ATR_PERIOD}"
+    close, low, high = (ind[c].to_numpy(dtype=float) for c in ("close", "low", "high"))
+    vwap, adx, rsi, atr = (ind[c].to_numpy(dtype=float) for c in ("VWAP", adx_col, rsi_col, atr_col))
+    prev_close = np.where(prev >= 0, close[np.maximum(prev, 0)], np.nan)
+
+    # Condizioni valutate su ogni riga come se fosse T1 (con T = riga valida precedente)
+    with np.errstate(invalid='ignore'):
+        base = valid & (prev >= 0) & (adx < adx_threshold)
+        dist_atr = np.abs(close - vwap) / np.maximum(1e-9, atr)
+        is_long = base & (close < vwap) & (dist_atr >= k_atr) & (rsi <= 40) & (close > prev_close)
+        is_short = base & (close > vwap) & (dist_atr >= k_atr) & (rsi >= 60) & (close < prev_close)
+    set_signals(frame, is_long, "Long", close, low - 1.2 * atr, vwap, 75, "VWAP-Reversion")
+    set_signals(frame, is_short, "Short", close, high + 1.2 * atr, vwap, 75, "VWAP-Reversion")
+
+    eligible = np.arange(len(df)) + 1 >= 100  # len(df) < 100 sul prefisso -> nessun segnale
+    return spread_to_bars(frame, valid, eligible)
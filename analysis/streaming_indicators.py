@@ -0,0 +1,586 @@
+# analysis/streaming_indicators.py - v1.1 (Indicatori Incrementali O(1) per Barra)
+# Versioni "streaming" degli indicatori che live_runner, phoenix_runner e le
+# strategie ricalcolano con pandas_ta su 400-500 candele a ogni poll. Ogni oggetto
+# tiene solo lo stato necessario e avanza di una candela alla volta con update();
+# seed(df) lo inizializza sullo storico. Le ricorsioni sono quelle di pandas
+# (ewm, rolling mean/var con compensazione di Kahan) e le formule quelle di
+# pandas_ta 0.3.14b, quindi l'ultimo valore coincide bit per bit con la colonna
+# pandas_ta calcolata sulla stessa storia (ATRr_14, ADX_14, RSI_14, BBL/BBM/BBU/BBB/BBP_20_2.0...).
+#
+# Nota: pandas_ta aggiunge un epsilon a high - low (e upper - lower nelle Bollinger)
+# su TUTTO il frame se almeno una riga ha ampiezza zero. ATR e ADX tengono quindi
+# due stati in parallelo e passano a quello "con epsilon" dalla prima candela piatta.
+#
+# Parità barra per barra con gli indicatori batch (pandas_ta se installato,
+# altrimenti analysis.kernels, a loro volta identici a pandas_ta):
+#   python -m analysis.streaming_indicators [--bars 3000] [--reference auto|pandas_ta|kernels]
+import argparse
+import math
+import sys
+from collections import deque
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from analysis.session_clock import TZ, SESSION_START
+
+EPSILON = sys.float_info.epsilon
+
+
+class _Streaming:
+    """Base: update() con i valori della candela, seed(df) per scorrere uno storico."""
+
+    inputs = ('close',)
+
+    def seed(self, df: pd.DataFrame):
+        """Fa avanzare l'indicatore su tutte le righe di df (colonne in self.inputs); restituisce self."""
+        for values in zip(*(df[c].to_numpy(dtype=float).tolist() for c in self.inputs)):
+            self.update(*values)
+        return self
+
+
+# ==============================================================================
+# --- MATTONI: MEDIA ESPONENZIALE E FINESTRE MOBILI (RICORSIONI DI PANDAS) ---
+# ==============================================================================
+
+class EwmMean(_Streaming):
+    """Media esponenziale aggiornata come pandas ewm().mean() (adjust e min_periods inclusi)."""
+
+    def __init__(self, alpha, adjust=True, min_periods=0):
+        self.old_wt_factor = 1.0 - alpha
+        self.new_wt = 1.0 if adjust else alpha
+        self.adjust = adjust
+        self.min_periods = max(min_periods, 1)
+        self.weighted = np.nan
+        self.old_wt = 1.0
+        self.nobs = 0
+        self.value = np.nan
+
+    def update(self, value):
+        is_observation = value == value
+        self.nobs += is_observation
+        if self.weighted == self.weighted:
+            self.old_wt *= self.old_wt_factor
+            if is_observation:
+                if self.weighted != value:
+                    self.weighted = (self.old_wt * self.weighted + self.new_wt * value) / (self.old_wt + self.new_wt)
+                self.old_wt = self.old_wt + self.new_wt if self.adjust else 1.0
+        elif is_observation:
+            self.weighted = value
+        self.value = self.weighted if self.nobs >= self.min_periods else np.nan
+        return self.value
+
+
+class RollingMean(_Streaming):
+    """pandas rolling(length, min_periods).mean(): somma mobile con compensazione di Kahan."""
+
+    def __init__(self, length, min_periods=None):
+        self.length = length
+        self.min_periods = length if min_periods is None else min_periods
+        self.window = deque()
+        self._reset()
+        self.value = np.nan
+
+    def _reset(self):
+        self.nobs = self.neg_ct = 0
+        self.sum_x = self.comp_add = self.comp_remove = 0.0
+        self.same_count, self.prev_value = 0, np.nan
+
+    def _add(self, val):
+        if val == val:
+            self.nobs += 1
+            y = val - self.comp_add
+            t = self.sum_x + y
+            self.comp_add = t - self.sum_x - y
+            self.sum_x = t
+            self.neg_ct += math.copysign(1.0, val) < 0
+            self.same_count = self.same_count + 1 if val == self.prev_value else 1
+            self.prev_value = val
+
+    def _remove(self, val):
+        if val == val:
+            self.nobs -= 1
+            y = -val - self.comp_remove
+            t = self.sum_x + y
+            self.comp_remove = t - self.sum_x - y
+            self.sum_x = t
+            self.neg_ct -= math.copysign(1.0, val) < 0
+
+    def update(self, value):
+        if self.length == 1:
+            self._reset()  # finestra di una barra: pandas riparte da zero a ogni riga
+        elif len(self.window) == self.length:
+            self._remove(self.window.popleft())
+        self.window.append(value)
+        self._add(value)
+        if self.nobs >= self.min_periods and self.nobs > 0:
+            result = self.sum_x / self.nobs
+            if self.same_count >= self.nobs:
+                result = self.prev_value
+            elif (self.neg_ct == 0 and result < 0) or (self.neg_ct == self.nobs and result > 0):
+                result = 0.0
+            self.value = result
+        else:
+            self.value = np.nan
+        return self.value
+
+
+class RollingVar(_Streaming):
+    """
+    pandas rolling(length, min_periods).var(ddof): Welford con compensazione di Kahan.
+    Come pandas, se un aggiornamento fa crollare la somma dei quadrati (possibile
+    cancellazione catastrofica) la finestra viene ricalcolata da capo.
+    """
+
+    INV_COND_TOL = EPSILON * 1e3
+
+    def __init__(self, length, ddof=1, min_periods=None):
+        self.length = length
+        self.ddof = ddof
+        self.min_periods = max(length if min_periods is None else min_periods, 1)
+        self.window = deque()
+        self._reset()
+        self.value = np.nan
+
+    def _reset(self):
+        self.nobs = self.mean_x = self.ssqdm_x = self.comp_add = self.comp_remove = 0.0
+        self.unstable = False
+
+    def _add(self, val):
+        if val != val:
+            return
+        prev_m2 = self.ssqdm_x
+        self.nobs += 1
+        prev_mean = self.mean_x - self.comp_add
+        y = val - self.comp_add
+        t = y - self.mean_x
+        self.comp_add = t + self.mean_x - y
+        self.mean_x = self.mean_x + t / self.nobs
+        self.ssqdm_x = self.ssqdm_x + (val - prev_mean) * (val - self.mean_x)
+        if prev_m2 * self.INV_COND_TOL > self.ssqdm_x:
+            self.unstable = True
+
+    def _remove(self, val):
+        if val == val:
+            prev_m2 = self.ssqdm_x
+            self.nobs -= 1
+            if self.nobs:
+                prev_mean = self.mean_x - self.comp_remove
+                y = val - self.comp_remove
+                t = y - self.mean_x
+                self.comp_remove = t + self.mean_x - y
+                self.mean_x = self.mean_x - t / self.nobs
+                self.ssqdm_x = self.ssqdm_x - (val - prev_mean) * (val - self.mean_x)
+                if prev_m2 * self.INV_COND_TOL > self.ssqdm_x:
+                    self.unstable = True
+            else:
+                self.mean_x = self.ssqdm_x = 0.0
+                self.unstable = False
+
+    def update(self, value):
+        recompute = not self.window or self.length == 1  # prima finestra o finestra di una barra
+        if len(self.window) == self.length:
+            self.window.popleft() if recompute else self._remove(self.window.popleft())
+        self.window.append(value)
+        if not recompute:
+            self._add(value)
+        if recompute or self.unstable:
+            self._reset()
+            for val in self.window:
+                self._add(val)
+            self.unstable = False
+        if self.nobs >= self.min_periods and self.nobs > self.ddof:
+            self.value = self.ssqdm_x / (self.nobs - self.ddof)
+        else:
+            self.value = np.nan
+        return self.value
+
+
+class RollingStd(RollingVar):
+    """pandas rolling().std(ddof): radice della varianza mobile (negativi numerici -> 0)."""
+
+    def update(self, value):
+        var = super().update(value)
+        self.value = 0.0 if var < 0 else np.sqrt(np.float64(var))
+        return self.value
+
+
+class RollingZScore(_Streaming):
+    """
+    (x - media mobile) / deviazione standard mobile, con deviazione nulla -> NaN:
+    è il vol_z di phoenix_runner prima del fillna(0.0).
+    """
+
+    def __init__(self, length=20, ddof=0):
+        self.mean = RollingMean(length)
+        self.std = RollingStd(length, ddof=ddof)
+        self.value = np.nan
+
+    def update(self, value):
+        mean, std = self.mean.update(value), self.std.update(value)
+        self.value = (value - mean) / std if std != 0 else np.nan
+        return self.value
+
+
+# ==============================================================================
+# --- INDICATORI PANDAS_TA ---
+# ==============================================================================
+
+class SMA(RollingMean):
+    """SMA_<length> di pandas_ta (rolling mean con min_periods = length)."""
+
+    def __init__(self, length=10):
+        super().__init__(length)
+
+
+class EMA(_Streaming):
+    """EMA_<length> di pandas_ta: seed con la SMA delle prime `length` chiusure, poi ewm(span, adjust=False)."""
+
+    def __init__(self, length=10):
+        self.length = length
+        self._seed_closes = []
+        self._ewm = EwmMean(2.0 / (length + 1), adjust=False)
+        self.value = np.nan
+
+    def update(self, close):
+        if self._seed_closes is None:
+            self.value = self._ewm.update(close)
+        else:
+            self._seed_closes.append(close)
+            if len(self._seed_closes) == self.length:
+                self.value = self._ewm.update(pd.Series(self._seed_closes).sum() / self.length)
+                self._seed_closes = None  # seed consumato: da qui in poi solo ewm
+        return self.value
+
+
+class RMA(EwmMean):
+    """Media di Wilder di pandas_ta: ewm(alpha=1/length, min_periods=length)."""
+
+    def __init__(self, length=10):
+        super().__init__(1.0 / length, adjust=True, min_periods=length)
+
+
+class RSI(_Streaming):
+    """RSI_<length> di Wilder come pandas_ta: RMA dei rialzi e dei ribassi di chiusura."""
+
+    def __init__(self, length=14):
+        self.length = length
+        self._gain, self._loss = RMA(length), RMA(length)
+        self._prev_close = np.nan
+        self.value = np.nan
+
+    def update(self, close):
+        change = close - self._prev_close
+        self._prev_close = close
+        gain = 0.0 if change < 0 else change
+        loss = 0.0 if change > 0 else change
+        gain_avg, loss_avg = self._gain.update(gain), self._loss.update(loss)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.value = 100 * np.float64(gain_avg) / (gain_avg + abs(loss_avg))
+        return self.value
+
+
+class ATR(_Streaming):
+    """ATRr_<length> di pandas_ta: RMA del true range (con l'epsilon delle candele piatte)."""
+
+    inputs = ('high', 'low', 'close')
+
+    def __init__(self, length=14):
+        self.length = length
+        self._plain, self._flat = RMA(length), RMA(length)
+        self.flat_seen = False
+        self.prev_close = np.nan
+        self.value = np.nan
+
+    def update(self, high, low, close):
+        self.flat_seen = self.flat_seen or high - low == 0
+        prev_close, self.prev_close = self.prev_close, close
+        if prev_close != prev_close:
+            plain_tr = flat_tr = np.nan  # prima candela: true range NaN
+        else:
+            gaps = max(abs(high - prev_close), abs(prev_close - low))
+            plain_tr, flat_tr = max(abs(high - low), gaps), max(abs(high - low + EPSILON), gaps)
+        self._plain.update(plain_tr)
+        self._flat.update(flat_tr)
+        self.value = self._flat.value if self.flat_seen else self._plain.value
+        return self.value
+
+
+class ADX(_Streaming):
+    """ADX_<length>, DMP_<length>, DMN_<length> di pandas_ta (RMA di Wilder, k = 100 / ATR)."""
+
+    inputs = ('high', 'low', 'close')
+
+    def __init__(self, length=14):
+        self.length = length
+        self.atr = ATR(length)
+        self._pos, self._neg = RMA(length), RMA(length)
+        self._dx_plain, self._dx_flat = RMA(length), RMA(length)  # ADX senza / con epsilon nell'ATR
+        self._prev = None
+        self.value = self.dmp = self.dmn = np.nan
+
+    def update(self, high, low, close):
+        self.atr.update(high, low, close)
+        if self._prev is None:
+            up = down = np.nan
+        else:
+            up, down = high - self._prev[0], self._prev[1] - low
+        self._prev = (high, low)
+        pos = up if (up > down and up > 0) else (0.0 if up == up else np.nan)
+        neg = down if (down > up and down > 0) else (0.0 if down == down else np.nan)
+        pos = 0.0 if abs(pos) < EPSILON else pos  # come zero() di pandas_ta
+        neg = 0.0 if abs(neg) < EPSILON else neg
+        pos_avg, neg_avg = self._pos.update(pos), self._neg.update(neg)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for atr, dx_rma, flat in ((self.atr._plain, self._dx_plain, False), (self.atr._flat, self._dx_flat, True)):
+                k = 100 / np.float64(atr.value)
+                dmp, dmn = k * pos_avg, k * neg_avg
+                adx = dx_rma.update(100 * abs(dmp - dmn) / (dmp + dmn))
+                if flat == self.atr.flat_seen:
+                    self.value, self.dmp, self.dmn = adx, dmp, dmn
+        return self.value
+
+
+class BollingerBands(_Streaming):
+    """
+    Bande di Bollinger di pandas_ta (BBL/BBM/BBU/BBB/BBP_<length>_<std>): SMA e deviazione
+    standard con ddof=0. La larghezza è BBB = 100 * (upper - lower) / mid; in pandas_ta
+    0.3.14b non esiste una colonna BBW.
+    """
+
+    def __init__(self, length=5, std=2.0):
+        self.length, self.std = length, float(std)
+        self._mid, self._var = SMA(length), RollingVar(length, ddof=0)
+        self.band_flat_seen = self.close_at_lower_seen = False
+        self.lower = self.mid = self.upper = self.bandwidth = self.percent = np.nan
+
+    @property
+    def value(self):
+        return {f"BBL_{self.length}_{self.std}": self.lower, f"BBM_{self.length}_{self.std}": self.mid,
+                f"BBU_{self.length}_{self.std}": self.upper, f"BBB_{self.length}_{self.std}": self.bandwidth,
+                f"BBP_{self.length}_{self.std}": self.percent}
+
+    def update(self, close):
+        mid, var = self._mid.update(close), self._var.update(close)
+        with np.errstate(invalid='ignore'):
+            deviation = np.sqrt(np.float64(var))
+        self.mid, self.lower, self.upper = mid, mid - self.std * deviation, mid + self.std * deviation
+        self.band_flat_seen = self.band_flat_seen or self.upper - self.lower == 0
+        self.close_at_lower_seen = self.close_at_lower_seen or close - self.lower == 0
+        band = self.upper - self.lower + (EPSILON if self.band_flat_seen else 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.bandwidth = 100 * band / np.float64(mid)
+            self.percent = (close - self.lower + (EPSILON if self.close_at_lower_seen else 0.0)) / np.float64(band)
+        return self.value
+
+
+class SessionVWAP(_Streaming):
+    """
+    VWAP di sessione di strategy_vwap_rev: somme azzerate sulla prima candela del giorno
+    (nel fuso di sessione) se cade nei 15 minuti dall'apertura; volume nullo -> NaN.
+    """
+
+    def __init__(self, session_start=SESSION_START, tz=TZ, marker_minutes=15):
+        self.session_start = session_start
+        self.marker_end = (datetime.combine(datetime(1900, 1, 1), session_start) + timedelta(minutes=marker_minutes)).time()
+        self.tz = tz
+        self.prev_date = None
+        self.pv_sum = self.volume_sum = 0.0
+        self.value = np.nan
+
+    def seed(self, df: pd.DataFrame):
+        for ts, high, low, close, volume in zip(df.index, *(df[c].to_numpy(dtype=float).tolist() for c in ('high', 'low', 'close', 'volume'))):
+            self.update(ts, high, low, close, volume)
+        return self
+
+    def update(self, timestamp, high, low, close, volume):
+        ts = pd.Timestamp(timestamp)
+        ts = ts.tz_localize('UTC').tz_convert(self.tz) if ts.tz is None else ts.tz_convert(self.tz)
+        date, clock = ts.date(), ts.time()
+        if date != self.prev_date and self.session_start <= clock < self.marker_end:
+            self.pv_sum = self.volume_sum = 0.0
+        self.prev_date = date
+        if volume == 0 or volume != volume:
+            self.value = np.nan
+            return self.value
+        self.pv_sum += (high + low + close) / 3.0 * volume
+        self.volume_sum += volume
+        self.value = self.pv_sum / self.volume_sum
+        return self.value
+
+
+# ==============================================================================
+# --- PARITÀ CON GLI INDICATORI BATCH ---
+# ==============================================================================
+
+BB_FIELDS = ('BBL', 'BBM', 'BBU', 'BBB', 'BBP')
+
+
+def _stream_series(make, df, inputs=None):
+    """Valore di un indicatore nuovo (make()) dopo ogni candela di df, come array (n,) o (n, k)."""
+    indicator = make()
+    out = []
+    for values in zip(*(df[c].to_numpy(dtype=float).tolist() for c in (inputs or indicator.inputs))):
+        indicator.update(*values)
+        if isinstance(indicator, ADX):
+            out.append((indicator.value, indicator.dmp, indicator.dmn))
+        elif isinstance(indicator, BollingerBands):
+            out.append(tuple(indicator.value.values()))
+        else:
+            out.append(indicator.value)
+    return np.asarray(out, dtype=np.float64)
+
+
+def _batch_functions(reference):
+    """
+    Indicatori batch sul riferimento scelto (df.ta oppure KernelTA, stessa interfaccia):
+    f(df, *parametri) -> colonne nell'ordine streaming, None se le barre sono meno di length.
+    """
+    from analysis.kernels import KernelTA, rma
+
+    def accessor(df):
+        if reference == 'pandas_ta':
+            import pandas_ta  # noqa: F401 (registra l'accessor df.ta)
+            return df.ta
+        return KernelTA(df)
+
+    def columns(result, names):
+        return None if result is None else result[names]
+
+    def wilder(df, n):
+        if reference == 'pandas_ta':
+            import pandas_ta as ta
+            return ta.rma(df['close'], length=n)
+        return None if len(df) < n else rma(df['close'], n)
+
+    return {
+        'EMA': lambda df, n: accessor(df).ema(length=n), 'SMA': lambda df, n: accessor(df).sma(length=n),
+        'RMA': wilder, 'RSI': lambda df, n: accessor(df).rsi(length=n), 'ATR': lambda df, n: accessor(df).atr(length=n),
+        'ADX': lambda df, n: columns(accessor(df).adx(length=n), [f"ADX_{n}", f"DMP_{n}", f"DMN_{n}"]),
+        'BBANDS': lambda df, n, k: columns(accessor(df).bbands(length=n, std=k), [f"{f}_{n}_{float(k)}" for f in BB_FIELDS]),
+    }
+
+
+def _as_expected(result, shape):
+    """Serie batch come array; None (storico più corto di length) equivale a "nessun valore", cioè NaN."""
+    if result is None:
+        return np.full(shape, np.nan)
+    return np.asarray(result, dtype=np.float64).reshape(shape)
+
+
+def _parity_cases(reference):
+    """
+    (nome, batch(df), fabbrica dell'indicatore streaming, input, per_prefisso).
+    per_prefisso=True per gli indicatori con l'epsilon di pandas_ta, che dipende da tutto
+    il frame: lì il valore streaming alla barra i si confronta con il batch su df[:i+1].
+    """
+    batch = _batch_functions(reference)
+    volume_z = lambda df: ((df['volume'] - df['volume'].rolling(20).mean())
+                           / df['volume'].rolling(20).std(ddof=0).replace(0, np.nan))
+    cases = [
+        ('EwmMean_span9', lambda df: df['close'].ewm(span=9).mean(), lambda: EwmMean(2 / 10), None, False),
+        ('EwmMean_a0.2', lambda df: df['close'].ewm(alpha=0.2, adjust=False, min_periods=5).mean(),
+         lambda: EwmMean(0.2, adjust=False, min_periods=5), None, False),
+        ('RollingMean_30', lambda df: df['close'].rolling(30).mean(), lambda: RollingMean(30), None, False),
+        ('RollingVar_30', lambda df: df['close'].rolling(30).var(), lambda: RollingVar(30), None, False),
+        ('RollingStd_20', lambda df: df['volume'].rolling(20).std(ddof=0), lambda: RollingStd(20, ddof=0), ('volume',), False),
+        ('RollingZScore_20', volume_z, lambda: RollingZScore(20), ('volume',), False),
+    ]
+    cases += [(f"EMA_{n}", lambda df, n=n: batch['EMA'](df, n), lambda n=n: EMA(n), None, False) for n in (9, 50, 200)]
+    cases += [
+        ('SMA_50', lambda df: batch['SMA'](df, 50), lambda: SMA(50), None, False),
+        ('RMA_19', lambda df: batch['RMA'](df, 19), lambda: RMA(19), None, False),
+        ('RSI_14', lambda df: batch['RSI'](df, 14), lambda: RSI(14), None, False),
+        ('RSI_7', lambda df: batch['RSI'](df, 7), lambda: RSI(7), None, False),
+        ('ATRr_14', lambda df: batch['ATR'](df, 14), lambda: ATR(14), None, True),
+        ('ADX_14', lambda df: batch['ADX'](df, 14), lambda: ADX(14), None, True),
+        ('BBANDS_20_2.0', lambda df: batch['BBANDS'](df, 20, 2.0), lambda: BollingerBands(20, 2.0), None, True),
+    ]
+    return cases
+
+
+def _cut_points(df, every):
+    """Lunghezze dei prefissi da verificare: campione regolare più l'intorno delle prime candele piatte."""
+    n = len(df)
+    flat = np.flatnonzero((df['high'] - df['low']).to_numpy() == 0)
+    points = set(range(1, n + 1, every)) | {n}
+    for i in flat[:3]:
+        points |= {i, i + 1, i + 2}
+    return sorted(p for p in points if 1 <= p <= n)
+
+
+def _check(df, reference, every):
+    """Lista di (nome, prima barra diversa) per df; vuota se tutto coincide."""
+    failures = []
+    for name, batch, make, inputs, per_prefix in _parity_cases(reference):
+        got = _stream_series(make, df, inputs)
+        if per_prefix:
+            for k in _cut_points(df, every):
+                expected = _as_expected(batch(df.iloc[:k]), (k,) + got.shape[1:])[-1]
+                if not np.array_equal(expected, got[k - 1], equal_nan=True):
+                    failures.append((name, k - 1))
+                    break
+            continue
+        expected = _as_expected(batch(df), got.shape)
+        same = (expected == got) | (np.isnan(expected) & np.isnan(got))
+        if not same.all():
+            failures.append((name, int(np.flatnonzero(~same.reshape(len(df), -1).all(axis=1))[0])))
+    return failures
+
+
+def _session_vwap_check(df):
+    """Prima barra in cui SessionVWAP differisce da strategy_vwap_rev (-1 se uguali, None se non importabile)."""
+    try:
+        from analysis.strategy_vwap_rev import session_vwap_frame
+    except ImportError:
+        return None
+    expected = session_vwap_frame(df)['VWAP'].to_numpy(dtype=float)
+    tracker = SessionVWAP()
+    got = np.asarray([tracker.update(ts, h, l, c, v) for ts, h, l, c, v in zip(
+        df.index, *(df[col].to_numpy(dtype=float).tolist() for col in ('high', 'low', 'close', 'volume')))])
+    same = (expected == got) | (np.isnan(expected) & np.isnan(got))
+    return -1 if same.all() else int(np.flatnonzero(~same)[0])
+
+
+def _main(argv=None):
+    from analysis.kernels import _synthetic_ohlcv
+
+    parser = argparse.ArgumentParser(description="Parità barra per barra degli indicatori streaming con quelli batch.")
+    parser.add_argument('--bars', type=int, default=3000, help="Barre del dataset sintetico principale")
+    parser.add_argument('--every', type=int, default=97, help="Passo dei prefissi per ATR/ADX/Bollinger")
+    parser.add_argument('--reference', choices=('auto', 'pandas_ta', 'kernels'), default='auto')
+    args = parser.parse_args(argv)
+
+    reference = args.reference
+    if reference == 'auto':
+        try:
+            import pandas_ta  # noqa: F401
+            reference = 'pandas_ta'
+        except ImportError:
+            reference = 'kernels'
+
+    df = _synthetic_ohlcv(args.bars)
+    df.loc[df.index[100:110], 'volume'] = 0.0  # candele senza volume: VWAP NaN e z-score con deviazione nulla
+    flat = df.iloc[:300].assign(open=100.0, high=100.0, low=100.0, close=100.0)
+    datasets = [('sintetico', df), ('corto', _synthetic_ohlcv(12, seed=3)), ('piatto', flat)]
+    print(f"Riferimento batch: {reference}")
+    failures = 0
+    for label, data in datasets:
+        problems = _check(data, reference, args.every)
+        vwap = _session_vwap_check(data)
+        if vwap is None:
+            print(f"  {label}: SessionVWAP non verificato (strategy_vwap_rev non importabile)")
+        elif vwap >= 0:
+            problems.append(('SessionVWAP', vwap))
+        for name, bar in problems:
+            print(f"  DIFF {label} {name}: prima barra diversa {bar} su {len(data)}")
+        failures += len(problems)
+        print(f"{label:<10}{len(data):>6} barre: {'ok' if not problems else f'{len(problems)} diversi'}")
+    print("Parità bit per bit su tutte le barre." if not failures else f"{failures} serie diverse dal batch.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
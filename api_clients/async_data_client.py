@@ -0,0 +1,202 @@
+# api_clients/async_data_client.py (v1.3 - Client asincrono per i runner live)
+# Variante asyncio di FinancialDataClient: una sola aiohttp.ClientSession con
+# connessioni in pool, concorrenza limitata da un semaforo e timeout per richiesta.
+# Un ciclo dei runner scarica tutte le candele che gli servono con un solo gather:
+# il tempo del ciclo diventa quello della richiesta più lenta, non la somma.
+#
+# Uso dai runner (sincroni):
+#   client = AsyncFinancialDataClient()
+#   snapshot = client.snapshot([(asset, "15m", "bybit", 400) for asset in config.ASSET_UNIVERSE], fallback=data_client)
+#   df = snapshot.get_klines(asset, "15m", limit=400)   # stessa firma di FinancialDataClient.get_klines
+# Per i runner a colpo singolo: fetch_snapshot(requests, fallback=data_client) apre e chiude il client.
+# Con cache=KLINE_CACHE (api_clients.kline_cache) si scaricano solo le richieste non ancora in cache
+# (o solo la coda, se in cache ci sono già le candele chiuse).
+import asyncio
+import logging
+import time
+
+import aiohttp
+import pandas as pd
+
+from api_clients.data_client import BYBIT_KLINE_URL, bybit_kline_params, parse_bybit_klines
+from infra.http import DEFAULT_TIMEOUT
+from infra.kline_decoder import decode_klines, loads
+
+BINANCE_KLINE_URL = "https://api.binance.com/api/v3/klines"
+DEFAULT_CONCURRENCY = 16
+RETRY_STATUS = {429, 500, 502, 503, 504}
+MAX_RETRIES = 3
+
+
+def parse_binance_klines(rows) -> pd.DataFrame:
+    """Righe /api/v3/klines -> DataFrame OHLCV con indice UTC crescente (stesso formato di Bybit)."""
+    return decode_klines(rows)
+
+
+class AsyncFinancialDataClient:
+    """
+    Client asincrono per le candele recenti (Bybit linear e Binance spot).
+    Le coroutine vanno usate su un solo event loop; i runner sincroni usano
+    gather_klines_sync()/snapshot(), che tengono vivi loop e sessione tra un ciclo e l'altro.
+    """
+
+    def __init__(self, max_concurrency: int = DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT, bybit_url: str = BYBIT_KLINE_URL):
+        self.max_concurrency = max_concurrency
+        self.bybit_url = bybit_url  # sostituibile con un server locale nei test (vedi api_clients.bybit_ws)
+        connect, read = timeout
+        self.timeout = aiohttp.ClientTimeout(total=connect + read, sock_connect=connect, sock_read=read)
+        self._session = None
+        self._semaphore = None
+        self._loop = None
+        self.requests_made = 0   # richieste HTTP completate
+        self.bytes_received = 0  # byte dei corpi di risposta
+
+    # --- Ciclo di vita ---
+
+    async def _ensure_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, headers={"Connection": "keep-alive"})
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def aclose(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self):
+        await self._ensure_session()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    def close(self):
+        """Chiude sessione e loop privato usati dalle chiamate sincrone."""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.run_until_complete(self.aclose())
+            self._loop.close()
+        self._loop = None
+
+    # --- Richieste ---
+
+    async def _get_json(self, url, params):
+        """GET con semaforo, timeout per richiesta e pochi retry su 429/5xx/errori di rete."""
+        session = await self._ensure_session()
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                async with self._semaphore:
+                    async with session.get(url, params=params) as response:
+                        if response.status in RETRY_STATUS and attempt < MAX_RETRIES:
+                            raise aiohttp.ClientResponseError(response.request_info, response.history, status=response.status)
+                        response.raise_for_status()
+                        body = await response.read()
+                self.requests_made += 1
+                self.bytes_received += len(body)
+                return loads(body)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == MAX_RETRIES or (isinstance(e, aiohttp.ClientResponseError) and e.status not in RETRY_STATUS):
+                    raise
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+    async def get_klines(self, symbol, interval, source='bybit', limit=200, start_time: int = None):
+        """
+        Come FinancialDataClient.get_klines (candele recenti): DataFrame, vuoto, o None se errore.
+        Con start_time (ms) arrivano solo le candele aperte da start_time in poi (al massimo limit).
+        """
+        source = source.lower()
+        try:
+            if source == 'bybit':
+                return parse_bybit_klines(await self._get_json(self.bybit_url, bybit_kline_params(symbol, interval, limit, start_time)))
+            if source == 'binance':
+                params = {'symbol': symbol, 'interval': interval, 'limit': limit}
+                if start_time:
+                    params['startTime'] = start_time
+                return parse_binance_klines(await self._get_json(BINANCE_KLINE_URL, params))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.error(f"Errore di connessione API {source} per {symbol} {interval}: {e!r}")
+        return None
+
+    async def gather_klines(self, requests) -> dict:
+        """
+        Scarica in parallelo una lista di richieste (symbol, interval, source, limit[, start_time]).
+        Restituisce {richiesta: DataFrame | None}; un errore su una richiesta non ferma le altre.
+        """
+        requests = list(dict.fromkeys(tuple(r) for r in requests))
+        results = await asyncio.gather(*(self.get_klines(*r) for r in requests), return_exceptions=True)
+        frames = {}
+        for request, result in zip(requests, results):
+            if isinstance(result, Exception):
+                logging.error(f"Errore durante il download di {request}: {result!r}")
+                result = None
+            frames[request] = result
+        return frames
+
+    # --- Facciata sincrona per i runner ---
+
+    def gather_klines_sync(self, requests) -> dict:
+        """gather_klines() da codice sincrono, su un loop privato riusato ad ogni ciclo (pool di connessioni incluso)."""
+        if self._loop is None or self._loop.is_closed():
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(self.gather_klines(requests))
+
+    def snapshot(self, requests, fallback=None, cache=None) -> "KlineSnapshot":
+        """
+        Snapshot di un ciclo; con cache (KlineCache) le richieste ancora fresche non vengono riscaricate
+        e quelle con le candele chiuse ancora valide scaricano solo la coda (tail_limit/store_tail).
+        """
+        if cache is None:
+            return KlineSnapshot(self.gather_klines_sync(requests), fallback)
+        frames, missing, tails = {}, [], {}
+        for request in dict.fromkeys(tuple(r) for r in requests):
+            df = cache.lookup(*request)
+            if df is not None:
+                frames[request] = df
+                continue
+            tail = cache.tail_limit(*request)
+            if tail is None:
+                missing.append(request)
+            else:
+                tails[request[:3] + (tail,)] = request
+        fetched_ms = int(time.time() * 1000)
+        for request, df in self.gather_klines_sync(missing + list(tails)).items():
+            if request in tails:
+                request, df = tails[request], cache.store_tail(*tails[request][:4], df, fetched_ms)
+                if df is None:
+                    continue  # coda non raccordata: la richiesta passa al fallback
+            else:
+                cache.store(*request[:4], df, fetched_ms, *request[4:])
+            frames[request] = df
+        return KlineSnapshot(frames, fallback)
+
+
+class KlineSnapshot:
+    """
+    Candele di un ciclo già scaricate, con la stessa get_klines di FinancialDataClient:
+    il codice di analisi esistente le legge senza modifiche. Ogni lettura restituisce una
+    copia (gli indicatori vengono aggiunti in place); le richieste non previste passano
+    al client sincrono di fallback.
+    """
+
+    def __init__(self, frames: dict, fallback=None):
+        self.frames = frames
+        self.fallback = fallback
+
+    def get_klines(self, symbol, interval, source='bybit', limit=200, start_time=None, end_time=None):
+        key = (symbol, interval, source, limit)
+        if start_time is None and end_time is None and key in self.frames:
+            df = self.frames[key]
+            return None if df is None else df.copy()
+        if self.fallback is None:
+            return None
+        return self.fallback.get_klines(symbol, interval, source, limit, start_time, end_time)
+
+
+def fetch_snapshot(requests, fallback=None, max_concurrency: int = DEFAULT_CONCURRENCY, cache=None) -> KlineSnapshot:
+    """Snapshot di un solo ciclo: apre client e sessione, scarica tutto in parallelo e li chiude."""
+    client = AsyncFinancialDataClient(max_concurrency=max_concurrency)
+    try:
+        return client.snapshot(requests, fallback, cache)
+    finally:
+        client.close()
@@ -1,6 +1,8 @@
 import requests
 import pandas as pd
 
+from infra.kline_decoder import decode_klines, loads
+
 BASE_URL = "https://api.binance.com/api/v3"
 
 def get_klines(symbol: str, interval: str, limit: int = 500):
@@ -11,24 +13,14 @@ def get_klines(symbol: str, interval: str, limit: int = 500):
     try:
         response = requests.get(endpoint, params=params, timeout=10)
         response.raise_for_status()
-        data = response.json()
+        data = loads(response.content)
 
         if not data:
             return pd.DataFrame() # Restituisce un DataFrame vuoto
 
-        df = pd.DataFrame(data, columns=[
-            'timestamp', 'open', 'high', 'low', 'close', 'volume', 
-            'close_time', 'quote_asset_volume', 'number_of_trades', 
-            'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'
-        ])
-        
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        df = df.set_index('timestamp')
-        numeric_cols = ['open', 'high', 'low', 'close', 'volume']
-        df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric, errors='coerce')
-        
-        return df[numeric_cols]
+        # [open_time, open, high, low, close, volume, close_time, ...]: bastano i primi sei campi
+        return decode_klines(data, utc=False)
 
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, ValueError) as e:
         print(f"ERRORE in binance_client.get_klines per {symbol}: {e}")
         return None
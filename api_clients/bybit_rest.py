@@ -7,6 +7,7 @@
 # ------------------------------------------------------------------
 
 import pandas as pd
+from infra.kline_decoder import decode_klines, loads
 from infra.http import new_session, DEFAULT_TIMEOUT
 
 BASE_URL = "https://api.bybit.com"
@@ -14,26 +15,14 @@ _s = new_session()
 
 INTERVAL_MAP = {"1h": "60", "4h": "240", "1d": "D"}
 
-def get_klines(symbol: str, timeframe: str, category: str = "linear", limit: int = 200) -> pd.DataFrame:
-    """
-    Scarica kline da Bybit v5/market/kline.
-    category: "spot" | "linear" | "inverse" (se usi derivati, "linear")
-    """
+def _kline_params(symbol: str, timeframe: str, category: str, limit: int) -> dict:
     iv = INTERVAL_MAP.get(timeframe.lower())
     if not iv:
         raise ValueError(f"Interval non supportato: {timeframe}")
+    return {"category": category, "symbol": symbol, "interval": iv, "limit": limit}
 
-    params = {
-        "category": category,
-        "symbol": symbol,
-        "interval": iv,
-        "limit": limit
-    }
-
-    r = _s.get(f"{BASE_URL}/v5/market/kline", params=params, timeout=DEFAULT_TIMEOUT)
-    r.raise_for_status()
-    payload = r.json()
 
+def _klines_frame(payload: dict) -> pd.DataFrame:
     if payload.get("retCode") != 0:
         raise RuntimeError(f"Bybit retCode={payload.get('retCode')} retMsg={payload.get('retMsg')}")
 
@@ -41,12 +30,28 @@ def get_klines(symbol: str, timeframe: str, category: str = "linear", limit: int
     if not rows:
         return pd.DataFrame()
 
-    # Bybit restituisce: [timestamp, open, high, low, close, volume, turnover]
-    df = pd.DataFrame(rows, columns=["t", "o", "h", "l", "c", "v", "turnover"])
-    df["t"] = pd.to_datetime(df["t"].astype("int64"), unit="ms")
-    df.set_index("t", inplace=True)
-    df.rename(columns={"o": "open", "h": "high", "l": "low", "c": "close", "v": "volume"}, inplace=True)
-    df[["open", "high", "low", "close", "volume"]] = df[["open", "high", "low", "close", "volume"]].apply(
-        pd.to_numeric, errors="coerce"
-    )
-    return df.sort_index()
\ No newline at end of file
+    # Bybit restituisce: [timestamp, open, high, low, close, volume, turnover], dal più recente
+    return decode_klines(rows, descending=True, utc=False, index_name="t")
+
+
+def get_klines(symbol: str, timeframe: str, category: str = "linear", limit: int = 200) -> pd.DataFrame:
+    """
+    Scarica kline da Bybit v5/market/kline.
+    category: "spot" | "linear" | "inverse" (se usi derivati, "linear")
+    """
+    params = _kline_params(symbol, timeframe, category, limit)
+    r = _s.get(f"{BASE_URL}/v5/market/kline", params=params, timeout=DEFAULT_TIMEOUT)
+    r.raise_for_status()
+    return _klines_frame(loads(r.content))
+
+
+async def get_klines_async(session, symbol: str, timeframe: str, category: str = "linear", limit: int = 200) -> pd.DataFrame:
+    """
+    Come get_klines ma su una aiohttp.ClientSession condivisa (connessioni in pool):
+    usala con asyncio.gather per scaricare più simboli/timeframe in parallelo.
+    Timeout e limite di connessioni sono quelli della sessione.
+    """
+    params = _kline_params(symbol, timeframe, category, limit)
+    async with session.get(f"{BASE_URL}/v5/market/kline", params=params) as r:
+        r.raise_for_status()
+        return _klines_frame(loads(await r.read()))
@@ -0,0 +1,562 @@
+# api_clients/bybit_ws.py (v1.3 - Feed K-line in streaming da Bybit v5 WebSocket)
+# Sottoscrive i topic kline.<intervallo>.<simbolo> dell'universo e tiene, per ogni
+# coppia simbolo/timeframe, un ring buffer NumPy a capacità fissa (infra.ring_buffer)
+# delle ultime candele chiuse più quella in formazione. Quando Bybit conferma una candela (confirm=true) i listener ricevono
+# subito un BarEvent: niente più polling REST di 400 barre ogni minuto.
+#
+# Alla (ri)connessione, e ogni volta che manca una candela, il buco viene colmato
+# via REST (AsyncFinancialDataClient) prima di applicare i messaggi successivi
+# dello stesso simbolo; le candele recuperate arrivano ai listener con backfilled=True.
+#
+# Per i test senza rete: `record` salva i frame ricevuti, `replay` li ripropone da un
+# server locale (WebSocket + endpoint REST ricostruito dai frame) su cui puntare lo stream.
+#   python -m api_clients.bybit_ws record --symbols BTCUSDT ETHUSDT --intervals 1m --out frames.jsonl --seconds 300
+#   python -m api_clients.bybit_ws replay frames.jsonl --port 8765 [--speed 10]
+#   python -m api_clients.bybit_ws watch --url ws://127.0.0.1:8765/v5/public/linear --rest http://127.0.0.1:8765/v5/market/kline
+# `check` verifica riconnessione e gap-fill senza rete: frame sintetici (o un file registrato) su un
+# ReplayServer che chiude la connessione ogni N frame perdendone alcuni; esce con 1 se mancano candele.
+#   python -m api_clients.bybit_ws check [--frames frames.jsonl] [--bars 120] [--drop-after 100 --skip 6]
+#
+# `publish` fa da ingester unico per la macchina: ogni aggiornamento (candele chiuse e in
+# formazione) viene scritto nel feed in memoria condivisa (infra.market_feed) letto dagli altri servizi.
+#   python -m api_clients.bybit_ws publish --intervals 15m 4h [--path /dev/shm/phoenix_market_feed]
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from typing import NamedTuple
+
+import aiohttp
+import numpy as np
+import pandas as pd
+from aiohttp import web
+
+from api_clients.async_data_client import AsyncFinancialDataClient
+from infra.kline_decoder import loads
+from infra.market_feed import DEFAULT_PATH as MARKET_FEED_PATH, MarketFeedWriter
+from infra.ohlcv_store import interval_ms, OHLCV_COLUMNS, OHLCVArrays
+from infra.ring_buffer import OHLCVRing
+
+PUBLIC_LINEAR_URL = "wss://stream.bybit.com/v5/public/linear"
+PING_SECONDS = 20          # Bybit chiude la connessione senza ping per più di ~30 s
+SUBSCRIBE_CHUNK = 10       # topic per messaggio di subscribe
+MAX_BACKOFF_SECONDS = 30
+DEFAULT_CAPACITY = 400
+
+
+def bybit_interval(timeframe) -> str:
+    """'15m' -> '15', '4h' -> '240', '1d' -> 'D' (anche le forme Bybit restano invariate)."""
+    minutes = interval_ms(timeframe) // 60_000
+    return {1440: "D", 10_080: "W"}.get(minutes, str(minutes))
+
+
+class BarEvent(NamedTuple):
+    symbol: str
+    interval: str           # timeframe come sottoscritto (es. '15m')
+    timestamp: pd.Timestamp  # apertura della candela, UTC
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+    backfilled: bool        # True se recuperata via REST dopo un buco
+
+
+class KlineBuffer:
+    """Ultime `capacity` candele chiuse di un simbolo/timeframe più quella in formazione."""
+
+    __slots__ = ('symbol', 'interval', 'step', 'closed', 'forming')
+
+    def __init__(self, symbol: str, interval: str, capacity: int = DEFAULT_CAPACITY):
+        self.symbol = symbol
+        self.interval = interval
+        self.step = interval_ms(interval)
+        self.closed = OHLCVRing(capacity)
+        self.forming = None  # tupla (start ms, open, high, low, close, volume)
+
+    @property
+    def capacity(self) -> int:
+        return self.closed.capacity
+
+    @property
+    def nbytes(self) -> int:
+        return self.closed.nbytes
+
+    @property
+    def last_closed_ms(self):
+        return self.closed.last_ms
+
+    def apply(self, bar: tuple, confirm: bool) -> bool:
+        """Applica un aggiornamento; True se ha chiuso una candela nuova. I duplicati/vecchi vengono ignorati."""
+        last = self.last_closed_ms
+        if last is not None and bar[0] <= last:
+            return False
+        if confirm:
+            self.closed.append(*bar)
+            if self.forming is not None and self.forming[0] <= bar[0]:
+                self.forming = None
+            return True
+        if self.forming is None or bar[0] >= self.forming[0]:
+            self.forming = bar
+        return False
+
+    def window(self, n: int = None) -> OHLCVArrays:
+        """Viste NumPy (senza copie) sulle ultime n candele chiuse."""
+        return self.closed.window(n)
+
+    def frame(self, include_forming: bool = True) -> pd.DataFrame:
+        """DataFrame OHLCV con indice UTC, nello stesso formato di FinancialDataClient.get_klines."""
+        if not include_forming or self.forming is None:
+            return self.closed.frame()
+        forming = np.array(self.forming, dtype=np.float64)
+        forming[0] = np.int64(self.forming[0]).view(np.float64)
+        return OHLCVArrays(np.column_stack([self.closed.window_matrix(), forming])).to_dataframe(as_index=True)
+
+
+def _event(buffer: KlineBuffer, bar: tuple, backfilled: bool) -> BarEvent:
+    return BarEvent(buffer.symbol, buffer.interval, pd.Timestamp(bar[0], unit='ms', tz='UTC'), *bar[1:], backfilled)
+
+
+class BybitKlineStream:
+    """
+    Feed K-line in streaming. I listener (callable sincroni, add_listener) ricevono un
+    BarEvent per ogni candela chiusa, in ordine per simbolo/timeframe; buffers[(simbolo, tf)]
+    contiene lo storico recente per le strategie.
+    """
+
+    def __init__(self, symbols, intervals, capacity: int = DEFAULT_CAPACITY, url: str = PUBLIC_LINEAR_URL,
+                 rest: AsyncFinancialDataClient = None, record_path: str = None):
+        self.url = url
+        self.rest = rest or AsyncFinancialDataClient(max_concurrency=8)
+        self.record_path = record_path
+        self.buffers = {(s, tf): KlineBuffer(s, tf, capacity) for s in symbols for tf in intervals}
+        self._topics = {f"kline.{bybit_interval(tf)}.{s}": (s, tf) for s, tf in self.buffers}
+        self._listeners = []
+        self._update_listeners = []
+        self._needs_fill = set()
+        self._pending = {}   # messaggi arrivati mentre il buco di quella chiave viene colmato
+        self._tasks = set()
+        self._stopped = False
+        self._ws = None
+        self.stats = {'frames': 0, 'bars_closed': 0, 'backfilled': 0, 'reconnects': 0, 'dispatch_us_max': 0.0}
+
+    def memory_by_symbol(self) -> dict:
+        """Byte dei buffer per simbolo (fissi: capacità x timeframe, indipendenti dalla durata del run)."""
+        usage = {}
+        for (symbol, _), buffer in self.buffers.items():
+            usage[symbol] = usage.get(symbol, 0) + buffer.nbytes
+        return usage
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def add_update_listener(self, callback):
+        """callback(buffer, bar, confirm) per OGNI aggiornamento accettato dal buffer, anche della candela in formazione."""
+        self._update_listeners.append(callback)
+
+    def stop(self):
+        """Ferma lo stream (da chiamare nel thread dell'event loop, es. da un listener o call_later)."""
+        self._stopped = True
+        if self._ws is not None and not self._ws.closed:
+            asyncio.get_running_loop().create_task(self._ws.close())
+
+    # --- Eventi ---
+
+    def _emit(self, event: BarEvent, received: float):
+        self.stats['bars_closed'] += 1
+        self.stats['backfilled'] += event.backfilled
+        for callback in self._listeners:
+            try:
+                callback(event)
+            except Exception as e:
+                logging.error(f"Listener {callback!r} fallito su {event.symbol} {event.interval}: {e}", exc_info=True)
+        if not event.backfilled:
+            self.stats['dispatch_us_max'] = max(self.stats['dispatch_us_max'], (time.perf_counter() - received) * 1e6)
+
+    def _buffer_apply(self, buffer: KlineBuffer, bar: tuple, confirm: bool) -> bool:
+        closed = buffer.apply(bar, confirm)
+        if self._update_listeners and (closed or buffer.forming is bar):
+            for callback in self._update_listeners:
+                try:
+                    callback(buffer, bar, confirm)
+                except Exception as e:
+                    logging.error(f"Update listener {callback!r} fallito su {buffer.symbol} {buffer.interval}: {e}", exc_info=True)
+        return closed
+
+    def _apply(self, key, bar: tuple, confirm: bool, received: float):
+        if key in self._pending:
+            self._pending[key].append((bar, confirm, received))
+            return
+        buffer = self.buffers[key]
+        last = buffer.last_closed_ms
+        if key in self._needs_fill or (last is not None and bar[0] > last + buffer.step):
+            # prima dei dati di questa chiave (o candele perse): recupero REST, poi il messaggio
+            self._needs_fill.discard(key)
+            self._pending[key] = [(bar, confirm, received)]
+            task = asyncio.get_running_loop().create_task(self._fill(key, bar[0]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            return
+        if self._buffer_apply(buffer, bar, confirm):
+            self._emit(_event(buffer, bar, False), received)
+
+    async def _fill(self, key, until_ms: int):
+        """Scarica via REST le candele chiuse prima di until_ms mancanti nel buffer, poi applica i messaggi in attesa."""
+        buffer = self.buffers[key]
+        last = buffer.last_closed_ms
+        missing = buffer.capacity if last is None else min(buffer.capacity, (until_ms - last) // buffer.step - 1)
+        try:
+            if missing > 0:
+                df = await self.rest.get_klines(buffer.symbol, bybit_interval(buffer.interval), 'bybit', min(1000, missing + 3))
+                if df is None:
+                    logging.warning(f"[WS] Recupero REST fallito per {buffer.symbol} {buffer.interval}: buco non colmato.")
+                else:
+                    stamps = df.index.as_unit('ms').asi8
+                    values = df[list(OHLCV_COLUMNS)].to_numpy(dtype=float)
+                    seeding = last is None
+                    for ts, row in zip(stamps, values):
+                        bar = (int(ts), *map(float, row))
+                        if ts < until_ms and self._buffer_apply(buffer, bar, True) and not seeding:
+                            self._emit(_event(buffer, bar, True), time.perf_counter())
+                    if not seeding and buffer.last_closed_ms is not None and buffer.last_closed_ms < until_ms - buffer.step:
+                        logging.warning(f"[WS] {buffer.symbol} {buffer.interval}: REST non ha restituito tutte le candele mancanti.")
+        finally:
+            for bar, confirm, received in self._pending.pop(key, []):
+                if self._buffer_apply(buffer, bar, confirm):
+                    self._emit(_event(buffer, bar, False), received)
+
+    # --- Messaggi ---
+
+    def _on_text(self, text: str):
+        received = time.perf_counter()
+        self.stats['frames'] += 1
+        message = loads(text)
+        key = self._topics.get(message.get('topic'))
+        if key is None:
+            if message.get('op') == 'subscribe' and not message.get('success', True):
+                logging.error(f"[WS] Subscribe rifiutato: {message.get('ret_msg')}")
+            return
+        for k in message.get('data', []):
+            bar = (int(k['start']), float(k['open']), float(k['high']), float(k['low']), float(k['close']), float(k['volume']))
+            self._apply(key, bar, bool(k.get('confirm')), received)
+
+    async def _ping(self, ws):
+        while True:
+            await asyncio.sleep(PING_SECONDS)
+            await ws.send_str(json.dumps({'op': 'ping'}))
+
+    async def _session(self, session, record):
+        async with session.ws_connect(self.url, heartbeat=None, autoping=True) as ws:
+            self._ws = ws
+            topics = list(self._topics)
+            for i in range(0, len(topics), SUBSCRIBE_CHUNK):
+                await ws.send_str(json.dumps({'op': 'subscribe', 'args': topics[i:i + SUBSCRIBE_CHUNK]}))
+            logging.info(f"[WS] Connesso a {self.url}: {len(topics)} topic sottoscritti.")
+            self._needs_fill = set(self.buffers)  # dopo ogni (ri)connessione si controllano i buchi
+            pinger = asyncio.create_task(self._ping(ws))
+            try:
+                async for msg in ws:
+                    if msg.type == aiohttp.WSMsgType.TEXT:
+                        if record is not None:
+                            record.write(json.dumps({'recv': time.time(), 'msg': json.loads(msg.data)}) + "\n")
+                        self._on_text(msg.data)
+                    elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                        break
+                    if self._stopped:
+                        break
+            finally:
+                pinger.cancel()
+
+    async def run(self):
+        """Connette, sottoscrive e riconnette con backoff esponenziale finché non viene chiamato stop()."""
+        backoff = 1
+        record = open(self.record_path, 'a') if self.record_path else None
+        try:
+            async with aiohttp.ClientSession() as session:
+                while not self._stopped:
+                    started = time.monotonic()
+                    try:
+                        await self._session(session, record)
+                    except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError) as e:
+                        logging.warning(f"[WS] Connessione persa: {e!r}")
+                    if self._stopped:
+                        break
+                    if time.monotonic() - started > MAX_BACKOFF_SECONDS:
+                        backoff = 1  # la connessione era stabile: si riparte dal backoff minimo
+                    self.stats['reconnects'] += 1
+                    logging.info(f"[WS] Riconnessione tra {backoff} s.")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+        finally:
+            if record is not None:
+                record.close()
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            await self.rest.aclose()
+
+    def run_forever(self):
+        asyncio.run(self.run())
+
+
+# --- Server locale di replay (test senza rete) ---
+
+class ReplayServer:
+    """
+    Ripropone frame registrati (righe JSON {'recv': s, 'msg': {...}}) a chi si connette su
+    /v5/public/linear, rispettando gli intervalli originali divisi per `speed`, e risponde su
+    /v5/market/kline con le candele ricostruite dai frame già inviati (per il gap-fill).
+    drop_after=N chiude la connessione ogni N frame inviati, per provare la riconnessione.
+    """
+
+    def __init__(self, frames: list, speed: float = 1.0, drop_after: int = None, skip_on_drop: int = 0):
+        self.frames = frames
+        self.speed = speed
+        self.drop_after = drop_after
+        self.skip_on_drop = skip_on_drop    # frame persi durante la disconnessione
+        self.cursor = 0
+        self.bars = {}                      # topic -> {start: riga kline Bybit}
+        self.connections = 0
+        self.runner = None
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs):
+        with open(path) as f:
+            return cls([json.loads(line) for line in f if line.strip()], **kwargs)
+
+    def _remember(self, msg: dict):
+        topic = msg.get('topic', '')
+        for k in msg.get('data', []) if topic.startswith('kline.') else []:
+            self.bars.setdefault(topic, {})[int(k['start'])] = [str(k['start']), k['open'], k['high'], k['low'], k['close'], k['volume'], k.get('turnover', '0')]
+
+    async def _ws(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connections += 1
+        topics = set()
+        subscribed = asyncio.Event()
+        reader = asyncio.create_task(self._read(ws, topics, subscribed))
+        sent = 0
+        previous = None
+        try:
+            await subscribed.wait()  # come Bybit: nessun frame prima del subscribe
+            while self.cursor < len(self.frames) and not ws.closed:
+                frame = self.frames[self.cursor]
+                if previous is not None and self.speed:
+                    await asyncio.sleep(max(0.0, (frame['recv'] - previous) / self.speed))
+                previous = frame['recv']
+                self.cursor += 1
+                msg = frame['msg']
+                self._remember(msg)
+                if msg.get('topic') in topics:
+                    try:
+                        await ws.send_str(json.dumps(msg))
+                    except ConnectionResetError:
+                        break  # il client ha chiuso: il frame va perso, come in produzione
+                    sent += 1
+                if self.drop_after and sent >= self.drop_after:
+                    for skipped in self.frames[self.cursor:self.cursor + self.skip_on_drop]:
+                        self._remember(skipped['msg'])
+                    self.cursor += self.skip_on_drop
+                    break
+        finally:
+            reader.cancel()
+            await ws.close()
+        return ws
+
+    async def _read(self, ws, topics, subscribed):
+        async for msg in ws:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                continue
+            request = json.loads(msg.data)
+            if request.get('op') == 'subscribe':
+                topics.update(request.get('args', []))
+                await ws.send_str(json.dumps({'success': True, 'ret_msg': '', 'op': 'subscribe'}))
+                subscribed.set()
+            elif request.get('op') == 'ping':
+                await ws.send_str(json.dumps({'success': True, 'ret_msg': 'pong', 'op': 'ping'}))
+
+    async def _kline(self, request):
+        q = request.query
+        bars = self.bars.get(f"kline.{q['interval']}.{q['symbol']}", {})
+        rows = [bars[start] for start in sorted(bars, reverse=True)[:int(q.get('limit', 200))]]
+        return web.json_response({'retCode': 0, 'retMsg': 'OK', 'result': {'symbol': q['symbol'], 'category': 'linear', 'list': rows}})
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8765):
+        app = web.Application()
+        app.router.add_get('/v5/public/linear', self._ws)
+        app.router.add_get('/v5/market/kline', self._kline)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        return f"ws://{host}:{port}/v5/public/linear", f"http://{host}:{port}/v5/market/kline"
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+
+def synthetic_frames(symbols, interval: str = '1m', bars: int = 120, start_ms: int = 1_700_000_000_000) -> list:
+    """Frame kline in formato `record` (un aggiornamento in formazione e uno di chiusura per candela)."""
+    step = interval_ms(interval)
+    rng = np.random.default_rng(7)
+    frames = []
+    for s, symbol in enumerate(symbols):
+        price = 100.0 * (s + 1)
+        for i in range(bars):
+            start = start_ms + i * step
+            close = price * (1 + rng.normal(0, 0.002))
+            row = {'start': start, 'open': str(price), 'high': str(max(price, close) * 1.001), 'low': str(min(price, close) * 0.999),
+                   'close': str(close), 'volume': str(round(rng.uniform(1, 10), 3)), 'turnover': '0'}
+            topic = f"kline.{bybit_interval(interval)}.{symbol}"
+            frames.append({'recv': (start + step // 2) / 1000, 'msg': {'topic': topic, 'data': [dict(row, confirm=False)]}})
+            frames.append({'recv': (start + step) / 1000, 'msg': {'topic': topic, 'data': [dict(row, confirm=True)]}})
+            price = close
+    frames.sort(key=lambda f: f['recv'])
+    return frames
+
+
+async def check_replay(frames: list, speed: float = 2000.0, drop_after: int = 100, skip_on_drop: int = 6,
+                       timeout: float = 120.0, port: int = 8765) -> list:
+    """
+    Fa girare uno stream contro un ReplayServer che cade ogni drop_after frame e confronta le
+    candele chiuse ricevute con quelle dei frame. Restituisce l'elenco dei problemi (vuoto = ok).
+    speed deve lasciare al gap-fill REST il tempo di rispondere prima dei frame successivi,
+    come in produzione: con speed=0 il server corre oltre le candele mancanti.
+    """
+    expected = {}
+    for frame in frames:
+        topic = frame['msg'].get('topic', '')
+        for k in frame['msg'].get('data', []) if topic.startswith('kline.') else []:
+            if k.get('confirm'):
+                expected.setdefault(topic, set()).add(int(k['start']))
+    server = ReplayServer(frames, speed=speed, drop_after=drop_after, skip_on_drop=skip_on_drop)
+    ws_url, rest_url = await server.start(port=port)
+    intervals = {topic.split('.')[1] for topic in expected}
+    by_code = {bybit_interval(tf): tf for tf in ('1m', '3m', '5m', '15m', '30m', '1h', '2h', '4h', '6h', '12h', '1d')}
+    symbols = sorted({topic.split('.', 2)[2] for topic in expected})
+    stream = BybitKlineStream(symbols, [by_code.get(i, i) for i in intervals], url=ws_url,
+                              rest=AsyncFinancialDataClient(bybit_url=rest_url))
+    received = {}
+    last = {tuple(topic.split('.', 2)[1:]): max(starts) for topic, starts in expected.items()}
+
+    def on_bar(event):
+        key = (bybit_interval(event.interval), event.symbol)
+        received.setdefault(key, []).append(int(event.timestamp.value // 1_000_000))
+        if all(received.get(k, [0])[-1] >= ms for k, ms in last.items()):
+            stream.stop()
+    stream.add_listener(on_bar)
+    asyncio.get_running_loop().call_later(timeout, stream.stop)
+    try:
+        await stream.run()
+    finally:
+        await server.stop()
+
+    problems = []
+    for (code, symbol), ms in last.items():
+        got = received.get((code, symbol), [])
+        want = sorted(s for s in expected[f"kline.{code}.{symbol}"] if s > min(expected[f"kline.{code}.{symbol}"]))
+        if got != sorted(set(got)):
+            problems.append(f"{symbol} {code}: candele fuori ordine o duplicate")
+        missing = sorted(set(want) - set(got))
+        if missing:
+            problems.append(f"{symbol} {code}: {len(missing)} candele mancanti (prima {pd.Timestamp(missing[0], unit='ms', tz='UTC')})")
+    if drop_after and len(frames) > drop_after and stream.stats['reconnects'] == 0:
+        problems.append("nessuna riconnessione: il server di replay non ha chiuso la connessione")
+    if drop_after and skip_on_drop and len(frames) > drop_after + skip_on_drop and stream.stats['backfilled'] == 0:
+        problems.append("nessuna candela recuperata via REST dopo i frame persi")
+    logging.info(f"[CHECK] connessioni={server.connections} stats={stream.stats}")
+    return problems
+
+
+def attach_feed_writer(stream: BybitKlineStream, path: str = None) -> MarketFeedWriter:
+    """Crea il feed in memoria condivisa per le serie dello stream e vi pubblica ogni aggiornamento."""
+    capacity = next(iter(stream.buffers.values())).capacity
+    writer = MarketFeedWriter(list(stream.buffers), capacity=capacity, path=path or MARKET_FEED_PATH)
+    stream.add_update_listener(lambda buffer, bar, confirm: writer.publish(buffer.symbol, buffer.interval, bar, confirm))
+    return writer
+
+
+def _main(argv=None):
+    parser = argparse.ArgumentParser(description="Feed K-line Bybit via WebSocket: osserva, registra o riproponi i frame.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name in ('watch', 'record', 'publish'):
+        p = sub.add_parser(name)
+        p.add_argument('--symbols', nargs='+', default=None, help="Default: config.ASSET_UNIVERSE")
+        p.add_argument('--intervals', nargs='+', default=['1m'])
+        p.add_argument('--url', default=PUBLIC_LINEAR_URL)
+        p.add_argument('--rest', default=None, help="Endpoint REST kline per il gap-fill (default: Bybit)")
+        p.add_argument('--seconds', type=float, default=None, help="Durata (default: fino a Ctrl+C)")
+        if name == 'record':
+            p.add_argument('--out', required=True)
+        if name == 'publish':
+            p.add_argument('--path', default=None, help="File del feed (default: MARKET_FEED_PATH o /dev/shm)")
+            p.add_argument('--capacity', type=int, default=DEFAULT_CAPACITY)
+    p = sub.add_parser('replay')
+    p.add_argument('path')
+    p.add_argument('--port', type=int, default=8765)
+    p.add_argument('--speed', type=float, default=1.0)
+    p = sub.add_parser('check', help="Verifica riconnessione e gap-fill contro un ReplayServer locale")
+    p.add_argument('--frames', default=None, help="Frame registrati con `record` (default: sintetici)")
+    p.add_argument('--symbols', nargs='+', default=['BTCUSDT', 'ETHUSDT'])
+    p.add_argument('--bars', type=int, default=120)
+    p.add_argument('--speed', type=float, default=2000.0)
+    p.add_argument('--drop-after', type=int, default=100, help="Frame inviati prima di ogni disconnessione")
+    p.add_argument('--skip', type=int, default=6, help="Frame persi a ogni disconnessione")
+    p.add_argument('--port', type=int, default=8765)
+    p.add_argument('--timeout', type=float, default=120.0)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+
+    if args.command == 'replay':
+        async def replay():
+            server = ReplayServer.from_file(args.path, speed=args.speed)
+            ws_url, rest_url = await server.start(port=args.port)
+            print(f"Replay di {len(server.frames)} frame su {ws_url} (REST: {rest_url})")
+            await asyncio.Event().wait()
+        asyncio.run(replay())
+        return 0
+
+    if args.command == 'check':
+        if args.frames:
+            with open(args.frames) as f:
+                frames = [json.loads(line) for line in f if line.strip()]
+        else:
+            frames = synthetic_frames(args.symbols, bars=args.bars)
+        problems = asyncio.run(check_replay(frames, speed=args.speed, drop_after=args.drop_after, skip_on_drop=args.skip,
+                                            timeout=args.timeout, port=args.port))
+        for problem in problems:
+            print(f"KO  {problem}")
+        print("OK: nessuna candela persa dopo le riconnessioni" if not problems else f"{len(problems)} problemi")
+        return 1 if problems else 0
+
+    import config
+    rest = AsyncFinancialDataClient(bybit_url=args.rest) if args.rest else None
+    capacity = getattr(args, 'capacity', DEFAULT_CAPACITY)
+    stream = BybitKlineStream(args.symbols or config.ASSET_UNIVERSE, args.intervals, capacity=capacity, url=args.url, rest=rest,
+                              record_path=getattr(args, 'out', None))
+    writer = None
+    if args.command == 'publish':
+        writer = attach_feed_writer(stream, path=args.path)
+        print(f"Feed di mercato su {writer.path}: {len(stream.buffers)} serie, {writer.nbytes / 1024:.0f} KB")
+    else:
+        stream.add_listener(lambda e: print(f"{e.timestamp} {e.symbol:<10} {e.interval:>4} C={e.close} V={e.volume}{' (backfill)' if e.backfilled else ''}"))
+
+    async def watch():
+        if args.seconds:
+            asyncio.get_running_loop().call_later(args.seconds, stream.stop)
+        await stream.run()
+    try:
+        asyncio.run(watch())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if writer is not None:
+            writer.close()
+    print(stream.stats)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
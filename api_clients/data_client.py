@@ -1,19 +1,62 @@
-# api_clients/data_client.py (v3.0 - con Paginazione per Backtesting completo)
+# api_clients/data_client.py (v3.4 - con Paginazione per Backtesting completo + Archivio OHLCV locale + Download concorrente + Decoder NumPy)
 import pandas as pd
 import requests
 import time
 from datetime import datetime, timezone
 
+from infra.kline_decoder import decode_klines, loads
+from infra.downloader import DOWNLOADER
+from infra.ohlcv_store import OHLCV_STORE
+
+BYBIT_KLINE_URL = "https://api.bybit.com/v5/market/kline"
+BYBIT_TIMEFRAME_MAP = {"1d": "D", "4h": "240", "15m": "15", "5m": "5"}
+
+
+def bybit_kline_params(symbol, interval, limit, start_time=None) -> dict:
+    """Parametri di /v5/market/kline (condivisi con il client asincrono)."""
+    params = {'category': 'linear', 'symbol': symbol, 'interval': BYBIT_TIMEFRAME_MAP.get(str(interval).lower(), interval), 'limit': limit}
+    if start_time:
+        params['start'] = start_time
+    return params
+
+
+def parse_bybit_klines(data):
+    """Risposta JSON di Bybit -> DataFrame OHLCV (indice UTC crescente), vuoto se non ci sono candele, None se errore API."""
+    if data['retCode'] == 0 and data['result']['list']:
+        # Bybit restituisce in ordine inverso: il decoder gira le righe mentre le converte
+        return decode_klines(data['result']['list'], descending=True)
+
+    if data['retCode'] == 0:
+        return pd.DataFrame()
+
+    print(f"Errore API Bybit: {data.get('retMsg', 'Errore sconosciuto')}")
+    return None
+
+
 class FinancialDataClient:
+    def __init__(self, store=None, use_store: bool = True):
+        # Gli intervalli storici (start_time/end_time) passano dall'archivio OHLCV locale
+        self.store = (store or OHLCV_STORE) if use_store else None
+
     def get_klines(self, symbol, interval, source='bybit', limit=200, start_time: int = None, end_time: int = None):
         if source.lower() == 'bybit':
-            return self._get_bybit_klines_paginated(symbol, interval, start_time, end_time) if start_time and end_time else self._get_bybit_klines(symbol, interval, limit)
+            return self._get_bybit_klines_range(symbol, interval, start_time, end_time) if start_time and end_time else self._get_bybit_klines(symbol, interval, limit)
         return None
 
     def _get_bybit_klines(self, symbol, interval, limit):
         """Funzione per il live trading, scarica solo i dati più recenti."""
         return self._fetch_bybit_batch(symbol, interval, limit=limit)
 
+    def _get_bybit_klines_range(self, symbol, interval, start_ms, end_ms):
+        """
+        Range storico dall'archivio locale: dall'API vengono scaricati solo i tratti mancanti
+        (testa/coda), a pagine parallele sotto il budget di richieste di Bybit.
+        """
+        if self.store is None:
+            return self._get_bybit_klines_paginated(symbol, interval, start_ms, end_ms)
+        fetch = lambda lo, hi: DOWNLOADER.fetch('bybit', symbol, interval, lo, hi)
+        return self.store.fetch_range('bybit', symbol, interval, start_ms, end_ms, fetch, as_index=True)
+
     def _get_bybit_klines_paginated(self, symbol, interval, start_ms, end_ms):
         """Funzione per il backtesting, scarica tutti i dati in un range usando la paginazione."""
         all_dfs = []
@@ -50,37 +93,13 @@ class FinancialDataClient:
 
     def _fetch_bybit_batch(self, symbol, interval, limit, start_time=None):
         """Funzione helper che scarica un singolo blocco di dati da Bybit."""
-        TIMEFRAME_MAP = {"1d": "D", "4h": "240", "15m": "15", "5m": "5"}
-        bybit_interval = TIMEFRAME_MAP.get(str(interval).lower(), interval)
-        
-        url = "https://api.bybit.com/v5/market/kline"
-        params = {'category': 'linear', 'symbol': symbol, 'interval': bybit_interval, 'limit': limit}
-        if start_time:
-            params['start'] = start_time
+        params = bybit_kline_params(symbol, interval, limit, start_time)
 
         try:
-            response = requests.get(url, params=params)
+            response = requests.get(BYBIT_KLINE_URL, params=params)
             response.raise_for_status()
-            data = response.json()
-            
-            if data['retCode'] == 0 and data['result']['list']:
-                df = pd.DataFrame(data['result']['list'], columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'turnover'])
-                df['timestamp'] = pd.to_datetime(df['timestamp'].astype(float), unit='ms')
-                df.set_index('timestamp', inplace=True)
-                df.index = df.index.tz_localize('UTC')
-
-                for col in ['open', 'high', 'low', 'close', 'volume']:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-                
-                df.dropna(inplace=True)
-                return df.iloc[::-1] # Bybit restituisce in ordine inverso, quindi giriamo
-            
-            if data['retCode'] == 0:
-                return pd.DataFrame()
-
-            print(f"Errore API Bybit: {data.get('retMsg', 'Errore sconosciuto')}")
-            return None
+            return parse_bybit_klines(loads(response.content))
 
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
             print(f"Errore di connessione API Bybit: {e}")
             return None
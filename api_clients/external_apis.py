@@ -1,5 +1,6 @@
 import requests
-import pandas as pd # <-- ECCO LA RIGA MANCANTE!
+
+from infra.kline_decoder import decode_klines, loads
 
 # --- For Yahoo Finance Assets ---
 YAHOO_ASSETS = ['SPY', 'QQQ', 'AAPL', 'GOOGL', 'MSFT', 'TSLA']
@@ -67,18 +68,9 @@ def get_binance_klines(symbol, timeframe, limit=200):
         params = {'symbol': symbol.upper(), 'interval': interval_map.get(timeframe, "1h"), 'limit': limit}
         response = requests.get(f"{BINANCE_API_URL}/klines", params=params)
         response.raise_for_status()
-        data = response.json()
+        data = loads(response.content)
         if not data: return None
-
-        df = pd.DataFrame(data, columns=[
-            'timestamp', 'open', 'high', 'low', 'close', 'volume', 'close_time',
-            'quote_asset_volume', 'number_of_trades', 'taker_buy_base_asset_volume',
-            'taker_buy_quote_asset_volume', 'ignore'
-        ])
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        df = df.set_index('timestamp')
-        df = df[['open', 'high', 'low', 'close', 'volume']].apply(pd.to_numeric)
-        return df
+        return decode_klines(data, utc=False)
     except Exception as e:
         print(f"ERRORE: Impossibile recuperare klines da Binance per {symbol}. {e}")
         return None
@@ -0,0 +1,399 @@
+# api_clients/kline_cache.py (v1.2 - Cache K-line con TTL alla chiusura della candela)
+# live_runner, phoenix_runner(_multi) e il servizio Telegram chiedono spesso le
+# stesse candele (simbolo, timeframe) nello stesso minuto. KlineCache si mette
+# davanti a FinancialDataClient con la stessa get_klines:
+#   - una risposta resta valida fino alla chiusura della candela successiva: è
+#     fresca se è stata scaricata dopo l'apertura della candela corrente (+ un
+#     piccolo margine perché l'exchange consolidi la candela appena chiusa);
+#   - la candela in formazione invece cambia a ogni trade: dopo FORMING_TTL_MS si
+#     riscaricano solo le ultime TAIL_BARS candele e si innestano sulle chiuse in cache;
+#   - una richiesta con limit minore è servita dalla coda di una più lunga già in cache;
+#   - richieste concorrenti sulla stessa chiave aspettano l'unico download in corso
+#     (single-flight) invece di ripeterlo;
+#   - con shared_dir (o KLINE_CACHE_DIR) le risposte sono condivise anche tra processi:
+#     un file .npy per chiave nel layout di OHLCVArrays, freschezza dalla mtime, e un
+#     file .lock creato in esclusiva come single-flight tra processi;
+#   - se sulla macchina gira l'ingester WebSocket (infra.market_feed) le richieste Bybit
+#     delle serie pubblicate si leggono dal feed in memoria condivisa, senza rete, finché
+#     il feed è vivo e aggiornato all'ultima candela chiusa.
+# stats() riporta richieste, hit, download, attese sul download in corso e byte serviti.
+import glob
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from api_clients.data_client import FinancialDataClient
+from infra.kline_decoder import matrix_frame
+from infra.market_feed import DEFAULT_PATH as MARKET_FEED_PATH, MarketFeedReader
+from infra.ohlcv_store import OHLCV_COLUMNS, interval_ms
+
+CLOSE_GRACE_MS = 2_000      # dopo la chiusura, l'exchange può correggere l'ultima candela per un paio di secondi
+LOCK_STALE_SECONDS = 30     # un .lock più vecchio è di un processo morto a metà download
+LOCK_POLL_SECONDS = 0.05
+DEFAULT_SHARED_DIR = os.getenv("KLINE_CACHE_DIR")
+FEED_MAX_AGE_SECONDS = 30   # feed senza scritture da più tempo: ingester fermo, si torna a REST
+FEED_RETRY_SECONDS = 5      # ogni quanto riprovare ad aprire il feed se non c'è
+FORMING_TTL_MS = 5_000      # età massima della candela in formazione servita dalla cache
+TAIL_BARS = 2               # coda riscaricata: ultima chiusa (ancora correggibile) + quella in formazione
+
+
+def bar_open_ms(now_ms: int, step: int) -> int:
+    return now_ms // step * step
+
+
+def is_fresh(fetched_ms: int, step: int, now_ms: int) -> bool:
+    """Scaricata dopo la chiusura dell'ultima candela (+ margine): le candele chiuse valgono fino alla prossima chiusura."""
+    return fetched_ms >= bar_open_ms(now_ms, step) + CLOSE_GRACE_MS
+
+
+def is_current(fetched_ms: int, step: int, now_ms: int) -> bool:
+    """Fresca e con la candela in formazione scaricata da al massimo FORMING_TTL_MS: servibile così com'è."""
+    return is_fresh(fetched_ms, step, now_ms) and now_ms - fetched_ms <= FORMING_TTL_MS
+
+
+def _frame_bytes(df) -> int:
+    return 0 if df is None else int(df.memory_usage(index=True).sum())
+
+
+class _Flight:
+    __slots__ = ('done', 'result')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class KlineCache:
+    """
+    Cache delle candele recenti davanti a un client con get_klines(symbol, interval, source, limit,
+    start_time, end_time). Thread-safe; le letture restituiscono sempre una copia.
+    """
+
+    def __init__(self, client=None, shared_dir: str = DEFAULT_SHARED_DIR, feed_path: str = MARKET_FEED_PATH):
+        self.client = client or FinancialDataClient()
+        self.shared_dir = shared_dir
+        self.feed_path = feed_path
+        self._feed = None
+        self._feed_checked = 0.0
+        if shared_dir:
+            os.makedirs(shared_dir, exist_ok=True)
+        self._entries = {}   # (symbol, interval, source) -> {limit: (fetched ms, df)}
+        self._ranges = {}    # (symbol, interval, source, start_time) -> (fetched ms, df)
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.counters = {'requests': 0, 'hits': 0, 'shared_hits': 0, 'feed_hits': 0, 'fetches': 0, 'tail_fetches': 0,
+                         'coalesced': 0, 'bypassed': 0, 'bytes_served': 0, 'bytes_fetched': 0}
+
+    # --- Statistiche ---
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+        served = stats['hits'] + stats['shared_hits'] + stats['feed_hits'] + stats['coalesced']
+        stats['hit_ratio'] = served / stats['requests'] if stats['requests'] else 0.0
+        return stats
+
+    def _count(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def _serve(self, df, kind: str):
+        """Copia per il chiamante (gli indicatori si aggiungono in place) e conteggio dei byte."""
+        if df is None:
+            return None
+        with self._lock:
+            self.counters[kind] += 1
+            self.counters['bytes_served'] += _frame_bytes(df)
+        return df.copy()
+
+    # --- Livello in processo ---
+
+    def _memory_entry(self, key, limit, now_ms, current: bool = True):
+        """(limit in cache, df) più corto che copre limit; con current=False basta che le candele chiuse siano fresche."""
+        step = interval_ms(key[1])
+        valid = is_current if current else is_fresh
+        with self._lock:
+            for cached_limit, (fetched_ms, df) in sorted(self._entries.get(key, {}).items()):
+                if cached_limit >= limit and valid(fetched_ms, step, now_ms):
+                    return cached_limit, df
+        return None
+
+    def _memory_lookup(self, key, limit, now_ms):
+        entry = self._memory_entry(key, limit, now_ms)
+        if entry is None:
+            return None
+        cached_limit, df = entry
+        return df if cached_limit == limit else df.iloc[-limit:]
+
+    def _splice(self, key, limit, tail, fetched_ms, now_ms):
+        """Innesta una coda appena scaricata sulle candele chiuse in cache; None se non si raccordano."""
+        entry = self._memory_entry(key, limit, now_ms, current=False)
+        if entry is None or tail is None or tail.empty:
+            return None
+        cached_limit, base = entry
+        if tail.index[0] > base.index[-1] + pd.Timedelta(milliseconds=interval_ms(key[1])):
+            return None
+        df = pd.concat([base[base.index < tail.index[0]], tail]).iloc[-cached_limit:]
+        self._count('tail_fetches')
+        self._count('bytes_fetched', _frame_bytes(tail))
+        self._memory_store(key, cached_limit, fetched_ms, df)
+        if self.shared_dir:
+            self._shared_store(key, cached_limit, df, fetched_ms)
+        return df if cached_limit == limit else df.iloc[-limit:]
+
+    def _memory_store(self, key, limit, fetched_ms, df):
+        step = interval_ms(key[1])
+        with self._lock:
+            slot = self._entries.setdefault(key, {})
+            for cached_limit in [l for l, (f, _) in slot.items() if not is_fresh(f, step, fetched_ms)]:
+                del slot[cached_limit]
+            slot[limit] = (fetched_ms, df)
+
+    # --- Livello tra processi ---
+
+    def _shared_path(self, key, limit) -> str:
+        symbol, interval, source = key
+        return os.path.join(self.shared_dir, f"{source.lower()}_{symbol}_{interval}_{limit}.npy")
+
+    def _shared_lookup(self, key, limit, now_ms):
+        step = interval_ms(key[1])
+        symbol, interval, source = key
+        candidates = []
+        for path in glob.glob(os.path.join(self.shared_dir, f"{source.lower()}_{symbol}_{interval}_*.npy")):
+            cached_limit = path[:-4].rsplit('_', 1)[-1]
+            if cached_limit.isdigit() and int(cached_limit) >= limit:
+                candidates.append((int(cached_limit), path))
+        for cached_limit, path in sorted(candidates):
+            try:
+                fetched_ms = int(os.stat(path).st_mtime * 1000)
+                if not is_fresh(fetched_ms, step, now_ms):
+                    continue
+                df = matrix_frame(np.load(path))
+            except (OSError, ValueError):
+                continue
+            self._memory_store(key, cached_limit, fetched_ms, df)  # base per l'innesto della coda anche se non current
+            if is_current(fetched_ms, step, now_ms):
+                return df if cached_limit == limit else df.iloc[-limit:]
+        return None
+
+    def _shared_store(self, key, limit, df, fetched_ms: int):
+        """Solo frame OHLCV con indice UTC (quelli di FinancialDataClient): scrittura atomica tmp + os.replace."""
+        if df is None or df.empty or list(df.columns) != list(OHLCV_COLUMNS) or getattr(df.index, 'tz', None) is None:
+            return
+        matrix = np.empty((1 + len(OHLCV_COLUMNS), len(df)))
+        matrix[0].view(np.int64)[:] = df.index.as_unit('ms').asi8
+        matrix[1:] = df.to_numpy(dtype=np.float64).T
+        path = self._shared_path(key, limit)
+        tmp = f"{path[:-4]}.{os.getpid()}.tmp.npy"
+        try:
+            np.save(tmp, matrix)
+            os.utime(tmp, (fetched_ms / 1000, fetched_ms / 1000))  # la freschezza si legge dalla mtime
+            os.replace(tmp, path)
+        except OSError as e:
+            logging.warning(f"Cache K-line: scrittura di {path} fallita: {e}")
+
+    def _shared_claim(self, key, limit):
+        """Path del .lock se tocca a questo processo scaricare; None se un altro processo ha appena finito (il file è pronto)."""
+        lock = self._shared_path(key, limit)[:-4] + ".lock"
+        while True:
+            try:
+                os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return lock
+            except FileExistsError:
+                try:
+                    if time.time() - os.stat(lock).st_mtime > LOCK_STALE_SECONDS:
+                        os.remove(lock)
+                        continue
+                except FileNotFoundError:
+                    pass
+                time.sleep(LOCK_POLL_SECONDS)
+                if not os.path.exists(lock):
+                    return None
+
+    # --- Feed in memoria condivisa ---
+
+    def feed(self):
+        """Lettore del feed di mercato se un ingester lo sta pubblicando, altrimenti None (riprova ogni pochi secondi)."""
+        if self._feed is None and self.feed_path and time.monotonic() - self._feed_checked > FEED_RETRY_SECONDS:
+            self._feed_checked = time.monotonic()
+            self._feed = MarketFeedReader.open(self.feed_path)
+        if self._feed is not None and self._feed.age_seconds() > FEED_MAX_AGE_SECONDS:
+            return None
+        return self._feed
+
+    def _feed_lookup(self, symbol, interval, source, limit, now_ms):
+        """Ultime `limit` candele (in formazione inclusa, come l'API) dal feed, se complete e aggiornate."""
+        feed = self.feed() if source == 'bybit' else None
+        if feed is None:
+            return None
+        try:
+            status = feed.status(symbol, interval)
+        except KeyError:
+            return None
+        step = interval_ms(interval)
+        if status['count'] < limit - 1 or status['last_ms'] is None or status['last_ms'] < bar_open_ms(now_ms, step) - step:
+            return None
+        df = feed.frame(symbol, interval, limit, include_forming=True).iloc[-limit:]
+        self._count('feed_hits')
+        self._count('bytes_served', _frame_bytes(df))
+        return df
+
+    # --- API ---
+
+    def lookup(self, symbol, interval, source='bybit', limit=200, start_time=None):
+        """Candele in cache ancora fresche (copia) oppure None, senza scaricare."""
+        if start_time is not None:
+            return None
+        self._count('requests')
+        key, now_ms = (symbol, interval, source), int(time.time() * 1000)
+        df = self._feed_lookup(symbol, interval, source, limit, now_ms)
+        if df is not None:
+            return df
+        df = self._memory_lookup(key, limit, now_ms)
+        if df is not None:
+            return self._serve(df, 'hits')
+        if self.shared_dir:
+            df = self._shared_lookup(key, limit, now_ms)
+            if df is not None:
+                return self._serve(df, 'shared_hits')
+        return None
+
+    def tail_limit(self, symbol, interval, source='bybit', limit=200, start_time=None):
+        """TAIL_BARS se in cache ci sono candele chiuse fresche su cui innestare una coda (store_tail), altrimenti None."""
+        if start_time is not None or limit <= TAIL_BARS:
+            return None
+        entry = self._memory_entry((symbol, interval, source), limit, int(time.time() * 1000), current=False)
+        return None if entry is None else TAIL_BARS
+
+    def store_tail(self, symbol, interval, source, limit, tail, fetched_ms: int = None):
+        """Registra una coda scaricata altrove (es. dal client asincrono): ultime `limit` candele aggiornate, o None."""
+        fetched_ms = int(time.time() * 1000) if fetched_ms is None else fetched_ms
+        df = self._splice((symbol, interval, source), limit, tail, fetched_ms, fetched_ms)
+        return None if df is None else df.copy()
+
+    def store(self, symbol, interval, source, limit, df, fetched_ms: int = None, start_time=None):
+        """Registra un download (anche fatto altrove, es. dal client asincrono) e lo mette in cache."""
+        self._count('fetches')
+        if df is None or start_time is not None:
+            return
+        key = (symbol, interval, source)
+        fetched_ms = int(time.time() * 1000) if fetched_ms is None else fetched_ms
+        self._memory_store(key, limit, fetched_ms, df)
+        self._count('bytes_fetched', _frame_bytes(df))
+        if self.shared_dir:
+            self._shared_store(key, limit, df, fetched_ms)
+
+    def _range_key(self, symbol, interval, source, start_time, end_time, now_ms):
+        """Solo i range che arrivano fino ad adesso (es. fetch_timeframes) sono condivisibili; gli altri None."""
+        if end_time < bar_open_ms(now_ms, interval_ms(interval)):
+            return None
+        return symbol, interval, source, start_time
+
+    def get_klines(self, symbol, interval, source='bybit', limit=200, start_time: int = None, end_time: int = None):
+        """Stessa firma e stessi risultati di FinancialDataClient.get_klines, con cache e single-flight."""
+        self._count('requests')
+        now_ms = int(time.time() * 1000)
+        if start_time and end_time:
+            return self._get_range(symbol, interval, source, limit, start_time, end_time, now_ms)
+        if start_time is not None or end_time is not None:
+            self._count('bypassed')
+            return self.client.get_klines(symbol, interval, source, limit, start_time, end_time)
+
+        df = self._feed_lookup(symbol, interval, source, limit, now_ms)
+        if df is not None:
+            return df
+        key = (symbol, interval, source)
+        df = self._memory_lookup(key, limit, now_ms)
+        if df is not None:
+            return self._serve(df, 'hits')
+
+        with self._lock:
+            flight = self._flights.get((key, limit))
+            leader = flight is None
+            if leader:
+                flight = self._flights[(key, limit)] = _Flight()
+        if not leader:
+            flight.done.wait()
+            return self._serve(flight.result, 'coalesced')
+        try:
+            flight.result = self._fetch_latest(key, limit, now_ms)
+            return None if flight.result is None else flight.result.copy()
+        finally:
+            with self._lock:
+                del self._flights[(key, limit)]
+            flight.done.set()
+
+    def _fetch_latest(self, key, limit, now_ms):
+        lock = None
+        if self.shared_dir:
+            df = self._shared_lookup(key, limit, now_ms)
+            if df is None:
+                lock = self._shared_claim(key, limit)
+                if lock is None:  # un altro processo ha scaricato mentre aspettavamo
+                    df = self._shared_lookup(key, limit, int(time.time() * 1000))
+            if df is not None:
+                self._serve(df, 'shared_hits')
+                return df
+        try:
+            fetched_ms = int(time.time() * 1000)
+            if self._memory_entry(key, limit, now_ms, current=False) is not None:
+                # candele chiuse ancora valide: basta riscaricare la coda con la candela in formazione
+                df = self._splice(key, limit, self.client.get_klines(key[0], key[1], key[2], TAIL_BARS), fetched_ms, fetched_ms)
+                if df is not None:
+                    return df
+            df = self.client.get_klines(key[0], key[1], key[2], limit)
+            self.store(*key, limit, df, fetched_ms)
+            return df
+        finally:
+            if lock is not None:
+                try:
+                    os.remove(lock)
+                except FileNotFoundError:
+                    pass
+
+    def _get_range(self, symbol, interval, source, limit, start_time, end_time, now_ms):
+        key = self._range_key(symbol, interval, source, start_time, end_time, now_ms)
+        if key is None:
+            self._count('bypassed')
+            return self.client.get_klines(symbol, interval, source, limit, start_time, end_time)
+        step = interval_ms(interval)
+        with self._lock:
+            cached = self._ranges.get(key)
+        if cached is not None and is_current(cached[0], step, now_ms):
+            return self._serve(cached[1], 'hits')  # altrimenti l'archivio riscarica solo la coda
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            return self._serve(flight.result, 'coalesced')
+        try:
+            fetched_ms = int(time.time() * 1000)
+            flight.result = self.client.get_klines(symbol, interval, source, limit, start_time, end_time)
+            self._count('fetches')
+            if flight.result is not None:
+                self._count('bytes_fetched', _frame_bytes(flight.result))
+                with self._lock:
+                    for stale in [k for k, (f, _) in self._ranges.items() if not is_fresh(f, interval_ms(k[1]), fetched_ms)]:
+                        del self._ranges[stale]
+                    self._ranges[key] = (fetched_ms, flight.result)
+            return None if flight.result is None else flight.result.copy()
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def log_stats(self, label: str = "Cache K-line"):
+        s = self.stats()
+        logging.info(f"{label}: {s['requests']} richieste, hit ratio {s['hit_ratio']:.0%} "
+                     f"({s['hits']} hit, {s['shared_hits']} da altri processi, {s['feed_hits']} dal feed, {s['coalesced']} in attesa), "
+                     f"{s['fetches']} download, {s['tail_fetches']} code, {s['bytes_served'] / 1024:.0f} KB serviti dalla cache.")
+
+
+KLINE_CACHE = KlineCache()
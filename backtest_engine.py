@@ -1,14 +1,24 @@
 # backtest_engine.py - Il motore di backtesting richiamabile
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 
 import config
 from api_clients.data_client import FinancialDataClient
 from analysis.session_clock import in_session, is_eod_window
-from analysis.strategy_vwap_rev import vwap_reversion_intraday
+from analysis.strategy_vwap_rev import vwap_reversion_batch
+from analysis.signal_frame import signals_at
+from analysis.exit_resolver import ExitResolver
+from analysis import strategy_vwap_rev, signal_frame, session_clock, exit_resolver
+from infra.result_store import code_version
 
-def run_single_backtest(asset: str, start_date_str: str, end_date_str: str, vwap_params: dict):
-    """Esegue un singolo backtest per una data combinazione di parametri."""
+def run_single_backtest(asset: str, start_date_str: str, end_date_str: str, vwap_params: dict, store=None):
+    """
+    Esegue un singolo backtest per una data combinazione di parametri.
+    Con store (infra.result_store.ResultStore) una combinazione già eseguita sugli
+    stessi dati e con lo stesso codice viene riletta dall'archivio.
+    """
     
     data_client = FinancialDataClient()
     
@@ -23,12 +33,32 @@ def run_single_backtest(asset: str, start_date_str: str, end_date_str: str, vwap
     df_trigger_warmup = data_client.get_klines(asset, config.OPERATIONAL_TIMEFRAME, start_time=start_warmup_ms, end_time=start_ms)
     df_trigger_full = pd.concat([df_trigger_warmup, df_trigger_hist]) if df_trigger_warmup is not None else df_trigger_hist
 
+    if store is not None:
+        store_key = store.make_key(df_trigger_full, vwap_params, 'vwap_reversion_intraday', _engine_version(),
+                                   asset=asset, start=start_date_str, end=end_date_str)
+        cached = store.get(store_key)
+        if cached is not None: return cached
+
     df_trigger_full.ta.atr(length=config.ATR_PERIOD, append=True)
     atr_col = f"ATRr_{config.ATR_PERIOD}"
 
     initial_equity, equity, trades, current_trade = 10000, 10000, [], None
 
-    for timestamp, candle in df_trigger_hist.iterrows():
+    # Indice SL/TP e barre di flatten EOD: a trade aperto si salta dritti alla candela di uscita
+    resolver = ExitResolver.from_frame(df_trigger_hist)
+    eod_bars = np.flatnonzero([is_eod_window(ts.to_pydatetime()) for ts in df_trigger_hist.index])
+    # Segnali VWAP di tutto lo storico in un passaggio; la barra i legge la riga di df_trigger_full.loc[:timestamp].iloc[-1]
+    full_pos = df_trigger_full.index.searchsorted(df_trigger_hist.index, side='right') - 1
+    vwap_frame = vwap_reversion_batch(df_trigger_full, asset=asset, **vwap_params)
+
+    i = 0
+    while i < len(df_trigger_hist):
+        if current_trade:
+            exit_bar = resolver.first_exit_bar(current_trade['side'], i, current_trade['sl'], current_trade['tp'], eod_bars)
+            if exit_bar is None: break
+            i = exit_bar
+
+        timestamp, candle = df_trigger_hist.index[i], df_trigger_hist.iloc[i]
         now = timestamp.to_pydatetime()
 
         if current_trade:
@@ -50,9 +80,7 @@ def run_single_backtest(asset: str, start_date_str: str, end_date_str: str, vwap
                 current_trade = None
 
         if not current_trade and in_session(now):
-            df_slice = df_trigger_full.loc[:timestamp]
-            
-            signals = vwap_reversion_intraday(df_slice, asset=asset, **vwap_params) or []
+            signals = signals_at(vwap_frame, full_pos[i])
             
             if signals:
                 best_signal = signals[0]
@@ -60,10 +88,13 @@ def run_single_backtest(asset: str, start_date_str: str, end_date_str: str, vwap
                     'entry_time': now, 'entry_price': best_signal['entry_price'], 'side': best_signal['side'],
                     'sl': best_signal['sl'], 'tp': best_signal['tp']
                 }
+        i += 1
 
     if not trades:
-        return {'pnl': 0, 'win_rate': 0, 'trades': 0, 'profit_factor': 0}
-        
+        result = {'pnl': 0, 'win_rate': 0, 'trades': 0, 'profit_factor': 0}
+        if store is not None: store.put(store_key, result, trades, engine='backtest_engine', asset=asset)
+        return result
+
     report_df = pd.DataFrame(trades)
     total_pnl = report_df['pnl'].sum()
     win_rate = len(report_df[report_df['pnl'] > 0]) / len(report_df) * 100
@@ -71,9 +102,19 @@ def run_single_backtest(asset: str, start_date_str: str, end_date_str: str, vwap
     total_losses = abs(report_df[report_df['pnl'] < 0]['pnl'].sum())
     profit_factor = total_wins / total_losses if total_losses > 0 else float('inf')
 
-    return {
+    result = {
         'pnl': round(total_pnl, 2),
         'win_rate': round(win_rate, 2),
         'trades': len(trades),
         'profit_factor': round(profit_factor, 2)
     }
+    if store is not None: store.put(store_key, result, trades, engine='backtest_engine', asset=asset)
+    return result
+
+@lru_cache(maxsize=None)
+def _engine_version():
+    """Versione del codice che determina i trade: cambia se cambia uno di questi moduli o parametri di config."""
+    return code_version(__file__, strategy_vwap_rev, signal_frame, session_clock, exit_resolver, settings={
+        name: getattr(config, name, None) for name in (
+            'OPTIMIZED_PARAMS', 'TIMEZONE', 'SESSION_START_TIME', 'SESSION_END_TIME',
+            'EOD_FLATTEN_WINDOW_MIN', 'ATR_PERIOD', 'OPERATIONAL_TIMEFRAME')})
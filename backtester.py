@@ -4,9 +4,10 @@ import logging
 from datetime import datetime
 
 # Assicurati che questi import funzionino dalla root del progetto
-from data_sources import binance_client
+from data_sources import get_historical_ohlcv
 from etl_service import load_strategies, get_params_for_symbol
 from analysis.market_analysis import find_pullback_signal
+from analysis.exit_resolver import ExitResolver
 
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
 
@@ -21,14 +22,10 @@ def run_backtest(symbol, years, all_settings):
     # 1. Carica i dati storici
     start_date = f"{years} years ago UTC"
     try:
-        klines = binance_client.get_historical_klines(symbol, "1h", start_date)
-        if not klines:
+        df = get_historical_ohlcv(symbol, "1h", start_date)
+        if df.empty:
             logging.warning(f"Nessun dato storico trovato per {symbol} su Binance. Potrebbe non essere disponibile. Salto.")
             return None
-        df = pd.DataFrame(klines, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_av', 'trades', 'tb_base_av', 'tb_quote_av', 'ignore'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        for col in ['open', 'high', 'low', 'close', 'volume']:
-            df[col] = pd.to_numeric(df[col])
         logging.info(f"Dati storici per {symbol} caricati: {len(df)} candele.")
     except Exception as e:
         logging.error(f"Impossibile scaricare i dati per {symbol}: {e}. Salto.")
@@ -43,29 +40,29 @@ def run_backtest(symbol, years, all_settings):
     active_trade = None
     start_index = max(params.get('ema_slow', 200), params.get('atr_len', 14)) + 10
 
-    for i in range(start_index, len(df)):
-        current_market_data = df.iloc[0:i]
-        
+    resolver = ExitResolver.from_frame(df)
+
+    i = start_index
+    while i < len(df):
         if active_trade:
-            current_candle = current_market_data.iloc[-1]
-            if active_trade['type'] == 'LONG':
-                if current_candle['low'] <= active_trade['sl']: active_trade['result'] = 'SL'
-                elif current_candle['high'] >= active_trade['tp']: active_trade['result'] = 'TP'
-            elif active_trade['type'] == 'SHORT':
-                if current_candle['high'] >= active_trade['sl']: active_trade['result'] = 'SL'
-                elif current_candle['low'] <= active_trade['tp']: active_trade['result'] = 'TP'
-            
-            if 'result' in active_trade:
-                trades.append(active_trade)
-                active_trade = None
+            # Salta direttamente alla candela che tocca SL/TP invece di scorrere il trade barra per barra
+            exit_bar, result = resolver.resolve(active_trade['type'], i - 1, active_trade['sl'], active_trade['tp'], end=len(df) - 1)
+            if result is None:
+                break
+            active_trade['result'] = result
+            trades.append(active_trade)
+            active_trade = None
+            i = exit_bar + 1
 
         if not active_trade:
+            current_market_data = df.iloc[0:i]
             signal = find_pullback_signal(symbol, current_market_data, params)
             if signal:
                 active_trade = {
                     'type': signal['signal_type'], 'entry_price': signal['entry_price'],
                     'sl': signal['stop_loss'], 'tp': signal['take_profit']
                 }
+        i += 1
 
     # 4. Calcola i risultati
     if not trades:
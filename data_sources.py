@@ -1,8 +1,13 @@
-# data_sources.py - v1.0
+# data_sources.py - v1.2
 # Modulo centralizzato per la connessione alle fonti dati.
 
 from binance.client import Client
+from binance.helpers import date_to_milliseconds
 import os
+import time
+
+from infra.downloader import DOWNLOADER
+from infra.ohlcv_store import OHLCV_STORE
 
 # NOTA: Per sicurezza, le chiavi API non dovrebbero essere scritte direttamente nel codice.
 # In un'implementazione reale, si userebbero variabili d'ambiente.
@@ -25,3 +30,16 @@ try:
 except Exception as e:
     print(f"Errore durante la connessione a Binance: {e}")
     binance_client = None
+
+
+def get_historical_ohlcv(symbol, interval, start_str, end_str=None, store=None):
+    """
+    Candele storiche Binance come DataFrame (timestamp + OHLCV) servite dall'archivio
+    OHLCV locale: dall'API vengono scaricati solo i tratti mancanti (storico più vecchio
+    di quello in archivio e barre nuove), a pagine parallele sotto il budget di Binance.
+    start_str/end_str: ms oppure stringhe "2 years ago UTC"; end_str=None -> adesso.
+    """
+    start_ms = start_str if isinstance(start_str, int) else date_to_milliseconds(start_str)
+    end_ms = int(time.time() * 1000) if end_str is None else (end_str if isinstance(end_str, int) else date_to_milliseconds(end_str))
+    fetch = lambda lo, hi: DOWNLOADER.fetch('binance', symbol, interval, lo, hi)
+    return (store or OHLCV_STORE).fetch_range('binance', symbol, interval, start_ms, end_ms, fetch)
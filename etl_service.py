@@ -1,5 +1,4 @@
-# etl_service.py - v4.0 (Production Portfolio Trader)
-import pandas as pd
+# etl_service.py - v4.2 (Production Portfolio Trader)
 import logging
 import time
 import json
@@ -7,7 +6,10 @@ import os
 import glob
 from datetime import datetime, timezone
 
-from data_sources import binance_client
+import pandas as pd
+
+from api_clients.async_data_client import AsyncFinancialDataClient
+from infra.ohlcv_store import OHLCV_STORE, interval_ms
 import database as db
 
 # Importiamo il motore di valutazione che conosce tutte le nostre logiche
@@ -20,6 +22,84 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
+# Candele 1h in una finestra mobile per asset: all'avvio dall'archivio OHLCV locale, poi a
+# ogni ciclo si scaricano (in parallelo per tutti gli asset) solo le candele dall'ultima in finestra.
+ANALYSIS_INTERVAL = "1h"
+WARMUP_MARGIN = 90  # con ema_slow=120 la finestra è di 210 candele, come il vecchio "210 hours ago UTC"
+MAX_PAGE = 1000     # candele per richiesta /api/v3/klines
+ASYNC_CLIENT = AsyncFinancialDataClient()
+WINDOWS = {}
+
+
+def window_size(params):
+    """Candele necessarie alla strategia: l'indicatore più lungo (EMA/ATR) più il margine di warm-up."""
+    return max(params.get('ema_slow', 200), params.get('ema_fast', 0), params.get('atr_len', 14)) + WARMUP_MARGIN
+
+
+class RollingKlineWindow:
+    """
+    Ultime `size` candele di un asset (colonna timestamp naive UTC + OHLCV, come evaluate_strategy_extended
+    si aspetta). L'ultima candela è di solito quella in formazione: il delta successivo riparte da lì.
+    """
+
+    def __init__(self, asset, size, store=OHLCV_STORE):
+        self.asset = asset
+        self.size = size
+        self.store = store
+        self.df = store.load('binance', asset, ANALYSIS_INTERVAL).tail(size).reset_index(drop=True)
+
+    @property
+    def last_ms(self):
+        return None if self.df.empty else pd.Timestamp(self.df['timestamp'].iloc[-1]).value // 1_000_000
+
+    def request(self, now_ms):
+        """Richiesta del ciclo: il delta dall'ultima candela, o la finestra intera se vuota o troppo vecchia."""
+        step = interval_ms(ANALYSIS_INTERVAL)
+        last = self.last_ms
+        if last is None or (now_ms - last) // step >= self.size:
+            return (self.asset, ANALYSIS_INTERVAL, 'binance', self.size)
+        return (self.asset, ANALYSIS_INTERVAL, 'binance', min(MAX_PAGE, (now_ms - last) // step + 1), last)
+
+    def append(self, new, replace, fetched_at):
+        """Aggiunge le candele scaricate (DataFrame con indice UTC) e salva in archivio quelle già chiuse."""
+        new = new.reset_index()
+        new['timestamp'] = new['timestamp'].dt.tz_localize(None).astype('datetime64[ms]')
+        kept = self.df.iloc[0:0] if replace else self.df[self.df['timestamp'] < new['timestamp'].iloc[0]]
+        self.df = pd.concat([kept, new], ignore_index=True).tail(self.size).reset_index(drop=True)
+
+        closed = new[new['timestamp'] + pd.Timedelta(milliseconds=interval_ms(ANALYSIS_INTERVAL)) <= pd.Timestamp(fetched_at, unit='ms')]
+        if len(closed):
+            self.store.merge('binance', self.asset, ANALYSIS_INTERVAL, closed)
+            first, last = (pd.Timestamp(closed['timestamp'].iloc[i]).value // 1_000_000 for i in (0, -1))
+            self.store.record_coverage('binance', self.asset, ANALYSIS_INTERVAL, first, last, fetched_at)
+
+
+def refresh_windows(production_strategies):
+    """Aggiorna le finestre di tutti gli asset con una sola tornata di richieste parallele; restituisce le statistiche del ciclo."""
+    fetched_at = int(time.time() * 1000)
+    for asset, strategy_data in production_strategies.items():
+        size = window_size(strategy_data.get('params') or {})
+        if asset not in WINDOWS or WINDOWS[asset].size != size:
+            WINDOWS[asset] = RollingKlineWindow(asset, size)
+    requests = [WINDOWS[asset].request(fetched_at) for asset in production_strategies]
+
+    calls, received = ASYNC_CLIENT.requests_made, ASYNC_CLIENT.bytes_received
+    frames = ASYNC_CLIENT.gather_klines_sync(requests)
+    calls, received = ASYNC_CLIENT.requests_made - calls, ASYNC_CLIENT.bytes_received - received
+
+    bars, failed = 0, []
+    for request, df in frames.items():
+        if df is None:
+            failed.append(request[0])  # finestra non aggiornata: l'asset salta il ciclo
+        elif not df.empty:
+            WINDOWS[request[0]].append(df, replace=len(request) == 4, fetched_at=fetched_at)
+            bars += len(df)
+    # Confronto con lo scaricamento completo della finestra per ogni asset (una pagina ciascuno)
+    baseline_bars = sum(WINDOWS[asset].size for asset in production_strategies)
+    bytes_per_bar = received / bars if bars else 0.0
+    return {'calls': calls, 'calls_saved': len(requests) - calls, 'bars': bars, 'bytes': received,
+            'bars_saved': baseline_bars - bars, 'bytes_saved': int((baseline_bars - bars) * bytes_per_bar), 'failed': failed}
+
 # --- MAPPATURA DELLE LOGICHE DI STRATEGIA ---
 # Questo dizionario traduce i nomi delle logiche in "ricette" eseguibili
 STRATEGY_BLUEPRINTS = {
@@ -66,6 +146,12 @@ def run_analysis_cycle(production_strategies):
 
     logging.info(f"--- AVVIO CICLO DI ANALISI PORTAFOGLIO ({len(production_strategies)} assets) ---")
 
+    started = time.monotonic()
+    stats = refresh_windows(production_strategies)
+    logging.info(f"Finestre aggiornate in {time.monotonic() - started:.2f} s: {stats['bars']} candele in {stats['calls']} chiamate "
+                 f"({stats['bytes'] / 1024:.1f} KiB); risparmiate {stats['bars_saved']} candele, ~{stats['bytes_saved'] / 1024:.1f} KiB, "
+                 f"{stats['calls_saved']} chiamate rispetto allo scaricamento completo.")
+
     for asset, strategy_data in production_strategies.items():
         logic_name = strategy_data.get('logic_name')
         params = strategy_data.get('params')
@@ -83,11 +169,11 @@ def run_analysis_cycle(production_strategies):
         try:
             logging.info(f"Analisi per {asset} con logica '{logic_name}'...")
             
-            # Scarica i dati più recenti
-            klines = binance_client.get_historical_klines(asset, "1h", "210 hours ago UTC")
-            df = pd.DataFrame(klines, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_av', 'trades', 'tb_base_av', 'tb_quote_av', 'ignore'])
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            for col in ['open', 'high', 'low', 'close', 'volume']: df[col] = pd.to_numeric(df[col])
+            # Finestra mobile aggiornata all'inizio del ciclo
+            df = WINDOWS[asset].df
+            if df.empty or asset in stats['failed']:
+                logging.warning(f"Dati non disponibili per {asset}. Salto.")
+                continue
 
             # Esegui la valutazione della strategia specifica
             signal = evaluate_strategy_extended(df, params, strategy_logic)
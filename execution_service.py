@@ -1,7 +1,9 @@
-# execution_service.py (MODALITÀ SIMULAZIONE - v1.1)
+# execution_service.py (MODALITÀ SIMULAZIONE - v1.2)
 # ----------------------------------------------------------------
 # Corregge il bug nella funzione get_market_price che impediva
 # di leggere correttamente la risposta dell'API di Bybit.
+# v1.2: il prezzo si legge prima dal feed di mercato in memoria
+# condivisa (infra.market_feed), se l'ingester è attivo.
 # ----------------------------------------------------------------
 
 from dotenv import load_dotenv
@@ -14,11 +16,13 @@ from decimal import Decimal, ROUND_DOWN
 
 import database
 from api_clients.bybit_client import BybitClient
+from infra.market_feed import MarketFeedReader
 
 # --- CONFIGURAZIONE ---
 MAX_SLIPPAGE_PERCENT = float(os.getenv("EXECUTION_MAX_SLIPPAGE", "0.005"))
 RISK_PER_TRADE_USD = float(os.getenv("EXECUTION_RISK_USD", "10.0"))
 SLEEP_INTERVAL = 10
+FEED_PRICE_MAX_AGE = float(os.getenv("EXECUTION_FEED_MAX_AGE", "5"))  # secondi
 
 class ExecutionService:
     def __init__(self):
@@ -26,10 +30,17 @@ class ExecutionService:
         print("### NESSUN ORDINE REALE VERRÀ PIAZZATO ###")
         database.init_db()
         self.bybit_client = BybitClient()
+        self.market_feed = None
         print("Servizio avviato. In attesa di nuovi intenti di trade da simulare...")
 
     def get_market_price(self, symbol):
         """Recupera il prezzo di mercato attuale per un simbolo."""
+        if self.market_feed is None:
+            self.market_feed = MarketFeedReader.open()  # l'ingester può partire dopo questo servizio
+        if self.market_feed:
+            price = self.market_feed.last_price(symbol, max_age=FEED_PRICE_MAX_AGE)
+            if price is not None:
+                return price
         try:
             tickers_response = self.bybit_client.session.get_tickers(category="linear", symbol=symbol)
             
@@ -0,0 +1,363 @@
+# infra/bulk_ingest.py - v1.1 (Import Offline degli Archivi Pubblici degli Exchange)
+# Anni di storico via REST sono lenti e limitati dal rate limit; Binance
+# (data.binance.vision) e Bybit (public.bybit.com) pubblicano gli stessi dati
+# come archivi giornalieri/mensili. Questo modulo importa una cartella di archivi
+# già scaricati (.zip, .csv, .csv.gz) nell'archivio OHLCV locale letto da
+# FinancialDataClient, data_sources e backtester, senza nessuna chiamata di rete.
+#
+# File riconosciuti dal nome (come pubblicati dagli exchange):
+#   Binance kline       BTCUSDT-1m-2024-01.zip / BTCUSDT-1m-2024-01-15.zip
+#   Binance trades      BTCUSDT-trades-2024-01.zip, BTCUSDT-aggTrades-2024-01.zip
+#   Bybit trades        BTCUSDT2024-01-15.csv.gz (derivati), BTCUSDT_2024-01-15.csv.gz (spot)
+# I trade vengono aggregati in candele del timeframe richiesto (default 1m); i minuti senza
+# trade diventano candele a volume zero al close precedente, come le kline degli exchange,
+# così la copertura registrata per il periodo non nasconde buchi.
+#
+# I file di una serie vengono letti in parallelo (un processo per file) con un
+# decoder a blocchi di CHUNK_ROWS righe: la memoria non dipende dalla dimensione
+# del file. Righe non valide (OHLC incoerenti, timestamp non allineati, valori
+# mancanti) vengono scartate e contate; i duplicati si risolvono nel merge
+# dell'archivio. Ogni serie viene scritta una sola volta e la copertura registrata,
+# così get_historical_ohlcv / get_klines non riscaricano i periodi importati.
+#
+# Exchange di destinazione: 'binance' (spot, come data_sources), 'binance_futures'
+# (file sotto una cartella 'futures'), 'bybit' (derivati lineari, come
+# FinancialDataClient), 'bybit_spot'; --exchange forza un nome.
+#
+# Uso da riga di comando:
+#   python -m infra.bulk_ingest <cartella> [--timeframe 1m] [--workers 8] [--exchange binance] [--columnar] [--dry-run]
+import argparse
+import gzip
+import io
+import logging
+import os
+import re
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from infra.ohlcv_store import OHLCV_STORE, OHLCV_COLUMNS, OHLCVStore, dedupe_sorted, interval_ms
+
+CHUNK_ROWS = 1_000_000
+FLOAT_PRECISION = 'round_trip'  # il parser veloce di pandas può sbagliare l'ultima cifra: i prezzi devono coincidere con quelli REST
+DEFAULT_WORKERS = max(1, min(8, os.cpu_count() or 1))
+N_ROWS = 1 + len(OHLCV_COLUMNS)
+_EXT = r'\.(?:zip|csv|csv\.gz)$'
+PATTERNS = (
+    ('binance', 'klines', re.compile(r'^(?P<symbol>[A-Z0-9]+)-(?P<interval>\d+[mhdw])-(?P<period>\d{4}-\d{2}(?:-\d{2})?)' + _EXT)),
+    ('binance', 'trades', re.compile(r'^(?P<symbol>[A-Z0-9]+)-trades-(?P<period>\d{4}-\d{2}(?:-\d{2})?)' + _EXT)),
+    ('binance', 'aggTrades', re.compile(r'^(?P<symbol>[A-Z0-9]+)-aggTrades-(?P<period>\d{4}-\d{2}(?:-\d{2})?)' + _EXT)),
+    ('bybit_spot', 'trades', re.compile(r'^(?P<symbol>[A-Z0-9]+)_(?P<period>\d{4}-\d{2}-\d{2})' + _EXT)),
+    ('bybit', 'trades', re.compile(r'^(?P<symbol>[A-Z0-9]+?)(?P<period>\d{4}-\d{2}-\d{2})' + _EXT)),
+)
+# Colonne (posizione) di timestamp, prezzo e quantità per i file di trade
+TRADE_COLUMNS = {
+    ('binance', 'trades'): (4, 1, 2),      # id, price, qty, quote_qty, time, is_buyer_maker
+    ('binance', 'aggTrades'): (5, 1, 2),   # agg_id, price, qty, first_id, last_id, transact_time, is_buyer_maker
+    ('bybit', 'trades'): (0, 4, 3),        # timestamp (s), symbol, side, size, price, ...
+    ('bybit_spot', 'trades'): (1, 2, 3),   # id, timestamp (ms), price, volume, side
+}
+
+
+class DumpFile(NamedTuple):
+    path: str
+    exchange: str   # nome dell'exchange nell'archivio OHLCV
+    source: str     # formato del file: 'binance' / 'bybit' / 'bybit_spot'
+    kind: str       # 'klines', 'trades', 'aggTrades'
+    symbol: str
+    interval: str   # timeframe delle candele (per i trade: quello di destinazione)
+    period_start: int
+    period_end: int
+
+
+def _period(period: str) -> tuple:
+    """'2024-01' o '2024-01-15' -> [inizio, fine] in ms del mese/giorno."""
+    start = pd.Timestamp(period, tz='UTC')
+    end = start + (pd.DateOffset(months=1) if len(period) == 7 else pd.Timedelta(days=1))
+    return int(start.value // 1_000_000), int(end.value // 1_000_000) - 1
+
+
+def classify(path: str, timeframe: str = '1m', exchange: str = None):
+    """DumpFile per un archivio riconosciuto, None altrimenti."""
+    name = os.path.basename(path)
+    for source, kind, pattern in PATTERNS:
+        match = pattern.match(name)
+        if not match:
+            continue
+        target = source
+        if source == 'binance' and 'futures' in os.path.normpath(path).split(os.sep):
+            target = 'binance_futures'
+        interval = match.group('interval') if kind == 'klines' else timeframe
+        start, end = _period(match.group('period'))
+        return DumpFile(path, exchange or target, source, kind, match.group('symbol'), interval, start, end)
+    return None
+
+
+def scan(folder: str, timeframe: str = '1m', exchange: str = None) -> tuple:
+    """(file riconosciuti, file ignorati) sotto folder, ricorsivamente."""
+    found, skipped = [], []
+    for dirpath, _, names in os.walk(folder):
+        for name in sorted(names):
+            path = os.path.join(dirpath, name)
+            dump = classify(path, timeframe, exchange)
+            (found if dump else skipped).append(dump or path)
+    return found, skipped
+
+
+# --- Decoder a blocchi ---
+
+def _open_stream(path: str):
+    """Stream binario del CSV: primo membro .csv di uno zip, gzip o file semplice."""
+    if path.endswith('.zip'):
+        archive = zipfile.ZipFile(path)
+        members = [m for m in archive.namelist() if m.endswith('.csv')]
+        if not members:
+            raise ValueError(f"{path}: nessun CSV nell'archivio.")
+        return archive.open(members[0])
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def _chunks(path: str, usecols: list):
+    """Blocchi di CHUNK_ROWS righe come matrice float64 con le colonne nell'ordine di usecols; salta l'intestazione se c'è."""
+    with _open_stream(path) as raw:
+        stream = raw if hasattr(raw, 'peek') else io.BufferedReader(raw)
+        first = stream.peek(64).lstrip()[:1]
+        reader = pd.read_csv(stream, header=None, skiprows=1 if first and not first.isdigit() else 0,
+                             usecols=usecols, chunksize=CHUNK_ROWS, engine='c', float_precision=FLOAT_PRECISION)
+        for chunk in reader:
+            chunk = chunk[usecols]
+            if not all(pd.api.types.is_numeric_dtype(t) for t in chunk.dtypes):
+                chunk = chunk.apply(pd.to_numeric, errors='coerce')
+            yield chunk.to_numpy(dtype=np.float64)
+
+
+def _to_ms(stamps: np.ndarray, source: str) -> np.ndarray:
+    """Timestamp del file -> ms: Bybit derivati in secondi, Binance spot dal 2025 in microsecondi."""
+    if source == 'bybit':
+        return np.round(stamps * 1000).astype(np.int64)
+    stamps = stamps.astype(np.int64)
+    return np.where(stamps >= 10 ** 14, stamps // 1000, stamps)
+
+
+def _valid_bars(matrix: np.ndarray, step: int) -> np.ndarray:
+    stamps = matrix[0].view(np.int64)
+    o, h, l, c, v = matrix[1:]
+    return (np.isfinite(matrix[1:]).all(axis=0) & (stamps % step == 0) & (l > 0) & (v >= 0)
+            & (h >= np.maximum(o, c)) & (l <= np.minimum(o, c)))
+
+
+def _read_klines(dump: DumpFile) -> tuple:
+    step = interval_ms(dump.interval)
+    parts, rows, invalid = [], 0, 0
+    for block in _chunks(dump.path, list(range(N_ROWS))):
+        rows += len(block)
+        stamps = np.nan_to_num(block[:, 0], nan=-1)
+        matrix = np.empty((N_ROWS, len(block)))
+        matrix[0].view(np.int64)[:] = _to_ms(stamps, dump.source)
+        matrix[1:] = block[:, 1:].T
+        valid = _valid_bars(matrix, step) & (stamps >= 0)
+        invalid += int((~valid).sum())
+        parts.append(matrix[:, valid])
+    return parts, rows, invalid
+
+
+def _aggregate(stamps, prices, sizes, step) -> tuple:
+    """Trade ordinati per tempo -> per bucket (bucket, primo ts, open, high, low, ultimo ts, close, volume)."""
+    buckets = stamps // step * step
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(stamps)] - 1
+    return (buckets[starts], stamps[starts], prices[starts], np.maximum.reduceat(prices, starts),
+            np.minimum.reduceat(prices, starts), stamps[ends], prices[ends], np.add.reduceat(sizes, starts))
+
+
+def _read_trades(dump: DumpFile) -> tuple:
+    step = interval_ms(dump.interval)
+    ts_col, price_col, size_col = TRADE_COLUMNS[(dump.source, dump.kind)]
+    partials, rows, invalid = [], 0, 0
+    for block in _chunks(dump.path, [ts_col, price_col, size_col]):
+        rows += len(block)
+        valid = np.isfinite(block).all(axis=1) & (block[:, 1] > 0) & (block[:, 2] >= 0)
+        invalid += int((~valid).sum())
+        block = block[valid]
+        if not len(block):
+            continue
+        stamps = _to_ms(block[:, 0], dump.source)
+        order = np.argsort(stamps, kind='stable')  # i dump Bybit non sono garantiti in ordine
+        partials.append(_aggregate(stamps[order], block[order, 1], block[order, 2], step))
+    if not partials:
+        return [], rows, invalid
+    # candele spezzate tra due blocchi: open dal trade più vecchio, close dal più recente
+    bucket, first_ts, open_, high, low, last_ts, close, volume = (np.concatenate(field) for field in zip(*partials))
+    by_first = np.lexsort((first_ts, bucket))
+    by_last = np.lexsort((last_ts, bucket))
+    buckets = bucket[by_first]
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(buckets)] - 1
+    matrix = np.empty((N_ROWS, len(starts)))
+    matrix[0].view(np.int64)[:] = buckets[starts]
+    matrix[1] = open_[by_first][starts]
+    matrix[2] = np.maximum.reduceat(high[by_first], starts)
+    matrix[3] = np.minimum.reduceat(low[by_first], starts)
+    matrix[4] = close[by_last][ends]
+    matrix[5] = np.add.reduceat(volume[by_first], starts)
+    return [matrix], rows, invalid
+
+
+def fill_empty_bars(matrix: np.ndarray, step: int, start_ms: int, end_ms: int) -> tuple:
+    """
+    Candele ricavate dai trade (ordinate, senza duplicati) -> (matrice, candele aggiunte): i bucket
+    senza trade in [start_ms, end_ms] diventano candele a volume zero con open = high = low = close
+    = close precedente, come le kline REST. I bucket prima del primo trade restano vuoti (manca il prezzo).
+    """
+    stamps = matrix[0].view(np.int64)
+    inside = stamps[(stamps >= start_ms) & (stamps <= end_ms)]
+    if not len(inside):
+        return matrix, 0
+    grid = np.arange(inside[0], end_ms + 1, step, dtype=np.int64)
+    missing = grid[~np.isin(grid, inside)]
+    if not len(missing):
+        return matrix, 0
+    filler = np.empty((N_ROWS, len(missing)))
+    filler[0].view(np.int64)[:] = missing
+    filler[1:5] = matrix[4, np.searchsorted(stamps, missing) - 1]
+    filler[5] = 0.0
+    return dedupe_sorted(np.concatenate([matrix, filler], axis=1)), len(missing)
+
+
+def read_dump(dump: DumpFile) -> tuple:
+    """(matrice (6, n) di candele valide ordinata e senza duplicati, righe lette, righe scartate)."""
+    parts, rows, invalid = (_read_klines if dump.kind == 'klines' else _read_trades)(dump)
+    matrix = np.concatenate(parts, axis=1) if parts else np.empty((N_ROWS, 0))
+    return dedupe_sorted(matrix), rows, invalid
+
+
+def _read_safe(dump: DumpFile):
+    try:
+        return read_dump(dump), None
+    except Exception as e:  # un archivio corrotto non ferma gli altri
+        return None, f"{type(e).__name__}: {e}"
+
+
+# --- Import nell'archivio ---
+
+def _coverage_runs(dumps) -> list:
+    """Periodi dei file uniti in tratti contigui [inizio, fine]."""
+    runs = []
+    for start, end in sorted({(d.period_start, d.period_end) for d in dumps}):
+        if runs and start <= runs[-1][1] + 1:
+            runs[-1][1] = max(runs[-1][1], end)
+        else:
+            runs.append([start, end])
+    return runs
+
+
+class BulkIngester:
+    """Importa gli archivi di una cartella nell'archivio OHLCV (e, se indicato, in quello colonnare)."""
+
+    def __init__(self, store: OHLCVStore = None, workers: int = DEFAULT_WORKERS, columnar=None):
+        self.store = store or OHLCV_STORE
+        self.workers = workers
+        self.columnar = columnar
+
+    def ingest(self, dumps, dry_run: bool = False) -> dict:
+        """
+        dumps: DumpFile (da scan). Restituisce per serie (exchange, simbolo, timeframe) file letti,
+        falliti, righe lette/scartate, candele valide e candele nuove in archivio.
+        """
+        series = {}
+        for dump in dumps:
+            series.setdefault((dump.exchange, dump.symbol, dump.interval), []).append(dump)
+        report = {}
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for key, files in sorted(series.items()):
+                files.sort(key=lambda d: d.period_start)
+                r = report[key] = {'files': len(files), 'failed': 0, 'rows': 0, 'invalid': 0, 'bars': 0, 'filled': 0, 'added': 0}
+                parts, ok = [], []
+                for dump, (result, error) in zip(files, pool.map(_read_safe, files)):
+                    if error:
+                        r['failed'] += 1
+                        logging.error(f"Import {os.path.basename(dump.path)} fallito: {error}")
+                        continue
+                    matrix, rows, invalid = result
+                    r['rows'] += rows
+                    r['invalid'] += invalid
+                    if invalid:
+                        logging.warning(f"Import {os.path.basename(dump.path)}: {invalid} righe non valide scartate su {rows}.")
+                    parts.append(matrix)
+                    ok.append(dump)
+                if not parts:
+                    continue
+                merged = dedupe_sorted(np.concatenate(parts, axis=1))
+                for start, end in _coverage_runs([d for d in ok if d.kind != 'klines']):
+                    merged, filled = fill_empty_bars(merged, interval_ms(key[2]), start, end)
+                    r['filled'] += filled
+                r['bars'] = merged.shape[1]
+                if dry_run:
+                    continue
+                self._store(key, merged, ok, r)
+        return report
+
+    def _store(self, key, matrix, dumps, report):
+        exchange, symbol, timeframe = key
+        frame = pd.DataFrame({'timestamp': matrix[0].view(np.int64), **{c: matrix[row] for row, c in enumerate(OHLCV_COLUMNS, start=1)}})
+        report['added'] = self.store.merge(exchange, symbol, timeframe, frame)
+        fetched_at = int(time.time() * 1000)
+        stamps = matrix[0].view(np.int64)
+        runs = []
+        for start, end in _coverage_runs(dumps):
+            # la copertura parte dalla prima candela del tratto: prima non c'era un prezzo da registrare
+            first = np.searchsorted(stamps, start)
+            if first < len(stamps) and stamps[first] <= end:
+                runs.append((int(stamps[first]), end))
+        # la copertura si estende solo per tratti contigui: all'indietro per i periodi più vecchi, poi in avanti
+        for start, end in reversed(runs):
+            self.store.record_coverage(exchange, symbol, timeframe, start, end, fetched_at)
+        for start, end in runs:
+            self.store.record_coverage(exchange, symbol, timeframe, start, end, fetched_at)
+        if self.columnar is not None:
+            self.columnar.merge(exchange, symbol, timeframe, matrix)
+
+
+def _main(argv=None):
+    parser = argparse.ArgumentParser(description="Import offline degli archivi kline/trade di Binance e Bybit nell'archivio OHLCV.")
+    parser.add_argument('folder', help="Cartella con gli archivi scaricati (.zip, .csv, .csv.gz)")
+    parser.add_argument('--timeframe', default='1m', help="Timeframe delle candele ricavate dai trade")
+    parser.add_argument('--exchange', default=None, help="Nome dell'exchange in archivio (default: dal formato del file)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--root', default=None, help="Cartella dell'archivio OHLCV (default: ohlcv_store)")
+    parser.add_argument('--columnar', action='store_true', help="Scrive anche nell'archivio colonnare compresso (infra.columnar_store)")
+    parser.add_argument('--dry-run', action='store_true', help="Legge e valida senza scrivere")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+
+    dumps, skipped = scan(args.folder, args.timeframe, args.exchange)
+    if skipped:
+        logging.info(f"{len(skipped)} file non riconosciuti ignorati (es. {os.path.basename(skipped[0])}).")
+    if not dumps:
+        print("Nessun archivio riconosciuto.")
+        return 1
+    columnar = None
+    if args.columnar:
+        from infra.columnar_store import COLUMNAR_STORE
+        columnar = COLUMNAR_STORE
+    ingester = BulkIngester(OHLCVStore(args.root) if args.root else None, args.workers, columnar)
+    started = time.time()
+    report = ingester.ingest(dumps, dry_run=args.dry_run)
+    elapsed = time.time() - started
+    for (exchange, symbol, timeframe), r in report.items():
+        print(f"{exchange:<15} {symbol:<10} {timeframe:<4} {r['files']:>4} file ({r['failed']} falliti)  {r['rows']:>12,} righe  "
+              f"{r['invalid']:>8,} scartate  {r['bars']:>10,} candele ({r['filled']:,} senza trade)  +{r['added']:,} in archivio")
+    rows = sum(r['rows'] for r in report.values())
+    print(f"{len(dumps)} file, {rows:,} righe in {elapsed:.1f} s ({rows / max(elapsed, 1e-9) / 1e6:.2f} M righe/s)")
+    return 1 if any(r['failed'] for r in report.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
@@ -0,0 +1,393 @@
+# infra/columnar_store.py - v1.0 (Archivio Colonnare Compresso per lo Storico 1m)
+# Anni di candele 1m per decine di simboli non stanno in memoria come DataFrame
+# float64 (48 byte a candela). Questo archivio le tiene su disco compresse, una
+# partizione per (exchange, simbolo, timeframe, mese):
+#   <root>/<exchange>/<SIMBOLO>/<timeframe>/<AAAA-MM>.phx
+#
+# Codifica di una partizione, a blocchi da BLOCK_ROWS candele decodificabili da soli:
+#   - prezzi come interi scalati (10^decimali, il minimo che li rappresenta esattamente);
+#     close in delta rispetto alla candela precedente, open/high/low come distanza dal
+#     close della stessa candela: numeri piccoli, salvati nel tipo intero più stretto;
+#   - timestamp come scarto dal passo del timeframe (quasi sempre 0);
+#   - volume come intero scalato;
+#   - ogni colonna con i byte riordinati per posizione (byte shuffle) e compressa con zlib.
+# La decodifica è esatta: (intero / 10^decimali) restituisce lo stesso float64 di partenza.
+# Se una colonna non ha una scala esatta si salvano i bit float64 (sempre senza perdite).
+#
+# File: magic + lunghezza + intestazione JSON (blocchi con primo/ultimo timestamp e
+# offset di ogni colonna) + dati. La lettura mappa il file in memoria e decomprime
+# solo i blocchi che intersecano l'intervallo richiesto.
+#
+# Uso da riga di comando:
+#   python -m infra.columnar_store import <exchange> <simbolo> <timeframe> [--from ohlcv_store]
+#   python -m infra.columnar_store list
+#   python -m infra.columnar_store bench <exchange> <simbolo> <timeframe> | --synthetic-days 365
+import argparse
+import json
+import os
+import sys
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from infra.ohlcv_store import (OHLCV_COLUMNS, OHLCVArrays, OHLCVStore, dedupe_sorted, frame_to_matrix,
+                               interval_ms, to_ms)
+
+DEFAULT_ROOT = "ohlcv_columnar"
+MAGIC = b'PHXCOL1\n'
+FORMAT_VERSION = 1
+BLOCK_ROWS = 16_384          # ~11 giorni di 1m: un intervallo breve decomprime poco
+MAX_DECIMALS = 10
+ZLIB_LEVEL = 6
+N_ROWS = 1 + len(OHLCV_COLUMNS)
+RAW_BYTES_PER_BAR = 8 * N_ROWS  # matrice float64 non compressa
+_INT_TYPES = (np.int8, np.int16, np.int32, np.int64)
+_EXACT_LIMIT = 2 ** 53
+
+
+def _empty() -> np.ndarray:
+    return np.empty((N_ROWS, 0))
+
+
+def _decimals(values: np.ndarray):
+    """Minimo numero di decimali che rappresenta esattamente tutti i valori, None se non esiste."""
+    if not len(values):
+        return 0
+    for d in range(MAX_DECIMALS + 1):
+        scaled = np.round(values * 10.0 ** d)
+        if np.abs(scaled).max() >= _EXACT_LIMIT:
+            return None
+        if np.array_equal(scaled / 10.0 ** d, values):
+            return d
+    return None
+
+
+def _to_int(values: np.ndarray, decimals) -> np.ndarray:
+    if decimals is None:
+        return values.view(np.int64).copy()
+    return np.round(values * 10.0 ** decimals).astype(np.int64)
+
+
+def _from_int(values: np.ndarray, decimals) -> np.ndarray:
+    if decimals is None:
+        return values.view(np.float64)
+    return values / 10.0 ** decimals
+
+
+def _narrow(values: np.ndarray) -> np.ndarray:
+    """Il tipo intero più stretto che contiene i valori."""
+    if not len(values):
+        return values.astype(np.int8)
+    lo, hi = int(values.min()), int(values.max())
+    for dtype in _INT_TYPES:
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return values.astype(dtype)
+    return values
+
+
+def _pack(values: np.ndarray) -> tuple:
+    """Colonna intera -> (bytes compressi, dtype): byte shuffle + zlib."""
+    values = _narrow(values)
+    size = values.dtype.itemsize
+    shuffled = values.view(np.uint8).reshape(-1, size).T.tobytes() if size > 1 else values.tobytes()
+    return zlib.compress(shuffled, ZLIB_LEVEL), values.dtype.str
+
+
+def _unpack(buffer, dtype: str, rows: int) -> np.ndarray:
+    dtype = np.dtype(dtype)
+    raw = np.frombuffer(zlib.decompress(buffer), dtype=np.uint8)
+    if dtype.itemsize > 1:
+        raw = raw.reshape(dtype.itemsize, rows).T.copy()
+    return raw.view(dtype).reshape(rows).astype(np.int64)
+
+
+def encode_partition(matrix: np.ndarray, step: int) -> bytes:
+    """Matrice (6, n) ordinata e senza duplicati -> contenuto del file .phx."""
+    prices = matrix[1:5]
+    price_decimals = _decimals(prices.ravel())
+    volume_decimals = _decimals(matrix[5])
+    stamps = matrix[0].view(np.int64)
+    blocks, payload, offset = [], [], 0
+    for lo in range(0, matrix.shape[1], BLOCK_ROWS):
+        hi = min(lo + BLOCK_ROWS, matrix.shape[1])
+        ts = stamps[lo:hi]
+        o, h, l, c = (_to_int(prices[i, lo:hi], price_decimals) for i in range(4))
+        v = _to_int(matrix[5, lo:hi], volume_decimals)
+        columns = {
+            'timestamp': np.diff(ts, prepend=ts[0]) - np.r_[0, np.full(len(ts) - 1, step, dtype=np.int64)],
+            'close': np.diff(c, prepend=c[0]),
+            'open': o - c, 'high': h - c, 'low': l - c,
+            'volume': v,
+        }
+        block = {'rows': int(hi - lo), 'first': int(ts[0]), 'last': int(ts[-1]), 'ts0': int(ts[0]), 'close0': int(c[0]),
+                 'columns': {}}
+        for name, values in columns.items():
+            data, dtype = _pack(values)
+            block['columns'][name] = [offset, len(data), dtype]
+            payload.append(data)
+            offset += len(data)
+        blocks.append(block)
+    header = json.dumps({'version': FORMAT_VERSION, 'step': step, 'rows': int(matrix.shape[1]),
+                         'price_decimals': price_decimals, 'volume_decimals': volume_decimals,
+                         'blocks': blocks}).encode()
+    return MAGIC + len(header).to_bytes(8, 'little') + header + b''.join(payload)
+
+
+def _decode_block(mm, data_start: int, block: dict, header: dict) -> np.ndarray:
+    rows = block['rows']
+
+    def column(name):
+        offset, length, dtype = block['columns'][name]
+        start = data_start + offset
+        return _unpack(mm[start:start + length], dtype, rows)
+    out = np.empty((N_ROWS, rows))
+    gaps = column('timestamp')
+    gaps[1:] += header['step']
+    out[0].view(np.int64)[:] = block['ts0'] + np.cumsum(gaps)
+    close = block['close0'] + np.cumsum(column('close'))
+    decimals = header['price_decimals']
+    for row, name in enumerate(('open', 'high', 'low'), start=1):
+        out[row] = _from_int(close + column(name), decimals)
+    out[4] = _from_int(close, decimals)
+    out[5] = _from_int(column('volume'), header['volume_decimals'])
+    return out
+
+
+class _Partition:
+    """File .phx mappato in memoria con l'intestazione già letta."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.mm = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(self.mm[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} non è una partizione colonnare.")
+        length = int.from_bytes(bytes(self.mm[len(MAGIC):len(MAGIC) + 8]), 'little')
+        start = len(MAGIC) + 8
+        self.header = json.loads(bytes(self.mm[start:start + length]))
+        if self.header['version'] != FORMAT_VERSION:
+            raise ValueError(f"{path}: versione {self.header['version']} non supportata.")
+        self.data_start = start + length
+
+    def read(self, start_ms: int = None, end_ms: int = None) -> np.ndarray:
+        """Decomprime solo i blocchi che intersecano [start_ms, end_ms] e taglia ai bordi."""
+        parts = []
+        for block in self.header['blocks']:
+            if (end_ms is not None and block['first'] > end_ms) or (start_ms is not None and block['last'] < start_ms):
+                continue
+            parts.append(_decode_block(self.mm, self.data_start, block, self.header))
+        if not parts:
+            return _empty()
+        matrix = parts[0] if len(parts) == 1 else np.concatenate(parts, axis=1)
+        stamps = matrix[0].view(np.int64)
+        lo = 0 if start_ms is None else int(np.searchsorted(stamps, start_ms, side='left'))
+        hi = len(stamps) if end_ms is None else int(np.searchsorted(stamps, end_ms, side='right'))
+        return matrix[:, lo:hi]
+
+
+def _month_key(ts_ms) -> str:
+    return str(np.datetime64(int(ts_ms), 'ms').astype('datetime64[M]'))
+
+
+class ColumnarStore:
+    """Archivio compresso per (exchange, simbolo, timeframe), con la stessa interfaccia di lettura di OHLCVStore."""
+
+    def __init__(self, root: str = DEFAULT_ROOT):
+        self.root = root
+        self._cache = {}  # path -> ((mtime, size), _Partition)
+
+    # --- Percorsi ---
+
+    def _folder(self, exchange: str, symbol: str, timeframe: str) -> str:
+        return os.path.join(self.root, exchange.lower(), symbol.upper(), timeframe)
+
+    def months(self, exchange: str, symbol: str, timeframe: str) -> list:
+        folder = self._folder(exchange, symbol, timeframe)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(name[:-4] for name in os.listdir(folder) if name.endswith('.phx'))
+
+    def _partition(self, path: str):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._cache.get(path)
+        if cached is None or cached[0] != key:
+            cached = self._cache[path] = (key, _Partition(path))
+        return cached[1]
+
+    # --- Lettura ---
+
+    def slice(self, exchange: str, symbol: str, timeframe: str, start=None, end=None) -> OHLCVArrays:
+        """Candele con apertura in [start, end] (estremi inclusi, None = senza limite), decodificate in NumPy."""
+        start_ms = None if start is None else to_ms(start)
+        end_ms = None if end is None else to_ms(end)
+        first = None if start_ms is None else _month_key(start_ms)
+        last = None if end_ms is None else _month_key(end_ms)
+        folder = self._folder(exchange, symbol, timeframe)
+        parts = []
+        for month in self.months(exchange, symbol, timeframe):
+            if (first is not None and month < first) or (last is not None and month > last):
+                continue
+            part = self._partition(os.path.join(folder, f"{month}.phx"))
+            if part is not None:
+                parts.append(part.read(start_ms, end_ms))
+        if not parts:
+            return OHLCVArrays(_empty())
+        return OHLCVArrays(parts[0] if len(parts) == 1 else np.concatenate(parts, axis=1))
+
+    def load(self, exchange: str, symbol: str, timeframe: str, start=None, end=None, as_index: bool = False) -> pd.DataFrame:
+        """Come slice() ma come DataFrame (vedi OHLCVArrays.to_dataframe)."""
+        return self.slice(exchange, symbol, timeframe, start, end).to_dataframe(as_index=as_index)
+
+    # --- Scrittura ---
+
+    def merge(self, exchange: str, symbol: str, timeframe: str, data) -> int:
+        """
+        Unisce candele (DataFrame come OHLCVStore.merge o matrice (6, n)) alle partizioni mensili;
+        a parità di timestamp vince la candela nuova. Restituisce il numero di candele nuove.
+        """
+        incoming = data if isinstance(data, np.ndarray) else frame_to_matrix(data)
+        if not incoming.shape[1]:
+            return 0
+        incoming = dedupe_sorted(incoming)
+        step = interval_ms(timeframe)
+        folder = self._folder(exchange, symbol, timeframe)
+        os.makedirs(folder, exist_ok=True)
+        month_of = incoming[0].view(np.int64).astype('datetime64[ms]').astype('datetime64[M]')
+        added = 0
+        for month in np.unique(month_of):
+            chunk = incoming[:, month_of == month]
+            path = os.path.join(folder, f"{month}.phx")
+            part = self._partition(path)
+            current = part.read() if part is not None else None
+            merged = chunk if current is None else dedupe_sorted(np.concatenate([current, chunk], axis=1))
+            if current is not None and merged.shape == current.shape and np.array_equal(merged.view(np.int64), current.view(np.int64)):
+                continue
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(encode_partition(merged, step))
+            self._cache.pop(path, None)
+            os.replace(tmp, path)
+            added += merged.shape[1] - (0 if current is None else current.shape[1])
+        return added
+
+    def import_from(self, store: OHLCVStore, exchange: str, symbol: str, timeframe: str) -> int:
+        """Copia una serie dell'archivio .npy (OHLCVStore) nelle partizioni compresse."""
+        matrix = store.load_matrix(exchange, symbol, timeframe)
+        return 0 if matrix is None else self.merge(exchange, symbol, timeframe, np.asarray(matrix))
+
+    # --- Manutenzione ---
+
+    def series(self) -> list:
+        """Serie in archivio con righe, mesi, byte su disco e rapporto di compressione rispetto a float64."""
+        rows = []
+        if not os.path.isdir(self.root):
+            return rows
+        for exchange in sorted(os.listdir(self.root)):
+            for symbol in sorted(os.listdir(os.path.join(self.root, exchange))):
+                for timeframe in sorted(os.listdir(os.path.join(self.root, exchange, symbol))):
+                    folder = self._folder(exchange, symbol, timeframe)
+                    months = self.months(exchange, symbol, timeframe)
+                    paths = [os.path.join(folder, f"{m}.phx") for m in months]
+                    count = sum(self._partition(p).header['rows'] for p in paths)
+                    stored = sum(os.path.getsize(p) for p in paths)
+                    rows.append({'exchange': exchange, 'symbol': symbol, 'timeframe': timeframe, 'rows': count,
+                                 'months': len(months), 'first': months[0] if months else None, 'last': months[-1] if months else None,
+                                 'bytes': stored, 'ratio': count * RAW_BYTES_PER_BAR / stored if stored else 0.0})
+        return rows
+
+    def drop(self, exchange: str, symbol: str, timeframe: str):
+        folder = self._folder(exchange, symbol, timeframe)
+        for month in self.months(exchange, symbol, timeframe):
+            path = os.path.join(folder, f"{month}.phx")
+            self._cache.pop(path, None)
+            os.remove(path)
+
+
+COLUMNAR_STORE = ColumnarStore()
+
+
+def _synthetic(days: int, seed: int = 7) -> np.ndarray:
+    """Random walk 1m con prezzi al tick (0.1) e volumi a 3 decimali, come un perpetual BTC."""
+    rng = np.random.default_rng(seed)
+    n = days * 1440
+    close = np.round(30_000 + np.cumsum(rng.normal(0, 8, n)), 1)
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.round(np.maximum(open_, close) + np.abs(rng.normal(0, 4, n)), 1)
+    low = np.round(np.minimum(open_, close) - np.abs(rng.normal(0, 4, n)), 1)
+    matrix = np.empty((N_ROWS, n))
+    matrix[0].view(np.int64)[:] = to_ms('2023-01-01') + np.arange(n, dtype=np.int64) * 60_000
+    matrix[1:5] = open_, high, low, close
+    matrix[5] = np.round(rng.gamma(2.0, 40.0, n), 3)
+    return matrix
+
+
+def _bench(store: ColumnarStore, exchange: str, symbol: str, timeframe: str, reference: np.ndarray = None):
+    info = next(s for s in store.series() if (s['exchange'], s['symbol'], s['timeframe']) == (exchange.lower(), symbol.upper(), timeframe))
+    print(f"{exchange} {symbol} {timeframe}: {info['rows']:,} candele in {info['months']} mesi, "
+          f"{info['bytes'] / 1e6:.2f} MB su disco vs {info['rows'] * RAW_BYTES_PER_BAR / 1e6:.2f} MB float64 -> {info['ratio']:.1f}x")
+    store._cache.clear()
+    started = time.perf_counter()
+    full = store.slice(exchange, symbol, timeframe)
+    elapsed = time.perf_counter() - started
+    print(f"  tutto lo storico : {elapsed * 1e3:8.1f} ms  {len(full) / elapsed / 1e6:6.1f} M candele/s  "
+          f"{len(full) * RAW_BYTES_PER_BAR / elapsed / 1e6:7.0f} MB/s decodificati")
+    if reference is not None:
+        print(f"  identico all'originale: {np.array_equal(full._matrix.view(np.int64), reference.view(np.int64))}")
+    stamps = full.timestamp_ms
+    if len(stamps):
+        mid = int(stamps[len(stamps) // 2])
+        for label, span in (('1 giorno', 86_400_000), ('1 settimana', 7 * 86_400_000)):
+            started = time.perf_counter()
+            for _ in range(20):
+                window = store.slice(exchange, symbol, timeframe, mid, mid + span - 1)
+            elapsed = (time.perf_counter() - started) / 20
+            print(f"  finestra {label:<11}: {elapsed * 1e3:8.2f} ms per {len(window):,} candele")
+
+
+def _main(argv=None):
+    parser = argparse.ArgumentParser(description="Archivio colonnare compresso delle candele (partizioni mensili).")
+    parser.add_argument('--root', default=DEFAULT_ROOT, help="Cartella dell'archivio compresso")
+    sub = parser.add_subparsers(dest='command', required=True)
+    cmd = sub.add_parser('import', help="Copia una serie da OHLCVStore")
+    cmd.add_argument('exchange'); cmd.add_argument('symbol'); cmd.add_argument('timeframe')
+    cmd.add_argument('--from', dest='source', default='ohlcv_store', help="Cartella di OHLCVStore")
+    sub.add_parser('list', help="Elenca le serie con il rapporto di compressione")
+    cmd = sub.add_parser('bench', help="Rapporto di compressione e velocità di decodifica")
+    cmd.add_argument('exchange', nargs='?'); cmd.add_argument('symbol', nargs='?'); cmd.add_argument('timeframe', nargs='?')
+    cmd.add_argument('--synthetic-days', type=int, default=None, help="Serie 1m sintetica in una cartella temporanea")
+    args = parser.parse_args(argv)
+
+    store = ColumnarStore(args.root)
+    if args.command == 'import':
+        started = time.perf_counter()
+        added = store.import_from(OHLCVStore(args.source), args.exchange, args.symbol, args.timeframe)
+        print(f"{added:,} candele nuove in {time.perf_counter() - started:.1f} s.")
+    elif args.command == 'list':
+        for s in store.series():
+            print(f"{s['exchange']:<8} {s['symbol']:<10} {s['timeframe']:<4} {s['rows']:>10,} candele  {s['first']} -> {s['last']}  "
+                  f"{s['bytes'] / 1e6:8.2f} MB  {s['ratio']:5.1f}x")
+    elif args.command == 'bench':
+        if args.synthetic_days:
+            import tempfile
+            with tempfile.TemporaryDirectory() as root:
+                store = ColumnarStore(root)
+                matrix = _synthetic(args.synthetic_days)
+                started = time.perf_counter()
+                store.merge('synthetic', 'BTCUSDT', '1m', matrix)
+                print(f"Codifica: {matrix.shape[1] / (time.perf_counter() - started) / 1e6:.2f} M candele/s")
+                _bench(store, 'synthetic', 'BTCUSDT', '1m', matrix)
+        elif args.timeframe:
+            _bench(store, args.exchange, args.symbol, args.timeframe)
+        else:
+            parser.error("bench: indicare exchange simbolo timeframe oppure --synthetic-days")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
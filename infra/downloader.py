@@ -0,0 +1,286 @@
+# infra/downloader.py - v1.0 (Downloader Storico Concorrente con Manifest)
+# Scarica intervalli storici di candele dividendoli in finestre allineate alla
+# pagina dell'exchange (1000 barre = una richiesta) e le chiede in parallelo su un
+# pool di thread. Un token bucket per exchange tiene le richieste sotto il budget
+# dell'API, quindi un backfill lungo è limitato dal rate limit e non dalla latenza.
+#
+# Le finestre sono allineate a multipli assoluti di (pagina x durata candela):
+# lo stesso periodo produce sempre le stesse finestre anche se l'inizio richiesto
+# si sposta ("2 years ago"). backfill() salva le pagine nell'archivio OHLCV e
+# annota le finestre completate in un manifest accanto alla serie
+# (<root>/<exchange>/<SIMBOLO>/<timeframe>.manifest.json): se il processo viene
+# interrotto, il run successivo riparte dalle finestre mancanti.
+#
+# Uso da riga di comando (default: config.ASSET_UNIVERSE):
+#   python -m infra.downloader --exchange bybit --timeframe 1m --since 2023-01-01 [--symbols BTCUSDT ETHUSDT]
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from infra.http import new_session, DEFAULT_TIMEOUT
+from infra.kline_decoder import decode_rows, loads
+from infra.ohlcv_store import OHLCV_STORE, OHLCV_COLUMNS, interval_ms, to_ms
+
+# Budget per exchange: barre per pagina, costo di una pagina e unità di costo al secondo.
+# Binance: klines con limit=1000 pesa 2 su 6000/minuto -> 40 peso/s lascia margine agli altri processi.
+# Bybit: 600 richieste ogni 5 s per IP sugli endpoint pubblici -> 20 richieste/s.
+EXCHANGES = {
+    'binance': {'url': "https://api.binance.com/api/v3/klines", 'page': 1000, 'cost': 2, 'budget': 40.0},
+    'bybit': {'url': "https://api.bybit.com/v5/market/kline", 'page': 1000, 'cost': 1, 'budget': 20.0},
+}
+DEFAULT_WORKERS = 16
+PAGE_RETRIES = 3
+
+
+class TokenBucket:
+    """Token bucket thread-safe: `rate` gettoni al secondo, fino a `capacity` accumulabili."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        """Blocca finché non ci sono `tokens` gettoni disponibili, poi li consuma."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def page_windows(start_ms: int, end_ms: int, step: int, page: int) -> list:
+    """
+    Finestre (k, inizio, fine) in ms che coprono [start_ms, end_ms]: la finestra k è
+    [k * page * step, (k + 1) * page * step - 1] ritagliata sull'intervallo richiesto.
+    """
+    span = page * step
+    first, last = start_ms // span, end_ms // span
+    return [(k, max(k * span, start_ms), min((k + 1) * span - 1, end_ms)) for k in range(first, last + 1)]
+
+
+def _binance_interval(step: int) -> str:
+    minutes = step // 60_000
+    if minutes % 10_080 == 0:
+        return f"{minutes // 10_080}w"
+    if minutes % 1440 == 0:
+        return f"{minutes // 1440}d"
+    return f"{minutes // 60}h" if minutes % 60 == 0 else f"{minutes}m"
+
+
+def _bybit_interval(step: int) -> str:
+    minutes = step // 60_000
+    return {1440: "D", 10_080: "W"}.get(minutes, str(minutes))
+
+
+def _page_frame(rows, descending: bool = False) -> pd.DataFrame:
+    """Righe [timestamp ms, open, high, low, close, volume, ...] -> DataFrame numerico in ordine crescente."""
+    if not rows:
+        return pd.DataFrame(columns=['timestamp', *OHLCV_COLUMNS])
+    matrix = decode_rows(rows, descending)
+    return pd.DataFrame({'timestamp': matrix[0].view(np.int64), **{col: matrix[row] for row, col in enumerate(OHLCV_COLUMNS, start=1)}})
+
+
+def _binance_page(session, symbol, step, lo, hi) -> pd.DataFrame:
+    params = {'symbol': symbol, 'interval': _binance_interval(step), 'startTime': lo, 'endTime': hi, 'limit': EXCHANGES['binance']['page']}
+    response = session.get(EXCHANGES['binance']['url'], params=params, timeout=DEFAULT_TIMEOUT)
+    response.raise_for_status()
+    return _page_frame(loads(response.content))
+
+
+def _bybit_page(session, symbol, step, lo, hi) -> pd.DataFrame:
+    params = {'category': 'linear', 'symbol': symbol, 'interval': _bybit_interval(step), 'start': lo, 'end': hi,
+              'limit': EXCHANGES['bybit']['page']}
+    response = session.get(EXCHANGES['bybit']['url'], params=params, timeout=DEFAULT_TIMEOUT)
+    response.raise_for_status()
+    payload = loads(response.content)
+    if payload.get('retCode') != 0:
+        raise RuntimeError(f"Bybit retCode={payload.get('retCode')} retMsg={payload.get('retMsg')}")
+    return _page_frame(payload['result']['list'], descending=True)  # Bybit restituisce dal più recente
+
+
+PAGE_FETCHERS = {'binance': _binance_page, 'bybit': _bybit_page}
+
+
+def _stitch(frames) -> pd.DataFrame:
+    """Concatena le pagine, ordina per timestamp e tiene l'ultima copia dei duplicati."""
+    frames = [f for f in frames if len(f)]
+    if not frames:
+        return _page_frame([])
+    merged = pd.concat(frames, ignore_index=True)
+    return merged.drop_duplicates('timestamp', keep='last').sort_values('timestamp', kind='stable').reset_index(drop=True)
+
+
+class HistoricalDownloader:
+    """Downloader concorrente con budget di richieste per exchange (condiviso tra tutti i simboli)."""
+
+    def __init__(self, store=None, workers: int = DEFAULT_WORKERS, budgets: dict = None):
+        self.store = store or OHLCV_STORE
+        self.workers = workers
+        budgets = budgets or {}
+        self.buckets = {name: TokenBucket(budgets.get(name, spec['budget'])) for name, spec in EXCHANGES.items()}
+        self.session = new_session()
+        self.requests = 0
+        self._count_lock = threading.Lock()
+
+    # --- Pagine ---
+
+    def _fetch_window(self, exchange, symbol, step, lo, hi) -> pd.DataFrame:
+        """Una pagina sotto budget, con qualche nuovo tentativo (il retry HTTP è già nella sessione)."""
+        for attempt in range(PAGE_RETRIES):
+            self.buckets[exchange].acquire(EXCHANGES[exchange]['cost'])
+            with self._count_lock:
+                self.requests += 1
+            try:
+                return PAGE_FETCHERS[exchange](self.session, symbol, step, lo, hi)
+            except Exception as e:
+                if attempt == PAGE_RETRIES - 1:
+                    raise
+                logging.warning(f"Downloader: {exchange} {symbol} [{lo}, {hi}] tentativo {attempt + 1} fallito: {e}")
+                time.sleep(0.5 * 2 ** attempt)
+
+    def fetch(self, exchange: str, symbol: str, timeframe: str, start, end):
+        """
+        Candele in [start, end] scaricate in parallelo (DataFrame timestamp ms + OHLCV),
+        oppure None se una pagina fallisce: è il `fetch` atteso da OHLCVStore.fetch_range.
+        """
+        step = interval_ms(timeframe)
+        windows = page_windows(to_ms(start), to_ms(end), step, EXCHANGES[exchange]['page'])
+        if not windows:
+            return _page_frame([])
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(windows))) as pool:
+            futures = [pool.submit(self._fetch_window, exchange, symbol, step, lo, hi) for _, lo, hi in windows]
+            try:
+                return _stitch([f.result() for f in futures])
+            except Exception as e:
+                logging.error(f"Downloader: {exchange} {symbol} {timeframe} non completato: {e}")
+                return None
+
+    # --- Backfill con manifest ---
+
+    def _manifest_path(self, exchange, symbol, timeframe) -> str:
+        return self.store._path(exchange, symbol, timeframe, 'manifest.json')
+
+    def load_manifest(self, exchange, symbol, timeframe) -> dict:
+        try:
+            with open(self._manifest_path(exchange, symbol, timeframe), 'r') as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            manifest = {}
+        if manifest.get('page') != EXCHANGES[exchange]['page']:
+            manifest = {'page': EXCHANGES[exchange]['page'], 'done': []}  # finestre diverse: si riparte
+        return manifest
+
+    def _save_manifest(self, exchange, symbol, timeframe, manifest: dict):
+        path = self._manifest_path(exchange, symbol, timeframe)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'page': manifest['page'], 'done': sorted(manifest['done'])}, f)
+        os.replace(tmp, path)
+
+    def backfill(self, exchange: str, symbols, timeframe: str, start, end=None, flush_pages: int = 200) -> dict:
+        """
+        Scarica [start, end] (end=None -> adesso) per tutti i simboli nell'archivio OHLCV.
+        Le finestre già nel manifest vengono saltate; ogni flush_pages pagine i dati vengono
+        uniti all'archivio e solo dopo le finestre vengono segnate come completate.
+        Restituisce per simbolo {'windows', 'skipped', 'done', 'failed'}.
+        """
+        started = time.time()
+        fetched_at = int(started * 1000)
+        start_ms, end_ms = to_ms(start), fetched_at if end is None else to_ms(end)
+        step = interval_ms(timeframe)
+        span = EXCHANGES[exchange]['page'] * step
+        report, manifests, pending = {}, {}, {}
+        jobs = []
+        for symbol in symbols:
+            manifest = manifests[symbol] = self.load_manifest(exchange, symbol, timeframe)
+            done = set(manifest['done'])
+            windows = page_windows(start_ms, end_ms, step, EXCHANGES[exchange]['page'])
+            todo = [w for w in windows if w[0] not in done]
+            report[symbol] = {'windows': len(windows), 'skipped': len(windows) - len(todo), 'done': 0, 'failed': 0}
+            pending[symbol] = []
+            jobs += [(symbol, *w) for w in todo]
+        logging.info(f"Backfill {exchange} {timeframe}: {len(jobs)} pagine da scaricare per {len(symbols)} simboli.")
+
+        def flush(symbol):
+            frames = pending[symbol]
+            if not frames:
+                return
+            self.store.merge(exchange, symbol, timeframe, _stitch([frame for _, _, _, frame in frames]))
+            # Solo finestre intere e già chiuse: quelle ritagliate o con l'ultima barra aperta si riscaricano
+            manifests[symbol]['done'] += [k for k, lo, hi, _ in frames if lo == k * span and hi == (k + 1) * span - 1 and hi < fetched_at]
+            self._save_manifest(exchange, symbol, timeframe, manifests[symbol])
+            report[symbol]['done'] += len(frames)
+            pending[symbol] = []
+
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        futures = {pool.submit(self._fetch_window, exchange, symbol, step, lo, hi): (symbol, k, lo, hi) for symbol, k, lo, hi in jobs}
+        try:
+            for completed, future in enumerate(as_completed(futures), start=1):
+                symbol, k, lo, hi = futures[future]
+                try:
+                    pending[symbol].append((k, lo, hi, future.result()))
+                except Exception as e:
+                    report[symbol]['failed'] += 1
+                    logging.error(f"Backfill {exchange} {symbol}: pagina [{lo}, {hi}] non scaricata: {e}")
+                if len(pending[symbol]) >= flush_pages:
+                    flush(symbol)
+                if completed % 100 == 0:
+                    elapsed = time.time() - started
+                    logging.info(f"Backfill {exchange} {timeframe}: {completed}/{len(jobs)} pagine, {self.requests / elapsed:.1f} req/s")
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            for symbol in symbols:
+                flush(symbol)  # anche se interrotto: quello che è arrivato resta in archivio e nel manifest
+
+        for symbol in symbols:
+            if not report[symbol]['failed']:
+                self.store.record_coverage(exchange, symbol, timeframe, start_ms, end_ms, fetched_at)
+        return report
+
+
+DOWNLOADER = HistoricalDownloader()
+
+
+def _main(argv=None):
+    import config
+    parser = argparse.ArgumentParser(description="Backfill concorrente delle candele storiche nell'archivio OHLCV.")
+    parser.add_argument('--exchange', default='bybit', choices=sorted(EXCHANGES))
+    parser.add_argument('--timeframe', default='1m')
+    parser.add_argument('--since', required=True, help="Inizio (es. 2023-01-01)")
+    parser.add_argument('--until', default=None, help="Fine (default: adesso)")
+    parser.add_argument('--symbols', nargs='*', default=None, help="Default: config.ASSET_UNIVERSE")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--budget', type=float, default=None, help="Unità di costo al secondo per l'exchange")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+
+    budgets = {args.exchange: args.budget} if args.budget else None
+    downloader = HistoricalDownloader(workers=args.workers, budgets=budgets)
+    started = time.time()
+    report = downloader.backfill(args.exchange, args.symbols or config.ASSET_UNIVERSE, args.timeframe, args.since, args.until)
+    for symbol, r in report.items():
+        print(f"{symbol:<10} {r['done']:>6} pagine scaricate, {r['skipped']:>6} già nel manifest, {r['failed']:>4} fallite (su {r['windows']})")
+    elapsed = time.time() - started
+    print(f"{downloader.requests} richieste in {elapsed:.1f} s ({downloader.requests / max(elapsed, 1e-9):.1f} req/s)")
+    return 1 if any(r['failed'] for r in report.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
@@ -0,0 +1,296 @@
+# infra/market_feed.py - v1.0 (Feed di Mercato in Memoria Condivisa tra Processi)
+# Un solo processo "ingester" (il feed WebSocket: `python -m api_clients.bybit_ws publish`
+# oppure `live_runner --publish`) scrive le candele in un file mappato in memoria
+# (/dev/shm se disponibile); live_runner, telegram/exchange/execution service e la
+# dashboard lo aprono in sola lettura e leggono le ultime candele senza copie e
+# senza chiamate di rete.
+#
+# Layout del file (tutto int64/float64 little-endian, allineato a 8 byte):
+#   header  : magic, versione, slot, capacità, pid dello scrittore, heartbeat ms
+#   chiavi  : per slot 32 byte ASCII "SIMBOLO|timeframe"
+#   meta    : per slot [seq, pos, count, last_ms, updated_ms, 0, 0, 0]
+#   forming : per slot la candela in formazione (ts ms come bit int64 + OHLCV)
+#   dati    : per slot una matrice (1 + 5) x (2 x capacità) con la stessa doppia
+#             scrittura di infra.ring_buffer.OHLCVRing: le ultime n candele sono
+#             sempre una fetta contigua.
+#
+# Seqlock per slot: lo scrittore porta seq a dispari, scrive, lo riporta a pari; il
+# lettore rilegge se seq è dispari o è cambiato durante la lettura. Un append
+# scrive solo in pos e pos + capacità, fuori dalla finestra delle ultime n < capacità
+# candele: una vista zero-copy resta coerente per (capacità - n) candele successive,
+# read() invece restituisce una copia validata dal seqlock.
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from infra.ohlcv_store import OHLCV_COLUMNS, OHLCVArrays
+
+MAGIC = int.from_bytes(b'PHXFEED1', 'little')
+VERSION = 1
+N_ROWS = 1 + len(OHLCV_COLUMNS)
+KEY_BYTES = 32
+HEADER_WORDS = 8
+META_WORDS = 8
+SEQ, POS, COUNT, LAST_MS, UPDATED_MS = range(5)
+HB = 5  # indice dell'heartbeat nell'header
+READ_TIMEOUT_SECONDS = 1.0  # uno scrittore non tiene mai uno slot così a lungo: oltre, è morto a metà scrittura
+DEFAULT_PATH = os.getenv("MARKET_FEED_PATH") or os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "phoenix_market_feed")
+
+
+def feed_key(symbol: str, timeframe: str) -> str:
+    return f"{symbol}|{timeframe}"
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class _FeedFile:
+    """Viste NumPy sulle sezioni del file mappato (comuni a scrittore e lettore)."""
+
+    def __init__(self, path: str, mode: str):
+        self.path = path
+        header = np.memmap(path, dtype=np.int64, mode='r', shape=(HEADER_WORDS,))
+        if int(header[0]) != MAGIC or int(header[1]) != VERSION:
+            raise ValueError(f"{path} non è un feed di mercato v{VERSION}.")
+        slots, capacity = int(header[2]), int(header[3])
+        del header
+        self.slots, self.capacity = slots, capacity
+        self._mm = np.memmap(path, dtype=np.uint8, mode=mode)
+        self._offset = 0
+        self.header = self._section(np.int64, (HEADER_WORDS,))
+        raw = self._section(np.uint8, (slots, KEY_BYTES))
+        self.keys = [bytes(row).rstrip(b'\0').decode('ascii') for row in raw]
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.meta = self._section(np.int64, (slots, META_WORDS))
+        self.forming = self._section(np.float64, (slots, N_ROWS))
+        self.data = self._section(np.float64, (slots, N_ROWS, 2 * capacity))
+        self.inode = os.stat(path).st_ino
+
+    def _section(self, dtype, shape):
+        """Vista sulla prossima sezione del file (le sezioni sono consecutive)."""
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        view = self._mm[self._offset:self._offset + nbytes].view(dtype).reshape(shape)
+        self._offset += nbytes
+        return view
+
+    @staticmethod
+    def size(slots: int, capacity: int) -> int:
+        return 8 * HEADER_WORDS + KEY_BYTES * slots + 8 * slots * (META_WORDS + N_ROWS + N_ROWS * 2 * capacity)
+
+
+class MarketFeedWriter:
+    """
+    Scrittore del feed (un solo processo). Le chiavi (simbolo, timeframe) sono fissate alla creazione;
+    il file viene preparato accanto e pubblicato con os.replace, quindi i lettori non vedono mai un
+    header a metà.
+    """
+
+    def __init__(self, keys, capacity: int = 400, path: str = DEFAULT_PATH):
+        keys = [feed_key(*k) if isinstance(k, tuple) else k for k in keys]
+        for key in keys:
+            if len(key.encode('ascii')) > KEY_BYTES:
+                raise ValueError(f"Chiave troppo lunga per il feed: {key}")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.truncate(_FeedFile.size(len(keys), capacity))
+        mm = np.memmap(tmp, dtype=np.uint8, mode='r+')
+        header = mm[:HEADER_WORDS * 8].view(np.int64)
+        header[:] = [MAGIC, VERSION, len(keys), capacity, os.getpid(), _now_ms(), 0, 0]
+        raw = b''.join(k.encode('ascii').ljust(KEY_BYTES, b'\0') for k in keys)
+        mm[HEADER_WORDS * 8:HEADER_WORDS * 8 + len(raw)] = np.frombuffer(raw, dtype=np.uint8)
+        mm.flush()
+        del header, mm
+        os.replace(tmp, path)
+        self.file = _FeedFile(path, 'r+')
+        self.file.forming[:] = np.nan
+        self.path, self.capacity = path, capacity
+
+    @property
+    def nbytes(self) -> int:
+        return _FeedFile.size(self.file.slots, self.capacity)
+
+    def _slot(self, symbol, timeframe):
+        return self.file.index.get(feed_key(symbol, timeframe))
+
+    def _begin(self, slot):
+        self.file.meta[slot, SEQ] += 1  # dispari: scrittura in corso
+
+    def _end(self, slot):
+        now = _now_ms()
+        self.file.meta[slot, UPDATED_MS] = now
+        self.file.meta[slot, SEQ] += 1  # pari: slot coerente
+        self.file.header[HB] = now
+
+    def publish(self, symbol, timeframe, bar: tuple, confirm: bool) -> bool:
+        """
+        Aggiornamento di una candela (ts ms, o, h, l, c, v) come KlineBuffer.apply: confirm=True aggiunge
+        una candela chiusa più recente dell'ultima, False aggiorna quella in formazione. True se pubblicato.
+        """
+        slot = self._slot(symbol, timeframe)
+        if slot is None:
+            return False
+        meta, cap = self.file.meta[slot], self.capacity
+        if meta[COUNT] and bar[0] <= meta[LAST_MS]:
+            return False
+        self._begin(slot)
+        try:
+            if confirm:
+                pos = int(meta[POS])
+                data = self.file.data[slot]
+                for i in (pos, pos + cap):
+                    data[0, i:i + 1].view(np.int64)[0] = bar[0]
+                    data[1:, i] = bar[1:]
+                meta[POS] = pos + 1 if pos + 1 < cap else 0
+                meta[COUNT] = min(int(meta[COUNT]) + 1, cap)
+                meta[LAST_MS] = bar[0]
+                forming = self.file.forming[slot]
+                if forming[0:1].view(np.int64)[0] <= bar[0]:
+                    forming[:] = np.nan
+            else:
+                forming = self.file.forming[slot]
+                forming[0:1].view(np.int64)[0] = bar[0]
+                forming[1:] = bar[1:]
+        finally:
+            self._end(slot)
+        return True
+
+    def heartbeat(self):
+        self.file.header[HB] = _now_ms()
+
+    def close(self, unlink: bool = True):
+        path = self.file.path
+        self.file = None
+        if unlink:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class MarketFeedReader:
+    """
+    Lettore in sola lettura (qualsiasi numero di processi). Se lo scrittore ricrea il feed
+    (riavvio) il file viene rimappato al primo accesso successivo.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self.file = _FeedFile(path, 'r')
+        self._checked = time.monotonic()
+
+    @classmethod
+    def open(cls, path: str = DEFAULT_PATH):
+        """Lettore oppure None se nessun ingester ha pubblicato il feed."""
+        try:
+            return cls(path)
+        except (OSError, ValueError):
+            return None
+
+    def _refresh(self):
+        if time.monotonic() - self._checked < 1.0:
+            return
+        self._checked = time.monotonic()
+        try:
+            if os.stat(self.path).st_ino != self.file.inode:
+                self.file = _FeedFile(self.path, 'r')
+        except (OSError, ValueError) as e:
+            logging.debug(f"Feed di mercato non rimappato: {e}")
+
+    def keys(self) -> list:
+        self._refresh()
+        return [tuple(k.split('|', 1)) for k in self.file.keys]
+
+    def age_seconds(self) -> float:
+        """Secondi dall'ultima scrittura dello scrittore (heartbeat)."""
+        self._refresh()
+        return (_now_ms() - int(self.file.header[HB])) / 1000
+
+    def _stable(self, slot, read):
+        """Esegue read() finché il seqlock dello slot non conferma una lettura senza scritture concorrenti."""
+        meta = self.file.meta[slot]
+        deadline = time.monotonic() + READ_TIMEOUT_SECONDS
+        while True:
+            before = int(meta[SEQ])
+            if not before & 1:
+                result = read()
+                if int(meta[SEQ]) == before:
+                    return result
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Feed di mercato: slot {self.file.keys[slot]} bloccato in scrittura.")
+            time.sleep(0)  # cede la CPU allo scrittore
+
+    def _slot(self, symbol, timeframe):
+        self._refresh()
+        slot = self.file.index.get(feed_key(symbol, timeframe))
+        if slot is None:
+            raise KeyError(f"{symbol} {timeframe} non pubblicato nel feed.")
+        return slot
+
+    def status(self, symbol, timeframe) -> dict:
+        """count, last_ms (ultima candela chiusa) e updated_ms dello slot."""
+        slot = self._slot(symbol, timeframe)
+        meta = self._stable(slot, lambda: self.file.meta[slot].copy())
+        return {'count': int(meta[COUNT]), 'last_ms': int(meta[LAST_MS]) if meta[COUNT] else None, 'updated_ms': int(meta[UPDATED_MS])}
+
+    def window(self, symbol, timeframe, n: int = None) -> OHLCVArrays:
+        """
+        Viste zero-copy sulle ultime n candele chiuse. Coerenti finché non arrivano altre (capacità - n)
+        candele; per una copia sempre coerente usare read().
+        """
+        slot = self._slot(symbol, timeframe)
+        cap = self.file.capacity
+
+        def bounds():
+            meta = self.file.meta[slot]
+            count = int(meta[COUNT])
+            k = count if n is None else min(n, count)
+            end = int(meta[POS]) + cap
+            return end - k, end
+        lo, hi = self._stable(slot, bounds)
+        return OHLCVArrays(self.file.data[slot][:, lo:hi])
+
+    def read(self, symbol, timeframe, n: int = None, include_forming: bool = False) -> OHLCVArrays:
+        """Copia coerente (seqlock) delle ultime n candele chiuse, più quella in formazione se richiesta."""
+        slot = self._slot(symbol, timeframe)
+        cap = self.file.capacity
+
+        def copy():
+            meta = self.file.meta[slot]
+            count = int(meta[COUNT])
+            k = count if n is None else min(n, count)
+            end = int(meta[POS]) + cap
+            matrix = self.file.data[slot][:, end - k:end]
+            forming = self.file.forming[slot]
+            if include_forming and count and not np.isnan(forming[1]) and forming[0:1].view(np.int64)[0] > meta[LAST_MS]:
+                return np.column_stack([matrix, forming])
+            return matrix.copy()
+        return OHLCVArrays(self._stable(slot, copy))
+
+    def last_price(self, symbol, timeframe: str = None, max_age: float = None):
+        """
+        Close dell'aggiornamento più recente (candela in formazione o ultima chiusa) della serie, o della
+        serie del simbolo aggiornata per ultima se timeframe è None; None se assente o più vecchio di max_age secondi.
+        """
+        timeframes = [timeframe] if timeframe else [tf for s, tf in self.keys() if s == symbol]
+        best = None
+        for tf in timeframes:
+            try:
+                updated = self.status(symbol, tf)['updated_ms']
+            except KeyError:
+                continue
+            if best is None or updated > best[0]:
+                best = (updated, tf)
+        if best is None or (max_age is not None and _now_ms() - best[0] > max_age * 1000):
+            return None
+        arrays = self.read(symbol, best[1], 1, include_forming=True)
+        return float(arrays.close[-1]) if len(arrays) else None
+
+    def frame(self, symbol, timeframe, n: int = None, include_forming: bool = False) -> pd.DataFrame:
+        """DataFrame OHLCV con indice UTC (formato di FinancialDataClient.get_klines)."""
+        return self.read(symbol, timeframe, n, include_forming).to_dataframe(as_index=True)
@@ -0,0 +1,349 @@
+# infra/ohlcv_store.py - v1.2 (Archivio OHLCV Locale con Riempimento Incrementale)
+# Archivio su disco delle candele per (exchange, simbolo, timeframe). Backtest,
+# optimizer, strategy_generator e ricerca leggono da qui e scaricano dall'exchange
+# solo i tratti mancanti in testa (storico più vecchio) e in coda (barre nuove).
+#
+# Struttura su disco (<root>/<exchange>/<SIMBOLO>/<timeframe>.*):
+#   .npy  -> matrice (1 + 5) x n float64 come SharedOHLCV: riga 0 = timestamp di
+#            apertura in ms (bit int64), poi open/high/low/close/volume. Ogni riga è
+#            una colonna contigua, i timestamp sono ordinati e senza duplicati.
+#   .json -> copertura: da dove lo storico è già stato chiesto (covered_from) e fino
+#            a quale barra le candele erano già chiuse al download (closed_until).
+#
+# La lettura usa np.load(mmap_mode='r'): slice() restituisce viste NumPy della
+# finestra temporale (searchsorted sui timestamp), senza copie. La scrittura è
+# atomica (file temporaneo + rename) e il merge è idempotente: a parità di
+# timestamp vince la candela appena scaricata (l'ultima barra può essere parziale).
+# Merge e aggiornamento della copertura avvengono sotto un lock di file (<serie>.lock)
+# così più processi (runner, optimizer, ingestione) non si sovrascrivono a vicenda.
+#
+# Uso da riga di comando:
+#   python -m infra.ohlcv_store list | gaps <exchange> <simbolo> <timeframe> | drop <exchange> <simbolo> <timeframe>
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: resta solo il lock tra thread dello stesso processo
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from infra.shared_ohlcv import OHLCV_COLUMNS
+
+DEFAULT_ROOT = "ohlcv_store"
+
+_UNIT_MS = {'m': 60_000, 'h': 3_600_000, 'd': 86_400_000, 'w': 604_800_000}
+
+
+def interval_ms(timeframe) -> int:
+    """Durata di una candela in ms: '15m', '1h', '4h', '1d', '1w' oppure le forme Bybit '15', '240', 'D', 'W'."""
+    tf = str(timeframe).strip()
+    if tf.isdigit():
+        return int(tf) * _UNIT_MS['m']
+    if tf in ('D', 'W'):
+        return _UNIT_MS[tf.lower()]
+    match = re.fullmatch(r'(\d+)([mhdw])', tf.lower())
+    if not match or tf.endswith('M'):
+        raise ValueError(f"Timeframe non supportato: {timeframe}")
+    return int(match.group(1)) * _UNIT_MS[match.group(2)]
+
+
+def to_ms(value) -> int:
+    """ms epoch da int (già in ms), datetime/Timestamp (naive = UTC) o stringa ISO."""
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    ts = pd.Timestamp(value)
+    ts = ts.tz_localize('UTC') if ts.tz is None else ts.tz_convert('UTC')
+    return int(ts.value // 1_000_000)
+
+
+_THREAD_LOCKS = {}
+_THREAD_LOCKS_GUARD = threading.Lock()
+
+
+@contextmanager
+def file_lock(path: str):
+    """Lock esclusivo su `path`.lock, valido tra processi (flock) e tra thread dello stesso processo."""
+    lock_path = f"{path}.lock"
+    with _THREAD_LOCKS_GUARD:
+        thread_lock = _THREAD_LOCKS.setdefault(os.path.abspath(lock_path), threading.Lock())
+    with thread_lock:
+        os.makedirs(os.path.dirname(lock_path) or '.', exist_ok=True)
+        with open(lock_path, 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def frame_to_matrix(df: pd.DataFrame) -> np.ndarray:
+    """DataFrame con DatetimeIndex o colonna 'timestamp' (datetime o ms) -> matrice ordinata senza duplicati."""
+    if df is None or df.empty:
+        return np.empty((1 + len(OHLCV_COLUMNS), 0))
+    if 'timestamp' in df.columns:
+        ts = df['timestamp']
+        stamps = ts.to_numpy(dtype=np.int64) if pd.api.types.is_numeric_dtype(ts) else _datetimes_to_ms(ts)
+    else:
+        stamps = _datetimes_to_ms(df.index)
+    matrix = np.empty((1 + len(OHLCV_COLUMNS), len(df)))
+    matrix[0].view(np.int64)[:] = stamps
+    for row, col in enumerate(OHLCV_COLUMNS, start=1):
+        matrix[row] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64)
+    matrix = matrix[:, ~np.isnan(matrix[1:]).any(axis=0)]
+    return dedupe_sorted(matrix)
+
+
+def _datetimes_to_ms(values) -> np.ndarray:
+    index = pd.DatetimeIndex(values)
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    return index.as_unit('ms').asi8
+
+
+def dedupe_sorted(matrix: np.ndarray) -> np.ndarray:
+    """Ordina per timestamp; a parità di timestamp tiene l'ULTIMA occorrenza (la più recente)."""
+    stamps = matrix[0].view(np.int64)
+    order = np.argsort(stamps, kind='stable')
+    stamps = stamps[order]
+    keep = np.ones(len(stamps), dtype=bool)
+    keep[:-1] = stamps[1:] != stamps[:-1]
+    return np.ascontiguousarray(matrix[:, order[keep]])
+
+
+class OHLCVArrays:
+    """Finestra di una serie: viste NumPy (timestamp datetime64[ms] + colonne OHLCV float64)."""
+
+    def __init__(self, matrix: np.ndarray):
+        self._matrix = matrix
+        self.timestamp_ms = matrix[0].view(np.int64)
+        self.timestamp = self.timestamp_ms.view('datetime64[ms]')
+        for row, col in enumerate(OHLCV_COLUMNS, start=1):
+            setattr(self, col, matrix[row])
+
+    def __len__(self):
+        return self._matrix.shape[1]
+
+    def column(self, name: str) -> np.ndarray:
+        return self.timestamp if name == 'timestamp' else getattr(self, name)
+
+    def to_dataframe(self, as_index: bool = False) -> pd.DataFrame:
+        """
+        as_index=False: colonne timestamp (naive UTC) + OHLCV, come i DataFrame di optimizer/strategy_generator.
+        as_index=True: DatetimeIndex UTC 'timestamp' + OHLCV, come FinancialDataClient.get_klines.
+        """
+        data = {col: np.array(getattr(self, col)) for col in OHLCV_COLUMNS}
+        stamps = np.array(self.timestamp)
+        if as_index:
+            return pd.DataFrame(data, index=pd.DatetimeIndex(stamps, name='timestamp').tz_localize('UTC'))
+        return pd.DataFrame({'timestamp': stamps, **data})
+
+
+class OHLCVStore:
+    """Archivio su disco delle candele, una serie per (exchange, simbolo, timeframe)."""
+
+    def __init__(self, root: str = DEFAULT_ROOT):
+        self.root = root
+        self.downloads = 0  # chiamate a fetch() eseguite (per i log)
+
+    # --- Percorsi e metadati ---
+
+    def _path(self, exchange: str, symbol: str, timeframe: str, ext: str) -> str:
+        return os.path.join(self.root, exchange.lower(), symbol.upper(), f"{timeframe}.{ext}")
+
+    def meta(self, exchange: str, symbol: str, timeframe: str) -> dict:
+        try:
+            with open(self._path(exchange, symbol, timeframe, 'json'), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write_meta(self, exchange, symbol, timeframe, meta: dict):
+        path = self._path(exchange, symbol, timeframe, 'json')
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp, path)
+
+    # --- Lettura ---
+
+    def load_matrix(self, exchange, symbol, timeframe, mmap: bool = True):
+        """Matrice (6, n) della serie così com'è su disco (in mmap di sola lettura se mmap=True), o None se non c'è."""
+        path = self._path(exchange, symbol, timeframe, 'npy')
+        try:
+            return np.load(path, mmap_mode='r' if mmap else None)
+        except FileNotFoundError:
+            return None
+
+    def slice(self, exchange: str, symbol: str, timeframe: str, start=None, end=None) -> OHLCVArrays:
+        """Candele con apertura in [start, end] (estremi inclusi, None = senza limite) come viste NumPy."""
+        matrix = self.load_matrix(exchange, symbol, timeframe)
+        if matrix is None:
+            return OHLCVArrays(np.empty((1 + len(OHLCV_COLUMNS), 0)))
+        stamps = matrix[0].view(np.int64)
+        lo = 0 if start is None else int(np.searchsorted(stamps, to_ms(start), side='left'))
+        hi = len(stamps) if end is None else int(np.searchsorted(stamps, to_ms(end), side='right'))
+        return OHLCVArrays(matrix[:, lo:hi])
+
+    def load(self, exchange: str, symbol: str, timeframe: str, start=None, end=None, as_index: bool = False) -> pd.DataFrame:
+        """Come slice() ma come DataFrame (vedi OHLCVArrays.to_dataframe)."""
+        return self.slice(exchange, symbol, timeframe, start, end).to_dataframe(as_index=as_index)
+
+    # --- Scrittura ---
+
+    def merge(self, exchange: str, symbol: str, timeframe: str, df: pd.DataFrame) -> int:
+        """Unisce df alla serie (idempotente, sotto lock di file); restituisce il numero di candele nuove."""
+        incoming = frame_to_matrix(df)
+        if not incoming.shape[1]:
+            return 0
+        path = self._path(exchange, symbol, timeframe, 'npy')
+        with file_lock(path):
+            current = self.load_matrix(exchange, symbol, timeframe, mmap=False)
+            merged = incoming if current is None else dedupe_sorted(np.concatenate([current, incoming], axis=1))
+            if current is not None and merged.shape == current.shape and np.array_equal(merged.view(np.int64), current.view(np.int64)):
+                return 0  # niente di nuovo: il file resta com'è
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as f:
+                np.save(f, merged)
+            os.replace(tmp, path)
+        return merged.shape[1] - (0 if current is None else current.shape[1])
+
+    # --- Riempimento incrementale ---
+
+    def missing_ranges(self, exchange: str, symbol: str, timeframe: str, start_ms: int, end_ms: int) -> list:
+        """
+        Tratti [inizio, fine] in ms da scaricare per coprire [start_ms, end_ms]: la testa prima
+        di covered_from e la coda dalla prima barra non ancora chiusa. La coda parte sempre da
+        lì (anche se start_ms è più avanti) così la serie resta senza buchi.
+        """
+        meta = self.meta(exchange, symbol, timeframe)
+        if 'covered_from' not in meta:
+            return [(start_ms, end_ms)]
+        ranges = []
+        covered_from = meta['covered_from']
+        if start_ms < covered_from:
+            ranges.append((start_ms, covered_from - 1))
+        closed_until = meta.get('closed_until')
+        tail_from = covered_from if closed_until is None else closed_until + interval_ms(timeframe)
+        if end_ms >= tail_from:
+            ranges.append((tail_from, end_ms))
+        return ranges
+
+    def record_coverage(self, exchange: str, symbol: str, timeframe: str, start_ms: int, end_ms: int, fetched_at: int):
+        """
+        Registra che [start_ms, end_ms] è stato scaricato per intero all'istante fetched_at (ms).
+        La copertura si estende solo se il tratto è contiguo a quella esistente: un blocco
+        isolato (es. un backfill di anni lontani) resta in archivio ma non la modifica.
+        """
+        step = interval_ms(timeframe)
+        with file_lock(self._path(exchange, symbol, timeframe, 'npy')):
+            stamps = self.slice(exchange, symbol, timeframe).timestamp_ms
+            meta = self.meta(exchange, symbol, timeframe)
+            covered_from, closed_until = meta.get('covered_from'), meta.get('closed_until')
+            if covered_from is not None:
+                tail_from = covered_from if closed_until is None else closed_until + step
+                if end_ms + 1 < covered_from or start_ms > tail_from:
+                    return
+            meta.update(exchange=exchange, symbol=symbol, timeframe=timeframe, rows=int(len(stamps)))
+            meta['covered_from'] = start_ms if covered_from is None else min(start_ms, covered_from)
+            closed = stamps[(stamps <= end_ms) & (stamps + step <= fetched_at)]
+            if len(closed) and (closed_until is None or closed[-1] > closed_until):
+                meta['closed_until'] = int(closed[-1])
+            self._write_meta(exchange, symbol, timeframe, meta)
+
+    def fetch_range(self, exchange: str, symbol: str, timeframe: str, start, end, fetch, as_index: bool = False) -> pd.DataFrame:
+        """
+        Candele in [start, end] servite dall'archivio; prima scarica con fetch(start_ms, end_ms)
+        solo i tratti mancanti. fetch restituisce un DataFrame (anche vuoto: l'exchange non ha
+        dati in quel tratto) oppure None in caso di errore (la copertura non viene estesa).
+        """
+        start_ms, end_ms = to_ms(start), to_ms(end)
+        for lo, hi in self.missing_ranges(exchange, symbol, timeframe, start_ms, end_ms):
+            fetched_at = int(time.time() * 1000)
+            df = fetch(lo, hi)
+            self.downloads += 1
+            if df is None:
+                logging.warning(f"Archivio OHLCV: download {exchange} {symbol} {timeframe} [{lo}, {hi}] fallito, uso i dati locali.")
+                continue
+            added = self.merge(exchange, symbol, timeframe, df)
+            self.record_coverage(exchange, symbol, timeframe, lo, hi, fetched_at)
+            logging.info(f"Archivio OHLCV: {exchange} {symbol} {timeframe} +{added} candele "
+                         f"({pd.to_datetime(lo, unit='ms')} -> {pd.to_datetime(hi, unit='ms')}).")
+        return self.load(exchange, symbol, timeframe, start_ms, end_ms, as_index=as_index)
+
+    # --- Manutenzione ---
+
+    def series(self) -> list:
+        """Elenco delle serie in archivio con righe, primo/ultimo timestamp e byte su disco."""
+        rows = []
+        if not os.path.isdir(self.root):
+            return rows
+        for exchange in sorted(os.listdir(self.root)):
+            for symbol in sorted(os.listdir(os.path.join(self.root, exchange))):
+                folder = os.path.join(self.root, exchange, symbol)
+                for name in sorted(os.listdir(folder)):
+                    if not name.endswith('.npy'):
+                        continue
+                    timeframe = name[:-4]
+                    stamps = self.slice(exchange, symbol, timeframe).timestamp
+                    rows.append({'exchange': exchange, 'symbol': symbol, 'timeframe': timeframe, 'rows': len(stamps),
+                                 'first': stamps[0] if len(stamps) else None, 'last': stamps[-1] if len(stamps) else None,
+                                 'bytes': os.path.getsize(os.path.join(folder, name))})
+        return rows
+
+    def gaps(self, exchange: str, symbol: str, timeframe: str) -> list:
+        """Buchi interni (candele mancanti tra due presenti): lista di (primo mancante, candele mancanti)."""
+        stamps = self.slice(exchange, symbol, timeframe).timestamp_ms
+        step = interval_ms(timeframe)
+        jumps = np.flatnonzero(np.diff(stamps) > step)
+        return [(pd.to_datetime(int(stamps[i]) + step, unit='ms'), int((stamps[i + 1] - stamps[i]) // step) - 1) for i in jumps]
+
+    def drop(self, exchange: str, symbol: str, timeframe: str):
+        for ext in ('npy', 'json', 'manifest.json'):
+            try:
+                os.remove(self._path(exchange, symbol, timeframe, ext))
+            except FileNotFoundError:
+                pass
+
+
+OHLCV_STORE = OHLCVStore()
+
+
+def _main(argv=None):
+    parser = argparse.ArgumentParser(description="Ispezione dell'archivio OHLCV locale.")
+    parser.add_argument('--root', default=DEFAULT_ROOT, help="Cartella dell'archivio")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list', help="Elenca le serie in archivio")
+    for name, text in (('gaps', "Buchi interni di una serie"), ('drop', "Elimina una serie")):
+        cmd = sub.add_parser(name, help=text)
+        cmd.add_argument('exchange'); cmd.add_argument('symbol'); cmd.add_argument('timeframe')
+    args = parser.parse_args(argv)
+
+    store = OHLCVStore(args.root)
+    if args.command == 'list':
+        for s in store.series():
+            print(f"{s['exchange']:<8} {s['symbol']:<10} {s['timeframe']:<4} {s['rows']:>8,} candele  {s['first']} -> {s['last']}  {s['bytes'] / 1e6:.2f} MB")
+    elif args.command == 'gaps':
+        gaps = store.gaps(args.exchange, args.symbol, args.timeframe)
+        for first_missing, count in gaps:
+            print(f"{first_missing}  {count} candele mancanti")
+        print(f"{len(gaps)} buchi.")
+    elif args.command == 'drop':
+        store.drop(args.exchange, args.symbol, args.timeframe)
+        print("Serie eliminata.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
@@ -0,0 +1,259 @@
+# infra/result_store.py - v1.1 (Archivio Risultati dei Backtest)
+# Archivio "content-addressed": ogni backtest è identificato dall'hash di
+# impronta dei dati + parametri + logica + versione del codice della strategia.
+# Se la stessa combinazione è già stata eseguita (anche in una sessione o in un
+# processo diverso) metriche e registro dei trade vengono riletti dal disco.
+#
+# Struttura su disco (<root>/<2 caratteri>/<hash>.*):
+#   .json -> metriche + metadati (leggibile a mano)
+#   .npz  -> registro dei trade in colonne (un array NumPy per campo)
+#
+# Uso da riga di comando:
+#   python -m infra.result_store list | show <hash> | stats | evict --max-mb 500 --max-age-days 30 | clear
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from analysis.indicator_cache import dataset_fingerprint
+
+DEFAULT_ROOT = "backtest_results"
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Moduli attraversati da ogni backtest (kernel/pandas_ta, cache indicatori, uscite SL/TP,
+# metriche): fanno sempre parte della versione, oltre a quelli indicati dal chiamante.
+TRADE_PATH_MODULES = (
+    'analysis/kernels.py', 'analysis/indicator_cache.py', 'analysis/exit_resolver.py', 'optimization/metrics.py',
+)
+
+
+def code_version(*sources, settings: dict = None) -> str:
+    """
+    Hash del sorgente dei moduli (oggetti modulo o percorsi) che determinano i trade,
+    più TRADE_PATH_MODULES e i valori di configurazione in settings (es. {nome: config.NOME}).
+    """
+    paths = [getattr(source, '__file__', source) for source in sources]
+    paths += [os.path.join(PROJECT_ROOT, module) for module in TRADE_PATH_MODULES]
+    digest = hashlib.sha256()
+    for path in dict.fromkeys(os.path.abspath(p) for p in paths):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    if settings:
+        digest.update(json.dumps(settings, sort_keys=True, default=str).encode())
+    return digest.hexdigest()[:16]
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return str(value)
+    raise TypeError(f"Tipo non serializzabile: {type(value)}")
+
+
+def _encode_ledger(trades) -> dict:
+    """Lista di trade (dict) -> colonne NumPy; i datetime diventano int64 in ns (UTC se con fuso)."""
+    frame = pd.DataFrame(trades)
+    columns, kinds = {}, {}
+    for name in frame.columns:
+        col = frame[name]
+        if isinstance(col.dtype, pd.DatetimeTZDtype):
+            columns[name], kinds[name] = col.dt.tz_convert('UTC').dt.tz_localize(None).astype('datetime64[ns]').to_numpy().view(np.int64), 'datetime_utc'
+        elif pd.api.types.is_datetime64_any_dtype(col):
+            columns[name], kinds[name] = col.astype('datetime64[ns]').to_numpy().view(np.int64), 'datetime'
+        elif pd.api.types.is_bool_dtype(col) or pd.api.types.is_numeric_dtype(col):
+            columns[name], kinds[name] = col.to_numpy(), 'number'
+        else:
+            columns[name], kinds[name] = col.astype(str).to_numpy(dtype=str), 'text'
+    columns['__kinds__'] = np.array(json.dumps(kinds))
+    return columns
+
+
+def _decode_ledger(arrays) -> list:
+    kinds = json.loads(str(arrays['__kinds__']))
+    data = {}
+    for name, kind in kinds.items():
+        values = arrays[name]
+        if kind == 'datetime':
+            values = pd.to_datetime(values.view('datetime64[ns]'))
+        elif kind == 'datetime_utc':
+            values = pd.to_datetime(values.view('datetime64[ns]')).tz_localize('UTC')
+        data[name] = values
+    return pd.DataFrame(data).to_dict('records')
+
+
+class ResultStore:
+    """Archivio su disco di metriche e registri dei trade, condivisibile tra processi."""
+
+    def __init__(self, root: str = DEFAULT_ROOT):
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+
+    # --- Chiavi ---
+
+    def make_key(self, df, params: dict, strategy_logic, code_version: str, **extra) -> str:
+        """Hash SHA-256 di impronta dati + parametri + logica + versione codice (+ extra, es. sessione)."""
+        payload = {'data': dataset_fingerprint(df), 'params': params, 'logic': strategy_logic,
+                   'code': code_version, 'extra': extra}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=_json_default).encode()).hexdigest()
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.{ext}")
+
+    # --- Lettura / scrittura ---
+
+    def get(self, key: str, with_trades: bool = False):
+        """Metriche salvate (e il registro dei trade se with_trades) oppure None."""
+        path = self._path(key, 'json')
+        try:
+            with open(path, 'r') as f:
+                record = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        os.utime(path)  # l'mtime fa da "ultimo accesso" per l'evizione LRU
+        if not with_trades:
+            return record['metrics']
+        ledger_path = self._path(key, 'npz')
+        trades = []
+        if os.path.exists(ledger_path):
+            with np.load(ledger_path) as arrays:
+                trades = _decode_ledger(arrays)
+        return record['metrics'], trades
+
+    def put(self, key: str, metrics: dict, trades=None, **meta):
+        """Salva metriche e registro; la scrittura è atomica (file temporaneo + rename)."""
+        os.makedirs(os.path.join(self.root, key[:2]), exist_ok=True)
+        if trades:
+            ledger_path = self._path(key, 'npz')
+            tmp = f"{ledger_path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                np.savez_compressed(f, **_encode_ledger(trades))
+            os.replace(tmp, ledger_path)
+        path = self._path(key, 'json')
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'metrics': metrics, 'meta': meta, 'created': time.time(), 'n_trades': len(trades or [])},
+                      f, default=_json_default)
+        os.replace(tmp, path)
+
+    def fetch_or_run(self, key: str, run, **meta):
+        """Restituisce le metriche in archivio, altrimenti esegue run() -> (metriche, trade) e le salva."""
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        metrics, trades = run()
+        self.put(key, metrics, trades, **meta)
+        return metrics
+
+    # --- Manutenzione ---
+
+    def entries(self) -> list:
+        """Elenco delle voci: hash, byte su disco, creazione, ultimo accesso, metadati, metriche."""
+        rows = []
+        if not os.path.isdir(self.root):
+            return rows
+        for bucket in sorted(os.listdir(self.root)):
+            folder = os.path.join(self.root, bucket)
+            for name in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+                if not name.endswith('.json'):
+                    continue
+                key = name[:-5]
+                path = os.path.join(folder, name)
+                ledger = self._path(key, 'npz')
+                try:
+                    with open(path, 'r') as f:
+                        record = json.load(f)
+                except (OSError, json.JSONDecodeError):
+                    continue
+                size = os.path.getsize(path) + (os.path.getsize(ledger) if os.path.exists(ledger) else 0)
+                rows.append({'key': key, 'bytes': size, 'created': record.get('created'),
+                             'last_access': os.path.getmtime(path), 'n_trades': record.get('n_trades', 0),
+                             'meta': record.get('meta', {}), 'metrics': record.get('metrics', {})})
+        return rows
+
+    def remove(self, key: str):
+        for ext in ('json', 'npz'):
+            try:
+                os.remove(self._path(key, ext))
+            except FileNotFoundError:
+                pass
+
+    def evict(self, max_bytes: int = None, max_age_days: float = None) -> int:
+        """Rimuove le voci più vecchie di max_age_days e poi le meno usate fino a stare sotto max_bytes."""
+        entries = sorted(self.entries(), key=lambda e: e['last_access'])
+        removed = 0
+        if max_age_days is not None:
+            cutoff = time.time() - max_age_days * 86400
+            for e in [e for e in entries if e['last_access'] < cutoff]:
+                self.remove(e['key']); entries.remove(e); removed += 1
+        if max_bytes is not None:
+            total = sum(e['bytes'] for e in entries)
+            for e in list(entries):
+                if total <= max_bytes:
+                    break
+                self.remove(e['key']); total -= e['bytes']; removed += 1
+        return removed
+
+    def stats(self) -> dict:
+        entries = self.entries()
+        lookups = self.hits + self.misses
+        return {'entries': len(entries), 'bytes': sum(e['bytes'] for e in entries),
+                'trades': sum(e['n_trades'] for e in entries), 'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0}
+
+    def log_stats(self, label: str = ""):
+        s = self.stats()
+        logging.info(f"Archivio risultati {label}| hit {s['hits']} / miss {s['misses']} (ratio {s['hit_ratio']:.1%}) | "
+                     f"{s['entries']} voci, {s['bytes'] / 1e6:.1f} MB su disco")
+
+
+def _main(argv=None):
+    parser = argparse.ArgumentParser(description="Ispezione dell'archivio dei risultati di backtest.")
+    parser.add_argument('--root', default=DEFAULT_ROOT, help="Cartella dell'archivio")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list', help="Elenca le voci (dalla più recente)")
+    show = sub.add_parser('show', help="Mostra metriche e trade di una voce (basta un prefisso dell'hash)")
+    show.add_argument('key')
+    sub.add_parser('stats', help="Totali dell'archivio")
+    evict = sub.add_parser('evict', help="Evizione per età e/o dimensione")
+    evict.add_argument('--max-mb', type=float)
+    evict.add_argument('--max-age-days', type=float)
+    sub.add_parser('clear', help="Svuota l'archivio")
+    args = parser.parse_args(argv)
+
+    store = ResultStore(args.root)
+    if args.command == 'list':
+        for e in sorted(store.entries(), key=lambda e: e['last_access'], reverse=True):
+            when = time.strftime('%Y-%m-%d %H:%M', time.localtime(e['last_access']))
+            print(f"{e['key'][:16]}  {when}  {e['bytes']:>9,} B  {e['n_trades']:>5} trade  {json.dumps(e['meta'])}  {json.dumps(e['metrics'])}")
+    elif args.command == 'show':
+        matches = [e['key'] for e in store.entries() if e['key'].startswith(args.key)]
+        if len(matches) != 1:
+            print(f"{len(matches)} voci corrispondono a '{args.key}'."); return 1
+        metrics, trades = store.get(matches[0], with_trades=True)
+        print(json.dumps(metrics, indent=4, default=_json_default))
+        if trades:
+            print(pd.DataFrame(trades).to_string())
+    elif args.command == 'stats':
+        s = store.stats()
+        print(f"{s['entries']} voci | {s['bytes'] / 1e6:.2f} MB | {s['trades']} trade in archivio")
+    elif args.command == 'evict':
+        max_bytes = int(args.max_mb * 1e6) if args.max_mb is not None else None
+        print(f"Rimosse {store.evict(max_bytes=max_bytes, max_age_days=args.max_age_days)} voci.")
+    elif args.command == 'clear':
+        for e in store.entries():
+            store.remove(e['key'])
+        print("Archivio svuotato.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
@@ -0,0 +1,94 @@
+# infra/ring_buffer.py (v1.0 - Ring buffer OHLCV a capacità fissa)
+# Struttura dati del percorso live: per ogni simbolo/timeframe una matrice NumPy
+# preallocata (1 + 5) x (2 x capacità) nello stesso layout di OHLCVArrays
+# (riga 0 = timestamp ms int64, righe 1-5 = OHLCV float64). Ogni candela viene
+# scritta due volte, in posizione i e i + capacità: le ultime n candele sono
+# sempre una fetta contigua, quindi le finestre sono viste senza copie e
+# l'append è O(1) senza compattazioni. La memoria per simbolo è fissa
+# (nbytes) e non cresce con il tempo di esecuzione.
+#
+# Il DataFrame viene costruito solo su richiesta (frame()), per il codice che
+# lavora ancora con pandas.
+import numpy as np
+import pandas as pd
+
+from infra.ohlcv_store import OHLCV_COLUMNS, OHLCVArrays
+
+N_ROWS = 1 + len(OHLCV_COLUMNS)
+
+
+class OHLCVRing:
+    """Ultime `capacity` candele di una serie, in colonne NumPy a dimensione fissa."""
+
+    __slots__ = ('capacity', '_data', '_stamps', '_pos', '_count')
+
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError(f"Capacità non valida: {capacity}")
+        self.capacity = capacity
+        self._data = np.zeros((N_ROWS, 2 * capacity))
+        self._stamps = self._data[0].view(np.int64)
+        self._pos = 0     # prossima posizione di scrittura in [0, capacity)
+        self._count = 0   # candele presenti (<= capacity)
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        """Byte occupati dalle colonne (fissi: non dipendono da quante candele sono arrivate)."""
+        return self._data.nbytes
+
+    @property
+    def last_ms(self):
+        """Apertura dell'ultima candela in ms, None se vuoto."""
+        return int(self._stamps[self._pos + self.capacity - 1]) if self._count else None
+
+    def append(self, ts_ms: int, open_, high, low, close, volume):
+        """Aggiunge una candela in coda (O(1)); oltre la capacità sovrascrive la più vecchia."""
+        pos, cap = self._pos, self.capacity
+        for i in (pos, pos + cap):
+            self._stamps[i] = ts_ms
+            self._data[1, i] = open_
+            self._data[2, i] = high
+            self._data[3, i] = low
+            self._data[4, i] = close
+            self._data[5, i] = volume
+        self._pos = pos + 1 if pos + 1 < cap else 0
+        self._count = min(self._count + 1, cap)
+
+    def extend(self, matrix: np.ndarray):
+        """Aggiunge in blocco una matrice (6, n) nel layout di OHLCVArrays (es. il seed REST)."""
+        n = matrix.shape[1]
+        if n == 0:
+            return
+        cap = self.capacity
+        if n >= cap:
+            self._data[:, :cap] = matrix[:, n - cap:]
+            self._data[:, cap:] = matrix[:, n - cap:]
+            self._pos, self._count = 0, cap
+        else:
+            pos = self._pos
+            idx = (pos + np.arange(n)) % cap
+            self._data[:, idx] = matrix
+            self._data[:, idx + cap] = matrix
+            self._pos = (pos + n) % cap
+            self._count = min(self._count + n, cap)
+
+    def window_matrix(self, n: int = None) -> np.ndarray:
+        """Vista (6, n) sulle ultime n candele in ordine crescente: nessuna copia, valida fino al prossimo append."""
+        n = self._count if n is None else min(n, self._count)
+        end = self._pos + self.capacity
+        return self._data[:, end - n:end]
+
+    def window(self, n: int = None) -> OHLCVArrays:
+        """Come window_matrix ma con le viste per colonna (.timestamp_ms, .open, ..., .close)."""
+        return OHLCVArrays(self.window_matrix(n))
+
+    def column(self, name: str, n: int = None) -> np.ndarray:
+        return self.window(n).column(name)
+
+    def frame(self, n: int = None) -> pd.DataFrame:
+        """DataFrame OHLCV con indice UTC (formato di FinancialDataClient.get_klines) delle ultime n candele, in copia."""
+        return self.window(n).to_dataframe(as_index=True)
+
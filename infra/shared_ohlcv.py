@@ -0,0 +1,90 @@
+"""
+Blocchi OHLCV in memoria condivisa.
+
+Il processo padre copia una sola volta le colonne del DataFrame in un segmento
+di shared memory; i worker si agganciano per nome e leggono gli array senza
+che i dati vengano serializzati (pickle) per ogni task.
+"""
+import gc
+import logging
+from multiprocessing import shared_memory, util
+
+import numpy as np
+import pandas as pd
+
+OHLCV_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+
+class SharedOHLCV:
+    """Matrice (1 + 5) x n: timestamp in ns (int64) seguito dalle colonne OHLCV (float64)."""
+
+    def __init__(self, shm: shared_memory.SharedMemory, n_rows: int, owner: bool):
+        self.shm = shm
+        self.n_rows = n_rows
+        self.owner = owner
+        self._matrix = np.ndarray((1 + len(OHLCV_COLUMNS), n_rows), dtype=np.float64, buffer=shm.buf)
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame):
+        """Crea il segmento e ci copia le colonne (df con colonna 'timestamp')."""
+        n_rows = len(df)
+        nbytes = max(1, (1 + len(OHLCV_COLUMNS)) * n_rows * 8)
+        shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        block = cls(shm, n_rows, owner=True)
+        block._matrix[0].view(np.int64)[:] = pd.to_datetime(df['timestamp']).to_numpy(dtype='datetime64[ns]').view(np.int64)
+        for row, col in enumerate(OHLCV_COLUMNS, start=1):
+            block._matrix[row][:] = df[col].to_numpy(dtype=float)
+        return block
+
+    @classmethod
+    def attach(cls, descriptor):
+        """Si aggancia a un segmento esistente partendo da descriptor()."""
+        name, n_rows = descriptor
+        return cls(shared_memory.SharedMemory(name=name), n_rows, owner=False)
+
+    def descriptor(self):
+        """Tupla picklabile (nome, righe) da passare ai worker."""
+        return self.shm.name, self.n_rows
+
+    def column(self, name: str) -> np.ndarray:
+        """Vista (zero-copy) su una colonna."""
+        if name == 'timestamp':
+            return self._matrix[0].view('datetime64[ns]')
+        return self._matrix[1 + OHLCV_COLUMNS.index(name)]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """DataFrame con la stessa forma di quelli usati da optimizer/strategy_generator."""
+        data = {'timestamp': self.column('timestamp')}
+        data.update({col: self.column(col) for col in OHLCV_COLUMNS})
+        return pd.DataFrame(data, copy=False)
+
+    def close(self):
+        self._matrix = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def attach_worker(descriptor, state: dict):
+    """
+    Aggancio lato worker del pool: mette blocco e DataFrame in `state` e registra
+    la chiusura all'uscita del processo. I figli di multiprocessing terminano con
+    os._exit e non eseguono gli hook atexit, per questo si usa util.Finalize.
+    """
+    block = SharedOHLCV.attach(descriptor)
+    state.update({'block': block, 'df': block.to_dataframe()})
+    util.Finalize(None, _release_worker, args=(state,), exitpriority=10)
+    return block
+
+
+def _release_worker(state: dict):
+    """Rilascia le viste sul segmento prima di chiuderlo (close fallisce se restano buffer esportati)."""
+    state.pop('df', None)
+    block = state.pop('block', None)
+    if block is None:
+        return
+    gc.collect()
+    try:
+        block.close()
+    except BufferError:
+        logging.warning(f"Segmento condiviso {block.shm.name} ancora referenziato all'uscita del worker: chiusura lasciata al sistema.")
@@ -1,5 +1,6 @@
-# intraday_backtester.py (v12.0 - "Polymorphic" Edition)
+# intraday_backtester.py (v12.1 - "Polymorphic" Edition, contesto derivato dal timeframe operativo)
 import logging
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta, timezone
 
@@ -7,10 +8,13 @@ import config
 from api_clients.data_client import FinancialDataClient
 from analysis.session_clock import in_session, is_eod_window
 from analysis.intraday_rules import IntradayState, IntradayRules
-from analysis.contextual_analyzer import get_market_bias
-from analysis.strategy_vwap_rev import vwap_reversion_intraday
-from analysis.strategy_orb import opening_range_breakout
-from analysis.strategy_bb_squeeze import bollinger_squeeze_breakout
+from analysis.contextual_analyzer import market_bias_series, bias_asof
+from analysis.strategy_vwap_rev import vwap_reversion_batch
+from analysis.strategy_orb import opening_range_breakout_batch
+from analysis.strategy_bb_squeeze import bollinger_squeeze_breakout_batch
+from analysis.signal_frame import signals_at
+from analysis.exit_resolver import ExitResolver
+from analysis.resampler import resample_ohlcv
 
 logging.basicConfig(level=logging.INFO, format='[BACKTEST V12] [%(levelname)s] %(message)s')
 
@@ -31,15 +35,14 @@ def run_backtest(asset: str, start_date_str: str, end_date_str: str):
 
     df_trigger_hist = data_client.get_klines(asset, config.OPERATIONAL_TIMEFRAME, start_time=start_ms, end_time=end_ms)
     if df_trigger_hist is None or df_trigger_hist.empty: logging.error(f"Dati trigger non trovati per {asset}."); return
-    df_context_hist = data_client.get_klines(asset, config.CONTEXT_TIMEFRAME, start_time=start_ms, end_time=end_ms)
-    if df_context_hist is None or df_context_hist.empty: logging.error(f"Dati di contesto non trovati per {asset}."); return
 
     start_warmup_ms = int((start_dt - timedelta(days=40)).timestamp() * 1000)
     df_trigger_warmup = data_client.get_klines(asset, config.OPERATIONAL_TIMEFRAME, start_time=start_warmup_ms, end_time=start_ms)
-    df_context_warmup = data_client.get_klines(asset, config.CONTEXT_TIMEFRAME, start_time=start_warmup_ms, end_time=start_ms)
     
     df_trigger_full = pd.concat([df_trigger_warmup, df_trigger_hist]) if df_trigger_warmup is not None else df_trigger_hist
-    df_context_full = pd.concat([df_context_warmup, df_context_hist]) if df_context_warmup is not None else df_context_hist
+    # Il contesto si ricava dalle stesse candele trigger (bucket UTC come l'exchange): niente download separati
+    df_context_full = resample_ohlcv(df_trigger_full[~df_trigger_full.index.duplicated(keep='last')], config.CONTEXT_TIMEFRAME, config.OPERATIONAL_TIMEFRAME)
+    if df_context_full.empty: logging.error(f"Dati di contesto non trovati per {asset}."); return
 
     df_trigger_full.ta.atr(length=config.ATR_PERIOD, append=True)
     atr_col = f"ATRr_{config.ATR_PERIOD}"
@@ -47,12 +50,38 @@ def run_backtest(asset: str, start_date_str: str, end_date_str: str):
     state, initial_equity, equity, trades, current_trade = IntradayState(), 10000, 10000, [], None
     market_bias, last_bias_check_day = 'SIDEWAYS', None
 
-    for timestamp, candle in df_trigger_hist.iterrows():
+    # Senza trailing stop lo SL è statico: a trade aperto si salta dritti alla candela di uscita
+    resolver = ExitResolver.from_frame(df_trigger_hist)
+    eod_bars = np.flatnonzero([is_eod_window(ts.to_pydatetime()) for ts in df_trigger_hist.index])
+    # Bias di contesto calcolato una volta sola e agganciato alle barre trigger con un
+    # as-of join sulle candele di contesto già chiuse (nessun look-ahead)
+    bias_by_bar = bias_asof(market_bias_series(df_context_full), df_trigger_hist.index)
+    day_open_bar = {}
+    for bar, ts in enumerate(df_trigger_hist.index): day_open_bar.setdefault(ts.date(), bar)
+
+    # Segnali delle tre strategie pre-calcolati sull'intero storico: la barra i legge la riga
+    # dell'ultima candela di df_trigger_full <= timestamp (la stessa di df_trigger_full.loc[:timestamp])
+    full_pos = df_trigger_full.index.searchsorted(df_trigger_hist.index, side='right') - 1
+    bias_full = np.full(len(df_trigger_full), 'SIDEWAYS', dtype=object)
+    bias_full[full_pos] = [bias_by_bar[day_open_bar[ts.date()]] for ts in df_trigger_hist.index]
+    signal_frames = [vwap_reversion_batch(df_trigger_full, asset=asset),
+                     bollinger_squeeze_breakout_batch(df_trigger_full, bias=bias_full),
+                     opening_range_breakout_batch(df_trigger_full)]
+    atr_full = df_trigger_full[atr_col].to_numpy()
+
+    i = 0
+    while i < len(df_trigger_hist):
+        if current_trade and not config.TRAILING_STOP_ENABLED:
+            exit_bar = resolver.first_exit_bar(current_trade['side'], i, current_trade['sl'], current_trade['tp'], eod_bars)
+            if exit_bar is None: break
+            i = exit_bar
+
+        timestamp, candle = df_trigger_hist.index[i], df_trigger_hist.iloc[i]
         now = timestamp.to_pydatetime()
         current_day = now.date()
         if last_bias_check_day != current_day:
-            df_context_slice = df_context_full.loc[:timestamp]
-            market_bias = get_market_bias(df_context_slice)
+            # Bias della prima candela del giorno, anche se ci arriviamo con un salto
+            market_bias = bias_by_bar[day_open_bar[current_day]]
             last_bias_check_day = current_day
         state.reset_if_new_day(now)
 
@@ -81,12 +110,7 @@ def run_backtest(asset: str, start_date_str: str, end_date_str: str):
                 trades.append(current_trade); current_trade = None
 
         if not current_trade:
-            df_slice = df_trigger_full.loc[:timestamp]
-            all_signals = []
-            vwap_signals = vwap_reversion_intraday(df_slice, asset=asset) or []
-            bb_signals = bollinger_squeeze_breakout(df_slice, bias=market_bias) or []
-            orb_signals = opening_range_breakout(df_slice) or []
-            all_signals.extend(vwap_signals); all_signals.extend(bb_signals); all_signals.extend(orb_signals)
+            all_signals = [signal for frame in signal_frames for signal in signals_at(frame, full_pos[i])]
 
             if all_signals:
                 # ... (logica di scoring identica a prima) ...
@@ -102,7 +126,8 @@ def run_backtest(asset: str, start_date_str: str, end_date_str: str):
                     is_allowed, reason = rules.allow_new_trade(now=now, equity=equity, state=state, signal_score=best_signal.get("score", 0))
                     if is_allowed:
                         rules.on_filled(state)
-                        current_trade = {'entry_time': now, 'entry_price': best_signal['entry_price'], 'side': best_signal['side'], 'sl': best_signal['sl'], 'tp': best_signal['tp'], 'strategy': best_signal['strategy'], 'initial_atr': df_slice.iloc[-1].get(atr_col, 0)}
+                        current_trade = {'entry_time': now, 'entry_price': best_signal['entry_price'], 'side': best_signal['side'], 'sl': best_signal['sl'], 'tp': best_signal['tp'], 'strategy': best_signal['strategy'], 'initial_atr': atr_full[full_pos[i]]}
+        i += 1
 
     print("\n" + "="*60); print(f"--- 📊 REPORT FINALE per {asset} 📊 ---")
     if not trades: print("Nessun trade eseguito."); print("="*60 + "\n"); return
@@ -1,4 +1,5 @@
-# live_runner.py - PHOENIX v12.0 Live Trading Engine
+# live_runner.py - PHOENIX v12.3 Live Trading Engine (polling REST o feed WebSocket)
+import argparse
 import logging
 import time
 from datetime import datetime, timezone  # <-- ECCO LA CORREZIONE!
@@ -6,27 +7,152 @@ import pandas as pd
 
 import config
 import database
-from api_clients.data_client import FinancialDataClient
+from api_clients.async_data_client import AsyncFinancialDataClient, fetch_snapshot
+from api_clients.kline_cache import KLINE_CACHE
+from api_clients.bybit_ws import BybitKlineStream, attach_feed_writer
 from api_clients.bybit_client import BybitClient
 from analysis.session_clock import in_session, is_eod_window, TZ
 from analysis.intraday_rules import IntradayState, IntradayRules
-from analysis.contextual_analyzer import get_market_bias
+from analysis.contextual_analyzer import MarketBiasTracker, timeframe_delta
+from analysis.resampler import IncrementalResampler
 
 # --- Importa TUTTE le tue strategie ---
-from analysis.strategy_vwap_rev import vwap_reversion_intraday
+from analysis.strategy_vwap_rev import vwap_reversion_intraday, VwapReversionTracker
 from analysis.strategy_orb import opening_range_breakout
 from analysis.strategy_bb_squeeze import bollinger_squeeze_breakout
 
 logging.basicConfig(level=logging.INFO, format='[LIVE RUNNER] [%(levelname)s] %(message)s')
 
-def run_live_bot():
+def context_limit(bias_trackers, asset, now_utc):
+    """Candele di contesto da scaricare per l'asset: 400 per inizializzare, 3 per aggiornare, None se non serve."""
+    tracker = bias_trackers.get(asset)
+    if tracker is None:
+        return 400
+    if now_utc < tracker.last_timestamp + 2 * timeframe_delta(config.CONTEXT_TIMEFRAME):
+        return None  # la prossima candela di contesto non è ancora chiusa
+    return 3
+
+def cycle_requests(bias_trackers, now_utc):
+    """Tutte le richieste di candele di un ciclo, da scaricare in parallelo prima dell'analisi."""
+    requests = [(asset, config.OPERATIONAL_TIMEFRAME, 'bybit', 400) for asset in config.ASSET_UNIVERSE]
+    for asset in config.ASSET_UNIVERSE:
+        limit = context_limit(bias_trackers, asset, now_utc)
+        if limit is not None:
+            requests.append((asset, config.CONTEXT_TIMEFRAME, 'bybit', limit))
+    return requests
+
+def update_market_bias(data_client, bias_trackers, asset, now_utc):
+    """
+    Aggiorna il tracker del bias con le candele di contesto chiuse dopo l'ultima vista.
+    La prima volta (o dopo un buco) lo inizializza sullo storico recente; poi scarica
+    solo le ultime candele. Restituisce il nuovo bias, o None se non c'era nulla da fare.
+    """
+    context_delta = timeframe_delta(config.CONTEXT_TIMEFRAME)
+    tracker = bias_trackers.get(asset)
+    limit = context_limit(bias_trackers, asset, now_utc)
+    if limit is None:
+        return None
+
+    df_context = data_client.get_klines(asset, config.CONTEXT_TIMEFRAME, limit=limit)
+    if df_context is None or df_context.empty:
+        return None
+    closed = df_context[df_context.index + context_delta <= now_utc]  # scarta la candela in formazione
+    if closed.empty:
+        return None
+    if tracker is not None and closed.index[0] > tracker.last_timestamp + context_delta:
+        del bias_trackers[asset]  # candele perse (es. runner fermo): si riparte dallo storico
+        return update_market_bias(data_client, bias_trackers, asset, now_utc)
+
+    if tracker is None:
+        tracker = bias_trackers[asset] = MarketBiasTracker.seed(closed)
+    else:
+        for ts, row in closed.iterrows():
+            tracker.update(ts, row['high'], row['low'], row['close'])
+    return tracker.bias
+
+def evaluate_signals(asset, df_trigger, bias, state, rules, db_session, now_utc, now_local, vwap_tracker=None):
+    """
+    Passi 3-5 di un asset: strategie sul timeframe operativo, scoring con il bias e salvataggio del segnale.
+    Con vwap_tracker (VwapReversionTracker già aggiornato sull'ultima candela chiusa) la VWAP-Reversion
+    usa gli indicatori incrementali invece di ricalcolare pandas_ta su df_trigger.
+    """
+    # 3. Ricerca Polimorfica di Segnali (riutilizziamo la tua logica!)
+    all_signals = []
+    
+    # Aggiungi qui ogni nuova strategia che creerai in futuro
+    if vwap_tracker is not None:
+        vwap_signals = vwap_tracker.signals()
+    else:
+        vwap_signals = vwap_reversion_intraday(df_trigger, asset=asset) or []
+    bb_signals = bollinger_squeeze_breakout(df_trigger, bias=bias) or []
+    orb_signals = opening_range_breakout(df_trigger) or []
+    
+    all_signals.extend(vwap_signals)
+    all_signals.extend(bb_signals)
+    all_signals.extend(orb_signals)
+
+    if not all_signals:
+        return
+
+    # 4. Scoring e Selezione del Segnale Migliore
+    for signal in all_signals:
+        is_aligned = (bias == 'BULLISH' and signal['side'] == 'Long') or \
+                     (bias == 'BEARISH' and signal['side'] == 'Short')
+        if bias != 'SIDEWAYS':
+            if is_aligned: signal['score'] += 10
+            elif signal['strategy'] == 'VWAP-Reversion': signal['score'] -= 15 # Penalizza reversion contro trend
+    
+    valid_signals = [s for s in all_signals if s['score'] >= config.INTRADAY_SIGNAL_SCORE_THRESHOLD]
+    if not valid_signals:
+        return
+
+    best_signal = max(valid_signals, key=lambda s: s.get("score", 0))
+    logging.info(f"[{asset}] Trovato segnale valido: {best_signal['strategy']} ({best_signal['side']}), Score: {best_signal['score']}")
+
+    # 5. Applica Regole Intraday e Salva il Segnale
+    # NOTA: questo codice NON esegue ordini, ma salva solo il segnale nel DB.
+    # L'esecuzione è lasciata manuale tramite il Command Center (app.py)
+    is_allowed, reason = rules.allow_new_trade(now=now_local, equity=10000, state=state, signal_score=best_signal.get("score", 0))
+    if is_allowed:
+        logging.info(f"[{asset}] Segnale approvato dalle regole intraday. Lo salvo nel database.")
+        rules.on_filled(state)
+        
+        # Crea e salva l'oggetto segnale nel database
+        signal_to_save = database.TechnicalSignal(
+            asset=asset,
+            timeframe=config.OPERATIONAL_TIMEFRAME,
+            signal=f"{best_signal['strategy']} {best_signal['side']}",
+            entry_price=best_signal['entry_price'],
+            take_profit=best_signal['tp'],
+            stop_loss=best_signal['sl'],
+            details=str({
+                "strategy": best_signal['strategy'],
+                "score": best_signal['score'],
+                "bias": bias,
+                "coherence": "Aligned" if is_aligned else "Divergent",
+                "final_score": best_signal['score'] # Puoi creare uno score più complesso
+            }),
+            created_at=now_utc
+        )
+        db_session.add(signal_to_save)
+        db_session.commit()
+        logging.info(f"[{asset}] SEGNALE SALVATO CON SUCCESSO!")
+
+    else:
+        logging.warning(f"[{asset}] Segnale scartato dalle regole intraday: {reason}")
+
+def run_live_bot(closed_only: bool = False):
     """
     Il ciclo principale del bot di trading live.
     Prende la logica dal backtester polimorfico e la applica in tempo reale.
+    Di default le strategie vedono come ultima riga la candela operativa in formazione (come
+    restituita dal REST); con closed_only=True la si scarta e si valutano solo candele chiuse,
+    come fa run_live_stream.
     """
     logging.info("--- 🔥 PHOENIX LIVE RUNNER v12.0 ATTIVATO 🔥 ---")
     
-    data_client = FinancialDataClient()
+    data_client = KLINE_CACHE  # stessa get_klines di FinancialDataClient, condivisa con gli altri servizi del processo
+    async_client = AsyncFinancialDataClient()
     trade_client = BybitClient()
     rules = IntradayRules()
     db_session = database.session_scope()
@@ -34,7 +160,8 @@ def run_live_bot():
     # Stato persistente del bot
     intraday_states = {asset: IntradayState() for asset in config.ASSET_UNIVERSE}
     market_biases = {asset: 'SIDEWAYS' for asset in config.ASSET_UNIVERSE}
-    last_bias_check = {}
+    bias_trackers = {}
+    operational_delta = timeframe_delta(config.OPERATIONAL_TIMEFRAME)
 
     while True:
         now_utc = datetime.now(timezone.utc)
@@ -55,94 +182,129 @@ def run_live_bot():
 
         logging.info(f"--- Inizio scansione assets ({now_local.strftime('%Y-%m-%d %H:%M:%S')}) ---")
 
+        # Tutte le candele del ciclo in parallelo; le richieste impreviste passano al client sincrono
+        started = time.monotonic()
+        klines = async_client.snapshot(cycle_requests(bias_trackers, now_utc), fallback=data_client, cache=KLINE_CACHE)
+        logging.info(f"Candele del ciclo scaricate in {time.monotonic() - started:.2f} s.")
+
         for asset in config.ASSET_UNIVERSE:
             try:
                 state = intraday_states[asset]
                 state.reset_if_new_day(now_local)
 
-                # 1. Analisi di Contesto (una volta ogni 4 ore circa)
-                if asset not in last_bias_check or (now_utc - last_bias_check.get(asset, now_utc)).total_seconds() > 4 * 3600:
-                    df_context = data_client.get_klines(asset, config.CONTEXT_TIMEFRAME, limit=400)
-                    if df_context is not None and not df_context.empty:
-                        market_biases[asset] = get_market_bias(df_context)
-                        last_bias_check[asset] = now_utc
-                        logging.info(f"[{asset}] Nuovo BIAS di mercato calcolato: {market_biases[asset]}")
+                # 1. Analisi di Contesto (aggiornata solo quando chiude una nuova candela di contesto)
+                new_bias = update_market_bias(klines, bias_trackers, asset, now_utc)
+                if new_bias is not None:
+                    market_biases[asset] = new_bias
+                    logging.info(f"[{asset}] Nuovo BIAS di mercato calcolato: {market_biases[asset]}")
 
                 # 2. Scarica i dati operativi più recenti
-                df_trigger = data_client.get_klines(asset, config.OPERATIONAL_TIMEFRAME, limit=400)
+                df_trigger = klines.get_klines(asset, config.OPERATIONAL_TIMEFRAME, limit=400)
+                if closed_only and df_trigger is not None:
+                    df_trigger = df_trigger[df_trigger.index + operational_delta <= now_utc]
                 if df_trigger is None or df_trigger.empty:
                     logging.warning(f"[{asset}] Impossibile scaricare i dati operativi. Salto.")
                     continue
 
-                # 3. Ricerca Polimorfica di Segnali (riutilizziamo la tua logica!)
-                all_signals = []
-                bias = market_biases[asset]
-                
-                # Aggiungi qui ogni nuova strategia che creerai in futuro
-                vwap_signals = vwap_reversion_intraday(df_trigger, asset=asset) or []
-                bb_signals = bollinger_squeeze_breakout(df_trigger, bias=bias) or []
-                orb_signals = opening_range_breakout(df_trigger) or []
-                
-                all_signals.extend(vwap_signals)
-                all_signals.extend(bb_signals)
-                all_signals.extend(orb_signals)
-
-                if not all_signals:
-                    continue
-
-                # 4. Scoring e Selezione del Segnale Migliore
-                for signal in all_signals:
-                    is_aligned = (bias == 'BULLISH' and signal['side'] == 'Long') or \
-                                 (bias == 'BEARISH' and signal['side'] == 'Short')
-                    if bias != 'SIDEWAYS':
-                        if is_aligned: signal['score'] += 10
-                        elif signal['strategy'] == 'VWAP-Reversion': signal['score'] -= 15 # Penalizza reversion contro trend
-                
-                valid_signals = [s for s in all_signals if s['score'] >= config.INTRADAY_SIGNAL_SCORE_THRESHOLD]
-                if not valid_signals:
-                    continue
-
-                best_signal = max(valid_signals, key=lambda s: s.get("score", 0))
-                logging.info(f"[{asset}] Trovato segnale valido: {best_signal['strategy']} ({best_signal['side']}), Score: {best_signal['score']}")
-
-                # 5. Applica Regole Intraday e Salva il Segnale
-                # NOTA: questo codice NON esegue ordini, ma salva solo il segnale nel DB.
-                # L'esecuzione è lasciata manuale tramite il Command Center (app.py)
-                is_allowed, reason = rules.allow_new_trade(now=now_local, equity=10000, state=state, signal_score=best_signal.get("score", 0))
-                if is_allowed:
-                    logging.info(f"[{asset}] Segnale approvato dalle regole intraday. Lo salvo nel database.")
-                    rules.on_filled(state)
-                    
-                    # Crea e salva l'oggetto segnale nel database
-                    signal_to_save = database.TechnicalSignal(
-                        asset=asset,
-                        timeframe=config.OPERATIONAL_TIMEFRAME,
-                        signal=f"{best_signal['strategy']} {best_signal['side']}",
-                        entry_price=best_signal['entry_price'],
-                        take_profit=best_signal['tp'],
-                        stop_loss=best_signal['sl'],
-                        details=str({
-                            "strategy": best_signal['strategy'],
-                            "score": best_signal['score'],
-                            "bias": bias,
-                            "coherence": "Aligned" if is_aligned else "Divergent",
-                            "final_score": best_signal['score'] # Puoi creare uno score più complesso
-                        }),
-                        created_at=now_utc
-                    )
-                    db_session.add(signal_to_save)
-                    db_session.commit()
-                    logging.info(f"[{asset}] SEGNALE SALVATO CON SUCCESSO!")
-
-                else:
-                    logging.warning(f"[{asset}] Segnale scartato dalle regole intraday: {reason}")
+                # 3-5. Strategie, scoring e salvataggio del segnale
+                evaluate_signals(asset, df_trigger, market_biases[asset], state, rules, db_session, now_utc, now_local)
 
             except Exception as e:
                 logging.error(f"Errore durante l'analisi di {asset}: {e}", exc_info=True)
 
+        KLINE_CACHE.log_stats()
         logging.info(f"--- Scansione completata. In attesa per {config.RUNNER_SLEEP_SECONDS} secondi. ---")
         time.sleep(config.RUNNER_SLEEP_SECONDS)
 
+def run_live_stream(publish: bool = False):
+    """
+    Variante event-driven di run_live_bot: le candele arrivano dal feed WebSocket di Bybit
+    e ogni asset viene analizzato appena chiude una candela operativa, sul buffer in memoria.
+    Il feed porta solo il timeframe operativo: le candele di contesto si ricavano in locale
+    (IncrementalResampler) e il bias si aggiorna appena se ne chiude una.
+    Con publish=True il runner fa anche da ingester del feed in memoria condivisa (infra.market_feed).
+    Le strategie vedono solo candele chiuse: l'analisi parte alla conferma della candela, quando
+    quella successiva non esiste ancora. Il polling (run_live_bot) include invece la candela in
+    formazione, salvo --closed-only.
+    """
+    logging.info("--- 🔥 PHOENIX LIVE RUNNER v12.2 (WebSocket) ATTIVATO 🔥 ---")
+
+    rules = IntradayRules()
+    db_session = database.session_scope()
+    intraday_states = {asset: IntradayState() for asset in config.ASSET_UNIVERSE}
+    market_biases = {asset: 'SIDEWAYS' for asset in config.ASSET_UNIVERSE}
+    bias_trackers = {}
+    vwap_trackers = {}  # indicatori della VWAP-Reversion aggiornati in O(1) a ogni candela chiusa
+    resamplers = {}
+    stream = BybitKlineStream(config.ASSET_UNIVERSE, [config.OPERATIONAL_TIMEFRAME], capacity=400)
+    memory = stream.memory_by_symbol()
+    logging.info(f"Buffer K-line: {max(memory.values(), default=0) / 1024:.1f} KB per simbolo, {sum(memory.values()) / 1024:.1f} KB totali (fissi).")
+    if publish:
+        writer = attach_feed_writer(stream)
+        logging.info(f"Feed di mercato condiviso pubblicato su {writer.path} ({writer.nbytes / 1024:.0f} KB).")
+
+    # Storico di contesto per inizializzare il bias: un solo download concorrente all'avvio
+    context_delta = timeframe_delta(config.CONTEXT_TIMEFRAME)
+    history = fetch_snapshot([(asset, config.CONTEXT_TIMEFRAME, 'bybit', 400) for asset in config.ASSET_UNIVERSE])
+    now_utc = datetime.now(timezone.utc)
+    for asset in config.ASSET_UNIVERSE:
+        context = history.get_klines(asset, config.CONTEXT_TIMEFRAME, limit=400)
+        if context is not None and not context.empty:
+            bias_trackers[asset] = MarketBiasTracker.seed(context[context.index + context_delta <= now_utc])
+            market_biases[asset] = bias_trackers[asset].bias
+
+    def context_bars(asset, event):
+        """Candele di contesto complete chiuse insieme a questa candela operativa, come (timestamp, high, low, close)."""
+        if asset not in resamplers:
+            # primo evento: il buffer operativo (già riempito via REST) ricostruisce anche il bucket in corso
+            closed = []
+            window = stream.buffers[(asset, config.OPERATIONAL_TIMEFRAME)].window()
+            resamplers[asset] = IncrementalResampler(config.OPERATIONAL_TIMEFRAME, [config.CONTEXT_TIMEFRAME]).seed(window, events=closed)
+        else:
+            closed = resamplers[asset].update(int(event.timestamp.value // 1_000_000), event.open, event.high, event.low, event.close, event.volume)
+        # le candele parziali (inizio del buffer o buco nel feed) falserebbero il bias: si saltano
+        return [(pd.Timestamp(bar[0], unit='ms', tz='UTC'), bar[2], bar[3], bar[4]) for _, bar, partial in closed if not partial]
+
+    def on_bar_closed(event):
+        asset = event.symbol
+        bars = context_bars(asset, event)
+        if bars:
+            tracker = bias_trackers.setdefault(asset, MarketBiasTracker())
+            for ts, high, low, close in bars:
+                market_biases[asset] = tracker.update(ts, high, low, close)  # le candele già viste vengono ignorate
+            logging.info(f"[{asset}] BIAS di mercato: {market_biases[asset]}")
+        if asset in vwap_trackers:
+            vwap_trackers[asset].update(event.timestamp, event.open, event.high, event.low, event.close, event.volume)
+        else:
+            # primo evento: il buffer contiene già questa candela e lo storico scaricato via REST
+            vwap_trackers[asset] = VwapReversionTracker(asset).seed(stream.buffers[(asset, config.OPERATIONAL_TIMEFRAME)].frame(include_forming=False))
+        if event.backfilled:
+            return  # candele recuperate dopo un buco: i segnali si cercano solo sull'ultima chiusa
+
+        now_utc = datetime.now(timezone.utc)
+        now_local = now_utc.astimezone(TZ)
+        if not in_session(now_local) or is_eod_window(now_local):
+            return
+        state = intraday_states[asset]
+        state.reset_if_new_day(now_local)
+        try:
+            df_trigger = stream.buffers[(asset, config.OPERATIONAL_TIMEFRAME)].frame(include_forming=False)
+            evaluate_signals(asset, df_trigger, market_biases[asset], state, rules, db_session, now_utc, now_local,
+                             vwap_tracker=vwap_trackers[asset])
+        except Exception as e:
+            logging.error(f"Errore durante l'analisi di {asset}: {e}", exc_info=True)
+
+    stream.add_listener(on_bar_closed)
+    stream.run_forever()
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PHOENIX Live Runner")
+    parser.add_argument('--poll', action='store_true', help="Usa il polling REST ogni RUNNER_SLEEP_SECONDS invece del feed WebSocket")
+    parser.add_argument('--closed-only', action='store_true', help="Con --poll valuta solo candele chiuse, come il feed WebSocket")
+    parser.add_argument('--publish', action='store_true', help="Pubblica il feed WebSocket in memoria condivisa per gli altri servizi")
+    args = parser.parse_args()
     database.init_db()
-    run_live_bot()
+    if args.poll:
+        run_live_bot(closed_only=args.closed_only)
+    else:
+        run_live_stream(publish=args.publish)
@@ -0,0 +1,75 @@
+# optimization/halving.py - v1.0 (Successive Halving dei Trial)
+# Scheduler multi-fidelity: tutti i candidati vengono valutati su una finestra
+# corta dello storico, si scarta la parte peggiore (pochi trade o PF basso) e i
+# superstiti passano a finestre via via più lunghe. L'ultimo gradino usa sempre
+# lo storico completo, quindi la classifica finale coincide con una valutazione
+# completa dei superstiti.
+import logging
+import math
+import time
+
+DEFAULT_ETA = 3             # a ogni gradino sopravvive 1/eta dei candidati
+DEFAULT_MIN_FRACTION = 1 / 9  # finestra del primo gradino come frazione dello storico
+
+
+def _window_bars(n_bars, fraction, warmup_bars):
+    """Barre del gradino: frazione dello storico, ma sempre oltre il warm-up degli indicatori."""
+    return min(n_bars, max(int(math.ceil(n_bars * fraction)), 2 * warmup_bars))
+
+
+def _rung_fractions(eta, min_fraction):
+    fractions, fraction = [], 1.0
+    while fraction > min_fraction * (1 + 1e-9):
+        fractions.append(fraction)
+        fraction /= eta
+    fractions.append(max(fraction, min_fraction))
+    return fractions[::-1]
+
+
+def successive_halving(df, param_combinations, evaluate, eta=DEFAULT_ETA, min_fraction=DEFAULT_MIN_FRACTION,
+                       min_trades=20, warmup_bars=0):
+    """
+    Valuta param_combinations con evaluate(df_finestra, params) -> metriche (come
+    optimizer.run_single_backtest) su finestre crescenti [0, n_r) dello storico.
+
+    A ogni gradino i candidati vengono ordinati mettendo in fondo quelli con meno
+    trade del minimo riproporzionato alla finestra (min_trades * frazione), poi per
+    profit factor decrescente (a parità vince l'indice più basso); sopravvive il
+    primo 1/eta. Restituisce un dizionario con:
+      - results: {indice_combinazione: metriche sullo storico completo} per i superstiti
+      - rungs: riepilogo di ogni gradino (barre, candidati valutati, superstiti)
+      - bars_evaluated / bars_full / compute_saved: barre simulate rispetto a una
+        valutazione completa di tutti i candidati
+    """
+    started = time.perf_counter()
+    n_bars = len(df)
+    candidates = list(range(len(param_combinations)))
+    fractions = _rung_fractions(eta, min_fraction)
+    rungs, bars_evaluated, results = [], 0, {}
+
+    for level, fraction in enumerate(fractions):
+        is_last = level == len(fractions) - 1
+        bars = n_bars if is_last else _window_bars(n_bars, fraction, warmup_bars)
+        window = df.iloc[:bars]
+        scores = {i: evaluate(window, param_combinations[i]) for i in candidates}
+        bars_evaluated += bars * len(candidates)
+
+        if is_last or bars == n_bars:
+            results = scores
+            rungs.append({'bars': bars, 'evaluated': len(candidates), 'kept': len(candidates)})
+            break
+
+        required_trades = min_trades * bars / n_bars
+        ranked = sorted(candidates, key=lambda i: (scores[i]['total_trades'] < required_trades,
+                                                   -scores[i]['profit_factor'], i))
+        survivors = sorted(ranked[:max(1, int(math.ceil(len(candidates) / eta)))])
+        rungs.append({'bars': bars, 'evaluated': len(candidates), 'kept': len(survivors)})
+        logging.info(f"  Halving gradino {level + 1}/{len(fractions)}: {len(candidates)} candidati su {bars} barre -> {len(survivors)} superstiti")
+        candidates = survivors
+
+    bars_full = n_bars * len(param_combinations)
+    compute_saved = 1 - bars_evaluated / bars_full if bars_full else 0.0
+    logging.info(f"Successive halving: {bars_evaluated:,} barre simulate invece di {bars_full:,} "
+                 f"(risparmio {compute_saved:.1%}) in {time.perf_counter() - started:.1f}s")
+    return {'results': results, 'rungs': rungs, 'bars_evaluated': bars_evaluated,
+            'bars_full': bars_full, 'compute_saved': compute_saved}
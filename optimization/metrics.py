@@ -0,0 +1,22 @@
+# optimization/metrics.py - v1.0 (Metriche dei Backtest)
+# Riepilogo dei trade chiusi condiviso da optimizer, walk-forward e sweep, senza
+# dipendenze dai client degli exchange.
+
+
+def summarize_trades(trades, equity_curve):
+    """Calcola le metriche finali (PF, drawdown, P/L) dalla lista dei trade chiusi."""
+    if not trades: return {"profit_factor": 0, "max_drawdown": 100, "total_trades": 0, "gross_pl": 0}
+
+    gross_profit = sum(abs(t['tp'] - t['entry']) for t in trades if t['result'] == 'TP')
+    gross_loss = sum(abs(t['sl'] - t['entry']) for t in trades if t['result'] == 'SL')
+    profit_factor = gross_profit / gross_loss if gross_loss > 0 else float('inf')
+
+    peak = max(equity_curve) if equity_curve else 1.0
+    max_drawdown = max([(peak - val) / peak for val in equity_curve]) * 100 if equity_curve else 100
+
+    return {
+        "profit_factor": round(profit_factor, 2),
+        "max_drawdown": round(max_drawdown, 2),
+        "total_trades": len(trades),
+        "gross_pl": round(gross_profit - gross_loss, 4)
+    }
@@ -0,0 +1,206 @@
+# optimization/search.py - v1.1 (Campionamento Lazy e Ricerca TPE)
+# Lo spazio dei parametri viene trattato come un numero in base mista: ogni
+# combinazione ha un indice in [0, grid_size) nello stesso ordine di
+# itertools.product, e si decodifica solo quando serve. Nessuna lista con
+# tutte le combinazioni viene mai costruita, anche con molte dimensioni.
+# Oltre al campionamento casuale c'è una ricerca sequenziale stile TPE
+# (Tree-structured Parzen Estimator) sugli indici ordinali di ogni parametro.
+#
+# Benchmark: python -m optimization.search [SIMBOLO] --seeds 10 | --synthetic-bars 6000 --seeds 10
+# Misura registrata (--synthetic-bars 6000 --seeds 10, Pullback_v13, 300 trial casuali):
+# TPE eguaglia il miglior PF casuale dopo una mediana di 40 valutazioni (min 24; in 1
+# dataset su 10 non lo raggiunge entro 300), contro i 24-189 trial del campionamento.
+import logging
+import math
+import random
+import sys
+
+
+def grid_size(param_space: dict) -> int:
+    """Numero di combinazioni dello spazio (prodotto delle cardinalità)."""
+    return math.prod(len(values) for values in param_space.values())
+
+
+def digits_at(param_space: dict, index: int) -> list:
+    """Indice -> posizione di ogni parametro nella sua lista (l'ultimo varia più in fretta)."""
+    digits = []
+    for values in reversed(list(param_space.values())):
+        index, digit = divmod(index, len(values))
+        digits.append(digit)
+    return digits[::-1]
+
+
+def index_of(param_space: dict, digits) -> int:
+    """Inverso di digits_at."""
+    index = 0
+    for values, digit in zip(param_space.values(), digits):
+        index = index * len(values) + digit
+    return index
+
+
+def combination_at(param_space: dict, index: int) -> dict:
+    """Combinazione numero `index`, identica a list(itertools.product(...))[index]."""
+    return {key: values[d] for (key, values), d in zip(param_space.items(), digits_at(param_space, index))}
+
+
+def sample_combinations(param_space: dict, k: int, seed=None) -> list:
+    """
+    k combinazioni distinte estratte senza materializzare il prodotto cartesiano.
+    random.sample su range() sceglie gli stessi indici che sceglierebbe sulla lista
+    completa, quindi con lo stesso seed il campione coincide con quello storico.
+    """
+    size = grid_size(param_space)
+    indices = random.Random(seed).sample(range(size), min(k, size))
+    return [combination_at(param_space, i) for i in indices]
+
+
+class TPESampler:
+    """
+    Ricerca sequenziale model-based: dopo n_startup estrazioni casuali le osservazioni
+    vengono divise tra "buone" (quota gamma con punteggio più alto) e "cattive"; per
+    ogni parametro si stimano due densità l(x) e g(x) con un kernel sugli indici
+    ordinali e si propone, tra n_candidates estratti da l, quello con l/g massimo.
+    """
+
+    def __init__(self, param_space: dict, gamma=0.25, n_startup=20, n_candidates=24, bandwidth=1.0, prior_weight=1.0, seed=None):
+        self.param_space = param_space
+        self.cardinalities = [len(values) for values in param_space.values()]
+        self.size = grid_size(param_space)
+        self.gamma = gamma
+        self.n_startup = n_startup
+        self.n_candidates = n_candidates
+        self.bandwidth = bandwidth
+        self.prior_weight = prior_weight
+        self.rng = random.Random(seed)
+        self.observations = {}  # indice -> punteggio
+
+    def _random_unseen(self):
+        if len(self.observations) >= self.size:
+            return None
+        while True:
+            index = self.rng.randrange(self.size)
+            if index not in self.observations:
+                return index
+
+    def _densities(self, digit_rows):
+        """Per ogni parametro, pesi normalizzati su ogni valore (prior uniforme + kernel gaussiano)."""
+        densities = []
+        for dim, cardinality in enumerate(self.cardinalities):
+            weights = [self.prior_weight / cardinality] * cardinality
+            for digits in digit_rows:
+                for j in range(cardinality):
+                    weights[j] += math.exp(-0.5 * ((j - digits[dim]) / self.bandwidth) ** 2)
+            total = sum(weights)
+            densities.append([w / total for w in weights])
+        return densities
+
+    def suggest(self) -> int:
+        """Indice della prossima combinazione da valutare (None se lo spazio è esaurito)."""
+        if len(self.observations) < self.n_startup:
+            return self._random_unseen()
+
+        ranked = sorted(self.observations.items(), key=lambda item: (-item[1], item[0]))
+        n_good = max(1, int(math.ceil(self.gamma * len(ranked))))
+        good = [digits_at(self.param_space, i) for i, _ in ranked[:n_good]]
+        bad = [digits_at(self.param_space, i) for i, _ in ranked[n_good:]]
+        l_dens, g_dens = self._densities(good), self._densities(bad)
+
+        best_index, best_ratio = None, -math.inf
+        for _ in range(self.n_candidates):
+            digits = [self.rng.choices(range(card), weights=l_dens[dim])[0] for dim, card in enumerate(self.cardinalities)]
+            index = index_of(self.param_space, digits)
+            if index in self.observations:
+                continue
+            ratio = sum(math.log(l_dens[d][x]) - math.log(g_dens[d][x]) for d, x in enumerate(digits))
+            if ratio > best_ratio:
+                best_index, best_ratio = index, ratio
+        return best_index if best_index is not None else self._random_unseen()
+
+    def observe(self, index: int, score: float):
+        self.observations[index] = score
+
+
+def tpe_search(param_space: dict, objective, n_trials: int, seed=None, **sampler_kwargs):
+    """
+    Esegue n_trials valutazioni guidate dal TPESampler.
+    objective(params) -> (punteggio, risultato): più alto è il punteggio, meglio è.
+    Generatore di (indice, params, risultato) nell'ordine di valutazione.
+    """
+    sampler = TPESampler(param_space, seed=seed, **sampler_kwargs)
+    for _ in range(min(n_trials, sampler.size)):
+        index = sampler.suggest()
+        if index is None:
+            break
+        params = combination_at(param_space, index)
+        score, result = objective(params)
+        sampler.observe(index, score)
+        yield index, params, result
+
+
+def trials_to_reach(history, trial_score, target) -> int:
+    """Numero di valutazioni necessarie per raggiungere (o superare) target; None se mai raggiunto."""
+    for n, (_, _, result) in enumerate(history, start=1):
+        if trial_score(result) >= target:
+            return n
+    return None
+
+
+def _synthetic_klines(n_bars: int, seed: int):
+    """Random walk orario con la forma dei DataFrame di load_klines_df (per il benchmark offline)."""
+    import numpy as np
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n_bars)))
+    open_ = np.r_[close[0], close[:-1]] * (1 + rng.normal(0, 0.001, n_bars))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.004, n_bars)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.004, n_bars)))
+    return pd.DataFrame({'timestamp': pd.date_range('2023-01-01', periods=n_bars, freq='1h'),
+                         'open': open_, 'high': high, 'low': low, 'close': close, 'volume': rng.uniform(10, 100, n_bars)})
+
+
+def _main(argv=None):
+    """
+    Benchmark: quante valutazioni servono a TPE per raggiungere il miglior punteggio
+    del campionamento casuale a `--trials` trial dell'optimizer, su uno o più dataset.
+    """
+    import argparse
+    import json
+    import statistics
+    from optimizer import load_klines_df, run_single_backtest, trial_score
+
+    parser = argparse.ArgumentParser(description="Confronto campionamento casuale vs TPE (valutazioni per raggiungere lo stesso PF).")
+    parser.add_argument('symbol', nargs='?', default="BTCUSDT")
+    parser.add_argument('--trials', type=int, default=300, help="Trial del campionamento casuale (budget massimo di TPE)")
+    parser.add_argument('--seeds', type=int, default=1, help="Ripetizioni con seed diversi (sintetico: anche dataset diversi)")
+    parser.add_argument('--synthetic-bars', type=int, default=None, help="Random walk orario di N barre invece dei dati reali")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    with open('parameters_space.json', 'r') as f:
+        space = json.load(f)
+    logic = {"name": "Pullback_v13_Original", "trend_filter": "check_trend_condition", "entry_condition": "check_pullback_entry_condition", "exit_logic": "calculate_sl_tp"}
+
+    needed = []
+    for seed in range(args.seeds):
+        if args.synthetic_bars:
+            df, key = _synthetic_klines(args.synthetic_bars, seed), (f"SYNTH{seed}", "1h")
+        else:
+            df, key = load_klines_df(args.symbol, 2), (args.symbol, "1h")
+        if df is None:
+            return 1
+        evaluate = lambda p: run_single_backtest(df, p, logic, vectorized=True, dataset_key=key)
+        random_history = [(None, p, evaluate(p)) for p in sample_combinations(space, args.trials, seed=42 + seed)]
+        target = max(trial_score(r) for _, _, r in random_history)
+        tpe_history = list(tpe_search(space, lambda p: (trial_score(r := evaluate(p)), r), args.trials, seed=42 + seed))
+        reached = trials_to_reach(tpe_history, trial_score, target)
+        needed.append(reached if reached is not None else args.trials)
+        logging.info(f"{key[0]} seed {seed}: miglior punteggio casuale {target:.2f} dopo {trials_to_reach(random_history, trial_score, target)} trial, "
+                     f"TPE lo raggiunge dopo {reached} trial (miglior TPE {max(trial_score(r) for _, _, r in tpe_history):.2f})")
+
+    logging.info(f"Valutazioni TPE per eguagliare {args.trials} trial casuali: mediana {statistics.median(needed):.0f}, "
+                 f"min {min(needed)}, max {max(needed)} su {len(needed)} dataset (mai raggiunto conta come {args.trials})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
@@ -0,0 +1,225 @@
+# optimization/sweep.py - v1.1 (Sweep Vettoriale della Griglia Parametri)
+# Valuta TUTTE le combinazioni di parameters_space.json insieme: gli indicatori
+# distinti vengono calcolati una volta, i segnali e i livelli SL/TP diventano
+# matrici barre x combinazioni (broadcasting NumPy) e la macchina a stati dei
+# trade avanza in parallelo su tutte le colonne. Restituisce la superficie
+# completa dei risultati (PF, DD, trade, P/L) invece del solo best_package.
+import itertools
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+import pandas_ta as ta  # noqa: F401 (registra l'accessor df.ta)
+
+from analysis.exit_resolver import ExitResolver
+from analysis.indicator_cache import cached_indicator
+from analysis.market_analysis import LONG_DIRECTIONS, SHORT_DIRECTIONS
+
+# Default identici a quelli di market_analysis quando il parametro manca dallo spazio
+PARAM_DEFAULTS = {'rr_ratio': 3.0, 'atr_mult_sl': 2.5, 'ema_slope_min': 0.0}
+DEFAULT_CHUNK_SIZE = 256  # colonne per blocco: limita la memoria a ~n_barre x 256 x 8 byte per matrice
+METRIC_COLUMNS = ['profit_factor', 'max_drawdown', 'total_trades', 'gross_pl']
+
+
+def expand_grid(param_space: dict) -> pd.DataFrame:
+    """Una riga per combinazione, nello stesso ordine di itertools.product."""
+    keys, values = zip(*param_space.items())
+    return pd.DataFrame(list(itertools.product(*values)), columns=list(keys))
+
+
+def _trend_side(is_up, is_down, directions):
+    """Combinazioni il cui trend ('UP'/'DOWN') apre in calculate_sl_tp il lato di `directions`."""
+    return (is_up & ('UP' in directions)) | (is_down & ('DOWN' in directions))
+
+
+def _lag(matrix, k):
+    """Trasla in avanti di k barre lungo l'asse 0 (NaN in testa), come signal_engine._lag."""
+    out = np.full(matrix.shape, np.nan)
+    if k < len(matrix):
+        out[k:] = matrix[:len(matrix) - k]
+    return out
+
+
+def _param_column(grid, name):
+    if name in grid.columns:
+        return grid[name].to_numpy(dtype=float)
+    return np.full(len(grid), PARAM_DEFAULTS[name])
+
+
+class _IndicatorMatrix:
+    """Serie di un indicatore per ogni lunghezza distinta della griglia, una colonna per lunghezza."""
+
+    def __init__(self, df, dataset_key, name, lengths, compute):
+        self.lengths = sorted({int(l) for l in lengths})
+        self.column_of = {length: j for j, length in enumerate(self.lengths)}
+        self.values = np.column_stack([
+            cached_indicator(df, dataset_key, name, (lambda l=length: compute(l)), length).to_numpy(dtype=float)
+            for length in self.lengths
+        ])
+
+    def columns(self, lengths):
+        return np.array([self.column_of[int(l)] for l in lengths])
+
+
+def _chunk_signals(bars, ema, atr, ema_lags, slope_lag3, atr_lag2, grid, strategy_logic):
+    """
+    Segnali e livelli per un blocco di combinazioni: matrici (n_barre, n_combinazioni)
+    allineate all'indice di iterazione, con le stesse regole di analysis.signal_engine.
+    """
+    n, c = len(bars['close']), len(grid)
+    fast_cols, slow_cols = ema.columns(grid['ema_fast']), ema.columns(grid['ema_slow'])
+
+    if strategy_logic.get('trend_filter') == 'check_trend_condition':
+        slope_min = _param_column(grid, 'ema_slope_min')
+        setup_ema, ref_ema = ema_lags[3][:, slow_cols], ema_lags[10][:, slow_cols]
+        setup_slope = slope_lag3[:, slow_cols]
+        is_up = (setup_ema > ref_ema) & (setup_slope > slope_min)
+        is_down = ~is_up & (setup_ema < ref_ema) & (setup_slope < -slope_min)
+    else:
+        is_up, is_down = np.ones((n, c), dtype=bool), np.zeros((n, c), dtype=bool)
+
+    entry_condition = strategy_logic.get('entry_condition')
+    if entry_condition == 'check_pullback_entry_condition':
+        setup_ema_fast = ema_lags[3][:, fast_cols]
+        setup_close = bars['setup_close'][:, None]
+        long_ok = (setup_close < setup_ema_fast) & bars['long_momentum'][:, None]
+        short_ok = (setup_close > setup_ema_fast) & bars['short_momentum'][:, None]
+        entry_signal = (is_up & long_ok) | (is_down & short_ok)
+    elif entry_condition == 'check_ema_cross_entry_condition':
+        prev_fast, prev_slow = ema_lags[2][:, fast_cols], ema_lags[2][:, slow_cols]
+        prev2_fast, prev2_slow = ema_lags[3][:, fast_cols], ema_lags[3][:, slow_cols]
+        cross_up = (prev2_fast < prev2_slow) & (prev_fast > prev_slow)
+        cross_down = (prev2_fast > prev2_slow) & (prev_fast < prev_slow)
+        entry_signal = (is_up & cross_up) | (is_down & cross_down)
+    else:
+        entry_signal = np.zeros((n, c), dtype=bool)
+
+    # Lato dal trend passato a calculate_sl_tp, con gli stessi rami (LONG_/SHORT_DIRECTIONS):
+    # oggi 'UP' non apre trade e 'DOWN' apre short, come in signal_engine.sl_tp_arrays
+    rr_ratio, atr_mult_sl = _param_column(grid, 'rr_ratio'), _param_column(grid, 'atr_mult_sl')
+    conf_atr = atr_lag2[:, atr.columns(grid['atr_len'])] * (atr_mult_sl - 1.0)
+    conf_high, conf_low = bars['conf_high'][:, None], bars['conf_low'][:, None]
+    long_sl = bars['setup_low'][:, None] - conf_atr
+    short_sl = bars['setup_high'][:, None] + conf_atr
+    is_long = _trend_side(is_up, is_down, LONG_DIRECTIONS) & ~(long_sl >= conf_high)
+    is_short = _trend_side(is_up, is_down, SHORT_DIRECTIONS) & ~(short_sl <= conf_low)
+
+    entry = np.where(is_long, conf_high, conf_low)
+    stop_loss = np.where(is_long, long_sl, short_sl)
+    take_profit = np.where(is_long, conf_high + (conf_high - long_sl) * rr_ratio, conf_low - (short_sl - conf_low) * rr_ratio)
+    levels_ok = (is_long | is_short) & (entry != 0) & (stop_loss != 0) & (take_profit != 0)
+    return entry_signal & levels_ok, is_long, entry, stop_loss, take_profit
+
+
+def _simulate(resolver, signal, is_long, entry, stop_loss, take_profit, start):
+    """
+    Macchina a stati dei trade (long e short) eseguita su tutte le colonne insieme: a ogni passo
+    ogni combinazione salta al prossimo segnale e poi alla barra di uscita (SL/TP).
+    I contatori vengono accumulati nello stesso ordine del ciclo per-barra.
+    """
+    n, c = signal.shape
+    rows = np.arange(n)[:, None]
+    next_signal = np.minimum.accumulate(np.where(signal, rows, n)[::-1], axis=0)[::-1]
+    next_signal = np.vstack([next_signal, np.full((1, c), n)])
+
+    pos = np.minimum(start, n)
+    active = np.arange(c)
+    trades = np.zeros(c, dtype=np.int64)
+    gross_profit, gross_loss = np.zeros(c), np.zeros(c)
+    equity, equity_max, equity_min = np.ones(c), np.ones(c), np.ones(c)
+
+    while len(active):
+        bar = next_signal[pos[active], active]
+        active, bar = active[bar < n], bar[bar < n]
+        sl, tp, long_ = stop_loss[bar, active], take_profit[bar, active], is_long[bar, active]
+        exit_bar, hit_sl, resolved = resolver.resolve_many(long_, bar, sl, tp, end=n - 1)
+        active, bar, sl, tp, long_ = active[resolved], bar[resolved], sl[resolved], tp[resolved], long_[resolved]
+        exit_bar, hit_sl = exit_bar[resolved], hit_sl[resolved]
+
+        entry_price = entry[bar, active]
+        pnl = (np.where(hit_sl, sl, tp) - entry_price) / entry_price
+        pnl = np.where(long_, pnl, -pnl)
+        equity[active] *= (1 + pnl)
+        equity_max[active] = np.maximum(equity_max[active], equity[active])
+        equity_min[active] = np.minimum(equity_min[active], equity[active])
+        gross_profit[active] += np.where(hit_sl, 0.0, np.abs(tp - entry_price))
+        gross_loss[active] += np.where(hit_sl, np.abs(sl - entry_price), 0.0)
+        trades[active] += 1
+        pos[active] = exit_bar + 1
+
+    return trades, gross_profit, gross_loss, equity_max, equity_min
+
+
+def _metrics_rows(trades, gross_profit, gross_loss, equity_max, equity_min):
+    """Stesse metriche (e arrotondamenti) di optimization.metrics.summarize_trades."""
+    rows = []
+    for t, gp, gl, peak, trough in zip(trades.tolist(), gross_profit.tolist(), gross_loss.tolist(),
+                                       equity_max.tolist(), equity_min.tolist()):
+        if t == 0:
+            rows.append((0, 100, 0, 0))
+            continue
+        profit_factor = gp / gl if gl > 0 else float('inf')
+        # Il DD di summarize_trades usa il picco globale: max((peak - val) / peak) = (peak - minimo) / peak
+        rows.append((round(profit_factor, 2), round((peak - trough) / peak * 100, 2), t, round(gp - gl, 4)))
+    return rows
+
+
+def sweep_parameter_grid(df_full, param_space, strategy_logic, chunk_size=DEFAULT_CHUNK_SIZE, dataset_key=None):
+    """
+    Backtest dell'intera griglia param_space per una logica di strategia.
+    Restituisce un DataFrame con una riga per combinazione (ordine di itertools.product):
+    colonne dei parametri + profit_factor, max_drawdown, total_trades, gross_pl, identiche
+    a quelle di optimizer.run_single_backtest per la stessa combinazione.
+    """
+    started = time.perf_counter()
+    grid = expand_grid(param_space)
+    df = df_full.reset_index(drop=True)
+
+    ema = _IndicatorMatrix(df, dataset_key, 'EMA', list(grid['ema_fast']) + list(grid['ema_slow']),
+                           lambda l: df.ta.ema(length=l))
+    atr = _IndicatorMatrix(df, dataset_key, 'ATR', grid['atr_len'], lambda l: df.ta.atr(length=l))
+    slope = np.vstack([np.full((1, len(ema.lengths)), np.nan), np.diff(ema.values, axis=0)])
+    ema_lags = {k: _lag(ema.values, k) for k in (2, 3, 10)}
+    slope_lag3, atr_lag2 = _lag(slope, 3), _lag(atr.values, 2)
+
+    high, low = df['high'].to_numpy(dtype=float), df['low'].to_numpy(dtype=float)
+    close, open_ = df['close'].to_numpy(dtype=float), df['open'].to_numpy(dtype=float)
+    conf_high, conf_low = _lag(high, 2), _lag(low, 2)
+    setup_high, setup_low = _lag(high, 3), _lag(low, 3)
+    conf_close, conf_open = _lag(close, 2), _lag(open_, 2)
+    bars = {
+        'close': close, 'setup_close': _lag(close, 3), 'setup_high': setup_high, 'setup_low': setup_low,
+        'conf_high': conf_high, 'conf_low': conf_low,
+        'long_momentum': (conf_close > conf_open) & (conf_high > setup_high),
+        'short_momentum': (conf_close < conf_open) & (conf_low < setup_low),
+    }
+    resolver = ExitResolver(high, low)
+    start = np.maximum(grid['ema_slow'].to_numpy(), grid['atr_len'].to_numpy()).astype(np.int64) + 10
+
+    rows = []
+    for first in range(0, len(grid), chunk_size):
+        chunk = grid.iloc[first:first + chunk_size]
+        signal, is_long, entry, stop_loss, take_profit = _chunk_signals(bars, ema, atr, ema_lags, slope_lag3, atr_lag2, chunk, strategy_logic)
+        rows.extend(_metrics_rows(*_simulate(resolver, signal, is_long, entry, stop_loss, take_profit, start[first:first + chunk_size])))
+
+    results = pd.concat([grid, pd.DataFrame(rows, columns=METRIC_COLUMNS)], axis=1)
+    elapsed = time.perf_counter() - started
+    logging.info(f"Sweep '{strategy_logic.get('name')}': {len(grid)} combinazioni su {len(df)} barre in {elapsed:.2f}s "
+                 f"({len(grid) / max(elapsed, 1e-9):.0f} comb/s)")
+    return results
+
+
+def best_package_from_sweep(results, strategy_logic, min_trades=20):
+    """
+    Sceglie la combinazione come optimize_asset_logic: PF massimo con più di min_trades
+    trade, a parità di PF vince la riga con indice più basso. None se nessuna è valida.
+    """
+    eligible = results[results['total_trades'] > min_trades]
+    if eligible.empty:
+        return None
+    best = eligible.index[eligible['profit_factor'].to_numpy().argmax()]
+    to_python = lambda v: v.item() if isinstance(v, np.generic) else v
+    params = {k: to_python(results.at[best, k]) for k in results.columns if k not in METRIC_COLUMNS}
+    performance = {k: to_python(results.at[best, k]) for k in METRIC_COLUMNS}
+    return {'params': params, 'performance': performance, 'logic_name': strategy_logic['name']}
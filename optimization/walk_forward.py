@@ -0,0 +1,168 @@
+# optimization/walk_forward.py - v1.0 (Walk-Forward con Finestre Purgate)
+# Divide lo storico in finestre train/test (rolling o anchored) separate da un
+# embargo, ottimizza i parametri sulla finestra di train con lo sweep vettoriale
+# e li valuta sulla finestra di test successiva, mai vista durante il fit.
+# Le finestre girano in parallelo su un pool di processi che legge l'OHLCV dalla
+# memoria condivisa; le curve out-of-sample vengono cucite in un'unica equity.
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import pandas as pd
+
+import config
+from analysis.signal_engine import generate_trades
+from infra.shared_ohlcv import SharedOHLCV, attach_worker
+from optimization.metrics import summarize_trades
+from optimization.sweep import sweep_parameter_grid, best_package_from_sweep
+
+DEFAULT_TRAIN_BARS = 365 * 24   # 1 anno di candele 1h
+DEFAULT_TEST_BARS = 90 * 24     # 1 trimestre
+DEFAULT_EMBARGO_BARS = 24       # 1 giorno di distacco tra train e test
+
+
+def walk_forward_windows(n_bars, train_bars=DEFAULT_TRAIN_BARS, test_bars=DEFAULT_TEST_BARS,
+                         embargo_bars=DEFAULT_EMBARGO_BARS, anchored=False):
+    """
+    Finestre consecutive come dizionari di indici [inizio, fine):
+    train -> embargo -> test, poi tutto scorre avanti di test_bars.
+    Con anchored=True il train parte sempre dalla prima barra e si allunga.
+    """
+    windows, test_start = [], train_bars + embargo_bars
+    while test_start < n_bars:
+        train_end = test_start - embargo_bars
+        windows.append({
+            'window': len(windows),
+            'train_start': 0 if anchored else train_end - train_bars, 'train_end': train_end,
+            'test_start': test_start, 'test_end': min(test_start + test_bars, n_bars),
+        })
+        test_start += test_bars
+    return windows
+
+
+def _equity_points(trades):
+    """P/L percentuale di ogni trade, come nell'equity di optimizer.run_single_backtest."""
+    points = []
+    for t in trades:
+        exit_price = t['sl'] if t['result'] == 'SL' else t['tp']
+        pnl = (exit_price - t['entry']) / t['entry']
+        if t['type'] == 'SHORT': pnl = -pnl
+        points.append((t['timestamp'], pnl))
+    return points
+
+
+def evaluate_window(df, window, param_space, strategy_logic, min_trades=20, dataset_key=None):
+    """
+    Fit sulla finestra di train (sweep completo della griglia) e valutazione out-of-sample.
+    Gli indicatori OOS sono calcolati sui dati fino alla fine del test (nessuna barra
+    futura), ma vengono accettati solo i segnali da test_start in poi; i trade ancora
+    aperti a fine finestra vengono scartati, quindi nessun trade attraversa due finestre.
+    """
+    train = df.iloc[window['train_start']:window['train_end']].reset_index(drop=True)
+    surface = sweep_parameter_grid(train, param_space, strategy_logic, dataset_key=dataset_key)
+    package = best_package_from_sweep(surface, strategy_logic, min_trades=min_trades)
+    result = dict(window, params=None, in_sample=None, out_of_sample=summarize_trades([], []), trades=[])
+    if package is None:
+        return result
+
+    oos_data = df.iloc[:window['test_end']]
+    trades = generate_trades(oos_data, package['params'], strategy_logic, dataset_key=dataset_key, start=window['test_start'])
+    equity_curve, equity = [1.0], 1.0
+    for _, pnl in _equity_points(trades):
+        equity *= (1 + pnl)
+        equity_curve.append(equity)
+    result.update(params=package['params'], in_sample=package['performance'],
+                  out_of_sample=summarize_trades(trades, equity_curve), trades=trades)
+    return result
+
+
+# ==============================================================================
+# --- ESECUZIONE PARALLELA DELLE FINESTRE ---
+# ==============================================================================
+
+_WORKER_STATE = {}
+
+def _init_worker(descriptor):
+    attach_worker(descriptor, _WORKER_STATE)
+
+def _run_window(window, param_space, strategy_logic, min_trades, dataset_key):
+    return evaluate_window(_WORKER_STATE['df'], window, param_space, strategy_logic, min_trades, dataset_key)
+
+
+def stitch_equity(window_results):
+    """Curva di equity out-of-sample unica, composta trade dopo trade in ordine di finestra."""
+    rows, equity = [], 1.0
+    for res in sorted(window_results, key=lambda r: r['window']):
+        for timestamp, pnl in _equity_points(res['trades']):
+            equity *= (1 + pnl)
+            rows.append({'timestamp': timestamp, 'window': res['window'], 'pnl': pnl, 'equity': equity})
+    return pd.DataFrame(rows, columns=['timestamp', 'window', 'pnl', 'equity'])
+
+
+def walk_forward(df, param_space, strategy_logic, train_bars=DEFAULT_TRAIN_BARS, test_bars=DEFAULT_TEST_BARS,
+                 embargo_bars=DEFAULT_EMBARGO_BARS, anchored=False, workers=1, min_trades=20, dataset_key=None):
+    """
+    Walk-forward completo su df. Restituisce un dizionario con:
+      - windows: DataFrame con una riga per finestra (intervalli, parametri scelti,
+        metriche in-sample e out-of-sample)
+      - equity: curva OOS cucita (timestamp, finestra, pnl, equity)
+      - summary: metriche aggregate su tutti i trade out-of-sample
+    """
+    df = df.reset_index(drop=True)
+    windows = walk_forward_windows(len(df), train_bars, test_bars, embargo_bars, anchored)
+    if not windows:
+        logging.warning(f"Storico troppo corto per il walk-forward ({len(df)} barre).")
+        return None
+    logging.info(f"Walk-forward '{strategy_logic['name']}': {len(windows)} finestre ({'anchored' if anchored else 'rolling'}) su {workers} processi...")
+
+    if workers > 1:
+        block = SharedOHLCV.from_dataframe(df)
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(block.descriptor(),)) as pool:
+                task = partial(_run_window, param_space=param_space, strategy_logic=strategy_logic, min_trades=min_trades, dataset_key=dataset_key)
+                results = list(pool.map(task, windows))
+        finally:
+            block.close()
+    else:
+        results = [evaluate_window(df, w, param_space, strategy_logic, min_trades, dataset_key) for w in windows]
+
+    ts = df['timestamp']
+    rows = []
+    for res in results:
+        row = {k: res[k] for k in ('window', 'train_start', 'train_end', 'test_start', 'test_end')}
+        row.update(train_from=ts.iloc[res['train_start']], test_from=ts.iloc[res['test_start']], test_to=ts.iloc[res['test_end'] - 1],
+                   params=json.dumps(res['params']) if res['params'] else None)
+        row.update({f"is_{k}": v for k, v in (res['in_sample'] or {}).items()})
+        row.update({f"oos_{k}": v for k, v in res['out_of_sample'].items()})
+        rows.append(row)
+
+    all_trades = [t for res in sorted(results, key=lambda r: r['window']) for t in res['trades']]
+    equity = stitch_equity(results)
+    summary = summarize_trades(all_trades, [1.0] + equity['equity'].tolist())
+    return {'windows': pd.DataFrame(rows), 'equity': equity, 'summary': summary}
+
+
+if __name__ == "__main__":
+    from optimizer import load_klines_df  # solo da CLI: carica il client Binance
+
+    # Run notturno su tutto l'universo: una riga per finestra e l'equity OOS per ogni asset
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    with open('parameters_space.json', 'r') as f:
+        param_space = json.load(f)
+    strategy_logic = {"name": "Pullback_v13_Original", "trend_filter": "check_trend_condition", "entry_condition": "check_pullback_entry_condition", "exit_logic": "calculate_sl_tp"}
+    YEARS = 3
+    WORKERS = os.cpu_count() or 1
+    symbols = sys.argv[1:] or config.ASSET_UNIVERSE
+
+    for symbol in symbols:
+        df = load_klines_df(symbol, YEARS)
+        if df is None: continue
+        report = walk_forward(df, param_space, strategy_logic, workers=WORKERS, dataset_key=(symbol, "1h"))
+        if report is None: continue
+        report['windows'].to_csv(f"walk_forward_{symbol}.csv", index=False)
+        report['equity'].to_csv(f"walk_forward_equity_{symbol}.csv", index=False)
+        s = report['summary']
+        logging.info(f"{symbol} OOS | PF: {s['profit_factor']} | DD: {s['max_drawdown']}% | Trades: {s['total_trades']} | P/L: {s['gross_pl']}")
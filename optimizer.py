@@ -1,94 +1,207 @@
 # optimizer.py - v4.0 (Multi-Logic Optimizer)
-import pandas as pd
+import numpy as np
 import logging
+import os
+import sys
 import json
-import itertools
 import random
 from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
 import warnings
 
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
 # Assicuriamoci di importare dal posto giusto, che ora è strategy_generator
 from strategy_generator import evaluate_strategy_extended
-from data_sources import binance_client
+from analysis.signal_engine import generate_trades
+from analysis.exit_resolver import ExitResolver
+from analysis.indicator_cache import INDICATOR_CACHE
+from infra.shared_ohlcv import SharedOHLCV, attach_worker
+from optimization.metrics import summarize_trades
+from optimization.sweep import sweep_parameter_grid, best_package_from_sweep
+from optimization.halving import successive_halving
+from optimization.search import sample_combinations, tpe_search, grid_size
+from infra.result_store import ResultStore, code_version
+import strategy_generator
+from analysis import market_analysis, signal_engine, exit_resolver
+from data_sources import get_historical_ohlcv
 
 
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
 
-def run_single_backtest(df_full, params, strategy_logic):
-    """Backtester leggero che ora accetta una logica di strategia variabile."""
+def run_single_backtest(df_full, params, strategy_logic, vectorized=False, dataset_key=None, store=None):
+    """
+    Backtester leggero che ora accetta una logica di strategia variabile.
+    Con vectorized=True gli indicatori vengono calcolati una sola volta
+    sull'intero storico (stessi trade del percorso per-barra); dataset_key
+    (symbol, timeframe) li condivide tra i trial tramite la cache indicatori.
+    Con store (infra.result_store.ResultStore) un backtest già eseguito sugli
+    stessi dati, parametri e codice viene riletto dall'archivio.
+    """
+    if store is not None:
+        key = store.make_key(df_full, params, strategy_logic, _engine_version(), engine='optimizer')
+        return store.fetch_or_run(key, lambda: _backtest(df_full, params, strategy_logic, vectorized, dataset_key),
+                                  engine='optimizer', logic=strategy_logic.get('name'))
+    return _backtest(df_full, params, strategy_logic, vectorized, dataset_key)[0]
+
+@lru_cache(maxsize=None)
+def _engine_version():
+    """Versione del codice che determina i trade: cambia se cambia uno di questi moduli."""
+    return code_version(__file__, strategy_generator, market_analysis, signal_engine, exit_resolver)
+
+def _backtest(df_full, params, strategy_logic, vectorized, dataset_key):
+    """Esegue il backtest e restituisce (metriche, trade)."""
+    if vectorized:
+        trades = generate_trades(df_full, params, strategy_logic, dataset_key=dataset_key)
+        equity_curve, current_equity = [1.0], 1.0
+        for t in trades:
+            exit_price = t['sl'] if t['result'] == 'SL' else t['tp']
+            pnl = (exit_price - t['entry']) / t['entry']
+            if t['type'] == 'SHORT': pnl = -pnl
+            current_equity *= (1 + pnl)
+            equity_curve.append(current_equity)
+        return summarize_trades(trades, equity_curve), trades
+
     trades, active_trade = [], None
     start_index = max(params.get('ema_slow', 200), params.get('atr_len', 14)) + 10
     equity_curve, current_equity = [1.0], 1.0
 
-    for i in range(start_index, len(df_full)):
-        current_market_data = df_full.iloc[0:i]
+    resolver = ExitResolver.from_frame(df_full)
+
+    i = start_index
+    while i < len(df_full):
         if active_trade:
-            c = current_market_data.iloc[-1]
-            result, exit_price = None, None
-            if active_trade['type'] == 'LONG' and c['low'] <= active_trade['sl']: result, exit_price = 'SL', active_trade['sl']
-            elif active_trade['type'] == 'LONG' and c['high'] >= active_trade['tp']: result, exit_price = 'TP', active_trade['tp']
-            elif active_trade['type'] == 'SHORT' and c['high'] >= active_trade['sl']: result, exit_price = 'SL', active_trade['sl']
-            elif active_trade['type'] == 'SHORT' and c['low'] <= active_trade['tp']: result, exit_price = 'TP', active_trade['tp']
-            if result:
-                pnl = (exit_price - active_trade['entry']) / active_trade['entry']
-                if active_trade['type'] == 'SHORT': pnl = -pnl
-                current_equity *= (1 + pnl)
-                equity_curve.append(current_equity)
-                active_trade['result'] = result
-                trades.append(active_trade)
-                active_trade = None
-        if not active_trade:
-            signal = evaluate_strategy_extended(current_market_data, params, strategy_logic)
-            if signal: active_trade = signal.copy()
-
-    if not trades: return {"profit_factor": 0, "max_drawdown": 100, "total_trades": 0, "gross_pl": 0}
-
-    gross_profit = sum(abs(t['tp'] - t['entry']) for t in trades if t['result'] == 'TP')
-    gross_loss = sum(abs(t['sl'] - t['entry']) for t in trades if t['result'] == 'SL')
-    profit_factor = gross_profit / gross_loss if gross_loss > 0 else float('inf')
-    
-    peak = max(equity_curve) if equity_curve else 1.0
-    max_drawdown = max([(peak - val) / peak for val in equity_curve]) * 100 if equity_curve else 100
-
-    return {
-        "profit_factor": round(profit_factor, 2), 
-        "max_drawdown": round(max_drawdown, 2), 
-        "total_trades": len(trades),
-        "gross_pl": round(gross_profit - gross_loss, 4)
-    }
+            # Salta direttamente alla candela che tocca SL/TP (controllata all'iterazione successiva)
+            exit_bar, result = resolver.resolve(active_trade['type'], i - 1, active_trade['sl'], active_trade['tp'], end=len(df_full) - 1)
+            if not result: break
+            exit_price = active_trade['sl'] if result == 'SL' else active_trade['tp']
+            pnl = (exit_price - active_trade['entry']) / active_trade['entry']
+            if active_trade['type'] == 'SHORT': pnl = -pnl
+            current_equity *= (1 + pnl)
+            equity_curve.append(current_equity)
+            active_trade['result'] = result
+            trades.append(active_trade)
+            active_trade = None
+            i = exit_bar + 1
+        signal = evaluate_strategy_extended(df_full.iloc[0:i], params, strategy_logic)
+        if signal: active_trade = signal.copy()
+        i += 1
 
-def optimize_asset_logic(symbol, years, param_space, num_tests, strategy_logic):
-    """Funzione core che ottimizza i parametri per una data logica di strategia."""
-    logging.info(f"--- OTTIMIZZAZIONE per {symbol} sulla logica '{strategy_logic['name']}' ---")
+    return summarize_trades(trades, equity_curve), trades
+
+def load_klines_df(symbol, years, interval="1h"):
+    """Klines di `years` anni (dall'archivio OHLCV locale) nel DataFrame usato dai backtest (None se errore)."""
     start_date = f"{years} years ago UTC"
     try:
-        klines = binance_client.get_historical_klines(symbol, "1h", start_date)
-        if not klines: logging.warning(f"Nessun dato per {symbol}."); return None
-        df = pd.DataFrame(klines, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_av', 'trades', 'tb_base_av', 'tb_quote_av', 'ignore'])
-        for col in ['open', 'high', 'low', 'close', 'volume']: df[col] = pd.to_numeric(df[col])
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        df = get_historical_ohlcv(symbol, interval, start_date)
+        if df.empty: logging.warning(f"Nessun dato per {symbol}."); return None
+        return df
     except Exception as e:
         logging.error(f"Errore dati per {symbol}: {e}"); return None
 
-    keys, values = zip(*param_space.items())
-    all_combinations = [dict(zip(keys, v)) for v in itertools.product(*values)]
-    param_combinations = random.sample(all_combinations, min(num_tests, len(all_combinations)))
-    
-    logging.info(f"Test di {len(param_combinations)} combinazioni di parametri...")
-    best_pf, best_package = -1, None
-    
-    for i, params in enumerate(param_combinations):
-        result = run_single_backtest(df.copy(), params, strategy_logic)
-        print(f"\r  Test {i+1:>4}/{len(param_combinations)} | PF: {result['profit_factor']:>4.2f} | DD: {result['max_drawdown']:>5.2f}% | P/L: {result['gross_pl']:>9.2f} | Trades: {result['total_trades']:<4}", end="")
-        if result['profit_factor'] > best_pf and result['total_trades'] > 20: # Minimo 20 trade per validità statistica
-            best_pf = result['profit_factor']
-            best_package = {'params': params, 'performance': result, 'logic_name': strategy_logic['name']}
+def trial_score(result, min_trades=20):
+    """Punteggio di un trial per le ricerche guidate: PF se ha più di min_trades trade, altrimenti -1."""
+    return result['profit_factor'] if result['total_trades'] > min_trades else -1
+
+def optimize_asset_logic(symbol, years, param_space, num_tests, strategy_logic, workers=1, seed=None, exhaustive=False, halving=False, search='random', store=None):
+    """
+    Funzione core che ottimizza i parametri per una data logica di strategia.
+    Con workers > 1 i trial vengono distribuiti su un pool di processi che leggono
+    l'OHLCV dalla memoria condivisa; con lo stesso seed il risultato è riproducibile.
+    Con exhaustive=True l'intera griglia viene valutata in un solo passaggio vettoriale
+    (optimization.sweep) e la superficie completa viene salvata in CSV.
+    Con halving=True i trial passano per lo scheduler di successive halving: solo i
+    superstiti dei gradini su finestre corte vengono valutati sullo storico completo.
+    Le combinazioni vengono estratte per indice senza materializzare la griglia;
+    search='tpe' sostituisce il campionamento casuale con la ricerca guidata TPE.
+    store (ResultStore) evita di rieseguire trial già presenti nell'archivio dei risultati.
+    """
+    logging.info(f"--- OTTIMIZZAZIONE per {symbol} sulla logica '{strategy_logic['name']}' ---")
+    df = load_klines_df(symbol, years)
+    if df is None: return None
+
+    dataset_key = (symbol, "1h")
+    if exhaustive:
+        surface = sweep_parameter_grid(df, param_space, strategy_logic, dataset_key=dataset_key)
+        surface_file = f"parameter_surface_{symbol}_{strategy_logic['name']}.csv"
+        surface.to_csv(surface_file, index=False)
+        logging.info(f"Superficie dei parametri ({len(surface)} combinazioni) salvata in: {surface_file}")
+        return best_package_from_sweep(surface, strategy_logic)
+
+    if search == 'tpe':
+        param_combinations = []
+        def evaluate_trial(params):
+            result = run_single_backtest(df, params, strategy_logic, vectorized=True, dataset_key=dataset_key, store=store)
+            return trial_score(result), result
+        def tpe_trials():
+            for i, (_, params, result) in enumerate(tpe_search(param_space, evaluate_trial, num_tests, seed=seed)):
+                param_combinations.append(params)
+                yield i, result
+        logging.info(f"Ricerca TPE su {min(num_tests, grid_size(param_space))} trial (griglia di {grid_size(param_space)} combinazioni)...")
+    else:
+        param_combinations = sample_combinations(param_space, num_tests, seed=seed)
+        logging.info(f"Test di {len(param_combinations)} combinazioni di parametri su {workers} processi...")
+    best_pf, best_index, best_package = -1, None, None
+
+    if search == 'tpe':
+        trial_results = tpe_trials()
+    elif halving:
+        warmup_bars = max(max(p.get('ema_slow', 200), p.get('atr_len', 14)) for p in param_combinations) + 10
+        evaluate = lambda window, params: run_single_backtest(window, params, strategy_logic, vectorized=True, dataset_key=dataset_key, store=store)
+        report = successive_halving(df, param_combinations, evaluate, warmup_bars=warmup_bars)
+        trial_results = sorted(report['results'].items())
+        logging.info(f"Halving: {len(trial_results)} superstiti valutati sullo storico completo (risparmio calcolo {report['compute_saved']:.1%})")
+    elif workers > 1:
+        trial_results = _run_trials_parallel(df, param_combinations, strategy_logic, workers, seed, dataset_key, store)
+    else:
+        trial_results = ((i, run_single_backtest(df, params, strategy_logic, vectorized=True, dataset_key=dataset_key, store=store)) for i, params in enumerate(param_combinations))
+
+    n_trials = len(trial_results) if isinstance(trial_results, list) else min(num_tests, grid_size(param_space))
+    for done, (i, result) in enumerate(trial_results, start=1):
+        # A parità di PF vince il trial con indice più basso, come nel ciclo sequenziale
+        is_better = result['profit_factor'] > best_pf or (result['profit_factor'] == best_pf and best_index is not None and i < best_index)
+        if is_better and result['total_trades'] > 20: # Minimo 20 trade per validità statistica
+            best_pf, best_index = result['profit_factor'], i
+            best_package = {'params': param_combinations[i], 'performance': result, 'logic_name': strategy_logic['name']}
+        print(f"\r  Test {done:>4}/{n_trials} | PF: {result['profit_factor']:>4.2f} | DD: {result['max_drawdown']:>5.2f}% | P/L: {result['gross_pl']:>9.2f} | Trades: {result['total_trades']:<4} | Best PF: {best_pf:>4.2f}", end="")
 
     print()
+    if workers == 1 or search == 'tpe':
+        INDICATOR_CACHE.log_stats(f"{symbol} ")
+        if store is not None: store.log_stats(f"{symbol} ")
     return best_package
 
+# ==============================================================================
+# --- ESECUZIONE PARALLELA DEI TRIAL ---
+# ==============================================================================
+
+_WORKER_STATE = {}
+
+def _init_worker(descriptor, strategy_logic, seed, dataset_key, store=None):
+    """Inizializzatore del pool: ogni worker si aggancia una volta sola ai dati condivisi."""
+    attach_worker(descriptor, _WORKER_STATE)
+    _WORKER_STATE.update({'strategy_logic': strategy_logic, 'seed': seed, 'dataset_key': dataset_key, 'store': store})
+
+def _run_trial(index, params):
+    """Esegue un singolo trial nel worker, con seed derivato dall'indice del trial."""
+    seed = _WORKER_STATE['seed']
+    if seed is not None:
+        random.seed(seed + index)
+        np.random.seed((seed + index) % 2**32)
+    return index, run_single_backtest(_WORKER_STATE['df'], params, _WORKER_STATE['strategy_logic'], vectorized=True, dataset_key=_WORKER_STATE['dataset_key'], store=_WORKER_STATE['store'])
+
+def _run_trials_parallel(df, param_combinations, strategy_logic, workers, seed, dataset_key=None, store=None):
+    """Generatore che restituisce (indice, risultato) man mano che i trial terminano."""
+    block = SharedOHLCV.from_dataframe(df)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(block.descriptor(), strategy_logic, seed, dataset_key, store)) as pool:
+            futures = [pool.submit(_run_trial, i, params) for i, params in enumerate(param_combinations)]
+            for future in as_completed(futures):
+                yield future.result()
+    finally:
+        block.close()
+
 if __name__ == "__main__":
     try:
         with open('hall_of_fame_new.json', 'r') as f:
@@ -108,6 +221,11 @@ if __name__ == "__main__":
 
     YEARS_TO_OPTIMIZE = 2
     RANDOM_TESTS_PER_ASSET = 300
+    PARALLEL_WORKERS = os.cpu_count() or 1
+    RANDOM_SEED = 42
+    EXHAUSTIVE_SWEEP = '--exhaustive' in sys.argv # Opt-in: griglia completa con lo sweep vettoriale invece del campionamento casuale
+    SUCCESSIVE_HALVING = False # Alternativa al campionamento completo: scarta presto i trial peggiori
+    RESULT_STORE = ResultStore() # Trial già eseguiti (stessi dati/parametri/codice) riletti dal disco
 
     production_strategies = {}
     
@@ -121,7 +239,9 @@ if __name__ == "__main__":
         if logic_name in STRATEGY_BLUEPRINTS:
             strategy_logic_to_optimize = STRATEGY_BLUEPRINTS[logic_name]
             
-            best_package = optimize_asset_logic(asset, YEARS_TO_OPTIMIZE, param_space, RANDOM_TESTS_PER_ASSET, strategy_logic_to_optimize)
+            best_package = optimize_asset_logic(asset, YEARS_TO_OPTIMIZE, param_space, RANDOM_TESTS_PER_ASSET, strategy_logic_to_optimize,
+                                                workers=PARALLEL_WORKERS, seed=RANDOM_SEED, exhaustive=EXHAUSTIVE_SWEEP,
+                                                halving=SUCCESSIVE_HALVING, store=RESULT_STORE)
             
             if best_package and best_package['performance']['profit_factor'] > 1.15: # Soglia di qualità finale
                 logging.info(f"✅ Strategia profittevole trovata e ottimizzata per {asset}!")
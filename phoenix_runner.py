@@ -10,7 +10,8 @@ from datetime import datetime, timezone, timedelta
 
 import database
 import config
-from api_clients.data_client import FinancialDataClient
+from api_clients.async_data_client import fetch_snapshot
+from api_clients.kline_cache import KLINE_CACHE
 
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] [%(asctime)s] %(message)s')
 
@@ -56,16 +57,18 @@ def phoenix_momentum(df):
 
 def run_daily_operations():
     logging.info(f"--- Avvio Operazioni Phoenix (PATCH v9.0 IMMEDIATE COMMIT) ---")
-    data_client = FinancialDataClient()
     database.init_db()
 
+    # Candele di tutti gli asset in parallelo, prima dell'analisi
+    klines = fetch_snapshot([(asset, config.TIMEFRAME, config.DATA_SOURCE, 500) for asset in config.ASSET_UNIVERSE], fallback=KLINE_CACHE, cache=KLINE_CACHE)
+
     # Apriamo la sessione una sola volta
     with database.session_scope() as session:
         # ... (logica pulizia e posizioni aperte) ...
         for asset in config.ASSET_UNIVERSE:
             try:
                 # ... (logica skip asset) ...
-                df = data_client.get_klines(asset, config.TIMEFRAME, config.DATA_SOURCE, limit=500)
+                df = klines.get_klines(asset, config.TIMEFRAME, config.DATA_SOURCE, limit=500)
                 if df is None or df.empty or len(df) < 50: continue
 
                 df.ta.adx(length=config.ADX_PERIOD, append=True); df.ta.rsi(length=config.RSI_PERIOD, append=True); df.ta.atr(length=config.ATR_PERIOD, append=True)
@@ -7,6 +7,7 @@ import logging
 import warnings
 from datetime import datetime, timezone
 
+import numpy as np
 import pandas as pd
 import pandas_ta as ta
 
@@ -15,7 +16,12 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if project_root not in sys.path:
     sys.path.append(project_root)
 
-from data_sources import binance_client
+from data_sources import get_historical_ohlcv
+from analysis.exit_resolver import ExitResolver
+from analysis.indicator_cache import cached_indicator
+from analysis import exit_resolver
+from infra.result_store import ResultStore, code_version
+from infra.columnar_store import COLUMNAR_STORE
 
 warnings.simplefilter(action='ignore', category=FutureWarning)
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
@@ -24,16 +30,34 @@ logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
 # ----------------------------------
 # Utils
 # ----------------------------------
-def prepare_dataframe(klines):
-    cols = ['timestamp','open','high','low','close','volume','close_time','quote_av','trades','tb_base_av','tb_quote_av','ignore']
-    df = pd.DataFrame(klines, columns=cols)
-    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-    for c in ['open','high','low','close','volume']:
-        df[c] = pd.to_numeric(df[c])
-    df = df[['timestamp','open','high','low','close','volume']].dropna().reset_index(drop=True)
+COLUMNAR_MAX_LAG = pd.Timedelta(days=2)  # l'archivio colonnare si aggiorna con i dump giornalieri/mensili
+COLUMNAR_MAX_GAP = pd.Timedelta(days=1)  # buco massimo tollerato (manutenzioni dell'exchange)
+
+def load_history(symbol, timeframe, years):
+    """
+    Storico degli ultimi `years` anni: dall'archivio colonnare (import offline, mai aggiornato in
+    automatico) solo se copre tutto il range senza buchi, altrimenti da get_historical_ohlcv.
+    Logga sempre da dove arrivano i dati.
+    """
+    now = pd.Timestamp.now(tz='UTC')
+    start = now - pd.DateOffset(years=years)
+    if COLUMNAR_STORE.months('binance', symbol, timeframe):
+        arrays = COLUMNAR_STORE.slice('binance', symbol, timeframe, start=start)
+        stamps = arrays.timestamp_ms
+        if len(stamps):
+            first, last = (pd.Timestamp(int(x), unit='ms', tz='UTC') for x in (stamps[0], stamps[-1]))
+            gap = pd.Timedelta(milliseconds=int(np.diff(stamps).max())) if len(stamps) > 1 else pd.Timedelta(0)
+            if first <= start + COLUMNAR_MAX_GAP and last >= now - COLUMNAR_MAX_LAG and gap <= COLUMNAR_MAX_GAP:
+                logging.info(f"[{symbol}] Dati dall'archivio colonnare: {first} -> {last} ({len(stamps)} barre).")
+                return arrays.to_dataframe()
+            logging.warning(f"[{symbol}] Archivio colonnare incompleto ({first} -> {last}, buco max {gap}) "
+                            f"per {start} -> {now}: uso get_historical_ohlcv.")
+        else:
+            logging.warning(f"[{symbol}] Archivio colonnare senza dati dal {start}: uso get_historical_ohlcv.")
+    df = get_historical_ohlcv(symbol, timeframe, f"{years} years ago UTC")
+    logging.info(f"[{symbol}] Dati da get_historical_ohlcv ({timeframe}, ultimi {years} anni).")
     return df
 
-
 def restrict_session(df, session_hours=None):
     if not session_hours: return df
     sh, eh = session_hours
@@ -52,27 +76,31 @@ def estimate_vol_regime(df, atr_col):
 # ----------------------------------
 # Indicatori Intraday
 # ----------------------------------
-def add_intraday_indicators(df: pd.DataFrame, params: dict) -> pd.DataFrame:
+def add_intraday_indicators(df: pd.DataFrame, params: dict, dataset_key=None) -> pd.DataFrame:
+    # Con dataset_key=(symbol, timeframe) le serie sono condivise tra le righe della griglia
+    def cached(name, compute, *args):
+        return cached_indicator(df, dataset_key, name, compute, *args)
+
     bb_len = params.get('bb_len', 20); bb_mult = params.get('bb_mult', 2.0)
-    bb = ta.bbands(df['close'], length=bb_len, std=bb_mult)
-    df['BBL'] = bb.iloc[:, 0]; df['BBM'] = bb.iloc[:, 1]; df['BBU'] = bb.iloc[:, 2]
+    bb = cached('BBANDS', lambda: ta.bbands(df['close'], length=bb_len, std=bb_mult), bb_len, bb_mult)
+    df['BBL'] = bb.iloc[:, 0].to_numpy(); df['BBM'] = bb.iloc[:, 1].to_numpy(); df['BBU'] = bb.iloc[:, 2].to_numpy()
 
     rsi_len = params.get('rsi_len', 14)
-    df['RSI'] = ta.rsi(df['close'], length=rsi_len)
+    df['RSI'] = cached('RSI', lambda: ta.rsi(df['close'], length=rsi_len), rsi_len).to_numpy()
 
     atr_len = params.get('atr_len', 14)
-    df[f'ATR_{atr_len}'] = ta.atr(df['high'], df['low'], df['close'], length=atr_len)
+    df[f'ATR_{atr_len}'] = cached('ATR', lambda: ta.atr(df['high'], df['low'], df['close'], length=atr_len), atr_len).to_numpy()
 
     dc_len = params.get('dc_len', 20)
-    df['DC_HIGH'] = df['high'].rolling(dc_len).max()
-    df['DC_LOW']  = df['low'].rolling(dc_len).min()
+    df['DC_HIGH'] = cached('DC_HIGH', lambda: df['high'].rolling(dc_len).max(), dc_len).to_numpy()
+    df['DC_LOW']  = cached('DC_LOW', lambda: df['low'].rolling(dc_len).min(), dc_len).to_numpy()
     df['DC_WIDTH'] = (df['DC_HIGH'] - df['DC_LOW']).fillna(0)
 
     v_len = params.get('vol_sma_len', 20)
-    df['VOL_SMA'] = df['volume'].rolling(v_len).mean()
+    df['VOL_SMA'] = cached('VOL_SMA', lambda: df['volume'].rolling(v_len).mean(), v_len).to_numpy()
 
     ema_tf = params.get('ema_trend_len', 100)
-    df[f'EMA_{ema_tf}'] = ta.ema(df['close'], length=ema_tf)
+    df[f'EMA_{ema_tf}'] = cached('EMA', lambda: ta.ema(df['close'], length=ema_tf), ema_tf).to_numpy()
     return df
 
 
@@ -139,28 +167,37 @@ def signal_breakout(df: pd.DataFrame, i: int, params: dict):
 # ----------------------------------
 # Backtest
 # ----------------------------------
-def backtest_intraday(df: pd.DataFrame, params: dict, logic_name: str, session_hours=None):
+def backtest_intraday(df: pd.DataFrame, params: dict, logic_name: str, session_hours=None, dataset_key=None, store=None):
+    if store is not None:
+        # Risultato già in archivio per gli stessi dati/parametri/sessione/codice
+        key = store.make_key(df, params, logic_name, code_version(__file__, exit_resolver), session_hours=session_hours)
+        return store.fetch_or_run(key, lambda: _backtest_intraday(df, params, logic_name, session_hours, dataset_key),
+                                  engine='mitragliere_intraday', logic=logic_name)
+    return _backtest_intraday(df, params, logic_name, session_hours, dataset_key)[0]
+
+
+def _backtest_intraday(df, params, logic_name, session_hours, dataset_key):
+    """Esegue il backtest intraday e restituisce (metriche, trade)."""
     df = restrict_session(df, session_hours)
-    df = add_intraday_indicators(df, params)
+    df = add_intraday_indicators(df, params, dataset_key=dataset_key)
     trades, active = [], None
     start = max(params.get(k, 20) for k in ['bb_len', 'dc_len', 'atr_len', 'ema_trend_len']) + 5
 
-    for i in range(start, len(df)):
+    resolver = ExitResolver.from_frame(df)
+
+    i = start
+    while i < len(df):
         if active:
-            c = df.iloc[i]; res = None
-            if active['side'] == 'LONG':
-                if c['low'] <= active['sl']: res = 'SL'
-                elif c['high'] >= active['tp']: res = 'TP'
-            else:
-                if c['high'] >= active['sl']: res = 'SL'
-                elif c['low'] <= active['tp']: res = 'TP'
-            if res:
-                active['exit_time'] = df.iloc[i]['timestamp']; active['result'] = res; trades.append(active); active = None
-        if not active:
-            sig = signal_mean_reversion(df, i, params) if logic_name == 'MR_BB_RSI' else signal_breakout(df, i, params)
-            if sig: sig['entry_time'] = df.iloc[i]['timestamp']; active = sig
-
-    if not trades: return {"name": logic_name, "profit_factor": 0, "total_trades": 0, "win_rate": 0, "avg_r_per_trade": 0}
+            # Salto diretto alla candela che tocca SL/TP
+            exit_bar, res = resolver.resolve(active['side'], i, active['sl'], active['tp'])
+            if res is None: break
+            active['exit_time'] = df.iloc[exit_bar]['timestamp']; active['result'] = res; trades.append(active); active = None
+            i = exit_bar
+        sig = signal_mean_reversion(df, i, params) if logic_name == 'MR_BB_RSI' else signal_breakout(df, i, params)
+        if sig: sig['entry_time'] = df.iloc[i]['timestamp']; active = sig
+        i += 1
+
+    if not trades: return {"name": logic_name, "profit_factor": 0, "total_trades": 0, "win_rate": 0, "avg_r_per_trade": 0}, trades
     atr_col = f"ATR_{params.get('atr_len', 14)}"
     regime = estimate_vol_regime(df, atr_col)
     gross_profit = sum(abs(t['tp'] - t['entry']) for t in trades if t['result'] == 'TP')
@@ -169,13 +206,13 @@ def backtest_intraday(df: pd.DataFrame, params: dict, logic_name: str, session_h
     win_trades = len([t for t in trades if t['result'] == 'TP'])
     win_rate = round((win_trades / len(trades)) * 100, 2)
     avg_r = round((gross_profit - gross_loss) / len(trades), 6)
-    return {"name": logic_name, "profit_factor": round(profit_factor, 2), "total_trades": len(trades), "win_rate": win_rate, "avg_r_per_trade": avg_r, "vol_regime": regime}
+    return {"name": logic_name, "profit_factor": round(profit_factor, 2), "total_trades": len(trades), "win_rate": win_rate, "avg_r_per_trade": avg_r, "vol_regime": regime}, trades
 
 
-def grid_search_intraday(df, logic_name, param_grid, session_hours=None):
+def grid_search_intraday(df, logic_name, param_grid, session_hours=None, dataset_key=None, store=None):
     results = []
     for params in param_grid:
-        res = backtest_intraday(df.copy(), params, logic_name, session_hours=session_hours)
+        res = backtest_intraday(df.copy(), params, logic_name, session_hours=session_hours, dataset_key=dataset_key, store=store)
         row = {**params, **res}; results.append(row)
     return sorted(results, key=lambda x: (x.get('profit_factor', 0), x.get('win_rate', 0)), reverse=True)
 
@@ -186,7 +223,6 @@ def grid_search_intraday(df, logic_name, param_grid, session_hours=None):
 if __name__ == '__main__':
     YEARS = 1; TF = '15m'; SESSION_HOURS = (8, 18)
     ASSETS = ["BTCUSDT", "ETHUSDT", "SOLUSDT", "XRPUSDT", "DOGEUSDT"]
-    start_date = f"{YEARS} years ago UTC"
     MR_GRID = [{"bb_len": 20, "bb_mult": 2.0, "rsi_len": 14, "rsi_buy": 30, "rsi_sell": 70, "atr_len": 14, "use_rr_mr": True, "ema_trend_len": 100},
                {"bb_len": 20, "bb_mult": 2.2, "rsi_len": 14, "rsi_buy": 28, "rsi_sell": 72, "atr_len": 14, "use_rr_mr": True, "ema_trend_len": 100},
                {"bb_len": 18, "bb_mult": 2.0, "rsi_len": 12, "rsi_buy": 32, "rsi_sell": 68, "atr_len": 14, "use_rr_mr": True, "ema_trend_len": 100},
@@ -195,18 +231,19 @@ if __name__ == '__main__':
                 {"dc_len": 30, "atr_len": 14, "min_compression_atr": 1.0, "vol_sma_len": 30, "volume_multiplier": 1.10, "rr_brk": 2.0, "ema_trend_len": 100},
                 {"dc_len": 14, "atr_len": 14, "min_compression_atr": 0.9, "vol_sma_len": 20, "volume_multiplier": 1.05, "rr_brk": 1.6, "ema_trend_len": 100}]
     hof = {}; all_rows = []
+    result_store = ResultStore()  # griglie già eseguite in sessioni precedenti
     try:
         with open('hall_of_fame_intraday.json', 'r') as f: hof = json.load(f); logging.info("Caricato HOF intraday.")
     except FileNotFoundError: logging.info("Creerò un nuovo HOF intraday.")
     for symbol in ASSETS:
         logging.info(f"=== INTRADAY RESEARCH v1.2 su {symbol} ({TF}) ===")
         try:
-            klines = binance_client.get_historical_klines(symbol, TF, start_date)
-            if not klines: logging.warning(f"No data for {symbol}. Skip."); continue
-            df = prepare_dataframe(klines); logging.info(f"Dati: {len(df)} barre")
+            df = load_history(symbol, TF, YEARS)  # archivio colonnare se copre il range, altrimenti download
+            if df is None or df.empty: logging.warning(f"No data for {symbol}. Skip."); continue
+            logging.info(f"Dati: {len(df)} barre")
         except Exception as e: logging.error(f"Errore dati {symbol}: {e}"); continue
-        mr_results = grid_search_intraday(df.copy(), 'MR_BB_RSI', MR_GRID, session_hours=SESSION_HOURS)
-        brk_results = grid_search_intraday(df.copy(), 'BRK_COMP_VOL', BRK_GRID, session_hours=SESSION_HOURS)
+        mr_results = grid_search_intraday(df.copy(), 'MR_BB_RSI', MR_GRID, session_hours=SESSION_HOURS, dataset_key=(symbol, TF), store=result_store)
+        brk_results = grid_search_intraday(df.copy(), 'BRK_COMP_VOL', BRK_GRID, session_hours=SESSION_HOURS, dataset_key=(symbol, TF), store=result_store)
         candidates = [x for x in (mr_results[0], brk_results[0]) if x and x.get('total_trades', 0) > 20]
         if candidates:
             best = sorted(candidates, key=lambda x: x.get('profit_factor', 0), reverse=True)[0]
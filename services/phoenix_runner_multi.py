@@ -1,12 +1,14 @@
-# services/phoenix_runner_multi.py (Patch 2)
+# services/phoenix_runner_multi.py (Patch 4)
+import asyncio
 import logging
 from datetime import datetime, timedelta
 from decimal import Decimal
 import pandas as pd
 import database
 import config
-from api_clients.data_client import FinancialDataClient
-from analysis.multi_timeframe_analyzer import analyze_multi_timeframes
+from api_clients.kline_cache import KLINE_CACHE
+from analysis.multi_timeframe_analyzer import analyze_multi_timeframes, TIMEFRAME_LIMIT
+from analysis.resampler import fetch_timeframes
 
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] [%(asctime)s] %(message)s')
 
@@ -18,16 +20,35 @@ def _choose_signal(signals_dict, coherence):
     if coherence == "MEDIUM": return signals_dict.get("4H") or signals_dict.get("15m") or max(signals_dict.values(), key=lambda s: s["score"])
     return max(signals_dict.values(), key=lambda s: s["score"])
 
+def prefetch_timeframes(assets) -> dict:
+    """
+    {asset: {timeframe: DataFrame}} per tutti gli asset in parallelo: le stesse richieste a range
+    dell'analizzatore, fatte da un gather (un thread per asset) davanti a KLINE_CACHE, così il
+    ciclo dura quanto l'asset più lento e le richieste ripetute restano in cache.
+    """
+    async def gather():
+        frames = await asyncio.gather(*(asyncio.to_thread(fetch_timeframes, KLINE_CACHE, asset, config.ACTIVE_TIMEFRAMES,
+                                                          config.DATA_SOURCE, TIMEFRAME_LIMIT) for asset in assets),
+                                      return_exceptions=True)
+        return dict(zip(assets, frames))
+    frames = asyncio.run(gather())
+    for asset, result in list(frames.items()):
+        if isinstance(result, Exception):
+            logging.error(f"{asset}: download delle candele fallito: {result!r}")
+            frames[asset] = None  # l'analizzatore riprova da solo
+    return frames
+
 def run_multi_timeframe_cycle():
     logging.info("=== Phoenix Multi-Timeframe Cycle (v7.0) ===")
-    data_client = FinancialDataClient()
     database.init_db()
     with database.session_scope() as session:
         try: open_pos_symbols = {p.symbol for p in session.query(database.OpenPosition).all()}
         except Exception: open_pos_symbols = set()
-        for asset in config.ASSET_UNIVERSE:
-            if asset in open_pos_symbols: continue
-            result = analyze_multi_timeframes(asset, data_client, config)
+        # Candele di tutti gli asset scaricate in parallelo (archivio locale + cache), poi analisi
+        assets = [asset for asset in config.ASSET_UNIVERSE if asset not in open_pos_symbols]
+        prefetched = prefetch_timeframes(assets)
+        for asset in assets:
+            result = analyze_multi_timeframes(asset, KLINE_CACHE, config, frames=prefetched.get(asset))
             signals, coherence = result["signals"], result["coherence"]
             if not signals:
                 logging.info(f"{asset}: nessun segnale su {config.ACTIVE_TIMEFRAMES}.")
@@ -48,6 +69,7 @@ def run_multi_timeframe_cycle():
             new_signal = database.TechnicalSignal(asset=asset, timeframe=timeframe_label, strategy=strategy, signal=signal_str, entry_price=entry, stop_loss=sl, take_profit=tp, details=details)
             session.add(new_signal)
             logging.info(f"✅ NUOVO SEGNALE: {asset} [{timeframe_label}] {signal_str} | score={chosen_score} | coherence={coherence}")
+    KLINE_CACHE.log_stats()
     logging.info("=== Ciclo Multi-Timeframe completato ===")
 
 if __name__ == "__main__":
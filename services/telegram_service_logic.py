@@ -2,7 +2,7 @@ import requests
 import os
 import pandas_ta as ta
 from database import session_scope, TechnicalSignal, OpenPosition
-from api_clients import financial_data_client
+from api_clients.kline_cache import KLINE_CACHE
 from datetime import datetime, timezone
 
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
@@ -78,7 +78,7 @@ def process_position_management_suggestions():
             return
 
         for pos in open_positions:
-            df = financial_data_client.get_data(pos.symbol, "15", 50, "Bybit-linear")
+            df = KLINE_CACHE.get_klines(pos.symbol, "15m", "bybit", limit=50)
             if df is None or df.empty:
                 continue
 
@@ -7,12 +7,17 @@ import json
 from datetime import datetime, timezone
 import warnings
 import os
+from functools import lru_cache
 
-from data_sources import binance_client
+from data_sources import get_historical_ohlcv
 from analysis.market_analysis import (
     add_indicators, check_trend_condition, 
     check_pullback_entry_condition, calculate_sl_tp
 )
+from analysis.signal_engine import generate_trades
+from analysis.exit_resolver import ExitResolver
+from analysis import market_analysis, signal_engine, exit_resolver
+from infra.result_store import ResultStore, code_version
 
 warnings.simplefilter(action='ignore', category=FutureWarning)
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
@@ -51,25 +56,47 @@ def evaluate_strategy_extended(df_market_data, params, strategy_logic):
     }
 
 
-def run_logic_backtest(df_full, params, strategy_logic):
+def run_logic_backtest(df_full, params, strategy_logic, vectorized=False, dataset_key=None, store=None):
+    if store is not None:
+        # Stessi dati, parametri, blueprint e codice: il risultato arriva dall'archivio
+        key = store.make_key(df_full, params, strategy_logic, _engine_version(), engine='strategy_generator')
+        return store.fetch_or_run(key, lambda: _logic_backtest(df_full, params, strategy_logic, vectorized, dataset_key),
+                                  engine='strategy_generator', logic=strategy_logic.get('name'))
+    return _logic_backtest(df_full, params, strategy_logic, vectorized, dataset_key)[0]
+
+
+@lru_cache(maxsize=None)
+def _engine_version():
+    """Versione del codice che determina i trade: cambia se cambia uno di questi moduli."""
+    return code_version(__file__, market_analysis, signal_engine, exit_resolver)
+
+
+def _logic_backtest(df_full, params, strategy_logic, vectorized, dataset_key):
+    """Esegue il backtest della logica e restituisce (metriche, trade)."""
+    if vectorized:
+        # Indicatori calcolati una sola volta sull'intero storico (stessi trade del ciclo per-barra),
+        # condivisi tra i blueprint dello stesso asset tramite la cache indicatori
+        trades = generate_trades(df_full, params, strategy_logic, dataset_key=dataset_key)
+        return _summarize_logic_trades(trades, strategy_logic), trades
     trades, active_trade = [], None
     start_index = max(params.get('ema_slow', 200), params.get('atr_len', 14)) + 10
-    for i in range(start_index, len(df_full)):
-        current_market_data = df_full.iloc[0:i]
+    resolver = ExitResolver.from_frame(df_full)
+    i = start_index
+    while i < len(df_full):
         if active_trade:
-            c = current_market_data.iloc[-1]
-            result = None
-            if active_trade['type'] == 'LONG' and c['low'] <= active_trade['sl']: result = 'SL'
-            elif active_trade['type'] == 'LONG' and c['high'] >= active_trade['tp']: result = 'TP'
-            elif active_trade['type'] == 'SHORT' and c['high'] >= active_trade['sl']: result = 'SL'
-            elif active_trade['type'] == 'SHORT' and c['low'] <= active_trade['tp']: result = 'TP'
-            if result:
-                active_trade['result'] = result
-                trades.append(active_trade)
-                active_trade = None
-        if not active_trade:
-            signal = evaluate_strategy_extended(current_market_data, params, strategy_logic)
-            if signal: active_trade = signal.copy()
+            exit_bar, result = resolver.resolve(active_trade['type'], i - 1, active_trade['sl'], active_trade['tp'], end=len(df_full) - 1)
+            if not result: break
+            active_trade['result'] = result
+            trades.append(active_trade)
+            active_trade = None
+            i = exit_bar + 1
+        signal = evaluate_strategy_extended(df_full.iloc[0:i], params, strategy_logic)
+        if signal: active_trade = signal.copy()
+        i += 1
+    return _summarize_logic_trades(trades, strategy_logic), trades
+
+
+def _summarize_logic_trades(trades, strategy_logic):
     if not trades:
         return {"name": strategy_logic['name'], "profit_factor": 0, "total_trades": 0, "win_rate": 0, "avg_r_per_trade": 0}
     gross_profit = sum(abs(t['tp'] - t['entry']) for t in trades if t['result'] == 'TP')
@@ -81,14 +108,6 @@ def run_logic_backtest(df_full, params, strategy_logic):
     return {"name": strategy_logic['name'], "profit_factor": round(profit_factor, 2), "total_trades": len(trades), "win_rate": win_rate, "avg_r_per_trade": avg_r}
 
 
-def prepare_dataframe(klines):
-    df = pd.DataFrame(klines, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_av', 'trades', 'tb_base_av', 'tb_quote_av', 'ignore'])
-    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-    for col in ['open', 'high', 'low', 'close', 'volume']:
-        df[col] = pd.to_numeric(df[col])
-    return df
-
-
 if __name__ == "__main__":
     STRATEGY_BLUEPRINTS = [
         {"name": "Pullback_v13_Original", "trend_filter": "check_trend_condition", "entry_condition": "check_pullback_entry_condition", "exit_logic": "calculate_sl_tp"},
@@ -119,6 +138,7 @@ if __name__ == "__main__":
         top_strategies = {}
         logging.info("Nessun 'hall_of_fame_new.json' esistente. Verrà creato un nuovo file.")
 
+    result_store = ResultStore()  # backtest già eseguiti in sessioni precedenti
     all_results = []
     for asset in ASSETS:
         # Controlla se l'asset è già stato analizzato
@@ -128,11 +148,10 @@ if __name__ == "__main__":
 
         logging.info(f"--- ANALISI STRATEGICA PER {asset} ---")
         try:
-            klines = binance_client.get_historical_klines(asset, "1h", start_date)
-            if not klines:
+            df = get_historical_ohlcv(asset, "1h", start_date)
+            if df.empty:
                 logging.warning(f"Nessun dato per {asset}. Salto.")
                 continue
-            df = prepare_dataframe(klines)
             logging.info(f"Dati per {asset} caricati ({len(df)} candele).")
         except Exception as e:
             logging.error(f"Errore download dati {asset}: {e}")
@@ -141,7 +160,7 @@ if __name__ == "__main__":
         asset_run_results = []
         for blueprint in STRATEGY_BLUEPRINTS:
             logging.info(f"Test: {blueprint['name']}...")
-            result = run_logic_backtest(df.copy(), base_params, blueprint)
+            result = run_logic_backtest(df, base_params, blueprint, vectorized=True, dataset_key=(asset, "1h"), store=result_store)
             result['asset'] = asset
             all_results.append(result)
             asset_run_results.append(result)